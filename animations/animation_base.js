@@ -314,6 +314,64 @@ drawCoordinates() {
     return { v, vx, vy, gForce };
   }
   
+  // 后端预计算的轨迹采样点（animation_instructions.trajectory: {t, x, y, events}）
+  // 相邻两点之间按匀加速插值，位置和速度都是精确的，不必逐帧积分；offset 为画面上的起点偏移
+  setTrajectory(trajectory, acceleration, offset = { x: 0, y: 0 }) {
+    const valid = trajectory && Array.isArray(trajectory.t) && trajectory.t.length >= 2;
+    this.trajectory = valid ? trajectory : null;
+    this.trajectoryAcceleration = acceleration;
+    this.trajectoryOffset = offset;
+    this.trajectoryIndex = 0;
+    return this.trajectory !== null;
+  }
+
+  trajectoryEvent(type) {
+    return this.trajectory.events?.find(event => event.type === type) || null;
+  }
+
+  trajectoryEndTime() {
+    return this.trajectory.t[this.trajectory.t.length - 1];
+  }
+
+  // 时刻 t 的位置和速度（超出采样范围时停在端点），index 为所在段的起点
+  trajectoryAt(t) {
+    const { t: ts, x: xs, y: ys } = this.trajectory;
+    const last = ts.length - 1;
+    const time = Math.min(Math.max(t, ts[0]), ts[last]);
+
+    // 时间单调递增：从上一帧所在的段向后找，倒回（reset）时从头开始
+    let i = this.trajectoryIndex;
+    if (ts[i] > time) i = 0;
+    while (i < last - 1 && ts[i + 1] < time) i++;
+    this.trajectoryIndex = i;
+
+    // 段起点速度 v = 弦/Δt - a·Δt/2
+    const { x: ax, y: ay } = this.trajectoryAcceleration;
+    const span = ts[i + 1] - ts[i];
+    const s = time - ts[i];
+    const vx = span > 0 ? (xs[i + 1] - xs[i]) / span - ax * span / 2 : 0;
+    const vy = span > 0 ? (ys[i + 1] - ys[i]) / span - ay * span / 2 : 0;
+    return {
+      x: xs[i] + vx * s + ax * s * s / 2 + this.trajectoryOffset.x,
+      y: ys[i] + vy * s + ay * s * s / 2 + this.trajectoryOffset.y,
+      vx: vx + ax * s,
+      vy: vy + ay * s,
+      index: i
+    };
+  }
+
+  // 轨迹线：已经过的采样点加当前位置，点数不随帧数增长
+  updateTrajectoryTrail(state) {
+    const { x: xs, y: ys } = this.trajectory;
+    const { x: dx, y: dy } = this.trajectoryOffset;
+    this.trail.pop();  // 上一帧的当前位置
+    while (this.trail.length <= state.index) {
+      const i = this.trail.length;
+      this.trail.push({ x: xs[i] + dx, y: ys[i] + dy });
+    }
+    this.trail.push({ x: state.x, y: state.y });
+  }
+
   // 坐标转换
   toCanvasX(physicsX) {
     return physicsX * this.config.scale + this.boundaryPadding;
@@ -9,6 +9,8 @@ class FreeFall extends AnimationBase {
     this.bounceLoss = params.bounceLoss || 0.8;  // 能量损失系数
     this.showVelocity = params.showVelocity || true;
     this.showAcceleration = params.showAcceleration || false;
+    // 后端预计算的采样点只覆盖到第一次落地，反弹时仍逐帧计算
+    this.setTrajectory(this.bounce ? null : params.trajectory, { x: 0, y: -this.g }, { x: 5, y: 0 });
     
     this.init();
   }
@@ -34,6 +36,18 @@ class FreeFall extends AnimationBase {
     
     const obj = this.objects[0];
     
+    if (this.trajectory) {
+      const state = this.trajectoryAt(this.time);
+      obj.position.y = state.y;
+      obj.velocity.y = state.vy;
+      this.updateTrajectoryTrail(state);
+      if (this.time >= this.trajectoryEndTime()) {
+        obj.velocity.y = 0;
+        this.isEnded = true;
+      }
+      return;
+    }
+    
     // 更新速度
     obj.velocity.y += obj.acceleration.y * dt;
     
@@ -10,6 +10,7 @@ class ProjectileMotion extends AnimationBase {
     // 计算初速度分量
     this.vx0 = this.v0 * Math.cos(this.angle);
     this.vy0 = this.v0 * Math.sin(this.angle);
+    this.setTrajectory(params.trajectory, { x: 0, y: -this.g });
     
     // 计算关键点
     this.calcKeyPoints();
@@ -59,6 +60,10 @@ class ProjectileMotion extends AnimationBase {
   
   update(dt) {
     if (this.isEnded) return;
+    if (this.trajectory) {
+      this.updateFromTrajectory();
+      return;
+    }
     
     const obj = this.objects[0];
     
@@ -96,6 +101,36 @@ class ProjectileMotion extends AnimationBase {
     }
   }
   
+  // 后端给出了采样点：段内插值，最高点和落地直接取事件
+  updateFromTrajectory() {
+    const obj = this.objects[0];
+    const state = this.trajectoryAt(this.time);
+    obj.position.x = state.x;
+    obj.position.y = state.y;
+    obj.velocity.x = state.vx;
+    obj.velocity.y = state.vy;
+    this.updateTrajectoryTrail(state);
+    
+    const apex = this.trajectoryEvent('apex');
+    if (apex && this.time >= apex.t && this.keyPoints.length === 0) {
+      this.keyPoints.push({
+        x: apex.x,
+        y: apex.y,
+        label: '最高点',
+        data: {
+          time: apex.t,
+          height: apex.y,
+          velocity: apex.speed
+        }
+      });
+    }
+    
+    if (this.time >= this.trajectoryEndTime()) {
+      this.isEnded = true;
+      this.showResults();
+    }
+  }
+  
   draw() {
     super.draw();
     // 修改：移除 drawKeyPoints() 和 drawComponents()，因为需求只在小球上标注，super.draw() 已处理向量
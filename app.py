@@ -2,6 +2,14 @@ import os
 from flask import Flask, render_template, send_from_directory
 from config import Config
 from routes.upload import upload_bp
+from routes.metrics import metrics_bp
+from routes.bulk import bulk_bp
+from routes.upload_sessions import upload_sessions_bp
+from routes.archive import archive_bp
+from services.image_preprocess import is_preprocess_enabled
+from services.image_workers import warm_preprocess_pool
+from services.ingest import IngestRequest
+from services.motion_classifier import load_motion_classifier
 
 def create_app():
     # 兼容性环境变量（建议在导入 PaddleOCR 前设置）
@@ -9,12 +17,21 @@ def create_app():
 
     app = Flask(__name__)
     app.config.from_object(Config)
+    # 上传文件在解析请求体时直接计算摘要 / base64（见 services/ingest.py）
+    app.request_class = IngestRequest
+
+    # 加载本地运动类型分类器（MOTION_CLASSIFIER_PATH，未配置时跳过）
+    load_motion_classifier()
 
     # 确保 uploads 目录存在
     os.makedirs(app.config["UPLOAD_FOLDER"], exist_ok=True)
 
     # 注册蓝图
     app.register_blueprint(upload_bp)
+    app.register_blueprint(metrics_bp)
+    app.register_blueprint(bulk_bp)
+    app.register_blueprint(upload_sessions_bp)
+    app.register_blueprint(archive_bp)
 
     # 简单健康检查
     @app.get("/health")
@@ -43,4 +60,11 @@ def create_app():
 app = create_app()
 
 if __name__ == "__main__":
-    app.run(host="127.0.0.1", port=5000, debug=True)
+    debug = True
+    # 提前拉起图片预处理进程池，第一张图片不必等待 worker 启动。
+    # 不放在 create_app() 中：worker 启动时会以 __mp_main__ 重新导入本文件；
+    # debug 模式下 werkzeug 重载器在子进程中重新运行本文件，只在实际处理请求的子进程中拉起。
+    # 其他方式部署（gunicorn app:app 等）时进程池在第一张图片到达时创建。
+    if is_preprocess_enabled() and (not debug or os.environ.get("WERKZEUG_RUN_MAIN") == "true"):
+        warm_preprocess_pool()
+    app.run(host="127.0.0.1", port=5000, debug=debug)
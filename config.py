@@ -35,6 +35,16 @@ class Config:
     # 限制上传体积（可按需调整）
     MAX_CONTENT_LENGTH = 10 * 1024 * 1024  # 10MB
 
+    # 一道题最多允许的图片张数（题干 + 示意图、跨页题目等，一次请求发送）
+    MAX_IMAGES_PER_PROBLEM = int(os.environ.get("MAX_IMAGES_PER_PROBLEM", "4"))
+
+    # 上传图片只读文件头探测真实尺寸：边长 / 像素数超限（含解压炸弹）时在读入内存前拒绝
+    MAX_IMAGE_DIMENSION = int(os.environ.get("MAX_IMAGE_DIMENSION", "12000"))
+    MAX_IMAGE_PIXELS = int(os.environ.get("MAX_IMAGE_PIXELS", "60000000"))
+
+    # 单个 /upload 请求的截止时间（秒），传递给 OCR / Claude 的每一次外部调用（0 表示不限制）
+    REQUEST_DEADLINE_SECONDS = float(os.environ.get("REQUEST_DEADLINE_SECONDS", "90"))
+
     # ==================== OCR 配置 ====================
     # OCR Provider（paddle/mock/manual）
     OCR_PROVIDER = os.environ.get("OCR_PROVIDER", "paddle").lower()
@@ -0,0 +1,80 @@
+import logging
+from flask import Blueprint, request, jsonify, current_app
+
+from routes.upload import solve_uploaded_problem
+from services.image_archive import image_archive
+
+archive_bp = Blueprint("archive", __name__)
+logger = logging.getLogger(__name__)
+
+
+@archive_bp.get("/archive/<digest>")
+def archive_entry(digest: str):
+    """
+    查询一张归档图片（按原图 SHA-256 摘要）
+
+    返回：
+    {
+        "digest", "path", "format", "width", "height",
+        "original_bytes", "stored_bytes", "filename", "recompressed",
+        "uploads", "created_at", "last_access"
+    }
+    """
+    entry = image_archive.describe(digest)
+    if entry is None:
+        return jsonify({
+            "error": "not_archived",
+            "message": "归档中没有这张图片（未上传过或已被淘汰）"
+        }), 404
+    return jsonify(entry), 200
+
+
+@archive_bp.post("/archive/reprocess")
+def archive_reprocess():
+    """
+    用归档图片重新解析一道题（prompt / 模型更新后，不需要用户重新上传）
+
+    请求体（JSON）：
+    {
+        "digests": ["<sha256>", ...]   # 按顺序属于同一道题
+    }
+
+    返回格式同 /upload。结果按原图摘要 + 当前 prompt 版本 + 模型缓存，
+    prompt 未变化时直接命中已有结果。
+    """
+    payload = request.get_json(silent=True) or {}
+    digests = payload.get("digests")
+    if isinstance(digests, str):
+        digests = [digests]
+    if not isinstance(digests, list) or not digests or not all(isinstance(d, str) for d in digests):
+        return jsonify({
+            "error": "missing_digests",
+            "message": "请在 digests 中给出归档图片的摘要列表"
+        }), 400
+
+    max_images = current_app.config["MAX_IMAGES_PER_PROBLEM"]
+    if len(digests) > max_images:
+        return jsonify({
+            "error": "too_many_files",
+            "message": f"一道题最多上传 {max_images} 张图片"
+        }), 400
+
+    try:
+        images, missing = image_archive.load_many(digests)
+    except Exception as e:
+        logger.error(f"读取归档图片失败: {e}")
+        return jsonify({
+            "error": "archive_read_failed",
+            "message": "读取归档图片失败",
+            "details": str(e)
+        }), 500
+    if missing:
+        return jsonify({
+            "error": "not_archived",
+            "message": "部分图片不在归档中（未上传过或已被淘汰）",
+            "details": missing
+        }), 404
+
+    logger.info(f"用归档图片重新解析：{len(images)} 张图片")
+    response, status = solve_uploaded_problem(images, archive=False)
+    return jsonify(response), status
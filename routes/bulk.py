@@ -0,0 +1,206 @@
+import logging
+from flask import Blueprint, request, jsonify, current_app
+
+from routes.upload import allowed_file
+from services.admission import admission_controlled
+from services.image_probe import ImageRejected
+from services.ingest import ingest_upload
+from services.batch_service import (
+    add_bulk_images,
+    close_bulk_job,
+    get_job_results,
+    list_jobs,
+    open_bulk_job,
+    resume_bulk_job,
+    submit_bulk_job,
+)
+
+bulk_bp = Blueprint("bulk", __name__)
+logger = logging.getLogger(__name__)
+
+
+def _ingest_files():
+    """读取请求中的 files 字段
+
+    Returns:
+        (images, None) 或 (None, 错误响应)
+    """
+    files = [f for f in request.files.getlist("files") if f and f.filename]
+    if not files:
+        return None, (jsonify({
+            "error": "missing_input",
+            "message": "请通过 files 字段上传至少一张图片",
+            "examples": {
+                "bulk_mode": "curl -X POST .../bulk -F 'files=@a.jpg' -F 'files=@b.jpg'"
+            }
+        }), 400)
+
+    images = []
+    for f in files:
+        if not allowed_file(f.filename):
+            return None, (jsonify({
+                "error": "unsupported_file_type",
+                "message": f"不支持的文件类型: {f.filename}，仅支持: {', '.join(current_app.config['ALLOWED_EXTENSIONS'])}"
+            }), 400)
+        try:
+            images.append(ingest_upload(f))
+        except ImageRejected as e:
+            return None, (jsonify({
+                "error": e.code,
+                "message": f"图片不可用: {f.filename}",
+                "details": e.message
+            }), e.status)
+    return images, None
+
+
+def _job_not_found(e: FileNotFoundError):
+    return jsonify({
+        "error": "job_not_found",
+        "message": "批量任务不存在",
+        "details": str(e)
+    }), 404
+
+
+def _invalid_request(e: ValueError):
+    logger.error(f"参数错误: {e}")
+    return jsonify({
+        "error": "invalid_request",
+        "message": "请求参数错误",
+        "details": str(e)
+    }), 400
+
+
+def _submit_failed(e: RuntimeError):
+    logger.error(f"批量提交失败: {e}")
+    return jsonify({
+        "error": "bulk_submit_failed",
+        "message": "批量提交失败（任务状态已保存，可稍后通过 POST /bulk/<job_id>/submit 重试）",
+        "details": str(e)
+    }), 500
+
+
+@bulk_bp.post("/bulk")
+@admission_controlled
+def bulk_submit():
+    """
+    批量提交题目图片（Message Batches API，离线处理）
+
+    请求参数：
+    - files: 多个图片文件（multipart/form-data，同名字段重复）
+
+    返回（202）：任务摘要 {"job_id", "status", "total", "counts", "batches"}
+    之后通过 GET /bulk/<job_id> 轮询进度（提交失败时用 POST /bulk/<job_id>/submit 重试）
+
+    整个请求体受 MAX_CONTENT_LENGTH 限制；图片较多时改用
+    POST /bulk/open → POST /bulk/<job_id>/files（可多次）→ POST /bulk/<job_id>/submit
+    """
+    images, error = _ingest_files()
+    if error:
+        return error
+
+    try:
+        summary = submit_bulk_job((image.filename, image.data) for image in images)
+        logger.info(f"✅ 批量任务已提交: {summary['job_id']}（{summary['total']} 张）")
+        return jsonify(summary), 202
+
+    except ValueError as e:
+        return _invalid_request(e)
+
+    except RuntimeError as e:
+        return _submit_failed(e)
+
+
+@bulk_bp.post("/bulk/open")
+def bulk_open():
+    """
+    创建空的批量任务，之后分多次请求追加图片
+
+    返回（201）：任务摘要（status 为 open）
+    """
+    return jsonify(open_bulk_job()), 201
+
+
+@bulk_bp.post("/bulk/<job_id>/files")
+@admission_controlled
+def bulk_add_files(job_id: str):
+    """
+    向 open 状态的任务追加图片（每个请求仍受 MAX_CONTENT_LENGTH 限制）
+
+    请求参数：
+    - files: 多个图片文件（multipart/form-data，同名字段重复）
+
+    返回（200）：任务摘要
+    """
+    images, error = _ingest_files()
+    if error:
+        return error
+
+    try:
+        return jsonify(add_bulk_images(job_id, ((image.filename, image.data) for image in images))), 200
+
+    except FileNotFoundError as e:
+        return _job_not_found(e)
+
+    except ValueError as e:
+        return _invalid_request(e)
+
+
+@bulk_bp.post("/bulk/<job_id>/submit")
+def bulk_close(job_id: str):
+    """
+    结束追加并提交任务；已提交的任务提交遗留批次（提交失败后重试）
+
+    返回（202）：任务摘要，之后通过 GET /bulk/<job_id> 轮询进度
+    """
+    try:
+        summary = close_bulk_job(job_id)
+        logger.info(f"✅ 批量任务已提交: {job_id}（{summary['total']} 张）")
+        return jsonify(summary), 202
+
+    except FileNotFoundError as e:
+        return _job_not_found(e)
+
+    except ValueError as e:
+        return _invalid_request(e)
+
+    except RuntimeError as e:
+        return _submit_failed(e)
+
+
+@bulk_bp.get("/bulk")
+def bulk_list():
+    """列出所有批量任务"""
+    return jsonify({"jobs": list_jobs()}), 200
+
+
+@bulk_bp.get("/bulk/<job_id>")
+def bulk_status(job_id: str):
+    """
+    查询批量任务进度（刷新已提交批次的状态并收集结果；不提交新批次，遗留批次用 POST /bulk/<job_id>/submit 提交）
+
+    查询参数：
+    - results=1: 附带每张图片的结果
+    """
+    try:
+        summary = resume_bulk_job(job_id, submit=False)
+        if request.args.get("results") in ("1", "true", "yes"):
+            summary["results"] = get_job_results(job_id)
+        return jsonify(summary), 200
+
+    except FileNotFoundError as e:
+        return _job_not_found(e)
+
+    except ValueError as e:
+        return jsonify({
+            "error": "invalid_request",
+            "message": "请求参数错误",
+            "details": str(e)
+        }), 400
+
+    except Exception as e:
+        logger.error(f"查询批量任务失败: {e}")
+        return jsonify({
+            "error": "bulk_status_failed",
+            "message": "查询批量任务失败",
+            "details": str(e)
+        }), 500
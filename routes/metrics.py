@@ -0,0 +1,254 @@
+import logging
+from flask import Blueprint, jsonify
+
+from services.admission import get_admission_stats
+from services.image_archive import get_archive_stats
+from services.image_preprocess import get_tier_stats
+from services.image_workers import get_preprocess_pool_stats
+from services.llm_service import get_fast_path_stats
+from services.pipeline_router import get_router_stats
+from services.prompt_registry import get_prompt_stats
+from services.result_store import result_store
+from services.shadow_eval import get_shadow_stats
+from services.upload_sessions import get_upload_session_stats
+from services.usage_tracker import get_budget_status, usage_tracker
+
+metrics_bp = Blueprint("metrics", __name__)
+logger = logging.getLogger(__name__)
+
+
+@metrics_bp.get("/pipeline/usage")
+def pipeline_usage():
+    """
+    Token 用量统计接口
+
+    返回：
+    {
+        "windows": {"hour": {...}, "day": {...}},   # 按 pipeline/model/problem_type 细分
+        "lifetime": {"requests", "input_tokens", "output_tokens"},
+        "budget": {"tier": "full/slim/rule_engine", "windows": {...}}
+    }
+    """
+    try:
+        summary = usage_tracker.summary()
+        summary["budget"] = get_budget_status()
+        return jsonify(summary), 200
+    except Exception as e:
+        logger.error(f"获取 token 用量失败: {e}")
+        return jsonify({
+            "error": "usage_check_failed",
+            "message": "获取 token 用量失败",
+            "details": str(e)
+        }), 500
+
+
+@metrics_bp.get("/pipeline/prompts")
+def pipeline_prompts():
+    """
+    Prompt 变体 A/B 统计接口
+
+    返回：
+    {
+        "prompts": {"multimodal": {"v1": {...}, "v2-compact": {...}}, "text": {...}},
+        "cache": {"size", "capacity", "hits", "misses"}
+    }
+    """
+    try:
+        return jsonify({
+            "prompts": get_prompt_stats(),
+            "cache": result_store.stats(),
+        }), 200
+    except Exception as e:
+        logger.error(f"获取 prompt 统计失败: {e}")
+        return jsonify({
+            "error": "prompt_stats_failed",
+            "message": "获取 prompt 统计失败",
+            "details": str(e)
+        }), 500
+
+
+@metrics_bp.get("/pipeline/router")
+def pipeline_router_stats():
+    """
+    Pipeline 路由统计接口（PIPELINE_MODE=auto 时用于选择路径）
+
+    返回：
+    {
+        "multimodal": {"requests", "failures", "avg_latency_s", "avg_tokens", "success_rate", "score"},
+        "two_stage": {...},
+        "rule_engine": {...}
+    }
+    """
+    try:
+        return jsonify(get_router_stats()), 200
+    except Exception as e:
+        logger.error(f"获取路由统计失败: {e}")
+        return jsonify({
+            "error": "router_stats_failed",
+            "message": "获取路由统计失败",
+            "details": str(e)
+        }), 500
+
+
+@metrics_bp.get("/pipeline/tiers")
+def pipeline_tier_stats():
+    """
+    渐进分辨率档位统计接口
+
+    返回：
+    {
+        "ladder": [1092, 1568],
+        "enabled": bool,
+        "tiers": {
+            "1092": {"requests", "accepted", "escalated", "invalid", "success_rate", "avg_input_tokens"},
+            ...
+        }
+    }
+    """
+    try:
+        return jsonify(get_tier_stats()), 200
+    except Exception as e:
+        logger.error(f"获取分辨率档位统计失败: {e}")
+        return jsonify({
+            "error": "tier_stats_failed",
+            "message": "获取分辨率档位统计失败",
+            "details": str(e)
+        }), 500
+
+
+@metrics_bp.get("/pipeline/preprocess-pool")
+def pipeline_preprocess_pool():
+    """
+    图片预处理进程池统计接口
+
+    返回：
+    {
+        "workers", "running",
+        "pools_created", "pool_resets", "pool_images", "inline_fallbacks"
+    }
+    """
+    try:
+        return jsonify(get_preprocess_pool_stats()), 200
+    except Exception as e:
+        logger.error(f"获取预处理进程池统计失败: {e}")
+        return jsonify({
+            "error": "preprocess_pool_stats_failed",
+            "message": "获取预处理进程池统计失败",
+            "details": str(e)
+        }), 500
+
+
+@metrics_bp.get("/pipeline/admission")
+def pipeline_admission():
+    """
+    上传内存预算 / 准入控制统计接口
+
+    返回：
+    {
+        "capacity_bytes", "in_use_bytes", "peak_bytes", "utilization",
+        "active", "waiting", "admitted", "queued", "rejected",
+        "avg_queue_wait_ms", "avg_hold_s", "memory_factor"
+    }
+    """
+    try:
+        return jsonify(get_admission_stats()), 200
+    except Exception as e:
+        logger.error(f"获取准入控制统计失败: {e}")
+        return jsonify({
+            "error": "admission_stats_failed",
+            "message": "获取准入控制统计失败",
+            "details": str(e)
+        }), 500
+
+
+@metrics_bp.get("/pipeline/upload-sessions")
+def pipeline_upload_sessions():
+    """
+    分块上传会话统计接口
+
+    返回：
+    {
+        "sessions", "states", "spool_reserved_bytes", "spool_capacity_bytes",
+        "created", "finalized", "expired", "aborted", "rejected",
+        "chunks", "resumed_chunks", "duplicate_bytes", "interrupted_chunks"
+    }
+    """
+    try:
+        return jsonify(get_upload_session_stats()), 200
+    except Exception as e:
+        logger.error(f"获取上传会话统计失败: {e}")
+        return jsonify({
+            "error": "upload_session_stats_failed",
+            "message": "获取上传会话统计失败",
+            "details": str(e)
+        }), 500
+
+
+@metrics_bp.get("/pipeline/archive")
+def pipeline_archive():
+    """
+    上传图片归档统计接口
+
+    返回：
+    {
+        "enabled", "directory", "images", "stored_bytes", "original_bytes", "compression_ratio",
+        "capacity_bytes", "queued", "stored", "deduplicated", "recompressed", "evicted",
+        "dropped", "failed", "avg_recompress_ms"
+    }
+    """
+    try:
+        return jsonify(get_archive_stats()), 200
+    except Exception as e:
+        logger.error(f"获取归档统计失败: {e}")
+        return jsonify({
+            "error": "archive_stats_failed",
+            "message": "获取归档统计失败",
+            "details": str(e)
+        }), 500
+
+
+@metrics_bp.get("/pipeline/fast-path")
+def pipeline_fast_path():
+    """
+    文本解析快速路径统计接口（规则引擎置信度达到阈值时跳过 Claude）
+
+    返回：
+    {
+        "threshold": 0.9,   # null 表示关闭
+        "classifier": {"path", "labels"},   # 未加载本地分类器时为 null
+        "motion_types": {"projectile": {"requests", "fast_path", "claude", "fallback", "rule_engine",
+                                        "avg_confidence", "fast_path_rate", "threshold"}, ...}
+    }
+    """
+    try:
+        return jsonify(get_fast_path_stats()), 200
+    except Exception as e:
+        logger.error(f"获取快速路径统计失败: {e}")
+        return jsonify({
+            "error": "fast_path_stats_failed",
+            "message": "获取快速路径统计失败",
+            "details": str(e)
+        }), 500
+
+
+@metrics_bp.get("/pipeline/shadow")
+def pipeline_shadow():
+    """
+    规则引擎影子评估接口（规则引擎与 Claude 结果的逐字段一致率）
+
+    返回：
+    {
+        "enabled", "log", "window", "target", "min_samples", "samples", "queued", "evaluated", "dropped", "failed",
+        "problem_types": {"projectile": {"samples", "agreement", "fields": {"motion_type": 0.98, ...}}, ...},
+        "fast_path_thresholds": {"projectile": {"samples", "agreement", "threshold", "enough_samples"}, ...}
+    }
+    """
+    try:
+        return jsonify(get_shadow_stats()), 200
+    except Exception as e:
+        logger.error(f"获取影子评估统计失败: {e}")
+        return jsonify({
+            "error": "shadow_stats_failed",
+            "message": "获取影子评估统计失败",
+            "details": str(e)
+        }), 500
@@ -1,9 +1,16 @@
 import os
 import logging
-from flask import Blueprint, request, jsonify, current_app
+from typing import Optional, Tuple
+from flask import Blueprint, request, jsonify, current_app, url_for
 from werkzeug.utils import secure_filename
 
+from services.admission import admission_controlled
 from services.claude_pipeline import process_image, get_pipeline_status
+from services.deadline import Deadline, DeadlineExceeded, RequestCancelled, watch_disconnect
+from services.image_archive import image_archive
+from services.image_preprocess import get_client_upload_target
+from services.image_probe import ImageRejected, allowed_formats_for_extensions
+from services.ingest import ingest_upload
 
 upload_bp = Blueprint("upload", __name__)
 logger = logging.getLogger(__name__)
@@ -15,18 +22,24 @@ def allowed_file(filename: str) -> bool:
 
 
 @upload_bp.post("/upload")
+@admission_controlled
 def upload():
     """
     接收题目图片 -> Claude 多模态 Pipeline (OCR + 解析 + 动画指令) -> 返回统一 JSON
 
-    支持两种模式（通过环境变量 PIPELINE_MODE 控制）：
+    支持以下模式（通过环境变量 PIPELINE_MODE 控制）：
     1. claude: 使用 Claude API 多模态能力（需要上传图片）
-    2. manual: 使用手动文本输入（需要提供 manual_text 参数）
+    2. two_stage: Mathpix OCR + 纯文本 Claude 解析（需要上传图片）
+    3. auto: 按观测到的延迟 / 成本 / 成功率在上述路径和规则引擎间路由
+    4. manual: 使用手动文本输入（需要提供 manual_text 参数）
 
     请求参数：
-    - file: 图片文件（claude 模式必需）
+    - file: 图片文件（claude 模式必需）；同一道题跨多张图片时可重复提交多个 file 字段，
+      按提交顺序作为一道题在一次调用中处理（上限 MAX_IMAGES_PER_PROBLEM）
     - manual_text: 手动输入的题目文本（manual 模式必需）
 
+    进程级内存预算不足时（见 services/admission.py）排队片刻，仍不足则返回 503 + Retry-After。
+
     返回格式：
     {
         "problem_type": str,
@@ -39,29 +52,43 @@ def upload():
     # 1. 获取 manual_text（如果有）
     manual_text = request.form.get("manual_text", "").strip() or None
 
-    # 2. 处理图片上传（如果有）
-    image_bytes = None
-    if "file" in request.files:
-        f = request.files["file"]
-        if f and f.filename != "":
-            # 检查文件类型
-            if not allowed_file(f.filename):
-                return jsonify({
-                    "error": "unsupported_file_type",
-                    "message": f"不支持的文件类型，仅支持: {', '.join(current_app.config['ALLOWED_EXTENSIONS'])}"
-                }), 400
-
-            # 读取图片字节（不保存到磁盘，直接传给 Claude）
-            try:
-                image_bytes = f.read()
-                logger.info(f"收到图片: {f.filename}（{len(image_bytes)} 字节）")
-            except Exception as e:
-                logger.error(f"读取图片失败: {e}")
-                return jsonify({
-                    "error": "file_read_failed",
-                    "message": "读取图片失败",
-                    "details": str(e)
-                }), 500
+    # 2. 处理图片上传（如果有，可按顺序上传多张）
+    files = [f for f in request.files.getlist("file") if f and f.filename != ""]
+    max_images = current_app.config["MAX_IMAGES_PER_PROBLEM"]
+    if len(files) > max_images:
+        return jsonify({
+            "error": "too_many_files",
+            "message": f"一道题最多上传 {max_images} 张图片"
+        }), 400
+
+    images = []
+    for f in files:
+        # 检查文件类型
+        if not allowed_file(f.filename):
+            return jsonify({
+                "error": "unsupported_file_type",
+                "message": f"不支持的文件类型，仅支持: {', '.join(current_app.config['ALLOWED_EXTENSIONS'])}"
+            }), 400
+
+        # 接收图片：摘要和 base64 在解析请求体时已一次算好（见 services/ingest.py）
+        try:
+            image = ingest_upload(f)
+            logger.info(f"收到图片: {f.filename}（{image.size} 字节，{image.info['width']}x{image.info['height']}）")
+        except ImageRejected as e:
+            # 格式不对 / 尺寸过大 / 疑似解压炸弹：只读了文件头就已拒绝
+            return jsonify({
+                "error": e.code,
+                "message": f"图片不可用: {f.filename}",
+                "details": e.message
+            }), e.status
+        except Exception as e:
+            logger.error(f"读取图片失败: {e}")
+            return jsonify({
+                "error": "file_read_failed",
+                "message": "读取图片失败",
+                "details": str(e)
+            }), 500
+        images.append(image)
 
     # 3. 检查参数完整性并智能选择 Pipeline
     pipeline_mode = os.environ.get("PIPELINE_MODE", "claude").lower()
@@ -73,10 +100,10 @@ def upload():
         # 有 manual_text，强制使用 manual pipeline
         actual_mode = "manual"
         logger.info("检测到 manual_text，使用 manual pipeline")
-    elif image_bytes:
+    elif images:
         # 有图片，使用配置的模式
         actual_mode = pipeline_mode
-        logger.info(f"检测到图片上传，使用 {actual_mode} pipeline")
+        logger.info(f"检测到 {len(images)} 张图片上传，使用 {actual_mode} pipeline")
     else:
         # 什么都没有，返回错误
         return jsonify({
@@ -84,35 +111,76 @@ def upload():
             "message": "请提供图片文件或 manual_text 参数",
             "examples": {
                 "claude_mode": "curl -X POST .../upload -F 'file=@image.jpg'",
+                "multi_image": "curl -X POST .../upload -F 'file=@stem.jpg' -F 'file=@diagram.jpg'",
                 "manual_mode": "curl -X POST .../upload -F 'manual_text=题目文本'"
             }
         }), 400
 
     # 验证必要参数
-    if actual_mode == "claude" and not image_bytes:
+    if actual_mode in ("claude", "two_stage", "auto") and not images:
         return jsonify({
             "error": "missing_file",
-            "message": "claude 模式需要上传图片文件",
+            "message": f"{actual_mode} 模式需要上传图片文件",
             "suggestion": "请上传图片，或提供 manual_text 参数"
         }), 400
 
     # 4. 调用 Claude Pipeline 或 Manual Pipeline
+    response, status = solve_uploaded_problem(images, manual_text)
+    return jsonify(response), status
+
+
+def solve_uploaded_problem(images: list, manual_text: Optional[str] = None, archive: bool = True) -> Tuple[dict, int]:
+    """
+    调用 Claude Pipeline 或 Manual Pipeline 并构建统一格式的响应
+
+    /upload、分块上传会话的 finalize（routes/upload_sessions.py）和归档重新解析（routes/archive.py）共用。
+    archive 为 True 时，处理结束后（不论成败）把图片交给后台归档（见 services/image_archive.py）。
+
+    Returns:
+        (响应 JSON, HTTP 状态码)
+    """
+    # 请求体已读完：创建截止时间，并在客户端断开时取消后续的外部调用
+    deadline = Deadline(current_app.config["REQUEST_DEADLINE_SECONDS"])
     try:
-        result = process_image(
-            image_source=image_bytes,
-            manual_text=manual_text
-        )
+        with watch_disconnect(request.environ, deadline):
+            try:
+                result = process_image(
+                    image_source=images,
+                    manual_text=manual_text,
+                    deadline=deadline
+                )
+            finally:
+                if archive and images:
+                    image_archive.submit(images)
+
+        logger.info(f"✅ Pipeline 处理成功: {result.get('problem_type')}（{deadline.elapsed():.1f}s）")
+
+    except RequestCancelled as e:
+        # 客户端已断开，响应不会被读取
+        logger.warning(f"⚠️  {e}")
+        return {
+            "error": "client_disconnected",
+            "message": "客户端已断开连接，请求已取消"
+        }, 499
 
-        logger.info(f"✅ Pipeline 处理成功: {result.get('problem_type')}")
+    except DeadlineExceeded as e:
+        # 超过截止时间（504）
+        logger.error(f"❌ {e}")
+        return {
+            "error": "deadline_exceeded",
+            "message": "处理超时",
+            "details": str(e),
+            "suggestion": "请稍后重试，或减少图片数量 / 改用 manual 模式"
+        }, 504
 
     except ValueError as e:
         # 参数错误（400）
         logger.error(f"参数错误: {e}")
-        return jsonify({
+        return {
             "error": "invalid_request",
             "message": "请求参数错误",
             "details": str(e)
-        }), 400
+        }, 400
 
     except RuntimeError as e:
         # Pipeline 执行失败（500）
@@ -123,23 +191,23 @@ def upload():
         if "api" in error_msg.lower() and "key" in error_msg.lower():
             error_msg = "API 调用失败，请检查环境变量配置"
 
-        return jsonify({
+        return {
             "error": "pipeline_failed",
             "message": "处理失败",
             "details": error_msg,
             "suggestion": "请检查日志或切换到 manual 模式"
-        }), 500
+        }, 500
 
     except Exception as e:
         # 未知错误（500）
         logger.error(f"未知错误: {e}", exc_info=True)
-        return jsonify({
+        return {
             "error": "unknown_error",
             "message": "未知错误",
             "details": str(e)
-        }), 500
+        }, 500
 
-    # 5. 构建响应（统一格式）
+    # 构建响应（统一格式）
     try:
         response = {
             "problem_type": result.get("problem_type", "unknown"),
@@ -153,15 +221,15 @@ def upload():
             response["parameters"] = result["parameters"]
 
         logger.info("✅ 响应构建成功")
-        return jsonify(response), 200
+        return response, 200
 
     except Exception as e:
         logger.error(f"构建响应失败: {e}")
-        return jsonify({
+        return {
             "error": "response_build_failed",
             "message": "构建响应失败",
             "details": str(e)
-        }), 500
+        }, 500
 
 
 @upload_bp.get("/pipeline/status")
@@ -186,3 +254,43 @@ def pipeline_status():
             "message": "获取 Pipeline 状态失败",
             "details": str(e)
         }), 500
+
+
+@upload_bp.get("/upload/config")
+def upload_config():
+    """
+    上传前端配置接口：浏览器按这里的目标分辨率缩放并重新压缩图片后再上传（见 static/image_compress.js）
+
+    返回：
+    {
+        "max_images": int,
+        "max_content_length": int,
+        "resize": {
+            "enabled": bool,
+            "max_long_edge": int,
+            "max_pixels": int,
+            "format": "jpeg" | "webp",
+            "mime_type": str,
+            "quality": float,
+            "worker_url": str
+        }
+    }
+    """
+    try:
+        target = get_client_upload_target()
+        # 服务端编码格式不在上传白名单中时（如 webp）浏览器改用 JPEG
+        if target["format"] not in allowed_formats_for_extensions(current_app.config["ALLOWED_EXTENSIONS"]):
+            target.update(format="jpeg", mime_type="image/jpeg")
+        target["worker_url"] = url_for("static", filename="image_compress.js")
+        return jsonify({
+            "max_images": current_app.config["MAX_IMAGES_PER_PROBLEM"],
+            "max_content_length": current_app.config["MAX_CONTENT_LENGTH"],
+            "resize": target,
+        }), 200
+    except Exception as e:
+        logger.error(f"获取上传配置失败: {e}")
+        return jsonify({
+            "error": "upload_config_failed",
+            "message": "获取上传配置失败",
+            "details": str(e)
+        }), 500
@@ -0,0 +1,215 @@
+import logging
+from typing import Optional
+from flask import Blueprint, request, jsonify, current_app
+from werkzeug.exceptions import ClientDisconnected
+
+from routes.upload import allowed_file, solve_uploaded_problem
+from services.admission import busy_response, estimate_request_cost, get_admission_wait, upload_budget
+from services.image_probe import ImageRejected
+from services.ingest import get_upload_limits
+from services.upload_sessions import SessionError, upload_sessions
+
+upload_sessions_bp = Blueprint("upload_sessions", __name__)
+logger = logging.getLogger(__name__)
+
+
+def _session_error(e: SessionError):
+    body = {"error": e.code, "message": e.message}
+    if e.details:
+        body["details"] = e.details
+    return jsonify(body), e.status
+
+
+def _image_rejected(e: ImageRejected, filename: Optional[str] = None):
+    return jsonify({
+        "error": e.code,
+        "message": f"图片不可用: {filename}" if filename else "图片不可用",
+        "details": e.message
+    }), e.status
+
+
+@upload_sessions_bp.post("/upload/sessions")
+def create_session():
+    """
+    创建分块上传会话（网络不稳定时代替一次性的 multipart /upload，断线后从断点续传）
+
+    请求体（JSON）：
+    {
+        "files": [{"filename": "stem.jpg", "size": 4718592}, ...]   # 按顺序属于同一道题
+    }
+
+    返回（201）：
+    {
+        "session_id": str,
+        "state": "open",
+        "files": [{"index", "filename", "size", "received"}],
+        "expires_in": int
+    }
+
+    之后：
+    - PUT /upload/sessions/<id>/files/<index>（请求头 Upload-Offset）上传分块
+    - GET /upload/sessions/<id> 查询已收到的字节数
+    - POST /upload/sessions/<id>/finalize 结束上传并解析题目（返回格式同 /upload）
+    """
+    payload = request.get_json(silent=True) or {}
+    files = payload.get("files")
+    if not isinstance(files, list) or not files:
+        return jsonify({
+            "error": "missing_files",
+            "message": "请在 files 中声明要上传的文件（filename + size）"
+        }), 400
+
+    max_images = current_app.config["MAX_IMAGES_PER_PROBLEM"]
+    if len(files) > max_images:
+        return jsonify({
+            "error": "too_many_files",
+            "message": f"一道题最多上传 {max_images} 张图片"
+        }), 400
+
+    declared = []
+    max_size = current_app.config["MAX_CONTENT_LENGTH"]
+    for item in files:
+        filename = str(item.get("filename", "")) if isinstance(item, dict) else ""
+        size = item.get("size") if isinstance(item, dict) else None
+        if not filename or not allowed_file(filename):
+            return jsonify({
+                "error": "unsupported_file_type",
+                "message": f"不支持的文件类型，仅支持: {', '.join(current_app.config['ALLOWED_EXTENSIONS'])}",
+                "details": filename
+            }), 400
+        if not isinstance(size, int) or isinstance(size, bool) or size <= 0:
+            return jsonify({
+                "error": "invalid_file_size",
+                "message": f"文件大小无效: {filename}",
+            }), 400
+        if max_size and size > max_size:
+            return jsonify({
+                "error": "file_too_large",
+                "message": f"文件超过 {max_size // (1024 * 1024)}MB: {filename}",
+            }), 413
+        declared.append((filename, size))
+
+    try:
+        session = upload_sessions.create(declared, get_upload_limits())
+    except SessionError as e:
+        return _session_error(e)
+    except Exception as e:
+        logger.error(f"创建上传会话失败: {e}")
+        return jsonify({
+            "error": "session_create_failed",
+            "message": "创建上传会话失败",
+            "details": str(e)
+        }), 500
+    return jsonify(session.summary()), 201
+
+
+@upload_sessions_bp.get("/upload/sessions/<session_id>")
+def session_status(session_id: str):
+    """查询会话状态和每个文件已收到的字节数（断线后据此续传）"""
+    try:
+        session = upload_sessions.get(session_id)
+    except SessionError as e:
+        return _session_error(e)
+    return jsonify(session.summary()), 200
+
+
+@upload_sessions_bp.put("/upload/sessions/<session_id>/files/<int:index>")
+def upload_chunk(session_id: str, index: int):
+    """
+    上传一个分块（请求体为原始字节）
+
+    请求头：
+    - Upload-Offset: 分块在文件中的起始位置；小于已收到的字节数时重叠部分会被跳过，
+      大于时返回 409 和服务端已收到的字节数
+
+    返回：{"index", "received", "size", "complete"}，响应头 Upload-Offset 为已收到的字节数
+    """
+    try:
+        offset = int(request.headers.get("Upload-Offset", ""))
+        if offset < 0:
+            raise ValueError
+    except ValueError:
+        return jsonify({
+            "error": "missing_offset",
+            "message": "请在 Upload-Offset 请求头中给出分块的起始位置"
+        }), 400
+
+    try:
+        session = upload_sessions.get(session_id)
+        received = upload_sessions.write_chunk(session, index, offset, request.stream.read)
+    except SessionError as e:
+        return _session_error(e)
+    except ImageRejected as e:
+        # 第一块就能探测出格式 / 尺寸：拒绝后整个会话作废，释放已占用的空间
+        upload_sessions.remove(session, reason="rejected")
+        return _image_rejected(e, session.files[index].filename)
+    except (ClientDisconnected, OSError):
+        # 已收到的数据保留，客户端重连后查询偏移继续
+        target = session.files[index]
+        logger.warning(f"⚠️  上传会话 {session_id} 分块中断，已收到 {target.received}/{target.size} 字节")
+        return jsonify({
+            "error": "client_disconnected",
+            "message": "连接中断，请查询已收到的字节数后续传"
+        }), 400
+
+    target = session.files[index]
+    response = jsonify({
+        "index": index,
+        "received": received,
+        "size": target.size,
+        "complete": target.complete,
+    })
+    response.headers["Upload-Offset"] = str(received)
+    return response, 200
+
+
+@upload_sessions_bp.post("/upload/sessions/<session_id>/finalize")
+def finalize_session(session_id: str):
+    """
+    结束上传并解析题目（返回格式同 /upload）
+
+    所有文件都已传完时才会处理；已经 finalize 过的会话直接返回上次的结果（响应丢失时可安全重试）。
+    进程级内存预算不足时（见 services/admission.py）返回 503 + Retry-After，会话保留，稍后重试即可。
+    """
+    try:
+        session = upload_sessions.get(session_id)
+        if session.result is not None:
+            response, status = session.result
+            return jsonify(response), status
+
+        cost = estimate_request_cost(session.total_size)
+        reservation = upload_budget.try_reserve(cost, get_admission_wait())
+        if reservation is None:
+            return busy_response(cost)
+
+        with reservation:
+            images = upload_sessions.begin_finalize(session)
+            if images is None:
+                response, status = session.result
+                return jsonify(response), status
+            logger.info(f"上传会话 {session_id} 完成：{len(images)} 张图片，共 {session.total_size} 字节")
+            response, status = solve_uploaded_problem(images)
+            if status == 499:
+                # 客户端在处理中途断开：会话回到 open（图片已接收完毕），重连后再次 finalize 即可
+                upload_sessions.abandon_finalize(session)
+            else:
+                # 其他结果（含错误）保留到会话过期，重复 finalize 直接返回
+                upload_sessions.complete_finalize(session, (response, status))
+            return jsonify(response), status
+
+    except SessionError as e:
+        return _session_error(e)
+    except ImageRejected as e:
+        upload_sessions.remove(session, reason="rejected")
+        return _image_rejected(e)
+
+
+@upload_sessions_bp.delete("/upload/sessions/<session_id>")
+def abort_session(session_id: str):
+    """放弃上传，立即删除已收到的分块"""
+    try:
+        session = upload_sessions.get(session_id)
+    except SessionError as e:
+        return _session_error(e)
+    upload_sessions.remove(session, reason="aborted")
+    return "", 204
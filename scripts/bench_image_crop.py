@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+文字区域裁剪基准测试：不同图片尺寸下的裁剪检测耗时，以及裁剪前后的字节数 / image tokens
+
+使用方法：
+  # 不带参数：合成 12MP 题目照片，测 12MP / 3MP / 1568px 三种尺寸
+  python scripts/bench_image_crop.py
+
+  # 指定图片或目录与测试尺寸
+  python scripts/bench_image_crop.py photos/ --size 4032x3024 1568x1176
+"""
+
+import argparse
+import io
+import statistics
+import sys
+import time
+from pathlib import Path
+
+# 添加项目根目录到 Python 路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from PIL import Image, ImageOps
+
+from bench_image_preprocess import collect_images, make_sample_photo
+from services.image_preprocess import (
+    crop_to_content,
+    estimate_image_tokens,
+    get_preprocess_settings,
+    preprocess_image,
+)
+
+DEFAULT_SIZES = ["4032x3024", "2016x1512", "1568x1176"]
+
+
+def parse_size(raw: str):
+    width, _, height = raw.lower().partition("x")
+    return int(width), int(height)
+
+
+def resize_to(data: bytes, size) -> Image.Image:
+    """解码、旋正并缩放到指定尺寸（按原图方向对齐长短边）"""
+    with Image.open(io.BytesIO(data)) as img:
+        img = ImageOps.exif_transpose(img).convert("RGB")
+    long_edge, short_edge = max(size), min(size)
+    if img.size[0] >= img.size[1]:
+        target = (long_edge, short_edge)
+    else:
+        target = (short_edge, long_edge)
+    return img if img.size == target else img.resize(target, Image.BILINEAR)
+
+
+def bench_crop_time(img: Image.Image, repeat: int):
+    crop_to_content(img)  # 预热（NumPy 首次调用）
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        _, box = crop_to_content(img)
+        timings.append((time.perf_counter() - started) * 1000)
+    return box, statistics.median(timings), max(timings)
+
+
+def bench_end_to_end(data: bytes):
+    """完整预处理（含 draft 解码）开 / 关裁剪的字节数与 tokens"""
+    base = get_preprocess_settings()
+    rows = {}
+    for label, crop in (("不裁剪", False), ("裁剪", True)):
+        processed, info = preprocess_image(data, dict(base, crop=crop))
+        width, height = info.get("size", (0, 0))
+        rows[label] = (len(processed), estimate_image_tokens(width, height), info.get("crop_box"), info.get("elapsed_ms"))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="文字区域裁剪基准测试")
+    parser.add_argument("paths", nargs="*", help="图片文件或目录（默认生成合成照片）")
+    parser.add_argument("--size", nargs="+", default=DEFAULT_SIZES, help="测试尺寸，如 4032x3024")
+    parser.add_argument("--repeat", type=int, default=9, help="每个尺寸重复次数（取中位数）")
+    args = parser.parse_args()
+
+    images = collect_images(args.paths) if args.paths else [("synthetic_12mp.jpg", make_sample_photo())]
+    if not images:
+        print("❌ 没有找到图片")
+        sys.exit(1)
+
+    print(f"{'图片':<24}{'尺寸':>12}{'中位ms':>9}{'最大ms':>9}{'裁剪面积':>10}  裁剪框")
+    for name, data in images:
+        for raw_size in args.size:
+            img = resize_to(data, parse_size(raw_size))
+            box, median_ms, max_ms = bench_crop_time(img, args.repeat)
+            if box:
+                ratio = (box[2] - box[0]) * (box[3] - box[1]) / (img.size[0] * img.size[1])
+                ratio_text = f"{ratio:.1%}"
+            else:
+                ratio_text = "整图"
+            print(
+                f"{name[:23]:<24}{img.size[0]}x{img.size[1]:<6}"
+                f"{median_ms:>8.2f}{max_ms:>9.2f}{ratio_text:>10}  {box or '-'}"
+            )
+
+    print("\n=== 完整预处理：裁剪前后 ===")
+    for name, data in images:
+        for label, (size, tokens, box, elapsed) in bench_end_to_end(data).items():
+            print(f"{name[:23]:<24}{label:<6} 字节 {size:>9,}  image tokens {tokens:>5}  耗时 {elapsed:>6.1f}ms  {box or ''}")
+
+
+if __name__ == "__main__":
+    main()
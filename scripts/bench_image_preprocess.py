@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+图片预处理基准测试：对比预处理前后的字节数、image tokens 和耗时
+
+使用方法：
+  # 不带参数：生成一张 12MP 的合成题目照片（EXIF 竖拍）做测试
+  python scripts/bench_image_preprocess.py
+
+  # 指定图片或目录，并对比多组配置
+  python scripts/bench_image_preprocess.py photos/ --format jpeg webp --long-edge 1568 1092
+
+  # 识别准确率（需要 CLAUDE_API_KEY）：samples.json 为
+  #   [{"image": "photos/1.jpg", "problem_text": "...", "parameters": {"initial_speed": 15, ...}}, ...]
+  python scripts/bench_image_preprocess.py --accuracy samples.json
+"""
+
+import argparse
+import base64
+import difflib
+import io
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+# 添加项目根目录到 Python 路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from PIL import Image, ImageDraw, ImageFont
+
+from services.image_preprocess import (
+    estimate_image_tokens,
+    get_preprocess_settings,
+    preprocess_image,
+    target_size,
+)
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".webp"}
+
+# 服务端会把超过该尺寸的图片缩小后再计费，原图的实际计费 tokens 以此为上限
+API_LONG_EDGE = 1568
+API_TOKEN_CAP = 1600
+
+
+def make_sample_photo(width: int = 4032, height: int = 3024) -> bytes:
+    """生成一张类似手机拍摄的题目照片（横向像素 + EXIF 竖拍方向）"""
+    img = Image.new("RGB", (width, height), (214, 205, 188))
+    draw = ImageDraw.Draw(img)
+    # 书页
+    draw.rectangle((400, 250, width - 400, height - 250), fill=(246, 244, 238))
+    try:
+        font = ImageFont.load_default(size=64)
+    except TypeError:
+        font = ImageFont.load_default()
+    lines = [
+        "12. A ball is thrown horizontally from a 20 m high platform",
+        "    with an initial speed of v0 = 15 m/s (g = 9.8 m/s^2).",
+        "  (1) How long does the ball stay in the air?",
+        "  (2) How far does it travel horizontally?",
+        "  (3) What is its speed just before hitting the ground?",
+    ]
+    for i, line in enumerate(lines):
+        draw.text((520, 420 + i * 110), line, fill=(30, 30, 30), font=font)
+    # 轻微噪声，避免 JPEG 压缩得过于理想
+    noise = Image.effect_noise((width, height), 12).convert("RGB")
+    img = Image.blend(img, noise, 0.06)
+
+    exif = Image.Exif()
+    exif[0x0112] = 6  # 手机竖拍：需要旋转 90°
+    out = io.BytesIO()
+    img.save(out, "JPEG", quality=92, exif=exif)
+    return out.getvalue()
+
+
+def collect_images(paths):
+    images = []
+    for raw in paths:
+        path = Path(raw)
+        if path.is_dir():
+            images.extend(sorted(p for p in path.iterdir() if p.suffix.lower() in IMAGE_SUFFIXES))
+        elif path.is_file():
+            images.append(path)
+    return [(p.name, p.read_bytes()) for p in images]
+
+
+def api_billed_tokens(width: int, height: int) -> int:
+    """原图发送后服务端缩放再计费的 tokens（估算）"""
+    return estimate_image_tokens(*target_size(width, height, API_LONG_EDGE, API_TOKEN_CAP))
+
+
+def bench_settings(images, settings, repeat: int):
+    rows = []
+    for name, data in images:
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            processed, info = preprocess_image(data, settings)
+            encoded = base64.standard_b64encode(processed)
+            timings.append((time.perf_counter() - started) * 1000)
+
+        with Image.open(io.BytesIO(data)) as original:
+            orig_w, orig_h = original.size
+        new_w, new_h = info.get("size", (orig_w, orig_h))
+        rows.append({
+            "name": name,
+            "original": f"{orig_w}x{orig_h}",
+            "processed": f"{new_w}x{new_h}",
+            "bytes_before": len(data),
+            "bytes_after": len(processed),
+            "base64_after": len(encoded),
+            "tokens_before": api_billed_tokens(orig_w, orig_h),
+            "tokens_after": estimate_image_tokens(new_w, new_h),
+            "grayscale": info.get("grayscale"),
+            "ms": statistics.median(timings),
+        })
+    return rows
+
+
+def print_rows(label, rows):
+    print(f"\n=== {label} ===")
+    print(f"{'图片':<24}{'尺寸':>22}{'字节':>24}{'tokens':>14}{'灰度':>6}{'耗时ms':>9}")
+    for r in rows:
+        print(
+            f"{r['name'][:23]:<24}"
+            f"{r['original'] + ' -> ' + r['processed']:>22}"
+            f"{r['bytes_before']:>11,} -> {r['bytes_after']:>9,}"
+            f"{r['tokens_before']:>6} -> {r['tokens_after']:<5}"
+            f"{'是' if r['grayscale'] else '否':>4}"
+            f"{r['ms']:>9.1f}"
+        )
+    total_before = sum(r["bytes_before"] for r in rows)
+    total_after = sum(r["bytes_after"] for r in rows)
+    tokens_before = sum(r["tokens_before"] for r in rows)
+    tokens_after = sum(r["tokens_after"] for r in rows)
+    print(
+        f"合计: 字节 {total_before:,} -> {total_after:,}（{total_after / total_before:.1%}），"
+        f"image tokens {tokens_before} -> {tokens_after}（{tokens_after / max(tokens_before, 1):.1%}）"
+    )
+
+
+def _text_similarity(a: str, b: str) -> float:
+    return difflib.SequenceMatcher(None, "".join(a.split()), "".join(b.split())).ratio()
+
+
+def _params_match(expected: dict, actual: dict) -> float:
+    keys = [k for k, v in expected.items() if v is not None]
+    if not keys:
+        return 1.0
+    hits = 0
+    for key in keys:
+        value = actual.get(key)
+        try:
+            if value is not None and abs(float(value) - float(expected[key])) <= 0.01 * max(abs(float(expected[key])), 1):
+                hits += 1
+        except (TypeError, ValueError):
+            pass
+    return hits / len(keys)
+
+
+def bench_accuracy(samples_path: str):
+    """原图 / 预处理后各调用一次 Claude，对比题目文字相似度、参数命中率和延迟"""
+    from services.claude_pipeline import call_claude_pipeline
+    from services.result_store import result_store
+
+    with open(samples_path, encoding="utf-8") as f:
+        samples = json.load(f)
+    base_dir = Path(samples_path).parent
+
+    print(f"\n=== 识别准确率（{len(samples)} 个样本）===")
+    summary = {}
+    for label, enabled in (("原图", "false"), ("预处理", "true")):
+        os.environ["IMAGE_PREPROCESS"] = enabled
+        result_store.clear()
+        text_scores, param_scores, latencies = [], [], []
+        for sample in samples:
+            image_path = base_dir / sample["image"]
+            started = time.perf_counter()
+            try:
+                result = call_claude_pipeline(image_path.read_bytes())
+            except Exception as e:
+                print(f"  ❌ {label} {sample['image']}: {e}")
+                text_scores.append(0.0)
+                param_scores.append(0.0)
+                continue
+            latencies.append(time.perf_counter() - started)
+            text_scores.append(_text_similarity(sample.get("problem_text", ""), result["problem_text"]))
+            param_scores.append(_params_match(sample.get("parameters", {}), result["parameters"]))
+        summary[label] = (statistics.mean(text_scores), statistics.mean(param_scores),
+                          statistics.median(latencies) if latencies else float("nan"))
+
+    for label, (text_score, param_score, latency) in summary.items():
+        print(f"  {label:<6} 题目文字相似度 {text_score:.3f}  参数命中率 {param_score:.1%}  中位延迟 {latency:.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="图片预处理基准测试")
+    parser.add_argument("paths", nargs="*", help="图片文件或目录（默认生成合成照片）")
+    parser.add_argument("--format", nargs="+", choices=["jpeg", "webp"], help="对比的编码格式")
+    parser.add_argument("--long-edge", nargs="+", type=int, help="对比的长边上限")
+    parser.add_argument("--quality", type=int, help="编码质量（默认读取 IMAGE_QUALITY）")
+    parser.add_argument("--repeat", type=int, default=3, help="每张图片重复次数（取中位数）")
+    parser.add_argument("--accuracy", help="识别准确率样本 JSON（需要 CLAUDE_API_KEY）")
+    args = parser.parse_args()
+
+    images = collect_images(args.paths) if args.paths else [("synthetic_12mp.jpg", make_sample_photo())]
+    if not images:
+        print("❌ 没有找到图片")
+        sys.exit(1)
+
+    base = get_preprocess_settings()
+    if args.quality:
+        base["quality"] = args.quality
+    for image_format in args.format or [base["format"]]:
+        for long_edge in args.long_edge or [base["max_long_edge"]]:
+            settings = dict(base, format=image_format, max_long_edge=long_edge)
+            label = f"{image_format} q={settings['quality']} 长边≤{long_edge} token≤{settings['token_budget'] or '∞'}"
+            print_rows(label, bench_settings(images, settings, args.repeat))
+
+    if args.accuracy:
+        bench_accuracy(args.accuracy)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+上传接收内存基准测试：并发上传大图时进程峰值 RSS（f.read + base64 vs 单次遍历 ingest）
+
+每种方式在独立子进程中运行：N 个线程同时解析一个 multipart 上传（请求体按块生成，不占内存），
+得到发送给 Claude 的 base64 后构造 JSON 请求体，并在所有线程都持有请求体时统一测量。
+两种方式都关闭图片预处理（原图 base64 直接发送，即 ingest 的 base64 模式）。
+分别测试每个请求一张图片和多张图片（--files，总大小相同；浏览器不给分段带 Content-Length）。
+
+glibc 默认会动态提高 mmap 阈值，释放的大块内存留在堆里不归还系统，RSS 反映的是分配器保留量
+而不是存活数据；子进程默认固定 MALLOC_MMAP_THRESHOLD_，--glibc-default 可关闭。
+
+使用方法：
+  python scripts/bench_ingest_memory.py                        # 50 并发 × 10MB
+  python scripts/bench_ingest_memory.py --concurrency 20 --size-mb 5 --files 4
+"""
+
+import argparse
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+# 添加项目根目录到 Python 路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+BOUNDARY = "----bench-ingest-boundary"
+PATTERN_SIZE = 1024 * 1024
+
+
+class MultipartBodyStream:
+    """按块生成的 multipart 请求体（files 个同名 file 字段平分 size，内容为重复的随机块）"""
+
+    def __init__(self, size: int, pattern: bytes, files: int = 1):
+        self._parts = []
+        for index in range(files):
+            separator = "\r\n" if index else ""
+            self._parts.append((
+                f"{separator}--{BOUNDARY}\r\n"
+                f'Content-Disposition: form-data; name="file"; filename="photo{index}.jpg"\r\n'
+                "Content-Type: image/jpeg\r\n\r\n"
+            ).encode("ascii"))
+            self._parts.append(None)
+        self._parts.append(f"\r\n--{BOUNDARY}--\r\n".encode("ascii"))
+        self._size = size // files
+        self._pattern = pattern
+        self.length = sum(self._size if part is None else len(part) for part in self._parts)
+        self._index = 0
+        self._offset = 0
+
+    def read(self, n: int = -1) -> bytes:
+        if n is None or n < 0:
+            n = self.length
+        out = []
+        while n > 0 and self._index < len(self._parts):
+            part = self._parts[self._index]
+            part_size = self._size if part is None else len(part)
+            take = min(n, part_size - self._offset)
+            if part is None:
+                start = self._offset % len(self._pattern)
+                take = min(take, len(self._pattern) - start)
+                out.append(self._pattern[start:start + take])
+            else:
+                out.append(part[self._offset:self._offset + take])
+            self._offset += take
+            n -= take
+            if self._offset >= part_size:
+                self._index += 1
+                self._offset = 0
+        return b"".join(out)
+
+
+def jpeg_pattern() -> bytes:
+    """真实 JPEG 的文件头（通过上传探测）+ 随机字节，作为每张图片的内容"""
+    from PIL import Image
+
+    out = io.BytesIO()
+    Image.new("RGB", (64, 64), (200, 200, 200)).save(out, "JPEG")
+    header = out.getvalue()[:-2]  # 去掉 EOI
+    return header + os.urandom(PATTERN_SIZE - len(header))
+
+
+def max_rss_mb() -> float:
+    # Linux 上 ru_maxrss 单位为 KB
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def current_rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except OSError:
+        return max_rss_mb()
+
+
+def run_worker(mode: str, concurrency: int, size: int, files: int) -> dict:
+    """子进程：按指定方式并发接收上传并测量峰值 RSS"""
+    os.environ["IMAGE_PREPROCESS"] = "false"
+    os.environ["CLAUDE_USE_FILES_API"] = "false"
+    os.environ["PIPELINE_MODE"] = "claude"
+
+    from flask import Flask, Request, request
+    from werkzeug.test import create_environ
+
+    from services.claude_pipeline import encode_image_to_base64
+    from services.ingest import IngestRequest, ingest_upload
+
+    app = Flask(__name__)
+    app.config["MAX_CONTENT_LENGTH"] = None
+    app.request_class = IngestRequest if mode == "ingest" else Request
+
+    pattern = jpeg_pattern()
+    baseline = current_rss_mb()
+    barrier = threading.Barrier(concurrency + 1)
+    release = threading.Event()
+    errors = []
+
+    def handle_upload():
+        body = MultipartBodyStream(size, pattern, files)
+        environ = create_environ(path="/upload", method="POST")
+        environ.update({
+            "CONTENT_TYPE": f"multipart/form-data; boundary={BOUNDARY}",
+            "CONTENT_LENGTH": str(body.length),
+            "wsgi.input": body,
+        })
+        try:
+            with app.request_context(environ):
+                blocks = []
+                for f in request.files.getlist("file"):
+                    image = ingest_upload(f) if mode == "ingest" else f.read()
+                    base64_image, mime_type = encode_image_to_base64(image)
+                    blocks.append({
+                        "type": "image",
+                        "source": {"type": "base64", "media_type": mime_type, "data": base64_image},
+                    })
+                # Anthropic SDK 发送前把请求体序列化为 JSON 字节
+                payload = json.dumps({"messages": [{"role": "user", "content": blocks}]}).encode("utf-8")
+                barrier.wait()
+                release.wait()
+                del payload, blocks, base64_image, image
+        except Exception as e:
+            errors.append(str(e))
+            barrier.abort()
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=handle_upload) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    try:
+        barrier.wait()
+        holding = current_rss_mb()
+    except threading.BrokenBarrierError:
+        holding = float("nan")
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    return {
+        "mode": mode,
+        "baseline_mb": baseline,
+        "holding_mb": holding,
+        "peak_mb": max_rss_mb(),
+        "elapsed_s": time.perf_counter() - started,
+        "errors": errors[:3],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="上传接收内存基准测试")
+    parser.add_argument("--concurrency", type=int, default=50, help="并发上传数")
+    parser.add_argument("--size-mb", type=float, default=10, help="每张图片大小（MB）")
+    parser.add_argument("--files", type=int, default=4, help="多图请求的图片数（总大小不变）")
+    parser.add_argument("--glibc-default", action="store_true", help="不固定 glibc mmap 阈值")
+    parser.add_argument("--worker", choices=["read", "ingest"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    size = int(args.size_mb * 1024 * 1024)
+
+    if args.worker:
+        print(json.dumps(run_worker(args.worker, args.concurrency, size, args.files)))
+        return
+
+    print(f"并发 {args.concurrency} × {args.size_mb:g}MB（图片预处理关闭，原图 base64 发送）")
+    env = dict(os.environ)
+    if not args.glibc_default:
+        env.setdefault("MALLOC_MMAP_THRESHOLD_", str(128 * 1024))
+
+    labels = {"read": "f.read() + base64", "ingest": "单次遍历 ingest"}
+    print(f"{'方式':<22}{'图片数':>6}{'基线MB':>10}{'持有请求体MB':>16}{'峰值RSS MB':>14}{'耗时s':>9}")
+    for files in sorted({1, max(args.files, 1)}):
+        results = {}
+        for mode in ("read", "ingest"):
+            output = subprocess.run(
+                [sys.executable, __file__, "--worker", mode, "--concurrency", str(args.concurrency),
+                 "--size-mb", str(args.size_mb), "--files", str(files)],
+                capture_output=True, text=True, check=True, env=env,
+            ).stdout
+            results[mode] = json.loads(output.strip().splitlines()[-1])
+
+        for mode, r in results.items():
+            print(
+                f"{labels[mode]:<22}{files:>6}{r['baseline_mb']:>10.0f}{r['holding_mb']:>16.0f}"
+                f"{r['peak_mb']:>14.0f}{r['elapsed_s']:>9.2f}"
+            )
+            if r["errors"]:
+                print(f"  ❌ {r['errors']}")
+
+        read_peak = results["read"]["peak_mb"] - results["read"]["baseline_mb"]
+        ingest_peak = results["ingest"]["peak_mb"] - results["ingest"]["baseline_mb"]
+        print(f"  {files} 张图片峰值增量: {read_peak:.0f}MB -> {ingest_peak:.0f}MB（{1 - ingest_peak / read_peak:.1%} 降低）")
+
+if __name__ == "__main__":
+    main()
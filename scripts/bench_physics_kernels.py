@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+动画持续时间 / 缩放比例基准测试：标量函数逐行循环 vs services/physics_kernels.py 的 NumPy 批量版本
+
+- claude_pipeline.estimate_duration + estimate_scale  vs  physics_kernels.estimate_animation_extent
+- llm_service._compute_duration + _build_animation_instructions 的 scale 计算  vs  fallback_animation_extent
+
+随机生成的输入覆盖各运动类型（含未知类型）、缺失值、0° / 90° / 负角度、g ≤ 0、高度为 0 等分支。
+先逐行校验两种实现的结果（相对误差 ≤ 1e-9），再分别计时（取多次重复的最小值）；
+标量循环太慢，只在前 --scalar-rows 行上计时，按行数折算。
+
+使用方法：
+  python scripts/bench_physics_kernels.py                    # 100 万行
+  python scripts/bench_physics_kernels.py --rows 5000000 --scalar-rows 100000 --repeat 5
+"""
+
+import argparse
+import math
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+# 添加项目根目录到 Python 路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from services.claude_pipeline import estimate_duration, estimate_scale
+from services.llm_service import _compute_duration
+from services.physics_kernels import estimate_animation_extent, fallback_animation_extent
+
+MOTION_TYPES = ["projectile", "horizontal_projectile", "free_fall", "vertical_throw", "uniform", "inclined_plane", "other"]
+
+
+def make_rows(count: int, seed: int) -> dict:
+    """随机输入；pipeline 版本的缺失值为 NaN（标量函数收到 None）"""
+    rng = np.random.default_rng(seed)
+    types = rng.choice(MOTION_TYPES, count)
+    v0 = rng.choice([0.0, 5.0, 12.5, 20.0, 35.0], count) + rng.random(count) * rng.integers(0, 2, count)
+    angle = rng.choice([0.0, 30.0, 45.0, 60.0, 90.0, -20.0, 135.0], count) + rng.random(count) * rng.integers(0, 2, count)
+    g = rng.choice([9.8, 10.0, 1.62, 0.0, -9.8], count, p=[0.5, 0.3, 0.1, 0.05, 0.05])
+    h0 = rng.choice([0.0, 1.5, 10.0, 45.0, -3.0], count) + rng.random(count) * rng.integers(0, 2, count)
+    for values in (v0, angle, h0):
+        values[rng.random(count) < 0.05] = np.nan
+    return {"types": types, "v0": v0, "angle": angle, "g": g, "h0": h0}
+
+
+def _none(value: float):
+    return None if math.isnan(value) else value
+
+
+def scalar_pipeline(rows: dict, count: int) -> tuple:
+    durations, scales = np.empty(count), np.empty(count)
+    for i, (t, v0, angle, g, h0) in enumerate(zip(
+            rows["types"][:count].tolist(), rows["v0"][:count].tolist(), rows["angle"][:count].tolist(),
+            rows["g"][:count].tolist(), rows["h0"][:count].tolist())):
+        v0, angle, h0 = _none(v0), _none(angle), _none(h0)
+        durations[i] = estimate_duration(t, v0, angle, g, h0)
+        scales[i] = estimate_scale(t, v0, angle, g, h0)
+    return durations, scales
+
+
+def fallback_inputs(rows: dict) -> dict:
+    """llm_service 的输入已填好默认值：v0 / angle 不为空，g 用 `or 9.8`，h0 用 `or 0`"""
+    g = np.where(rows["g"] == 0, 9.8, rows["g"])
+    return {
+        "types": rows["types"],
+        "v0": np.nan_to_num(rows["v0"], nan=20.0),
+        "angle": np.nan_to_num(rows["angle"], nan=45.0),
+        "g": g,
+        "h0": np.nan_to_num(rows["h0"], nan=0.0),
+    }
+
+
+def scalar_fallback(rows: dict, count: int) -> tuple:
+    """llm_service._compute_duration + _build_animation_instructions 中的 scale 计算（原样照搬）"""
+    durations, scales = np.empty(count), np.empty(count)
+    for i, (t, v0, angle, g, h0) in enumerate(zip(
+            rows["types"][:count].tolist(), rows["v0"][:count].tolist(), rows["angle"][:count].tolist(),
+            rows["g"][:count].tolist(), rows["h0"][:count].tolist())):
+        durations[i] = _compute_duration(t, v0, angle, g, h0)
+        max_range = v0 * v0 * abs(math.sin(2 * math.radians(angle))) / g if v0 > 0 else 10
+        max_height = h0 + (v0 * math.sin(math.radians(angle))) ** 2 / (2 * g) if v0 > 0 else h0
+        scale = min(700 / max(max_range, 1), 500 / max(max_height, 1), 30)
+        scales[i] = max(scale, 10)
+    return durations, scales
+
+
+def check_parity(label: str, expected: tuple, actual: tuple) -> None:
+    for name, want, got in zip(("duration", "scale"), expected, actual):
+        if not np.allclose(got, want, rtol=1e-9, atol=0, equal_nan=True):
+            bad = int(np.argmax(~np.isclose(got, want, rtol=1e-9, atol=0, equal_nan=True)))
+            print(f"❌ {label} {name} 第 {bad} 行不一致: 标量 {want[bad]!r}，批量 {got[bad]!r}")
+            sys.exit(1)
+        worst = np.nanmax(np.abs(got - want) / np.maximum(np.abs(want), 1e-300))
+        print(f"✅ {label} {name}: {len(want)} 行一致（最大相对误差 {worst:.1e}）")
+
+
+def bench(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="动画持续时间 / 缩放比例基准测试")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="批量版本的行数")
+    parser.add_argument("--scalar-rows", type=int, default=200_000, help="标量循环计时 / 校验的行数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3, help="计时重复次数（取最小值）")
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows, args.seed)
+    scalar_rows = min(args.scalar_rows, args.rows)
+    fallback_rows = fallback_inputs(rows)
+
+    def batch_pipeline(count=None):
+        sl = slice(count)
+        return estimate_animation_extent(rows["types"][sl], rows["v0"][sl], rows["angle"][sl], rows["g"][sl], rows["h0"][sl])
+
+    def batch_fallback(count=None):
+        r, sl = fallback_rows, slice(count)
+        return fallback_animation_extent(r["types"][sl], r["v0"][sl], r["angle"][sl], r["g"][sl], r["h0"][sl])
+
+    check_parity("pipeline", scalar_pipeline(rows, scalar_rows), batch_pipeline(scalar_rows))
+    check_parity("fallback", scalar_fallback(fallback_rows, scalar_rows), batch_fallback(scalar_rows))
+
+    print(f"\n{'实现':<32}{'行数':>10}{'耗时 s':>10}{'ns/行':>10}{'加速':>8}")
+    for label, scalar_fn, batch_fn in (
+        ("pipeline", lambda: scalar_pipeline(rows, scalar_rows), batch_pipeline),
+        ("fallback", lambda: scalar_fallback(fallback_rows, scalar_rows), batch_fallback),
+    ):
+        scalar_s = bench(scalar_fn, args.repeat)
+        batch_s = bench(batch_fn, args.repeat)
+        scalar_ns = scalar_s / scalar_rows * 1e9
+        batch_ns = batch_s / args.rows * 1e9
+        print(f"{label + ' 标量循环':<32}{scalar_rows:>10}{scalar_s:>10.3f}{scalar_ns:>10.1f}{'':>8}")
+        print(f"{label + ' NumPy 批量':<32}{args.rows:>10}{batch_s:>10.3f}{batch_ns:>10.1f}{scalar_ns / batch_ns:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
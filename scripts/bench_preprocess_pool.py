@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+图片预处理进程池基准测试：图片突发期间纯文本请求（manual 模式）的延迟分布
+
+同一进程内：若干线程持续预处理 12MP 照片（模拟图片上传突发），另一组线程不断发送 manual_text 请求，
+统计文本请求的 p50 / p99 / 最大延迟。分别在「请求线程中处理」（IMAGE_PREPROCESS_WORKERS=0）
+和进程池两种配置下运行（各自独立子进程），并附上无图片负载时的基线。
+
+使用方法：
+  python scripts/bench_preprocess_pool.py
+  python scripts/bench_preprocess_pool.py --image-threads 4 --workers 2 --duration 10
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+# 添加项目根目录到 Python 路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+sys.path.insert(0, str(Path(__file__).parent))
+
+MANUAL_TEXT = "一个小球从 20 m 高的平台以 15 m/s 的初速度水平抛出，g = 9.8 m/s²，求落地时间和水平位移。"
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    index = min(int(round(q * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def run_worker(image_threads: int, text_threads: int, duration: float) -> dict:
+    """子进程：图片突发 + 文本请求，返回文本请求延迟统计"""
+    from bench_image_preprocess import make_sample_photo
+
+    from app import create_app
+    from services.claude_pipeline import prepare_images
+    from services.image_workers import get_preprocess_pool, get_preprocess_workers
+
+    app = create_app()
+    client = app.test_client()
+    photo = make_sample_photo()
+
+    # 等 worker 启动完成并预热（进程池模式）
+    pool = get_preprocess_pool()
+    if pool is not None:
+        prepare_images([photo])
+
+    stop = threading.Event()
+    latencies = []
+    images_done = []
+
+    def image_burst():
+        while not stop.is_set():
+            prepare_images([photo])
+            images_done.append(1)
+
+    def text_requests():
+        local = []
+        while not stop.is_set():
+            started = time.perf_counter()
+            response = client.post("/upload", data={"manual_text": MANUAL_TEXT})
+            local.append((time.perf_counter() - started) * 1000)
+            if response.status_code != 200:
+                raise RuntimeError(f"文本请求失败: {response.status_code}")
+        latencies.extend(local)
+
+    threads = [threading.Thread(target=image_burst) for _ in range(image_threads)]
+    threads += [threading.Thread(target=text_requests) for _ in range(text_threads)]
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    return {
+        "workers": get_preprocess_workers(),
+        "requests": len(latencies),
+        "images": len(images_done),
+        "p50": percentile(latencies, 0.50),
+        "p99": percentile(latencies, 0.99),
+        "max": max(latencies),
+        "mean": statistics.mean(latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="图片预处理进程池基准测试")
+    parser.add_argument("--image-threads", type=int, default=4, help="持续预处理图片的线程数")
+    parser.add_argument("--text-threads", type=int, default=2, help="发送文本请求的线程数")
+    parser.add_argument("--workers", default="auto", help="进程池大小（IMAGE_PREPROCESS_WORKERS）")
+    parser.add_argument("--duration", type=float, default=8, help="每种配置的运行时间（秒）")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--images", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_worker(args.images, args.text_threads, args.duration)))
+        return
+
+    configs = [
+        ("无图片负载", "0", 0),
+        ("请求线程中处理", "0", args.image_threads),
+        (f"进程池（{args.workers}）", args.workers, args.image_threads),
+    ]
+    print(f"文本请求线程 {args.text_threads}，图片线程 {args.image_threads}，每种配置 {args.duration:g}s，CPU {os.cpu_count()} 核")
+    print(f"{'配置':<20}{'文本请求数':>10}{'图片数':>8}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for label, workers, image_threads in configs:
+        env = dict(os.environ, IMAGE_PREPROCESS="true", IMAGE_PREPROCESS_WORKERS=workers, PIPELINE_MODE="manual")
+        output = subprocess.run(
+            [sys.executable, __file__, "--worker", "--images", str(image_threads),
+             "--text-threads", str(args.text_threads), "--duration", str(args.duration)],
+            capture_output=True, text=True, check=True, env=env,
+        ).stdout
+        r = json.loads(output.strip().splitlines()[-1])
+        print(f"{label:<20}{r['requests']:>10}{r['images']:>8}{r['p50']:>10.2f}{r['p99']:>10.2f}{r['max']:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,408 @@
+#!/usr/bin/env python3
+"""
+规则引擎基准测试：参数提取和运动类型判别的旧实现与 services/rule_engine.py 的共用规则表
+
+- 参数提取：旧实现每次调用逐条 re.search，新实现预编译 + 必需字面文字预筛
+- 运动类型：旧实现按优先级逐条 `in` 查找，新实现同样按优先级查找（去掉多余关键词、预编译角度正则）；
+  另外测一种"单次扫描"的写法作对照：所有关键词和角度合成一条正则，一次找出全部命中再套优先级
+
+先在对照语料上逐条比较两种实现的结果（必须完全一致），再对同一批文本计时；
+另外把多段题干拼成 OCR 长文本（约 650 字符）单独计时。
+对照语料包括：
+- 模板生成的题干（中英文、不同写法的单位 / 符号 / 大小写，参数顺序随机）
+- 由关键词、数字和符号随机拼接的片段（专门制造重叠、相邻和同位置的匹配）
+
+使用方法：
+  python scripts/bench_rule_engine.py                 # 10 万条文本
+  python scripts/bench_rule_engine.py --texts 20000 --seed 1 --repeat 5
+"""
+
+import argparse
+import random
+import re
+import sys
+import time
+from pathlib import Path
+
+# 添加项目根目录到 Python 路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from services.rule_engine import (
+    ANGLE_PATTERN,
+    ANGLE_RULE,
+    FALLBACK_MOTION_RULES,
+    PIPELINE_MOTION_RULES,
+    classify_angle,
+    fallback_motion_rules,
+    fallback_parameter_rules,
+    pipeline_motion_rules,
+    pipeline_parameter_rules,
+)
+
+# ---------- 旧实现（原样保留，作为对照） ----------
+
+
+def legacy_extract_parameters(text: str) -> dict:
+    """claude_pipeline.extract_parameters 的旧实现"""
+    def match_number(patterns):
+        for pattern in patterns:
+            m = re.search(pattern, text, re.IGNORECASE)
+            if m:
+                try:
+                    return float(m.group(1))
+                except ValueError:
+                    continue
+        return None
+
+    speed = match_number([
+        r"初速度\s*[:：=]?\s*([0-9]+(?:\.[0-9]+)?)",
+        r"v0?\s*[:：=]?\s*([0-9]+(?:\.[0-9]+)?)",
+        r"速度\s*[:：=]?\s*([0-9]+(?:\.[0-9]+)?)\s*(?:m/s|米/秒)?",
+        r"以\s*([0-9]+(?:\.[0-9]+)?)\s*m/s",
+        r"([0-9]+(?:\.[0-9]+)?)\s*m/s\s*的.*速度",
+    ])
+
+    angle = match_number([
+        r"角度\s*[:：=]?\s*([0-9]+(?:\.[0-9]+)?)",
+        r"([0-9]+(?:\.[0-9]+)?)\s*[°度]\s*角",
+        r"以\s*([0-9]+(?:\.[0-9]+)?)\s*[°度]",
+    ])
+
+    height = match_number([
+        r"高度\s*(?:为|是|[:：])\s*([0-9]+(?:\.[0-9]+)?)",
+        r"从\s*([0-9]+(?:\.[0-9]+)?)\s*[米m]",
+        r"高\s*([0-9]+(?:\.[0-9]+)?)\s*[米m]",
+        r"([0-9]+(?:\.[0-9]+)?)\s*米高",
+        r"([0-9]+(?:\.[0-9]+)?)\s*m高",
+    ])
+
+    gravity = match_number([
+        r"g\s*[:：=]?\s*([0-9]+(?:\.[0-9]+)?)",
+        r"重力加速度\s*(?:为|是|[:：])\s*([0-9]+(?:\.[0-9]+)?)",
+    ]) or 9.8
+
+    friction = match_number([
+        r"摩擦系数\s*[:：=]?\s*([0-9]+(?:\.[0-9]+)?)",
+        r"μ\s*[:：=]?\s*([0-9]+(?:\.[0-9]+)?)",
+    ])
+
+    return {
+        "initial_speed": speed,
+        "angle": angle,
+        "initial_height": height,
+        "gravity": gravity,
+        "friction": friction,
+    }
+
+
+def _legacy_match_number(patterns, text: str):
+    for pattern in patterns:
+        m = re.search(pattern, text, re.IGNORECASE)
+        if m:
+            try:
+                return float(m.group(1))
+            except ValueError:
+                continue
+    return None
+
+
+def legacy_extract_parameters_fallback(ocr_text: str) -> dict:
+    """llm_service._extract_parameters_fallback 的旧实现"""
+    speed = _legacy_match_number([
+        r"初速度\s*[:：=]?\s*([0-9]+(?:\.[0-9]+)?)",
+        r"v0\s*[:：=]?\s*([0-9]+(?:\.[0-9]+)?)",
+        r"速度\s*[:：=]?\s*([0-9]+(?:\.[0-9]+)?)\s*(?:m/s|米/秒|米每秒)?",
+        r"以\s*([0-9]+(?:\.[0-9]+)?)\s*m/s",
+        r"([0-9]+(?:\.[0-9]+)?)\s*m/s\s*的.*速度",
+    ], ocr_text)
+
+    angle = _legacy_match_number([
+        r"角度\s*[:：=]?\s*([0-9]+(?:\.[0-9]+)?)",
+        r"([0-9]+(?:\.[0-9]+)?)\s*[°度]\s*角",
+        r"以\s*([0-9]+(?:\.[0-9]+)?)\s*[°度]",
+    ], ocr_text)
+
+    height = _legacy_match_number([
+        r"高度\s*(?:为|是|[:：])\s*([0-9]+(?:\.[0-9]+)?)",
+        r"从\s*([0-9]+(?:\.[0-9]+)?)\s*[米m]",
+        r"高\s*([0-9]+(?:\.[0-9]+)?)\s*[米m]",
+        r"([0-9]+(?:\.[0-9]+)?)\s*米高",
+        r"([0-9]+(?:\.[0-9]+)?)\s*m高",
+    ], ocr_text)
+
+    gravity = _legacy_match_number([
+        r"g\s*[:：=]?\s*([0-9]+(?:\.[0-9]+)?)",
+        r"重力加速度\s*(?:为|是|[:：])\s*([0-9]+(?:\.[0-9]+)?)",
+    ], ocr_text) or 9.8
+
+    return {
+        "initial_speed": speed,
+        "angle": angle,
+        "initial_height": height,
+        "gravity": gravity,
+    }
+
+
+def legacy_detect_motion_type(text: str) -> str:
+    """claude_pipeline.detect_motion_type 的旧实现"""
+    if "匀速" in text or "匀速直线" in text:
+        return "uniform"
+    if any(kw in text for kw in ["自由落体", "自由下落"]):
+        return "free_fall"
+    if any(kw in text for kw in ["平抛", "水平抛", "水平抛射"]):
+        return "horizontal_projectile"
+    if "竖直上抛" in text or "竖直抛" in text:
+        return "vertical_throw"
+    if any(kw in text for kw in ["斜面", "斜坡", "inclined plane"]):
+        return "inclined_plane"
+    angle_match = re.search(r"([0-9]+(?:\.[0-9]+)?)\s*[°度]", text)
+    if angle_match:
+        angle = float(angle_match.group(1))
+        if 0 < angle < 90:
+            return "projectile"
+        elif angle == 90:
+            return "vertical_throw"
+        elif angle == 0:
+            return "horizontal_projectile"
+    if any(kw in text for kw in ["斜抛", "斜向", "角度"]):
+        return "projectile"
+    if "抛" in text or "弹道" in text or "抛体" in text:
+        return "projectile"
+    return "projectile"
+
+
+def legacy_detect_motion_type_fallback(ocr_text: str) -> str:
+    """llm_service._detect_motion_type_fallback 的旧实现"""
+    if "匀速" in ocr_text or "匀速直线" in ocr_text:
+        return "uniform"
+    if any(keyword in ocr_text for keyword in ["自由落体", "自由下落"]):
+        return "free_fall"
+    if any(keyword in ocr_text for keyword in ["平抛", "水平抛", "水平抛射"]):
+        return "horizontal_projectile"
+    if "竖直上抛" in ocr_text or "竖直抛" in ocr_text:
+        return "vertical_throw"
+    angle_match = re.search(r"([0-9]+(?:\.[0-9]+)?)\s*[°度]", ocr_text)
+    if angle_match:
+        angle = float(angle_match.group(1))
+        if 0 < angle < 90 and angle != 0:
+            return "projectile"
+        elif angle == 90:
+            return "vertical_throw"
+        elif angle == 0:
+            return "horizontal_projectile"
+    if any(keyword in ocr_text for keyword in ["斜抛", "斜向", "角度"]):
+        return "projectile"
+    if "抛" in ocr_text or "弹道" in ocr_text or "抛体" in ocr_text:
+        return "projectile"
+    lowered = ocr_text.lower()
+    if "parabola" in lowered or "projectile" in lowered:
+        return "projectile"
+    if "下落" in ocr_text or "坠落" in ocr_text:
+        return "projectile"
+    return "projectile"
+
+
+class SinglePassMotionRules:
+    """对照：所有关键词和角度合成一条正则，finditer 一次找出全部命中，再按规则优先级判别
+
+    关键词按长度从长到短排列；会被更长关键词遮住的短关键词都属于同一条或更低优先级的规则，不影响结果。
+    """
+
+    def __init__(self, rules, default="projectile"):
+        self.default = default
+        self.labels = [label for label, _ in rules]
+        self.angle_priority = self.labels.index(ANGLE_RULE)
+        priority_of = {}
+        for priority, (label, keywords) in enumerate(rules):
+            for keyword in keywords:
+                if keyword.startswith("*"):
+                    # 与 str.lower() 一致的不区分大小写：只展开 ASCII 字母
+                    keyword = keyword[1:]
+                    pattern = "".join(f"[{c.lower()}{c.upper()}]" if c.isascii() and c.isalpha() else re.escape(c)
+                                      for c in keyword)
+                else:
+                    pattern = re.escape(keyword)
+                priority_of.setdefault(pattern, priority)
+        keywords = sorted(priority_of, key=len, reverse=True)
+        self.group_priority = [priority_of[pattern] for pattern in keywords]
+        self.pattern = re.compile(
+            ANGLE_PATTERN.pattern + "|" + "|".join(f"({pattern})" for pattern in keywords)
+        )
+
+    def classify(self, text: str) -> str:
+        hit = set()
+        angle = None
+        for m in self.pattern.finditer(text):
+            if m.lastindex == 1:
+                if angle is None:
+                    angle = float(m.group(1))
+            else:
+                hit.add(self.group_priority[m.lastindex - 2])
+        for priority, label in enumerate(self.labels):
+            if priority == self.angle_priority:
+                if angle is not None and classify_angle(angle) is not None:
+                    return classify_angle(angle)
+            elif priority in hit:
+                return label
+        return self.default
+
+
+single_pass_motion_rules = SinglePassMotionRules(PIPELINE_MOTION_RULES)
+single_pass_fallback_motion_rules = SinglePassMotionRules(FALLBACK_MOTION_RULES)
+
+
+def new_extract_parameters(text: str) -> dict:
+    params = pipeline_parameter_rules.extract(text)
+    params["gravity"] = params["gravity"] or 9.8
+    return params
+
+
+def new_extract_parameters_fallback(text: str) -> dict:
+    params = fallback_parameter_rules.extract(text)
+    params["gravity"] = params["gravity"] or 9.8
+    return params
+
+
+# ---------- 对照语料 ----------
+
+CLAUSES = [
+    "一个物体从{h}米高的平台以{v}m/s的速度水平抛出",
+    "以{v}m/s的初速度、与水平方向成{a}°角斜向上抛出一个小球",
+    "小球从高{h}m处自由下落",
+    "初速度：{v} m/s，抛射角度={a}",
+    "v0 = {v} m/s，θ = {a}度",
+    "V={v}，高度为{h}",
+    "重力加速度为{g}",
+    "取g={g}m/s²",
+    "G: {g}",
+    "物体在摩擦系数为{mu}的水平面上滑行",
+    "μ={mu}",
+    "动摩擦因数 µ = {mu}",
+    "一辆汽车以{v}m/s匀速直线行驶了{t}s",
+    "将小球以{a}°斜向上抛出，速度{v}米/秒",
+    "{v} m/s 的水平初速度",
+    "塔高{h}米，从塔顶竖直上抛",
+    "从{h}m高处静止释放",
+    "A ball is thrown at {v} m/s at an angle of {a} degrees from a height of {h} m.",
+    "A stone is dropped from a {h}m tall tower, g = {g} m/s^2.",
+    "速度 v = {v}米每秒",
+    "求物体落地时间和水平位移",
+    "（结果保留两位小数）",
+    "物体沿倾角为{a}°的光滑斜面下滑",
+    "炮弹飞行的弹道近似为抛物线",
+    "The projectile follows a Parabola",
+    "A block slides down an inclined plane",
+    "石块从悬崖上坠落",
+    "小球在竖直平面内转过{t}度",
+]
+
+FRAGMENTS = [
+    "初速度", "速度", "v", "V", "v0", "g", "G", "以", "从", "高", "高度", "米高", "m高", "角", "角度",
+    "度", "°", "m/s", "米/秒", "的", "重力加速度", "摩擦系数", "μ", "µ", "Μ", "为", "是", ":", "：", "=",
+    " ", "  ", "\n", "米", "m", "M", "抛", "。", "，",
+]
+
+
+def _number(rng: random.Random) -> str:
+    return rng.choice([
+        str(rng.randint(0, 120)),
+        f"{rng.uniform(0, 100):.{rng.randint(1, 3)}f}",
+        str(rng.randint(1000, 99999)),
+    ])
+
+
+def make_corpus(count: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    texts = []
+    for i in range(count):
+        if i % 4 == 3:
+            parts = [rng.choice(FRAGMENTS) if rng.random() < 0.6 else _number(rng) for _ in range(rng.randint(3, 30))]
+            texts.append("".join(parts))
+            continue
+        clauses = rng.sample(CLAUSES, rng.randint(1, 5))
+        text = "，".join(clause.format(
+            h=_number(rng), v=_number(rng), a=rng.choice(["30", "45", "60", "0", "90", "37.5"]),
+            g=rng.choice(["9.8", "10", "9.81"]), mu=rng.choice(["0.2", "0.35", "0.5"]), t=_number(rng),
+        ) for clause in clauses) + "。"
+        texts.append(text)
+    return texts
+
+
+def check_parity(texts: list) -> int:
+    mismatches = 0
+    for new, old in (
+        (new_extract_parameters, legacy_extract_parameters),
+        (new_extract_parameters_fallback, legacy_extract_parameters_fallback),
+        (pipeline_motion_rules.classify, legacy_detect_motion_type),
+        (fallback_motion_rules.classify, legacy_detect_motion_type_fallback),
+        (single_pass_motion_rules.classify, legacy_detect_motion_type),
+        (single_pass_fallback_motion_rules.classify, legacy_detect_motion_type_fallback),
+    ):
+        for text in texts:
+            if new(text) != old(text):
+                mismatches += 1
+                if mismatches <= 5:
+                    print(f"❌ 结果不一致（{new.__name__}）: {text!r}\n   新: {new(text)}\n   旧: {old(text)}")
+    return mismatches
+
+
+def bench(fn, texts: list, repeat: int) -> float:
+    """取 repeat 次中最快的一次（机器负载波动时更稳定）"""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for text in texts:
+            fn(text)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="规则引擎参数提取基准测试")
+    parser.add_argument("--texts", type=int, default=100_000, help="文本条数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3, help="计时重复次数（取最快）")
+    args = parser.parse_args()
+
+    texts = make_corpus(args.texts, args.seed)
+    mismatches = check_parity(texts)
+    if mismatches:
+        print(f"❌ {mismatches} 条结果不一致")
+        sys.exit(1)
+    print(f"✅ {len(texts)} 条文本：参数提取和运动类型判别的新旧实现结果完全一致")
+
+    rng = random.Random(args.seed)
+    problems = [text for i, text in enumerate(texts[:4000]) if i % 4 != 3]
+    long_texts = ["".join(rng.sample(problems, 10)) for _ in range(max(len(texts) // 10, 1))]
+    # 只含一般抛体的长文本：判别要走完前面所有规则，是逐条查找最慢的情况
+    projectile_problems = [text for text in problems if legacy_detect_motion_type(text) == "projectile"
+                           and legacy_detect_motion_type_fallback(text) == "projectile"]
+    projectile_texts = ["".join(rng.sample(projectile_problems, 10)) for _ in range(len(long_texts))]
+    mismatches = check_parity(long_texts) + check_parity(projectile_texts)
+    if mismatches:
+        print(f"❌ 长文本有 {mismatches} 条结果不一致")
+        sys.exit(1)
+    print(f"✅ {len(long_texts) + len(projectile_texts)} 条长文本：结果一致")
+
+    cases = (
+        ("extract_parameters", legacy_extract_parameters, new_extract_parameters),
+        ("_extract_parameters_fallback", legacy_extract_parameters_fallback, new_extract_parameters_fallback),
+        ("detect_motion_type", legacy_detect_motion_type, pipeline_motion_rules.classify),
+        ("detect_motion_type（单次扫描）", legacy_detect_motion_type, single_pass_motion_rules.classify),
+        ("_detect_motion_type_fallback", legacy_detect_motion_type_fallback, fallback_motion_rules.classify),
+        ("_detect_motion_type_fallback（单次扫描）", legacy_detect_motion_type_fallback,
+         single_pass_fallback_motion_rules.classify),
+    )
+    print(f"\n{'实现':<44}{'旧 µs':>9}{'新 µs':>9}{'加速':>8}")
+    for corpus_label, corpus in (("对照语料", texts), ("长文本", long_texts), ("长文本（一般抛体）", projectile_texts)):
+        avg_chars = sum(map(len, corpus)) / len(corpus)
+        print(f"{corpus_label}：{len(corpus)} 条，平均 {avg_chars:.0f} 字符")
+        for label, old, new in cases:
+            old_us = bench(old, corpus, args.repeat) / len(corpus) * 1e6
+            new_us = bench(new, corpus, args.repeat) / len(corpus) * 1e6
+            print(f"  {label:<42}{old_us:>9.1f}{new_us:>9.1f}{old_us / new_us:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+预计算轨迹采样点（services/trajectory.py）的体积、精度和前端耗时
+
+1. 体积：generate_animation_instructions 的输出不带 / 带自适应采样点 / 带固定 60fps 采样点时的
+   JSON 字节数（原始和 gzip），以及采样点数
+2. 精度：按前端的匀加速插值（animations/animation_base.js 的 trajectoryAt）在每一帧重建位置，
+   与闭式解比较的最大误差（像素）；采样折线与真实曲线的最大偏差（像素）
+3. 前端耗时（需要 node）：在 node 中加载 animations/ 下的动画类（Canvas 用空实现代替），
+   逐帧执行 update + draw 直到运动结束，比较逐帧计算与使用采样点时每帧的平均耗时（取多次重复的最小值），
+   其中 update + drawTrail 单独计时（网格、坐标轴等与轨迹无关的绘制不受影响）
+
+使用方法：
+  python scripts/bench_trajectory.py
+  TRAJECTORY_TOLERANCE_PX=1 python scripts/bench_trajectory.py --repeat 20
+"""
+
+import argparse
+import gzip
+import json
+import math
+import shutil
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+# 添加项目根目录到 Python 路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from services.claude_pipeline import generate_animation_instructions
+from services.trajectory import POSITION_DIGITS, TIME_DIGITS
+
+FPS = 60
+
+CASES = [
+    ("斜抛 v0=20 45°", "projectile", {"initial_speed": 20, "angle": 45}),
+    ("斜抛 v0=30 60° h0=5", "projectile", {"initial_speed": 30, "angle": 60, "initial_height": 5}),
+    ("斜抛 v0=50 30°", "projectile", {"initial_speed": 50, "angle": 30}),
+    ("平抛 v0=15 h0=20", "horizontal_projectile", {"initial_speed": 15, "initial_height": 20}),
+    ("竖直上抛 v0=15", "vertical_throw", {"initial_speed": 15}),
+    ("自由落体 h0=10", "free_fall", {"initial_height": 10}),
+]
+
+NODE_DRIVER = r"""
+const log = console.log;
+console.log = () => {};
+const ctx = new Proxy({}, { get: (target, key) => key in target ? target[key] : () => {} });
+const makeCanvas = () => ({ width: 800, height: 600, getContext: () => ctx });
+
+function run(Cls, params, repeat) {
+  let best = Infinity, frames = 0, trail = 0, updateBest = Infinity;
+  for (let r = 0; r < repeat; r++) {
+    const anim = new Cls(makeCanvas(), params);
+    let updateTime = 0n;
+    const started = process.hrtime.bigint();
+    for (frames = 0; frames < 100000; frames++) {
+      if (anim.checkBoundary()) break;
+      const before = process.hrtime.bigint();
+      anim.update(anim.dt);
+      anim.drawTrail();
+      updateTime += process.hrtime.bigint() - before;
+      anim.draw();
+      if (anim.isEnded) break;
+      anim.time += anim.dt;
+    }
+    best = Math.min(best, Number(process.hrtime.bigint() - started));
+    updateBest = Math.min(updateBest, Number(updateTime));
+    trail = anim.trail.length;
+  }
+  return { frames: frames + 1, frame_us: best / 1000 / (frames + 1), update_us: updateBest / 1000 / (frames + 1), trail };
+}
+
+const { cases, repeat } = JSON.parse(require('fs').readFileSync(0, 'utf8'));
+const classes = { projectile: ProjectileMotion, free_fall: FreeFall };
+log(JSON.stringify(cases.map(c => {
+  const Cls = classes[c.type];
+  const { trajectory, ...plain } = c.params;
+  return { frame: run(Cls, plain, repeat), sampled: run(Cls, c.params, repeat) };
+})));
+"""
+
+
+def payload_size(instructions: dict) -> tuple:
+    raw = json.dumps(instructions, ensure_ascii=False, separators=(",", ":")).encode()
+    return len(raw), len(gzip.compress(raw))
+
+
+def closed_form(instructions: dict, t: float) -> tuple:
+    angle = math.radians(instructions["angle"])
+    v0, g = instructions["initial_speed"], instructions["gravity"]
+    return (v0 * math.cos(angle) * t if abs(math.cos(angle)) > 1e-9 else 0.0,
+            instructions["initial_y"] + v0 * math.sin(angle) * t - g * t * t / 2)
+
+
+def fixed_rate(instructions: dict, trajectory: dict) -> dict:
+    """同样格式、按帧率等间隔采样的轨迹（对照组）"""
+    end = trajectory["t"][-1]
+    times = [min(i / FPS, end) for i in range(math.ceil(end * FPS) + 1)]
+    points = [closed_form(instructions, t) for t in times]
+    return {**trajectory,
+            "t": [round(t, TIME_DIGITS) for t in times],
+            "x": [round(x, POSITION_DIGITS) for x, _ in points],
+            "y": [round(y, POSITION_DIGITS) for _, y in points]}
+
+
+def interpolation_error(instructions: dict, trajectory: dict) -> float:
+    """按前端 trajectoryAt 的匀加速插值在每一帧重建位置，与闭式解的最大距离（米）"""
+    ts, xs, ys = trajectory["t"], trajectory["x"], trajectory["y"]
+    g = instructions["gravity"]
+    worst, i = 0.0, 0
+    for frame in range(int(ts[-1] * FPS) + 1):
+        t = frame / FPS
+        while i < len(ts) - 2 and ts[i + 1] < t:
+            i += 1
+        span, s = ts[i + 1] - ts[i], t - ts[i]
+        vx = (xs[i + 1] - xs[i]) / span
+        vy = (ys[i + 1] - ys[i]) / span + g * span / 2
+        x, y = closed_form(instructions, t)
+        worst = max(worst, math.hypot(xs[i] + vx * s - x, ys[i] + vy * s - g * s * s / 2 - y))
+    return worst
+
+
+def polyline_error(instructions: dict, trajectory: dict, steps: int = 32) -> float:
+    """采样折线与真实曲线的最大距离（米，每段取 steps 个点）"""
+    ts, xs, ys = trajectory["t"], trajectory["x"], trajectory["y"]
+    worst = 0.0
+    for i in range(len(ts) - 1):
+        dx, dy = xs[i + 1] - xs[i], ys[i + 1] - ys[i]
+        length = math.hypot(dx, dy)
+        for k in range(1, steps):
+            x, y = closed_form(instructions, ts[i] + (ts[i + 1] - ts[i]) * k / steps)
+            if length > 0:
+                worst = max(worst, abs((x - xs[i]) * dy - (y - ys[i]) * dx) / length)
+    return worst
+
+
+def node_timings(cases: list, repeat: int) -> list:
+    sources = [(project_root / "animations" / name).read_text(encoding="utf-8")
+               for name in ("animation_base.js", "projectile_motion.js", "free_fall.js")]
+    with tempfile.NamedTemporaryFile("w", suffix=".js", encoding="utf-8", delete=False) as script:
+        script.write("\n".join(sources + [NODE_DRIVER]))
+    try:
+        output = subprocess.run(["node", script.name], input=json.dumps({"cases": cases, "repeat": repeat}),
+                                capture_output=True, text=True, check=True).stdout
+    finally:
+        Path(script.name).unlink()
+    return json.loads(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="预计算轨迹采样点的体积、精度和前端耗时")
+    parser.add_argument("--repeat", type=int, default=10, help="前端计时重复次数（取最小值）")
+    args = parser.parse_args()
+
+    rows, node_cases = [], []
+    for label, motion_type, params in CASES:
+        instructions = generate_animation_instructions(motion_type, {"gravity": 9.8, **params})
+        trajectory = instructions.get("trajectory")
+        if trajectory is None:
+            print("❌ 未生成轨迹采样点（TRAJECTORY_SAMPLES 是否为 false？）")
+            sys.exit(1)
+        plain = {k: v for k, v in instructions.items() if k != "trajectory"}
+        scale = instructions["scale"]
+        rows.append({
+            "label": label,
+            "points": len(trajectory["t"]),
+            "frames": math.ceil(trajectory["t"][-1] * FPS) + 1,
+            "plain": payload_size(plain),
+            "adaptive": payload_size(instructions),
+            "fixed": payload_size({**plain, "trajectory": fixed_rate(instructions, trajectory)}),
+            "interp_px": interpolation_error(instructions, trajectory) * scale,
+            "polyline_px": polyline_error(instructions, trajectory) * scale,
+        })
+        if instructions["type"] == "free_fall":
+            js_params = {"h0": instructions["initial_y"], "g": instructions["gravity"], "mass": 1}
+        else:
+            js_params = {"v0": instructions["initial_speed"], "angle": instructions["angle"],
+                         "g": instructions["gravity"], "h0": instructions["initial_y"], "mass": 1}
+        node_cases.append({"type": instructions["type"], "params": {**js_params, "trajectory": trajectory}})
+
+    print(f"{'题目':<22}{'采样点':>7}{'帧数':>6}{'无采样 B':>10}{'自适应 B':>14}{'60fps B':>14}"
+          f"{'插值误差 px':>12}{'折线偏差 px':>12}")
+    for row in rows:
+        print(f"{row['label']:<22}{row['points']:>7}{row['frames']:>6}"
+              f"{'%d/%d' % row['plain']:>10}{'%d/%d' % row['adaptive']:>14}{'%d/%d' % row['fixed']:>14}"
+              f"{row['interp_px']:>12.4f}{row['polyline_px']:>12.3f}")
+    print("（字节数为 原始/gzip）")
+
+    if not shutil.which("node"):
+        print("\n⚠️  未找到 node，跳过前端耗时测试")
+        return
+    print(f"\n{'题目':<22}{'帧数':>6}{'逐帧 µs/帧':>12}{'采样 µs/帧':>12}{'逐帧 update+轨迹线':>18}{'采样 update+轨迹线':>18}"
+          f"{'轨迹线点数':>12}")
+    for row, timing in zip(rows, node_timings(node_cases, args.repeat)):
+        frame, sampled = timing["frame"], timing["sampled"]
+        print(f"{row['label']:<22}{sampled['frames']:>6}{frame['frame_us']:>12.2f}{sampled['frame_us']:>12.2f}"
+              f"{frame['update_us']:>18.3f}{sampled['update_us']:>18.3f}{'%d→%d' % (frame['trail'], sampled['trail']):>12}")
+
+
+if __name__ == "__main__":
+    main()
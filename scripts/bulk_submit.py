@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+批量提交命令行工具（Message Batches API，离线处理）
+
+直接调用 services/batch_service.py，不需要启动 Flask。
+任务状态保存在 BATCH_STATE_DIR（默认 uploads/batches），中断后可以继续。
+
+使用方法：
+  # 提交一个目录下的所有图片（或若干文件）
+  python scripts/bulk_submit.py submit problems/ --wait
+
+  # 查看 / 继续某个任务（提交遗留批次、收集已结束批次的结果）
+  python scripts/bulk_submit.py status <job_id>
+  python scripts/bulk_submit.py wait <job_id> --interval 60
+
+  # 继续所有未完成的任务（如进程重启后）
+  python scripts/bulk_submit.py resume
+
+  # 导出结果
+  python scripts/bulk_submit.py results <job_id> > results.json
+
+本地联调：先启动 python scripts/stub_claude_server.py，
+再设置 CLAUDE_BASE_URL=http://127.0.0.1:8765 CLAUDE_API_KEY=stub
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+# 添加项目根目录到 Python 路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from services.batch_service import (
+    get_job_results,
+    list_jobs,
+    resume_bulk_job,
+    submit_bulk_job,
+    wait_bulk_job,
+)
+
+IMAGE_SUFFIXES = {".png", ".jpg", ".jpeg"}
+
+
+def collect_images(paths):
+    """展开目录，按文件名排序返回 (filename, bytes)"""
+    files = []
+    for raw in paths:
+        path = Path(raw)
+        if path.is_dir():
+            files.extend(p for p in sorted(path.iterdir()) if p.suffix.lower() in IMAGE_SUFFIXES)
+        elif path.suffix.lower() in IMAGE_SUFFIXES:
+            files.append(path)
+        else:
+            print(f"⚠️  跳过不支持的文件: {path}", file=sys.stderr)
+
+    for path in files:
+        yield path.name, path.read_bytes()
+
+
+def print_summary(summary):
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批量提交题目图片（Message Batches API）")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_submit = sub.add_parser("submit", help="提交图片（文件或目录）")
+    p_submit.add_argument("paths", nargs="+")
+    p_submit.add_argument("--wait", action="store_true", help="提交后轮询直到完成")
+    p_submit.add_argument("--interval", type=float, default=30.0, help="轮询间隔（秒）")
+
+    p_status = sub.add_parser("status", help="推进并查看任务状态")
+    p_status.add_argument("job_id")
+
+    p_wait = sub.add_parser("wait", help="轮询直到任务完成")
+    p_wait.add_argument("job_id")
+    p_wait.add_argument("--interval", type=float, default=30.0)
+    p_wait.add_argument("--timeout", type=float, default=None)
+
+    sub.add_parser("resume", help="继续所有未完成的任务")
+    sub.add_parser("list", help="列出所有任务")
+
+    p_results = sub.add_parser("results", help="输出任务结果 JSON")
+    p_results.add_argument("job_id")
+
+    args = parser.parse_args()
+
+    if args.command == "submit":
+        summary = submit_bulk_job(collect_images(args.paths))
+        print_summary(summary)
+        if args.wait:
+            print_summary(wait_bulk_job(summary["job_id"], poll_interval=args.interval))
+
+    elif args.command == "status":
+        print_summary(resume_bulk_job(args.job_id))
+
+    elif args.command == "wait":
+        print_summary(wait_bulk_job(args.job_id, poll_interval=args.interval, timeout=args.timeout))
+
+    elif args.command == "resume":
+        for job in list_jobs():
+            if job["status"] != "completed":
+                print_summary(resume_bulk_job(job["job_id"]))
+
+    elif args.command == "list":
+        print_summary(list_jobs())
+
+    elif args.command == "results":
+        print(json.dumps(get_job_results(args.job_id), ensure_ascii=False, indent=2))
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
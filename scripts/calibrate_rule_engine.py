@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+规则引擎置信度校准：对照结果存储（RESULT_STORE_PATH）中 Claude 给出的答案
+
+对每条 Claude 结果（source 为 claude / batch / split）的 problem_text 重新跑一遍规则引擎
+（与 llm_service.analyze_physics_text 相同的 fallback 规则表），按置信度分组统计与 Claude 答案的一致率：
+- 运动类型相同
+- 该类型必需的参数（REQUIRED_PARAMETERS）数值相同；其他参数两边都给出时也必须相同
+
+输出：
+- 每个置信度取值的样本数和一致率
+- 阈值表：置信度 ≥ 阈值的题目占比（走快速路径的比例）和其中的一致率，以及建议的 RULE_ENGINE_FAST_PATH_THRESHOLD
+- 每种扣分原因的一致率（用于调整 rule_engine.CONFIDENCE_PENALTIES）
+
+使用方法：
+  python scripts/calibrate_rule_engine.py                          # 读取 RESULT_STORE_PATH
+  python scripts/calibrate_rule_engine.py --store data/results.jsonl --target 0.99 --show 10
+"""
+
+import argparse
+import os
+import sys
+from collections import defaultdict
+from pathlib import Path
+
+# 添加项目根目录到 Python 路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from services.result_store import ResultStore
+from services.rule_engine import REQUIRED_PARAMETERS, fallback_motion_rules, fallback_parameter_rules
+
+COMPARED_PARAMETERS = ("initial_speed", "angle", "initial_height")
+
+
+def _to_float(value):
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _same(a, b, tolerance: float) -> bool:
+    if a is None or b is None:
+        return a is None and b is None
+    return abs(a - b) <= tolerance * max(1.0, abs(b))
+
+
+def compare(motion_type: str, params: dict, claude_type: str, claude_params: dict, tolerance: float) -> list:
+    """规则引擎结果与 Claude 答案不一致的地方（空列表表示一致）"""
+    diffs = []
+    if motion_type != claude_type:
+        diffs.append(f"motion_type {motion_type} != {claude_type}")
+    required = REQUIRED_PARAMETERS.get(claude_type, ())
+    for name in COMPARED_PARAMETERS:
+        ours, theirs = params.get(name), _to_float(claude_params.get(name))
+        if name not in required and (ours is None or theirs is None):
+            continue
+        if not _same(ours, theirs, tolerance):
+            diffs.append(f"{name} {ours} != {theirs}")
+    return diffs
+
+
+def load_samples(store: ResultStore, sources: set, tolerance: float) -> list:
+    """[(置信度, 扣分原因, 不一致之处, 题目文本)]"""
+    samples = []
+    for record in store.iter_records():
+        result = record.get("result") or {}
+        text = result.get("problem_text")
+        if record.get("source") not in sources or not text:
+            continue
+        claude_type = str(result.get("problem_type") or "projectile").removeprefix("physics_")
+        claude_params = result.get("parameters") or {}
+
+        motion_type = fallback_motion_rules.classify(text)
+        params = fallback_parameter_rules.extract(text)
+        confidence, reasons = fallback_motion_rules.confidence(text, motion_type, params)
+        samples.append((confidence, reasons, compare(motion_type, params, claude_type, claude_params, tolerance), text))
+    return samples
+
+
+def suggest_threshold(samples: list, target: float, min_samples: int):
+    """一致率达到 target 的最低阈值（覆盖的题目最多），没有满足条件的阈值时返回 None"""
+    for threshold in sorted({confidence for confidence, *_ in samples}):
+        covered = [diffs for confidence, _, diffs, _ in samples if confidence >= threshold]
+        if len(covered) >= min_samples and sum(not d for d in covered) / len(covered) >= target:
+            return threshold
+    return None
+
+
+def report(samples: list, args) -> None:
+    total = len(samples)
+    agreed = sum(not diffs for _, _, diffs, _ in samples)
+    print(f"共 {total} 条 Claude 结果，规则引擎与之一致 {agreed} 条（{agreed / total:.1%}）\n")
+
+    print(f"{'置信度':>8}{'样本':>8}{'一致率':>9}{'≥ 阈值占比':>12}{'≥ 阈值一致率':>14}")
+    by_score = defaultdict(list)
+    for confidence, _, diffs, _ in samples:
+        by_score[confidence].append(not diffs)
+    for confidence in sorted(by_score, reverse=True):
+        hits = by_score[confidence]
+        covered = [not d for c, _, d, _ in samples if c >= confidence]
+        print(f"{confidence:>8.4f}{len(hits):>8}{sum(hits) / len(hits):>9.1%}"
+              f"{len(covered) / total:>12.1%}{sum(covered) / len(covered):>14.1%}")
+
+    print(f"\n{'扣分原因':<24}{'样本':>8}{'一致率':>9}")
+    by_reason = defaultdict(list)
+    for _, reasons, diffs, _ in samples:
+        for reason in {r.split(":", 1)[0] for r in reasons} or {"(无)"}:
+            by_reason[reason].append(not diffs)
+    for reason, hits in sorted(by_reason.items()):
+        print(f"{reason:<24}{len(hits):>8}{sum(hits) / len(hits):>9.1%}")
+
+    threshold = suggest_threshold(samples, args.target, args.min_samples)
+    if threshold is None:
+        print(f"\n⚠️  没有一致率达到 {args.target:.1%}（且至少 {args.min_samples} 条）的阈值，建议关闭快速路径"
+              "（RULE_ENGINE_FAST_PATH_THRESHOLD=0）")
+    else:
+        covered = sum(confidence >= threshold for confidence, *_ in samples)
+        print(f"\n✅ 建议 RULE_ENGINE_FAST_PATH_THRESHOLD={threshold:g}：{covered / total:.1%} 的题目走快速路径，"
+              f"一致率 ≥ {args.target:.1%}")
+
+    if args.show:
+        mismatches = sorted((s for s in samples if s[2]), key=lambda s: -s[0])[:args.show]
+        if mismatches:
+            print("\n置信度最高的不一致样本：")
+        for confidence, reasons, diffs, text in mismatches:
+            print(f"  [{confidence:.4f}] {text[:60]}")
+            print(f"           {'; '.join(diffs)}{'（' + ', '.join(reasons) + '）' if reasons else ''}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="规则引擎置信度校准")
+    parser.add_argument("--store", default=os.environ.get("RESULT_STORE_PATH", ""),
+                        help="结果存储 JSONL 路径（默认 RESULT_STORE_PATH）")
+    parser.add_argument("--sources", default="claude,batch,split", help="参与校准的结果来源（逗号分隔）")
+    parser.add_argument("--target", type=float, default=0.98, help="快速路径要求的一致率")
+    parser.add_argument("--min-samples", type=int, default=20, help="建议阈值至少覆盖的样本数")
+    parser.add_argument("--tolerance", type=float, default=1e-3, help="参数数值的相对误差容限")
+    parser.add_argument("--show", type=int, default=0, help="列出置信度最高的 N 条不一致样本")
+    args = parser.parse_args()
+
+    if not args.store or not os.path.exists(args.store):
+        print(f"❌ 结果存储不存在: {args.store or '(未设置 RESULT_STORE_PATH)'}")
+        sys.exit(1)
+
+    sources = {s.strip() for s in args.sources.split(",") if s.strip()}
+    samples = load_samples(ResultStore(capacity=0, path=args.store), sources, args.tolerance)
+    if not samples:
+        print(f"❌ {args.store} 中没有来源为 {', '.join(sorted(sources))} 的结果")
+        sys.exit(1)
+    report(samples, args)
+
+
+if __name__ == "__main__":
+    main()
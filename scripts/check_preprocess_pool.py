@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+检查 `python app.py` 启动时图片预处理进程池是否正常工作
+
+1. 以子进程运行 python app.py（debug 模式，含 werkzeug 重载器），等待 /health
+2. 上传一张大图到 /upload（触发预处理）
+3. 读取 GET /pipeline/preprocess-pool：进程池没有被重建（pool_resets = 0）、
+   没有图片退回请求线程处理（inline_fallbacks = 0），且图片确实交给了进程池（pool_images ≥ 1）；
+   同时检查服务日志中没有 multiprocessing 的 bootstrapping 错误
+
+使用方法（先启动 API 替身：python scripts/stub_claude_server.py）：
+  CLAUDE_API_KEY=stub CLAUDE_BASE_URL=http://127.0.0.1:8765 python scripts/check_preprocess_pool.py
+"""
+
+import io
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import requests
+from PIL import Image
+
+project_root = Path(__file__).parent.parent
+
+BASE_URL = os.environ.get("BASE_URL", "http://127.0.0.1:5000")
+
+
+def make_photo() -> bytes:
+    """3000x2000 的噪声 JPEG（超过预处理长边上限，一定会被缩放）"""
+    out = io.BytesIO()
+    Image.effect_noise((3000, 2000), 64).convert("RGB").save(out, "JPEG", quality=90)
+    return out.getvalue()
+
+
+def wait_for_server(timeout: float = 60) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(f"{BASE_URL}/health", timeout=2).status_code == 200:
+                return True
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    return False
+
+
+def main():
+    env = dict(os.environ, IMAGE_PREPROCESS="true", PYTHONUNBUFFERED="1")
+    env.setdefault("IMAGE_PREPROCESS_WORKERS", "2")
+    log = tempfile.TemporaryFile(mode="w+")
+    # 新的进程组：结束时连同重载器子进程和 worker 一起终止
+    server = subprocess.Popen([sys.executable, "app.py"], cwd=project_root, env=env,
+                              stdout=log, stderr=subprocess.STDOUT, start_new_session=True)
+    try:
+        if not wait_for_server():
+            print("❌ 服务未能启动")
+            sys.exit(1)
+
+        resp = requests.post(f"{BASE_URL}/upload", files={"file": ("photo.jpg", make_photo(), "image/jpeg")},
+                             timeout=120)
+        print(f"ℹ️  /upload 返回 {resp.status_code}")
+        stats = requests.get(f"{BASE_URL}/pipeline/preprocess-pool", timeout=10).json()
+        print(f"ℹ️  进程池统计: {stats}")
+    finally:
+        os.killpg(server.pid, signal.SIGTERM)
+        server.wait(timeout=30)
+
+    log.seek(0)
+    bootstrap_errors = log.read().count("bootstrapping phase")
+    failures = []
+    if stats.get("pool_resets"):
+        failures.append(f"进程池重建 {stats['pool_resets']} 次")
+    if stats.get("inline_fallbacks"):
+        failures.append(f"{stats['inline_fallbacks']} 张图片退回请求线程处理")
+    if not stats.get("pool_images"):
+        failures.append("没有图片交给进程池处理")
+    if bootstrap_errors:
+        failures.append(f"日志中有 {bootstrap_errors} 处 bootstrapping 错误")
+
+    if failures:
+        print(f"❌ {'；'.join(failures)}")
+        sys.exit(1)
+    print(f"✅ 进程池正常（创建 {stats['pools_created']} 次，处理 {stats['pool_images']} 张图片）")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+分块续传上传客户端（可注入断线，用于测试 / 对比 multipart 上传）
+
+断线模型：每发送若干字节随机断开一次连接（指数分布，平均间隔 --drop-every-kb），
+断开时直接关闭 socket，服务端读到的请求体不完整。
+- multipart /upload：断线后只能从头重新上传
+- 分块会话（/upload/sessions）：断线后查询已收到的字节数，从断点继续
+创建会话、查询偏移和 finalize 这些小请求不注入断线。
+
+使用方法：
+  # 上传一张或多张图片（同一道题），断线时自动续传
+  python scripts/resumable_upload.py stem.jpg diagram.jpg --url http://127.0.0.1:5000
+
+  # 对比两种上传方式的完成率和出结果时间（--serve 在本进程内启动服务）
+  python scripts/resumable_upload.py --compare --serve --trials 20 --drop-every-kb 400 --bandwidth-kbps 2000
+
+本地联调：先启动 python scripts/stub_claude_server.py，
+再设置 CLAUDE_BASE_URL=http://127.0.0.1:8765 CLAUDE_API_KEY=stub
+"""
+
+import argparse
+import functools
+import http.client
+import json
+import os
+import random
+import socket
+import statistics
+import sys
+import threading
+import time
+import uuid
+from pathlib import Path
+from urllib.parse import urlsplit
+
+# 添加项目根目录到 Python 路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+sys.path.insert(0, str(Path(__file__).parent))
+
+# 每次写入 socket 的大小（限速粒度）
+SEND_PIECE = 16 * 1024
+
+
+class ConnectionDropped(Exception):
+    """注入的断线"""
+
+
+class LossyLink:
+    """按指数分布随机断线、按带宽限速的发送端"""
+
+    def __init__(self, drop_every_kb: float = 0, bandwidth_kbps: float = 0, seed: int = 0):
+        self.rng = random.Random(seed)
+        self.mean_bytes = drop_every_kb * 1024
+        self.bytes_per_second = bandwidth_kbps * 1024 / 8
+        self.bytes_sent = 0
+        self.drops = 0
+        self._until_drop = self._next_drop()
+
+    def _next_drop(self) -> float:
+        return self.rng.expovariate(1 / self.mean_bytes) if self.mean_bytes > 0 else float("inf")
+
+    def send(self, conn: http.client.HTTPConnection, data: bytes) -> None:
+        """发送请求体；到达断线点时关闭 socket 并抛出 ConnectionDropped"""
+        view = memoryview(data)
+        for start in range(0, len(view), SEND_PIECE):
+            piece = view[start:start + SEND_PIECE]
+            if len(piece) >= self._until_drop:
+                partial = int(self._until_drop)
+                conn.send(piece[:partial])
+                self.bytes_sent += partial
+                self._until_drop = self._next_drop()
+                self.drops += 1
+                conn.sock.shutdown(socket.SHUT_RDWR)
+                conn.close()
+                raise ConnectionDropped()
+            conn.send(piece)
+            self.bytes_sent += len(piece)
+            self._until_drop -= len(piece)
+            if self.bytes_per_second:
+                time.sleep(len(piece) / self.bytes_per_second)
+
+
+def _connect(base_url: str, timeout: float) -> http.client.HTTPConnection:
+    parts = urlsplit(base_url)
+    conn_class = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+    return conn_class(parts.hostname, parts.port, timeout=timeout)
+
+
+def _request(base_url: str, method: str, path: str, body: bytes = b"", headers: dict = None,
+             link: LossyLink = None, timeout: float = 120) -> tuple:
+    """发送一个请求，返回 (状态码, JSON)；link 不为 None 时请求体经过 LossyLink 发送"""
+    conn = _connect(base_url, timeout)
+    try:
+        conn.putrequest(method, path)
+        for name, value in (headers or {}).items():
+            conn.putheader(name, value)
+        conn.putheader("Content-Length", str(len(body)))
+        conn.endheaders()
+        if link is not None:
+            link.send(conn, body)
+        elif body:
+            conn.send(body)
+        response = conn.getresponse()
+        raw = response.read()
+        return response.status, json.loads(raw) if raw else {}
+    finally:
+        conn.close()
+
+
+def _json_request(base_url: str, method: str, path: str, payload: dict = None) -> tuple:
+    body = json.dumps(payload).encode("utf-8") if payload is not None else b""
+    return _request(base_url, method, path, body, {"Content-Type": "application/json"})
+
+
+def upload_multipart(base_url: str, files: list, link: LossyLink, max_retries: int) -> dict:
+    """一次性 multipart 上传到 /upload，断线后从头重传"""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for filename, data in files:
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+            f"Content-Type: application/octet-stream\r\n\r\n".encode("utf-8") + data + b"\r\n"
+        )
+    body = b"".join(parts) + f"--{boundary}--\r\n".encode("utf-8")
+    headers = {"Content-Type": f"multipart/form-data; boundary={boundary}"}
+
+    for attempt in range(max_retries + 1):
+        try:
+            status, data = _request(base_url, "POST", "/upload", body, headers, link)
+            return {"ok": status == 200, "status": status, "attempts": attempt + 1, "response": data}
+        except (ConnectionDropped, ConnectionError, http.client.HTTPException):
+            continue
+    return {"ok": False, "status": None, "attempts": max_retries + 1, "response": None}
+
+
+def upload_resumable(base_url: str, files: list, link: LossyLink, max_retries: int,
+                     chunk_size: int = 256 * 1024) -> dict:
+    """分块会话上传：断线后查询已收到的字节数，从断点继续"""
+    status, session = _json_request(base_url, "POST", "/upload/sessions", {
+        "files": [{"filename": filename, "size": len(data)} for filename, data in files],
+    })
+    if status != 201:
+        return {"ok": False, "status": status, "attempts": 1, "response": session}
+    session_id = session["session_id"]
+
+    drops = 0
+    for index, (_, data) in enumerate(files):
+        offset = 0
+        while offset < len(data):
+            chunk = data[offset:offset + chunk_size]
+            try:
+                status, result = _request(
+                    base_url, "PUT", f"/upload/sessions/{session_id}/files/{index}", chunk,
+                    {"Upload-Offset": str(offset), "Content-Type": "application/octet-stream"}, link,
+                )
+            except (ConnectionDropped, ConnectionError, http.client.HTTPException):
+                drops += 1
+                if drops > max_retries:
+                    _json_request(base_url, "DELETE", f"/upload/sessions/{session_id}")
+                    return {"ok": False, "status": None, "attempts": drops, "response": None}
+                # 断点续传：以服务端实际收到的字节数为准
+                _, state = _json_request(base_url, "GET", f"/upload/sessions/{session_id}")
+                offset = state["files"][index]["received"]
+                continue
+            if status != 200:
+                return {"ok": False, "status": status, "attempts": drops + 1, "response": result}
+            offset = result["received"]
+
+    status, data = _json_request(base_url, "POST", f"/upload/sessions/{session_id}/finalize")
+    return {"ok": status == 200, "status": status, "attempts": drops + 1, "response": data}
+
+
+def _serve() -> str:
+    """在本进程内启动服务（多线程），返回 base URL"""
+    from werkzeug.serving import make_server
+
+    from app import create_app
+
+    server = make_server("127.0.0.1", 0, create_app(), threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}"
+
+
+def _load_files(paths: list) -> list:
+    if paths:
+        return [(Path(p).name, Path(p).read_bytes()) for p in paths]
+    from bench_image_preprocess import make_sample_photo
+
+    return [("sample.jpg", make_sample_photo())]
+
+
+def compare(base_url: str, files: list, args) -> None:
+    total = sum(len(data) for _, data in files)
+    print(f"上传 {len(files)} 个文件共 {total / 1024:.0f}KB，平均每 {args.drop_every_kb:g}KB 断线一次，"
+          f"带宽 {args.bandwidth_kbps or '不限'} kbps，最多重连 {args.max_retries} 次，{args.trials} 次试验")
+    print(f"{'方式':<12}{'完成率':>8}{'p50 s':>9}{'平均 s':>9}{'发送 KB':>10}{'断线次数':>10}")
+    resumable = functools.partial(upload_resumable, chunk_size=args.chunk_kb * 1024)
+    for label, upload in (("multipart", upload_multipart), ("分块续传", resumable)):
+        durations, sent, drops, done = [], 0, 0, 0
+        for trial in range(args.trials):
+            link = LossyLink(args.drop_every_kb, args.bandwidth_kbps, seed=trial)
+            started = time.perf_counter()
+            result = upload(base_url, files, link, args.max_retries)
+            if result["ok"]:
+                done += 1
+                durations.append(time.perf_counter() - started)
+            sent += link.bytes_sent
+            drops += link.drops
+        p50 = f"{statistics.median(durations):.2f}" if durations else "-"
+        mean = f"{statistics.mean(durations):.2f}" if durations else "-"
+        print(f"{label:<12}{done / args.trials:>8.0%}{p50:>9}{mean:>9}"
+              f"{sent / args.trials / 1024:>10.0f}{drops / args.trials:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="分块续传上传客户端")
+    parser.add_argument("files", nargs="*", help="图片文件（按顺序属于同一道题；--compare 时默认生成一张 12MP 样例）")
+    parser.add_argument("--url", default=os.environ.get("BASE_URL", "http://127.0.0.1:5000"))
+    parser.add_argument("--serve", action="store_true", help="在本进程内启动服务（忽略 --url）")
+    parser.add_argument("--drop-every-kb", type=float, default=0, help="平均每发送多少 KB 断线一次（0 表示不断线）")
+    parser.add_argument("--bandwidth-kbps", type=float, default=0, help="上行带宽（kbps，0 表示不限速）")
+    parser.add_argument("--max-retries", type=int, default=5, help="每次上传最多重连次数")
+    parser.add_argument("--chunk-kb", type=int, default=256, help="分块大小（KB）")
+    parser.add_argument("--compare", action="store_true", help="对比 multipart 与分块续传")
+    parser.add_argument("--trials", type=int, default=10, help="--compare 的试验次数")
+    parser.add_argument("--seed", type=int, default=0, help="断线随机种子")
+    args = parser.parse_args()
+
+    base_url = _serve() if args.serve else args.url
+    files = _load_files(args.files)
+
+    if args.compare:
+        compare(base_url, files, args)
+        return
+
+    link = LossyLink(args.drop_every_kb, args.bandwidth_kbps, seed=args.seed)
+    started = time.perf_counter()
+    result = upload_resumable(base_url, files, link, args.max_retries, args.chunk_kb * 1024)
+    print(f"{'✅' if result['ok'] else '❌'} 状态码 {result['status']}，断线 {link.drops} 次，"
+          f"发送 {link.bytes_sent / 1024:.0f}KB，耗时 {time.perf_counter() - started:.2f}s")
+    print(json.dumps(result["response"], ensure_ascii=False, indent=2))
+    sys.exit(0 if result["ok"] else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+"""
+本地 Claude API 替身服务器（无需 API Key / 网络）
+
+实现了 Pipeline 用到的最小接口子集，用于联调和验证：
+- POST   /v1/messages          返回固定的物理题 JSON（带 usage）
+- POST   /v1/files             Files API 上传，返回 file_id
+- DELETE /v1/files/<file_id>   删除文件
+- POST   /v1/messages/batches  创建批次（--batch-delay 秒后结束）
+- GET    /v1/messages/batches/<id>[/results]  查询批次 / 下载 JSONL 结果
+- GET    /_stats               调用统计（消息数、上传数、请求体字节数等）
+
+使用方法：
+  python scripts/stub_claude_server.py --port 8765
+
+  # 另一个终端：让后端指向替身服务器
+  export CLAUDE_API_KEY=stub
+  export CLAUDE_BASE_URL=http://127.0.0.1:8765
+  export CLAUDE_USE_FILES_API=true
+  python app.py
+
+  # 前 1 次消息返回非法 JSON，用于验证重试时图片只上传一次
+  python scripts/stub_claude_server.py --invalid-first 1
+
+  # 批次提交 5 秒后结束（配合 scripts/bulk_submit.py）
+  python scripts/stub_claude_server.py --batch-delay 5
+
+  # 每次消息延迟 3 秒返回，用于验证请求截止时间 / 客户端断开取消
+  python scripts/stub_claude_server.py --message-delay 3
+"""
+
+import argparse
+import itertools
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_RESPONSE = {
+    "problem_text": "一个物体从10米高处以15m/s的初速度水平抛出，g=9.8m/s²，求落地时间。",
+    "problem_type": "horizontal_projectile",
+    "parameters": {
+        "initial_speed": 15,
+        "angle": 0,
+        "initial_height": 10,
+        "gravity": 9.8,
+        "friction": None,
+    },
+    "solution_steps": [
+        "步骤1：识别为平抛运动",
+        "步骤2：竖直方向 h = g t² / 2",
+        "步骤3：t = sqrt(2h/g) ≈ 1.43 s",
+    ],
+    "animation_instructions": {
+        "type": "projectile",
+        "initial_speed": 15,
+        "angle": 0,
+        "gravity": 9.8,
+        "initial_x": 0,
+        "initial_y": 10,
+    },
+}
+
+
+class StubState:
+    """替身服务器的共享状态"""
+
+    def __init__(self, response: dict, invalid_first: int, batch_delay: float = 0.0, message_delay: float = 0.0):
+        self.lock = threading.Lock()
+        self.response = response
+        self.invalid_remaining = invalid_first
+        self.batch_delay = batch_delay
+        self.message_delay = message_delay
+        self.ids = itertools.count(1)
+        self.files = {}
+        self.batches = {}
+        self.stats = {
+            "messages": 0,
+            "message_body_bytes": 0,
+            "files_uploaded": 0,
+            "files_deleted": 0,
+            "image_blocks_base64": 0,
+            "image_blocks_file": 0,
+            "batches_created": 0,
+            "batch_requests": 0,
+        }
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    state: StubState = None
+
+    def log_message(self, fmt, *args):
+        print(f"[stub] {self.command} {self.path} -> {fmt % args}")
+
+    def _send_json(self, status: int, payload: dict):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status: int, message: str):
+        self._send_json(status, {
+            "type": "error",
+            "error": {"type": "invalid_request_error", "message": message},
+        })
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get("Content-Length", "0") or 0)
+        return self.rfile.read(length) if length else b""
+
+    @property
+    def route(self) -> str:
+        return self.path.split("?", 1)[0]
+
+    def do_GET(self):
+        if self.route == "/_stats":
+            with self.state.lock:
+                self._send_json(200, dict(self.state.stats, files_alive=len(self.state.files)))
+            return
+        m = re.fullmatch(r"/v1/messages/batches/([\w-]+)(/results)?", self.route)
+        if m:
+            self._handle_batch_get(m.group(1), bool(m.group(2)))
+            return
+        self._error(404, f"unknown route {self.route}")
+
+    def do_POST(self):
+        if self.route == "/v1/messages":
+            self._handle_messages()
+        elif self.route == "/v1/messages/batches":
+            self._handle_batch_create()
+        elif self.route == "/v1/files":
+            self._handle_file_upload()
+        else:
+            self._error(404, f"unknown route {self.route}")
+
+    def do_DELETE(self):
+        m = re.fullmatch(r"/v1/files/([\w-]+)", self.route)
+        if not m:
+            self._error(404, f"unknown route {self.route}")
+            return
+        file_id = m.group(1)
+        with self.state.lock:
+            existed = self.state.files.pop(file_id, None) is not None
+            if existed:
+                self.state.stats["files_deleted"] += 1
+        if not existed:
+            self._error(404, f"file {file_id} not found")
+            return
+        self._send_json(200, {"id": file_id, "type": "file_deleted"})
+
+    def _handle_file_upload(self):
+        body = self._read_body()
+        content_type = self.headers.get("Content-Type", "")
+        mime = re.search(rb"Content-Type:\s*(image/\w+)", body)
+        with self.state.lock:
+            file_id = f"file_stub_{next(self.state.ids)}"
+            self.state.files[file_id] = len(body)
+            self.state.stats["files_uploaded"] += 1
+        self._send_json(200, {
+            "id": file_id,
+            "type": "file",
+            "filename": f"{file_id}.img",
+            "mime_type": mime.group(1).decode() if mime else "image/jpeg",
+            "size_bytes": len(body),
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "downloadable": False,
+        })
+        if not content_type.startswith("multipart/form-data"):
+            print("[stub] ⚠️  Files API 上传不是 multipart/form-data")
+
+    def _next_text(self) -> str:
+        """下一条回复文本（调用方持有锁）"""
+        if self.state.invalid_remaining > 0:
+            self.state.invalid_remaining -= 1
+            return "抱歉，我无法返回 JSON。"
+        return json.dumps(self.state.response, ensure_ascii=False)
+
+    def _message(self, model: str, text: str, input_tokens: int) -> dict:
+        return {
+            "id": f"msg_stub_{next(self.state.ids)}",
+            "type": "message",
+            "role": "assistant",
+            "model": model,
+            "content": [{"type": "text", "text": text}],
+            "stop_reason": "end_turn",
+            "stop_sequence": None,
+            "usage": {
+                "input_tokens": max(input_tokens, 1),
+                "output_tokens": max(len(text) // 4, 1),
+            },
+        }
+
+    def _batch_payload(self, batch_id: str) -> dict:
+        batch = self.state.batches[batch_id]
+        ended = time.time() >= batch["ends_at"]
+        total = len(batch["results"])
+        host, port = self.server.server_address[:2]
+        return {
+            "id": batch_id,
+            "type": "message_batch",
+            "processing_status": "ended" if ended else "in_progress",
+            "request_counts": {
+                "processing": 0 if ended else total,
+                "succeeded": total if ended else 0,
+                "errored": 0,
+                "canceled": 0,
+                "expired": 0,
+            },
+            "created_at": batch["created_at"],
+            "expires_at": batch["created_at"],
+            "ended_at": batch["created_at"] if ended else None,
+            "archived_at": None,
+            "cancel_initiated_at": None,
+            "results_url": f"http://{host}:{port}/v1/messages/batches/{batch_id}/results" if ended else None,
+        }
+
+    def _handle_batch_create(self):
+        body = self._read_body()
+        try:
+            payload = json.loads(body)
+        except json.JSONDecodeError:
+            self._error(400, "body is not valid JSON")
+            return
+
+        with self.state.lock:
+            batch_id = f"msgbatch_stub_{next(self.state.ids)}"
+            results = []
+            for request in payload.get("requests", []):
+                params = request.get("params", {})
+                text = self._next_text()
+                # 粗略估算：请求体每 4 字节约 1 token
+                input_tokens = len(json.dumps(params)) // 4
+                results.append({
+                    "custom_id": request["custom_id"],
+                    "result": {"type": "succeeded", "message": self._message(params.get("model", "stub"), text, input_tokens)},
+                })
+            self.state.batches[batch_id] = {
+                "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                "ends_at": time.time() + self.state.batch_delay,
+                "results": results,
+            }
+            self.state.stats["batches_created"] += 1
+            self.state.stats["batch_requests"] += len(results)
+            response = self._batch_payload(batch_id)
+        self._send_json(200, response)
+
+    def _handle_batch_get(self, batch_id: str, results: bool):
+        with self.state.lock:
+            if batch_id not in self.state.batches:
+                self._error(404, f"batch {batch_id} not found")
+                return
+            payload = self._batch_payload(batch_id)
+            lines = [json.dumps(r, ensure_ascii=False) for r in self.state.batches[batch_id]["results"]]
+
+        if not results:
+            self._send_json(200, payload)
+            return
+        if payload["processing_status"] != "ended":
+            self._error(400, "batch has not ended")
+            return
+        body = ("\n".join(lines) + "\n").encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/binary")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _handle_messages(self):
+        body = self._read_body()
+        try:
+            payload = json.loads(body)
+        except json.JSONDecodeError:
+            self._error(400, "body is not valid JSON")
+            return
+
+        with self.state.lock:
+            self.state.stats["messages"] += 1
+            self.state.stats["message_body_bytes"] += len(body)
+
+            for message in payload.get("messages", []):
+                content = message.get("content")
+                if not isinstance(content, list):
+                    continue
+                for block in content:
+                    if block.get("type") != "image":
+                        continue
+                    source = block.get("source", {})
+                    if source.get("type") == "file":
+                        if source.get("file_id") not in self.state.files:
+                            self._error(404, f"file {source.get('file_id')} not found")
+                            return
+                        self.state.stats["image_blocks_file"] += 1
+                    else:
+                        self.state.stats["image_blocks_base64"] += 1
+
+            text = self._next_text()
+            # 粗略估算：请求体每 4 字节约 1 token
+            message = self._message(payload.get("model", "stub"), text, len(body) // 4)
+
+        if self.state.message_delay:
+            time.sleep(self.state.message_delay)
+        try:
+            self._send_json(200, message)
+        except (BrokenPipeError, ConnectionResetError):
+            print("[stub] ⚠️  客户端在响应前断开（超时）")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地 Claude API 替身服务器")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--response-file", help="自定义返回 JSON 文件（默认内置平抛题）")
+    parser.add_argument("--invalid-first", type=int, default=0, help="前 N 次消息返回非法 JSON")
+    parser.add_argument("--batch-delay", type=float, default=0.0, help="批次创建后多少秒变为 ended")
+    parser.add_argument("--message-delay", type=float, default=0.0, help="每次消息延迟多少秒返回")
+    args = parser.parse_args()
+
+    response = DEFAULT_RESPONSE
+    if args.response_file:
+        with open(args.response_file, encoding="utf-8") as f:
+            response = json.load(f)
+
+    StubHandler.state = StubState(response, args.invalid_first, args.batch_delay, args.message_delay)
+    server = ThreadingHTTPServer((args.host, args.port), StubHandler)
+    print(f"✅ Claude 替身服务器已启动: http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+训练运动类型分类器（services/motion_classifier.py）：以结果存储中 Claude 给出的 problem_type 为标注
+
+1. 读取 RESULT_STORE_PATH 中来源为 claude / batch / split 的结果（problem_text -> problem_type）
+2. 按 --holdout 划出验证集，在其余样本上训练，报告验证集上：
+   - 分类器、规则引擎（claude_pipeline.detect_motion_type）各自与 Claude 的一致率，以及两者之间的一致率
+   - 分类器概率不低于各阈值时的覆盖率和准确率
+   - 单条文本推理耗时（取多次重复的最小值）
+3. 在全部样本上重新训练，保存为 .npz（服务通过 MOTION_CLASSIFIER_PATH 加载）
+
+使用方法：
+  python scripts/train_motion_classifier.py --output uploads/motion_classifier.npz
+  python scripts/train_motion_classifier.py --store data/results.jsonl --bits 15 --epochs 300 --holdout 0.3
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+
+# 添加项目根目录到 Python 路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from services.claude_pipeline import detect_motion_type
+from services.motion_classifier import DEFAULT_BITS, MotionClassifier
+from services.result_store import ResultStore
+
+
+def load_examples(store: ResultStore, sources: set) -> list:
+    """[(题目文本, Claude 的运动类型)]，同一题目文本只保留最后一条"""
+    examples = {}
+    for record in store.iter_records():
+        result = record.get("result") or {}
+        text = result.get("problem_text")
+        if record.get("source") not in sources or not text:
+            continue
+        examples[text] = str(result.get("problem_type") or "projectile").removeprefix("physics_")
+    return list(examples.items())
+
+
+def time_inference(classifier: MotionClassifier, texts: list, repeat: int) -> float:
+    """单条文本的平均推理耗时（µs，取 repeat 次的最小值）"""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for text in texts:
+            classifier.predict(text)
+        best = min(best, time.perf_counter() - started)
+    return best / len(texts) * 1e6
+
+
+def report(classifier: MotionClassifier, holdout: list, args) -> None:
+    predictions = [classifier.predict(text) for text, _ in holdout]
+    rules = [detect_motion_type(text) for text, _ in holdout]
+    truth = [label for _, label in holdout]
+    total = len(holdout)
+
+    def rate(flags):
+        flags = list(flags)
+        return f"{sum(flags) / len(flags):.1%}" if flags else "-"
+
+    print(f"\n验证集 {total} 条：")
+    print(f"  分类器与 Claude 一致      {rate(p == t for (p, _), t in zip(predictions, truth))}")
+    print(f"  规则引擎与 Claude 一致    {rate(r == t for r, t in zip(rules, truth))}")
+    print(f"  分类器与规则引擎一致      {rate(p == r for (p, _), r in zip(predictions, rules))}")
+
+    print(f"\n{'类型':<24}{'样本':>6}{'分类器':>9}{'规则引擎':>10}")
+    for label, count in sorted(Counter(truth).items()):
+        picked = [i for i, t in enumerate(truth) if t == label]
+        print(f"{label:<24}{count:>6}{rate(predictions[i][0] == label for i in picked):>9}"
+              f"{rate(rules[i] == label for i in picked):>10}")
+
+    print(f"\n{'概率 ≥':>8}{'覆盖率':>9}{'准确率':>9}")
+    for threshold in (0.5, 0.7, 0.8, 0.9, 0.95, 0.99):
+        covered = [p == t for (p, prob), t in zip(predictions, truth) if prob >= threshold]
+        print(f"{threshold:>8.2f}{len(covered) / total:>9.1%}{rate(covered):>9}")
+
+    texts = [text for text, _ in holdout]
+    micros = time_inference(classifier, texts, args.repeat)
+    avg_chars = sum(len(t) for t in texts) / total
+    print(f"\n推理耗时 {micros:.1f} µs/条（平均 {avg_chars:.0f} 字符）{'✅' if micros < 100 else '⚠️  超过 100 µs'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="训练运动类型分类器")
+    parser.add_argument("--store", default=os.environ.get("RESULT_STORE_PATH", ""),
+                        help="结果存储 JSONL 路径（默认 RESULT_STORE_PATH）")
+    parser.add_argument("--output", default=os.environ.get("MOTION_CLASSIFIER_PATH", "") or "motion_classifier.npz",
+                        help="模型输出路径（默认 MOTION_CLASSIFIER_PATH）")
+    parser.add_argument("--sources", default="claude,batch,split", help="参与训练的结果来源（逗号分隔）")
+    parser.add_argument("--bits", type=int, default=DEFAULT_BITS, help="哈希桶数为 2^bits")
+    parser.add_argument("--epochs", type=int, default=200, help="训练轮数")
+    parser.add_argument("--holdout", type=float, default=0.2, help="验证集比例")
+    parser.add_argument("--min-samples", type=int, default=5, help="样本少于该数的类型不参与训练")
+    parser.add_argument("--seed", type=int, default=0, help="划分验证集的随机种子")
+    parser.add_argument("--repeat", type=int, default=5, help="推理计时重复次数")
+    args = parser.parse_args()
+
+    if not args.store or not os.path.exists(args.store):
+        print(f"❌ 结果存储不存在: {args.store or '(未设置 RESULT_STORE_PATH)'}")
+        sys.exit(1)
+
+    sources = {s.strip() for s in args.sources.split(",") if s.strip()}
+    examples = load_examples(ResultStore(capacity=0, path=args.store), sources)
+    counts = Counter(label for _, label in examples)
+    dropped = {label for label, count in counts.items() if count < args.min_samples}
+    examples = [(text, label) for text, label in examples if label not in dropped]
+    if len({label for _, label in examples}) < 2:
+        print(f"❌ 样本不足：至少需要两种运动类型各 {args.min_samples} 条（现有 {dict(counts)}）")
+        sys.exit(1)
+    print(f"共 {len(examples)} 条样本：{dict(sorted(counts.items()))}")
+    if dropped:
+        print(f"⚠️  样本过少，跳过类型: {', '.join(sorted(dropped))}")
+
+    random.Random(args.seed).shuffle(examples)
+    split = int(len(examples) * (1 - args.holdout))
+    if 0 < split < len(examples):
+        train, holdout = examples[:split], examples[split:]
+        started = time.perf_counter()
+        classifier = MotionClassifier.train([t for t, _ in train], [l for _, l in train], args.bits, epochs=args.epochs)
+        print(f"训练 {len(train)} 条，耗时 {time.perf_counter() - started:.1f}s")
+        report(classifier, holdout, args)
+
+    classifier = MotionClassifier.train([t for t, _ in examples], [l for _, l in examples], args.bits, epochs=args.epochs)
+    classifier.save(args.output)
+    print(f"\n✅ 已用全部 {len(examples)} 条样本训练并保存到 {args.output}（{os.path.getsize(args.output) / 1024:.0f}KB）")
+
+
+if __name__ == "__main__":
+    main()
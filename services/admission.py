@@ -0,0 +1,229 @@
+"""上传请求的全局内存预算与准入控制
+
+MAX_CONTENT_LENGTH 只限制单个请求；并发上传时原图、base64、JSON 请求体等副本的总量没有上限，
+几百个并发上传就可能让 worker 被 OOM kill。这里在上传视图解析请求体之前按
+「Content-Length × 每字节内存系数」向进程级预算申请额度：
+
+- 额度足够：立即放行，视图返回（pipeline 结束）后释放
+- 额度不足：最多排队 UPLOAD_ADMISSION_WAIT 秒，仍不足时返回 503 + Retry-After
+
+每字节内存系数按接收模式估算（见 services/ingest.py，bench_ingest_memory.py 实测）：
+raw 模式约 2 倍（原图 + 预处理结果 + 余量），base64 模式约 2.7 倍（base64 + SDK 的 JSON 请求体）。
+
+环境变量：
+- UPLOAD_MEMORY_BUDGET_MB: 进程级预算（MB，可选，默认 1024，0 表示不限制）
+- UPLOAD_MEMORY_FACTOR: 每字节内存系数（可选，默认 auto 按接收模式估算）
+- UPLOAD_ADMISSION_WAIT: 额度不足时最多排队的秒数（可选，默认 2）
+"""
+
+import functools
+import logging
+import math
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from flask import current_app, jsonify, request
+
+from services.ingest import get_ingest_mode
+
+logger = logging.getLogger(__name__)
+
+# 各接收模式下每字节上传数据的内存系数
+MODE_MEMORY_FACTORS = {"raw": 2.0, "base64": 2.7}
+
+# Retry-After 的范围（秒）
+MIN_RETRY_AFTER = 1
+MAX_RETRY_AFTER = 30
+
+
+def get_memory_budget() -> int:
+    """进程级内存预算（字节，0 表示不限制）"""
+    try:
+        return max(int(float(os.environ.get("UPLOAD_MEMORY_BUDGET_MB", "1024")) * 1024 * 1024), 0)
+    except ValueError:
+        return 1024 * 1024 * 1024
+
+
+def get_memory_factor() -> float:
+    raw = os.environ.get("UPLOAD_MEMORY_FACTOR", "auto").lower()
+    if raw != "auto":
+        try:
+            return max(float(raw), 0.0)
+        except ValueError:
+            pass
+    return MODE_MEMORY_FACTORS[get_ingest_mode()]
+
+
+def get_admission_wait() -> float:
+    try:
+        return max(float(os.environ.get("UPLOAD_ADMISSION_WAIT", "2")), 0.0)
+    except ValueError:
+        return 2.0
+
+
+def estimate_request_cost(content_length: Optional[int], max_content_length: Optional[int] = None) -> int:
+    """估算一个上传请求在处理期间占用的内存（字节）
+
+    没有 Content-Length（chunked 上传）时按 MAX_CONTENT_LENGTH 估算。
+    """
+    size = content_length if content_length is not None else (max_content_length or 0)
+    return int(size * get_memory_factor())
+
+
+class Reservation:
+    """一次预算占用；with 块结束或调用 release() 时归还（可重复调用）"""
+
+    def __init__(self, budget: "MemoryBudget", nbytes: int, waited_s: float):
+        self.budget = budget
+        self.nbytes = nbytes
+        self.waited_s = waited_s
+        self.acquired_at = time.monotonic()
+        self._released = False
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self.budget._release(self)
+
+    def __enter__(self) -> "Reservation":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
+
+
+class MemoryBudget:
+    """线程安全的字节预算：申请不足时排队等待，超时返回 None"""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._in_use = 0
+        self._peak = 0
+        self._active = 0
+        self._waiting = 0
+        self._admitted = 0
+        self._queued = 0
+        self._rejected = 0
+        self._total_wait_s = 0.0
+        # 占用时长的指数移动平均，用于估算 Retry-After
+        self._avg_hold_s: Optional[float] = None
+
+    def try_reserve(self, nbytes: int, timeout: float = 0.0) -> Optional[Reservation]:
+        """申请 nbytes 额度，最多等待 timeout 秒
+
+        单个请求的估算超过整个预算时按整个预算计（空闲时仍可单独放行）。
+
+        Returns:
+            Reservation，或超时仍不足时返回 None
+        """
+        capacity = get_memory_budget()
+        nbytes = max(nbytes, 0)
+        if capacity > 0:
+            nbytes = min(nbytes, capacity)
+
+        started = time.monotonic()
+        with self._cond:
+            waited = False
+            while capacity > 0 and self._in_use + nbytes > capacity:
+                remaining = timeout - (time.monotonic() - started)
+                if remaining <= 0:
+                    self._rejected += 1
+                    return None
+                waited = True
+                self._waiting += 1
+                try:
+                    self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+
+            waited_s = time.monotonic() - started
+            self._in_use += nbytes
+            self._peak = max(self._peak, self._in_use)
+            self._active += 1
+            self._admitted += 1
+            if waited:
+                self._queued += 1
+                self._total_wait_s += waited_s
+        return Reservation(self, nbytes, waited_s)
+
+    def _release(self, reservation: Reservation) -> None:
+        held_s = time.monotonic() - reservation.acquired_at
+        with self._cond:
+            self._in_use -= reservation.nbytes
+            self._active -= 1
+            if self._avg_hold_s is None:
+                self._avg_hold_s = held_s
+            else:
+                self._avg_hold_s = 0.8 * self._avg_hold_s + 0.2 * held_s
+            self._cond.notify_all()
+
+    def retry_after(self) -> int:
+        """建议客户端的重试间隔（秒）：近期请求的平均占用时长"""
+        with self._cond:
+            avg_hold_s = self._avg_hold_s
+        if avg_hold_s is None:
+            return MIN_RETRY_AFTER
+        return min(max(math.ceil(avg_hold_s), MIN_RETRY_AFTER), MAX_RETRY_AFTER)
+
+    def stats(self) -> Dict[str, Any]:
+        capacity = get_memory_budget()
+        with self._cond:
+            return {
+                "capacity_bytes": capacity,
+                "in_use_bytes": self._in_use,
+                "peak_bytes": self._peak,
+                "utilization": round(self._in_use / capacity, 4) if capacity else None,
+                "active": self._active,
+                "waiting": self._waiting,
+                "admitted": self._admitted,
+                "queued": self._queued,
+                "rejected": self._rejected,
+                "avg_queue_wait_ms": round(self._total_wait_s / self._queued * 1000, 1) if self._queued else 0.0,
+                "avg_hold_s": round(self._avg_hold_s, 3) if self._avg_hold_s is not None else None,
+                "memory_factor": get_memory_factor(),
+            }
+
+
+# 全局单例
+upload_budget = MemoryBudget()
+
+
+def get_admission_stats() -> Dict[str, Any]:
+    return upload_budget.stats()
+
+
+def busy_response(cost: int):
+    """预算不足时的 503 响应（带 Retry-After）"""
+    retry_after = upload_budget.retry_after()
+    logger.warning(
+        f"⚠️  内存预算不足，拒绝上传（需要 {cost / 1024 / 1024:.1f}MB，"
+        f"已占用 {upload_budget.stats()['in_use_bytes'] / 1024 / 1024:.1f}MB）"
+    )
+    response = jsonify({
+        "error": "server_busy",
+        "message": "服务器繁忙，请稍后重试",
+        "details": f"上传内存预算已满，建议 {retry_after} 秒后重试"
+    })
+    response.status_code = 503
+    response.headers["Retry-After"] = str(retry_after)
+    return response
+
+
+def admission_controlled(view):
+    """上传视图的准入控制装饰器：在解析请求体之前申请预算，视图返回后释放"""
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        cost = estimate_request_cost(request.content_length, current_app.config.get("MAX_CONTENT_LENGTH"))
+        reservation = upload_budget.try_reserve(cost, get_admission_wait())
+        if reservation is None:
+            return busy_response(cost)
+
+        with reservation:
+            if reservation.waited_s > 0.01:
+                logger.info(f"内存预算排队 {reservation.waited_s * 1000:.0f}ms 后放行")
+            return view(*args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,472 @@
+"""离线批量模式（Message Batches API）
+
+老师批量准备题目时不需要交互式延迟：把多张图片打包成 Message Batch 提交，
+价格和限流成本都低于逐张调用 /upload。
+
+流程：
+1. submit_bulk_job: 保存图片和任务状态到磁盘，用 build_batch_request 构建请求后提交
+   （图片较多时：open_bulk_job 创建任务，add_bulk_images 分多次追加，close_bulk_job 提交）
+2. refresh_bulk_job: 查询批次状态，结束后拉取结果，
+   经 parse_claude_response（内部调用 validate_and_normalize_response）规范化，
+   缺失的 duration / scale 用 physics_kernels 按批次一次补齐后写入 result_store
+3. 任务状态保存在 BATCH_STATE_DIR/<job_id>/state.json，进程重启后可以继续提交 / 轮询 / 收集
+
+环境变量：
+- BATCH_STATE_DIR: 任务状态目录（可选，默认 uploads/batches）
+- BATCH_MAX_REQUESTS: 单个批次最多请求数（可选，默认 1000，超出自动拆分为多个批次）
+- BATCH_MAX_MB: 单个批次请求体的大小上限（MB，可选，默认 200；Message Batches 限制为 256MB，超过时按 256MB 计）
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+from config import Config
+from services.claude_pipeline import (
+    attach_trajectory,
+    build_batch_request,
+    create_claude_client,
+    detect_mime_type,
+    get_claude_credentials,
+    parse_claude_response,
+)
+from services.physics_kernels import estimate_animation_extent
+from services.result_store import result_store
+from services.shadow_eval import shadow_evaluator
+from services.usage_tracker import record_usage
+
+logger = logging.getLogger(__name__)
+
+_MIME_EXTENSIONS = {
+    "image/png": "png",
+    "image/jpeg": "jpg",
+    "image/gif": "gif",
+    "image/webp": "webp",
+}
+
+# 同一任务的状态文件读写需要串行
+_job_locks: Dict[str, threading.Lock] = {}
+_job_locks_guard = threading.Lock()
+
+
+def get_batch_state_dir() -> Path:
+    return Path(os.environ.get("BATCH_STATE_DIR", "").strip() or os.path.join(Config.UPLOAD_FOLDER, "batches"))
+
+
+# Message Batches API 单个批次请求体的大小上限
+BATCH_SIZE_LIMIT = 256 * 1024 * 1024
+
+# 划分批次时预估的每条请求除图片外的开销（prompt、JSON 结构等）
+REQUEST_OVERHEAD_BYTES = 16 * 1024
+
+
+def get_batch_max_bytes() -> int:
+    try:
+        max_mb = float(os.environ.get("BATCH_MAX_MB", "200"))
+    except ValueError:
+        max_mb = 200.0
+    return min(max(int(max_mb * 1024 * 1024), 1), BATCH_SIZE_LIMIT)
+
+
+def get_batch_max_requests() -> int:
+    try:
+        return max(int(os.environ.get("BATCH_MAX_REQUESTS", "1000")), 1)
+    except ValueError:
+        return 1000
+
+
+def _job_lock(job_id: str) -> threading.Lock:
+    with _job_locks_guard:
+        return _job_locks.setdefault(job_id, threading.Lock())
+
+
+def _job_dir(job_id: str) -> Path:
+    if not job_id or not job_id.replace("-", "").isalnum():
+        raise ValueError(f"非法的 job_id: {job_id!r}")
+    return get_batch_state_dir() / job_id
+
+
+def load_job(job_id: str) -> dict:
+    """读取任务状态
+
+    Raises:
+        FileNotFoundError: 任务不存在
+    """
+    state_path = _job_dir(job_id) / "state.json"
+    if not state_path.exists():
+        raise FileNotFoundError(f"批量任务不存在: {job_id}")
+    with open(state_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _save_job(job: dict) -> None:
+    """原子写入任务状态（先写临时文件再替换）"""
+    job_dir = _job_dir(job["job_id"])
+    job_dir.mkdir(parents=True, exist_ok=True)
+    job["updated_at"] = time.time()
+    tmp_path = job_dir / "state.json.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(job, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, job_dir / "state.json")
+
+
+def list_jobs() -> List[dict]:
+    """列出所有任务的摘要"""
+    state_dir = get_batch_state_dir()
+    if not state_dir.exists():
+        return []
+    jobs = []
+    for entry in sorted(state_dir.iterdir()):
+        if (entry / "state.json").exists():
+            jobs.append(job_summary(load_job(entry.name)))
+    return jobs
+
+
+def job_summary(job: dict) -> dict:
+    """任务摘要（不含结果详情）"""
+    counts: Dict[str, int] = {}
+    for item in job["items"].values():
+        counts[item["status"]] = counts.get(item["status"], 0) + 1
+    return {
+        "job_id": job["job_id"],
+        "status": job["status"],
+        "created_at": job["created_at"],
+        "updated_at": job.get("updated_at"),
+        "total": len(job["items"]),
+        "counts": counts,
+        "batches": [
+            {"batch_id": b.get("batch_id"), "status": b["status"], "size": len(b["custom_ids"])}
+            for b in job["batches"]
+        ],
+    }
+
+
+def _new_job() -> dict:
+    job_id = uuid.uuid4().hex[:16]
+    return {
+        "job_id": job_id,
+        "status": "open",
+        "created_at": time.time(),
+        "items": {},
+        "batches": [],
+    }
+
+
+def _store_images(job: dict, images: Iterable[tuple[str, bytes]]) -> int:
+    """把图片写入任务目录并追加到 items（custom_id 接着已有图片编号），返回新增数量"""
+    job_dir = _job_dir(job["job_id"])
+    image_dir = job_dir / "images"
+    image_dir.mkdir(parents=True, exist_ok=True)
+
+    items = job["items"]
+    added = 0
+    for filename, data in images:
+        if not data:
+            raise ValueError(f"图片为空: {filename}")
+        custom_id = f"img-{len(items):05d}"
+        extension = _MIME_EXTENSIONS.get(detect_mime_type(data), "jpg")
+        image_path = image_dir / f"{custom_id}.{extension}"
+        with open(image_path, "wb") as f:
+            f.write(data)
+        items[custom_id] = {
+            "filename": filename,
+            "image_path": str(image_path.relative_to(job_dir)),
+            "bytes": len(data),
+            "status": "pending",
+            "cache_key": None,
+            "result": None,
+            "error": None,
+        }
+        added += 1
+    return added
+
+
+def _estimate_request_bytes(job: dict, item: dict) -> int:
+    """按原图 base64 编码后的大小预估一条请求的字节数（预处理只会缩小图片）"""
+    size = item.get("bytes")
+    if size is None:
+        size = (_job_dir(job["job_id"]) / item["image_path"]).stat().st_size
+    return (size + 2) // 3 * 4 + REQUEST_OVERHEAD_BYTES
+
+
+def _plan_batches(job: dict) -> None:
+    """按 BATCH_MAX_REQUESTS 和 BATCH_MAX_MB 把图片划分为批次，任务进入 created 状态（尚未提交）"""
+    if not job["items"]:
+        raise ValueError("批量任务至少需要一张图片")
+    max_requests = get_batch_max_requests()
+    max_bytes = get_batch_max_bytes()
+    groups: List[List[str]] = [[]]
+    group_bytes = 0
+    for custom_id, item in job["items"].items():
+        size = _estimate_request_bytes(job, item)
+        if groups[-1] and (len(groups[-1]) >= max_requests or group_bytes + size > max_bytes):
+            groups.append([])
+            group_bytes = 0
+        groups[-1].append(custom_id)
+        group_bytes += size
+    job["batches"] = [{"batch_id": None, "status": "pending", "custom_ids": group} for group in groups]
+    job["status"] = "created"
+
+
+def create_bulk_job(images: Iterable[tuple[str, bytes]]) -> dict:
+    """保存图片并创建任务（尚未提交）
+
+    Args:
+        images: (filename, image_bytes) 序列
+
+    Returns:
+        任务状态 dict
+    """
+    job = _new_job()
+    _store_images(job, images)
+    _plan_batches(job)
+    _save_job(job)
+    logger.info(f"✅ 已创建批量任务 {job['job_id']}（{len(job['items'])} 张图片，{len(job['batches'])} 个批次）")
+    return job
+
+
+def open_bulk_job() -> dict:
+    """创建空任务（open 状态），之后分多次 add_bulk_images 追加图片，最后 close_bulk_job 提交
+
+    单个请求受 MAX_CONTENT_LENGTH 限制，成百上千张图片需要分多次上传。
+
+    Returns:
+        任务摘要
+    """
+    job = _new_job()
+    _save_job(job)
+    logger.info(f"✅ 已创建批量任务 {job['job_id']}（等待追加图片）")
+    return job_summary(job)
+
+
+def add_bulk_images(job_id: str, images: Iterable[tuple[str, bytes]]) -> dict:
+    """向 open 状态的任务追加图片，返回任务摘要
+
+    Raises:
+        FileNotFoundError: 任务不存在
+        ValueError: 任务已提交或图片为空
+    """
+    with _job_lock(job_id):
+        job = load_job(job_id)
+        if job["status"] != "open":
+            raise ValueError(f"批量任务 {job_id} 已提交，不能再追加图片")
+        added = _store_images(job, images)
+        _save_job(job)
+    logger.info(f"✅ 批量任务 {job_id} 追加 {added} 张图片（共 {len(job['items'])} 张）")
+    return job_summary(job)
+
+
+def close_bulk_job(job_id: str, client: Optional[Any] = None) -> dict:
+    """结束追加并提交任务（已提交的任务直接推进），返回任务摘要
+
+    Raises:
+        FileNotFoundError: 任务不存在
+        ValueError: 任务中没有图片
+        RuntimeError: 提交批次失败（任务状态已保存，可稍后 resume）
+    """
+    with _job_lock(job_id):
+        job = load_job(job_id)
+        if job["status"] == "open":
+            _plan_batches(job)
+            _save_job(job)
+            logger.info(f"✅ 批量任务 {job_id} 开始提交（{len(job['items'])} 张图片，{len(job['batches'])} 个批次）")
+    return resume_bulk_job(job_id, client)
+
+
+def _submit_pending_batches(job: dict, client: Any) -> None:
+    """提交尚未提交的批次（可重复调用，已提交的批次会跳过）
+
+    构建请求时按实际的 JSON 大小再检查一次 BATCH_MAX_MB：超出时把剩余图片拆到紧随其后的新批次。
+    """
+    job_dir = _job_dir(job["job_id"])
+    max_bytes = get_batch_max_bytes()
+    index = 0
+    while index < len(job["batches"]):
+        batch = job["batches"][index]
+        index += 1
+        if batch["batch_id"]:
+            continue
+
+        requests, total_bytes = [], 0
+        for position, custom_id in enumerate(batch["custom_ids"]):
+            item = job["items"][custom_id]
+            with open(job_dir / item["image_path"], "rb") as f:
+                request, plan = build_batch_request(f.read(), custom_id)
+            size = len(json.dumps(request, ensure_ascii=False).encode("utf-8"))
+            if requests and total_bytes + size > max_bytes:
+                job["batches"].insert(index, {"batch_id": None, "status": "pending",
+                                              "custom_ids": batch["custom_ids"][position:]})
+                batch["custom_ids"] = batch["custom_ids"][:position]
+                logger.info(f"批次超过 {max_bytes} 字节，剩余 {len(job['batches'][index]['custom_ids'])} 张图片拆到新批次")
+                break
+            item["cache_key"] = plan["cache_key"]
+            item["digest"] = plan["digest"]
+            item["prompt_version"] = plan["prompt_version"]
+            item["model"] = plan["model"]
+            requests.append(request)
+            total_bytes += size
+
+        message_batch = client.messages.batches.create(requests=requests)
+        batch["batch_id"] = message_batch.id
+        batch["status"] = message_batch.processing_status
+        for custom_id in batch["custom_ids"]:
+            job["items"][custom_id]["status"] = "submitted"
+        # 每提交一个批次就落盘，避免重启后重复提交
+        _save_job(job)
+        logger.info(f"✅ 已提交批次 {message_batch.id}（{len(requests)} 条请求，{total_bytes} 字节）")
+
+
+def submit_bulk_job(images: Iterable[tuple[str, bytes]]) -> dict:
+    """创建并提交批量任务，返回任务摘要"""
+    job = create_bulk_job(images)
+    return resume_bulk_job(job["job_id"])
+
+
+def _as_number(value: Any) -> Optional[float]:
+    """动画参数转为 float；缺失或无法转换时返回 None（按默认值计算）"""
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _fill_animation_extents(results: List[dict]) -> None:
+    """整批补齐缺失的 duration / scale（与 validate_and_normalize_response 逐题计算的结果一致），再生成轨迹采样点"""
+    anims = [normalized["animation_instructions"] for normalized in results]
+    missing = [anim for anim in anims if not anim.get("duration") or not anim.get("scale")]
+    if missing:
+        durations, scales = estimate_animation_extent(
+            [anim["type"] for anim in missing],
+            *([_as_number(anim[name]) for anim in missing]
+              for name in ("initial_speed", "angle", "gravity", "initial_y")),
+        )
+        for anim, duration, scale in zip(missing, durations, scales):
+            if not anim.get("duration"):
+                anim["duration"] = float(duration)
+            if not anim.get("scale"):
+                anim["scale"] = float(scale)
+
+    for anim in anims:
+        attach_trajectory(anim)
+
+
+def _collect_batch_results(job: dict, batch: dict, client: Any) -> None:
+    """拉取已结束批次的结果并写入 result_store"""
+    parsed = []
+    for entry in client.messages.batches.results(batch["batch_id"]):
+        item = job["items"].get(entry.custom_id)
+        if item is None:
+            logger.warning(f"⚠️  未知的 custom_id: {entry.custom_id}")
+            continue
+
+        result = entry.result
+        if result.type != "succeeded":
+            item["status"] = result.type
+            error = getattr(result, "error", None)
+            item["error"] = str(error) if error else result.type
+            continue
+
+        message = result.message
+        try:
+            normalized = parse_claude_response(message.content[0].text, fill_extent=False)
+        except ValueError as e:
+            record_usage("batch", message.model, message, "invalid")
+            item["status"] = "invalid"
+            item["error"] = str(e)
+            continue
+
+        record_usage("batch", message.model, message, normalized["problem_type"])
+        parsed.append((item, normalized, message.model))
+
+    _fill_animation_extents([normalized for _, normalized, _ in parsed])
+
+    for item, normalized, model in parsed:
+        result_store.put(
+            item["cache_key"], normalized,
+            source="batch", digest=item.get("digest"),
+            prompt_version=item.get("prompt_version"), model=model,
+        )
+        shadow_evaluator.submit("batch", normalized)
+        item["status"] = "succeeded"
+        item["result"] = normalized
+
+    batch["status"] = "collected"
+
+
+def resume_bulk_job(job_id: str, client: Optional[Any] = None, submit: bool = True) -> dict:
+    """推进任务：提交未提交的批次、刷新状态、收集已结束批次的结果
+
+    Args:
+        submit: 是否提交未提交的批次（会产生费用）；False 时只刷新已提交批次的状态并收集结果
+
+    Returns:
+        任务摘要
+    """
+    with _job_lock(job_id):
+        job = load_job(job_id)
+        if job["status"] in ("open", "completed"):
+            return job_summary(job)
+
+        if client is None:
+            api_key, _ = get_claude_credentials()
+            client = create_claude_client(api_key)
+
+        if submit:
+            try:
+                _submit_pending_batches(job, client)
+            except Exception as e:
+                _save_job(job)
+                logger.error(f"❌ 提交批次失败: {e}")
+                raise RuntimeError(f"提交批次失败: {e}")
+        elif not any(batch["batch_id"] for batch in job["batches"]):
+            return job_summary(job)
+
+        for batch in job["batches"]:
+            if batch["status"] == "collected" or not batch["batch_id"]:
+                continue
+            message_batch = client.messages.batches.retrieve(batch["batch_id"])
+            batch["status"] = message_batch.processing_status
+            if message_batch.processing_status == "ended":
+                _collect_batch_results(job, batch, client)
+                _save_job(job)
+
+        if all(batch["status"] == "collected" for batch in job["batches"]):
+            job["status"] = "completed"
+        else:
+            job["status"] = "in_progress"
+        _save_job(job)
+
+        return job_summary(job)
+
+
+def wait_bulk_job(job_id: str, poll_interval: float = 30.0, timeout: Optional[float] = None) -> dict:
+    """轮询直到任务完成或超时，返回任务摘要"""
+    started = time.monotonic()
+    while True:
+        summary = resume_bulk_job(job_id)
+        if summary["status"] == "completed":
+            return summary
+        if timeout is not None and time.monotonic() - started >= timeout:
+            return summary
+        logger.info(f"批量任务 {job_id} 进行中: {summary['counts']}")
+        time.sleep(poll_interval)
+
+
+def get_job_results(job_id: str) -> List[dict]:
+    """返回任务中每张图片的结果（按提交顺序）"""
+    job = load_job(job_id)
+    return [
+        {
+            "custom_id": custom_id,
+            "filename": item["filename"],
+            "status": item["status"],
+            "result": item["result"],
+            "error": item["error"],
+        }
+        for custom_id, item in job["items"].items()
+    ]
@@ -4,7 +4,12 @@
 环境变量依赖：
 - CLAUDE_API_KEY: Claude API 密钥（必需，claude 模式）
 - CLAUDE_MODEL: Claude 模型名称（可选，默认 claude-sonnet-4-5-20250929）
-- PIPELINE_MODE: claude/manual（可选，默认 claude）
+- PIPELINE_MODE: claude/two_stage/auto/manual（可选，默认 claude）
+- CLAUDE_SLIM_MODEL: token 预算紧张时使用的精简模型（可选，默认 claude-haiku-4-5）
+- CLAUDE_SLIM_MAX_TOKENS: 精简模式下的 max_tokens（可选，默认 2048）
+- CLAUDE_ESCALATION_MODEL: 返回结果校验失败时升级使用的模型（可选，默认不升级）
+- CLAUDE_BASE_URL: API 地址（可选，用于指向本地替身服务器测试）
+- CLAUDE_SPLIT_MODE: 多小问题目拆分后并行解答（可选，默认 false，见 services/split_pipeline.py）
 """
 
 import base64
@@ -12,14 +17,48 @@ import json
 import logging
 import math
 import os
-import re
+import time
 from pathlib import Path
-from typing import Any, Dict, Optional, Union
+from typing import Any, Dict, List, Optional, Sequence, Union
 
 from anthropic import Anthropic
 
+from services.deadline import (
+    Deadline,
+    DeadlineExceeded,
+    RequestCancelled,
+    check_deadline,
+    current_deadline,
+    deadline_scope,
+    timeout_kwargs,
+)
+from services.file_cache import FILES_API_BETA, file_id_cache, is_files_api_enabled
+from services.image_preprocess import (
+    get_preprocess_settings,
+    is_preprocess_enabled,
+    plan_tier_ladder,
+    prepare_for_model,
+    tier_stats,
+)
+from services.image_workers import preprocess_many
+from services.image_probe import ImageRejected, probe_image
+from services.ingest import IngestedImage
+from services.prompt_registry import prompt_registry, record_prompt_result, select_prompt
+from services.result_store import compute_digest, make_cache_key, result_store
+from services.rule_engine import pipeline_motion_rules, pipeline_parameter_rules
+from services.pipeline_router import pipeline_router
+from services.shadow_eval import shadow_evaluator
+from services.trajectory import CANVAS_HEIGHT, CANVAS_WIDTH, MAX_SCALE, MIN_SCALE, build_trajectory
+from services.usage_tracker import get_budget_tier, record_usage, track_request_usage
+
 logger = logging.getLogger(__name__)
 
+# 单张图片（路径或字节）；一道题可以由按顺序排列的多张图片组成（如题干 + 示意图、跨页题目）
+ImageSource = Union[str, bytes, Path, IngestedImage]
+# 读取后的单张图片：原图字节，或已接收的上传图片（带预先计算的摘要 / base64）
+ImageData = Union[bytes, IngestedImage]
+ImageInput = Union[ImageSource, Sequence[ImageSource]]
+
 
 # ==================== 配置 ====================
 
@@ -27,7 +66,8 @@ def get_pipeline_mode() -> str:
     """获取当前 Pipeline 模式
 
     Returns:
-        'claude' 或 'manual'
+        'claude'（多模态）、'two_stage'（Mathpix OCR + 文本 Claude）、
+        'auto'（路由器按延迟 / 成本 / 成功率选择）或 'manual'
     """
     return os.environ.get("PIPELINE_MODE", "claude").lower()
 
@@ -57,6 +97,38 @@ def get_claude_credentials() -> tuple[str, str]:
     return api_key, model
 
 
+def get_slim_settings() -> tuple[str, int]:
+    """获取 token 预算紧张时使用的精简配置
+
+    Returns:
+        (slim_model, slim_max_tokens)
+    """
+    model = os.environ.get("CLAUDE_SLIM_MODEL", "claude-haiku-4-5").strip()
+    try:
+        max_tokens = int(os.environ.get("CLAUDE_SLIM_MAX_TOKENS", "2048"))
+    except ValueError:
+        max_tokens = 2048
+    return model, max_tokens
+
+
+def get_escalation_model() -> Optional[str]:
+    """获取校验失败时升级使用的模型（未配置返回 None）"""
+    model = os.environ.get("CLAUDE_ESCALATION_MODEL", "").strip()
+    return model or None
+
+
+def create_claude_client(api_key: str) -> Anthropic:
+    """创建 Anthropic 客户端（支持 CLAUDE_BASE_URL 指向本地替身服务器）
+
+    当前线程有请求截止时间时关闭 SDK 自动重试：SDK 每次重试都会重新计时，
+    会让请求超出截止时间；重试由 Pipeline 自己的尝试循环在剩余时间内完成。
+    """
+    base_url = os.environ.get("CLAUDE_BASE_URL", "").strip() or None
+    if current_deadline() is not None:
+        return Anthropic(api_key=api_key, base_url=base_url, max_retries=0)
+    return Anthropic(api_key=api_key, base_url=base_url)
+
+
 # ==================== Claude 多模态调用 ====================
 
 CLAUDE_SYSTEM_PROMPT = """你是一个物理题 OCR + 解析专家。你的任务是：
@@ -126,12 +198,40 @@ CLAUDE_USER_PROMPT = """请从图片中识别物理题目，并按以下 JSON 
 
 现在请开始识别图片中的物理题目，只返回 JSON："""
 
+# 精简版 prompt：去掉冗长说明，保留字段定义和判别规则
+CLAUDE_SYSTEM_PROMPT_COMPACT = """物理题 OCR + 解析。只输出纯 JSON，不要 Markdown 代码块和解释。"""
+
+CLAUDE_USER_PROMPT_COMPACT = """识别图中物理题，输出 JSON：
+{"problem_text":题目原文,"problem_type":类型,"parameters":{"initial_speed":m/s,"angle":度,"initial_height":m,"gravity":默认9.8,"friction":系数},"solution_steps":[至少3步],"animation_instructions":{"type":动画类型,"initial_speed","angle","gravity","initial_x":0,"initial_y":初始高度,"duration":秒,"scale":10-30}}
+未给出的参数为 null。
+problem_type: projectile(斜抛) / horizontal_projectile(平抛,angle=0) / free_fall(自由落体,v0=0) / vertical_throw(竖直上抛,angle=90) / uniform(匀速直线) / inclined_plane(斜面)
+type: free_fall→free_fall, uniform→uniform, inclined_plane→inclined_plane, 其余→projectile"""
+
+prompt_registry.register("multimodal", "v1", system=CLAUDE_SYSTEM_PROMPT, user=CLAUDE_USER_PROMPT)
+prompt_registry.register(
+    "multimodal", "v2-compact",
+    system=CLAUDE_SYSTEM_PROMPT_COMPACT, user=CLAUDE_USER_PROMPT_COMPACT,
+)
+
+
+def detect_mime_type(image_data: bytes) -> str:
+    """根据文件头判断图片格式（无法识别时默认 image/jpeg）"""
+    if image_data[:8] == b'\x89PNG\r\n\x1a\n':
+        return "image/png"
+    elif image_data[:2] == b'\xff\xd8':
+        return "image/jpeg"
+    elif image_data[:6] in (b'GIF87a', b'GIF89a'):
+        return "image/gif"
+    elif image_data[:4] == b'WEBP' or (image_data[:4] == b'RIFF' and image_data[8:12] == b'WEBP'):
+        return "image/webp"
+    return "image/jpeg"  # 默认
 
-def encode_image_to_base64(image_source: Union[str, bytes, Path]) -> tuple[str, str]:
+
+def encode_image_to_base64(image_source: ImageSource) -> tuple[str, str]:
     """将图片编码为 base64
 
     Args:
-        image_source: 图片路径（str/Path）或图片字节（bytes）
+        image_source: 图片路径（str/Path）、图片字节（bytes）或已接收的上传图片（复用接收时的编码结果）
 
     Returns:
         (base64_string, mime_type)
@@ -140,20 +240,15 @@ def encode_image_to_base64(image_source: Union[str, bytes, Path]) -> tuple[str,
         FileNotFoundError: 图片文件不存在
         ValueError: 不支持的图片格式
     """
+    if isinstance(image_source, IngestedImage):
+        mime_type = image_source.info["mime_type"] if image_source.info else detect_mime_type(image_source.head)
+        return image_source.base64_text(), mime_type
+
     # 读取图片字节
     if isinstance(image_source, bytes):
         image_data = image_source
         # 根据文件头判断格式
-        if image_data[:8] == b'\x89PNG\r\n\x1a\n':
-            mime_type = "image/png"
-        elif image_data[:2] == b'\xff\xd8':
-            mime_type = "image/jpeg"
-        elif image_data[:6] in (b'GIF87a', b'GIF89a'):
-            mime_type = "image/gif"
-        elif image_data[:4] == b'WEBP':
-            mime_type = "image/webp"
-        else:
-            mime_type = "image/jpeg"  # 默认
+        mime_type = detect_mime_type(image_data)
     else:
         # 路径方式
         image_path = Path(image_source)
@@ -198,21 +293,81 @@ def clean_json_response(text: str) -> str:
     return text.strip()
 
 
-def validate_and_normalize_response(data: dict) -> dict:
+class LowResolutionSuspected(ValueError):
+    """识别结果缺题目文字 / 关键参数或参数不合理，可能是图片分辨率不足"""
+
+
+# 各题型至少需要一个的关键参数
+_REQUIRED_PARAMETERS = {
+    "projectile": ("initial_speed",),
+    "horizontal_projectile": ("initial_speed", "initial_height"),
+    "vertical_throw": ("initial_speed",),
+    "free_fall": ("initial_height",),
+    "uniform": ("initial_speed",),
+}
+
+# 参数的合理范围（闭区间）
+_PARAMETER_RANGES = {
+    "initial_speed": (0, 1000),
+    "angle": (-90, 360),
+    "initial_height": (0, 10000),
+    "gravity": (0.1, 30),
+    "friction": (0, 2),
+}
+
+
+def find_resolution_issues(data: dict) -> list:
+    """检查识别结果中疑似由分辨率不足导致的问题（小字 / 下标看不清）
+
+    Returns:
+        问题描述列表，空列表表示没有发现问题
+    """
+    issues = []
+    params = data.get("parameters") or {}
+
+    required = _REQUIRED_PARAMETERS.get(data.get("problem_type"), ())
+    if required and all(params.get(name) is None for name in required):
+        issues.append(f"缺少关键参数 {'/'.join(required)}")
+
+    for name, (low, high) in _PARAMETER_RANGES.items():
+        value = params.get(name)
+        if value is None:
+            continue
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            issues.append(f"{name}={value!r} 不是数字")
+            continue
+        if not (low <= number <= high) or math.isnan(number):
+            issues.append(f"{name}={value} 超出合理范围 [{low}, {high}]")
+
+    return issues
+
+
+def validate_and_normalize_response(data: dict, strict: bool = False, fill_extent: bool = True) -> dict:
     """校验并规范化 Claude 返回的 JSON
 
     Args:
         data: Claude 返回的原始 dict
+        strict: 是否检查关键参数缺失 / 不合理（渐进分辨率的低档位使用，失败时升档重试）
+        fill_extent: 是否补齐缺失的 duration / scale 并生成轨迹采样点；
+            批量收集结果时为 False，由调用方用 physics_kernels 整批补齐后再调用 attach_trajectory
 
     Returns:
         规范化后的 dict
 
     Raises:
+        LowResolutionSuspected: problem_text 为空，或 strict 时参数缺失 / 不合理（ValueError 的子类）
         ValueError: 数据格式不符合要求
     """
     # 必需字段
     if "problem_text" not in data or not data["problem_text"]:
-        raise ValueError("缺少 problem_text 字段或为空")
+        raise LowResolutionSuspected("缺少 problem_text 字段或为空")
+
+    if strict:
+        issues = find_resolution_issues(data)
+        if issues:
+            raise LowResolutionSuspected("；".join(issues))
 
     # 默认值
     if "problem_type" not in data or not data["problem_type"]:
@@ -262,6 +417,10 @@ def validate_and_normalize_response(data: dict) -> dict:
     if "initial_y" not in anim:
         anim["initial_y"] = params.get("initial_height", 0)
 
+    if not fill_extent:
+        logger.info("✅ 响应数据校验通过")
+        return data
+
     # 计算持续时间（如果缺失）
     if "duration" not in anim or not anim["duration"]:
         anim["duration"] = estimate_duration(
@@ -282,10 +441,24 @@ def validate_and_normalize_response(data: dict) -> dict:
             anim["initial_y"]
         )
 
+    attach_trajectory(anim)
+
     logger.info("✅ 响应数据校验通过")
     return data
 
 
+def attach_trajectory(anim: dict) -> None:
+    """轨迹采样点总是由后端按规范化后的参数重新生成（不使用模型返回的 trajectory）"""
+    anim.pop("trajectory", None)
+    try:
+        trajectory = build_trajectory(anim)
+    except (TypeError, ValueError) as e:
+        logger.warning(f"⚠️ 动画参数无法生成轨迹采样点: {e}")
+        trajectory = None
+    if trajectory is not None:
+        anim["trajectory"] = trajectory
+
+
 def estimate_duration(motion_type: str, v0: float, angle: float, g: float, h0: float) -> float:
     """估算运动持续时间（秒）"""
     if g <= 0:
@@ -338,19 +511,264 @@ def estimate_scale(motion_type: str, v0: float, angle: float, g: float, h0: floa
     max_height = h0 + (v0 * math.sin(angle_rad)) ** 2 / (2 * g) if v0 > 0 else h0
 
     # Canvas 默认大小约 800x600，留边距
-    scale_x = 700 / max(max_range, 1)
-    scale_y = 500 / max(max_height, 1)
-    scale = min(scale_x, scale_y, 30)
-    scale = max(scale, 10)
+    scale_x = CANVAS_WIDTH / max(max_range, 1)
+    scale_y = CANVAS_HEIGHT / max(max_height, 1)
+    scale = min(scale_x, scale_y, MAX_SCALE)
+    scale = max(scale, MIN_SCALE)
 
     return scale
 
 
-def call_claude_pipeline(image_source: Union[str, bytes, Path]) -> dict:
+def read_image_bytes(image_source: ImageSource) -> ImageData:
+    """读取图片原始字节（路径或字节）；已接收的上传图片原样返回，保留摘要和 base64 结果"""
+    if isinstance(image_source, (bytes, IngestedImage)):
+        return image_source
+
+    image_path = Path(image_source)
+    if not image_path.exists():
+        raise FileNotFoundError(f"图片文件不存在: {image_path}")
+    with open(image_path, "rb") as f:
+        return f.read()
+
+
+def read_image_list(image_source: ImageInput) -> List[ImageData]:
+    """读取一道题的全部图片字节（保持顺序）
+
+    Raises:
+        ValueError: 图片列表为空
+    """
+    if isinstance(image_source, (list, tuple)):
+        images = [read_image_bytes(item) for item in image_source]
+    else:
+        images = [read_image_bytes(image_source)]
+
+    if not images:
+        raise ValueError("至少需要一张图片")
+    return images
+
+
+def image_digest(image_data: ImageData) -> str:
+    """图片摘要（上传图片使用接收时计算的摘要）"""
+    if isinstance(image_data, IngestedImage):
+        return image_data.digest
+    return compute_digest(image_data)
+
+
+def raw_image_bytes(image_data: ImageData) -> bytes:
+    """需要原图字节的环节（预处理、Files API、Mathpix）使用"""
+    if isinstance(image_data, IngestedImage):
+        return image_data.data
+    return image_data
+
+
+def image_dimensions(image_data: ImageData) -> Optional[tuple]:
+    """图片像素尺寸（上传图片使用接收时的探测结果，其余只解析文件头；无法识别时返回 None）"""
+    if isinstance(image_data, IngestedImage) and image_data.info:
+        return image_data.info["width"], image_data.info["height"]
+    try:
+        info = probe_image(image_data.head if isinstance(image_data, IngestedImage) else image_data)
+    except ImageRejected:
+        return None
+    return info["width"], info["height"]
+
+
+def combine_digests(digests: Sequence[str]) -> str:
+    """多张图片的组合摘要（单张图片时就是该图片的摘要，保证单图缓存 key 不变）"""
+    if len(digests) == 1:
+        return digests[0]
+    return compute_digest(":".join(digests).encode("ascii"))
+
+
+def parse_claude_response(raw_text: str, strict: bool = False, fill_extent: bool = True) -> dict:
+    """清理、解析并规范化 Claude 返回的文本
+
+    Raises:
+        ValueError: 不是有效 JSON 或缺少必需字段
+    """
+    cleaned_text = clean_json_response(raw_text)
+
+    try:
+        data = json.loads(cleaned_text)
+    except json.JSONDecodeError as e:
+        logger.error(f"JSON 解析失败: {e}")
+        logger.error(f"原始文本: {cleaned_text[:500]}")
+        raise ValueError(f"Claude 返回的不是有效 JSON: {e}")
+
+    if not isinstance(data, dict):
+        raise ValueError("Claude 返回的不是 JSON 对象")
+
+    return validate_and_normalize_response(data, strict=strict, fill_extent=fill_extent)
+
+
+def build_image_block(client: Anthropic, image_data: ImageData, digest: str) -> tuple[dict, bool]:
+    """构建图片内容块（每个请求只构建一次，所有重试 / 升级复用）
+
+    启用 Files API 时上传一次并以 file_id 引用，否则使用 base64。
+
+    Returns:
+        (image_block, uses_files_api)
+    """
+    if is_files_api_enabled():
+        raw = raw_image_bytes(image_data)
+        mime_type = detect_mime_type(raw)
+        try:
+            file_id = file_id_cache.get_or_upload(client, digest, raw, mime_type)
+            return {"type": "image", "source": {"type": "file", "file_id": file_id}}, True
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            logger.warning(f"⚠️  Files API 上传失败，改用 base64: {e}")
+
+    base64_image, mime_type = encode_image_to_base64(image_data)
+    return {
+        "type": "image",
+        "source": {
+            "type": "base64",
+            "media_type": mime_type,
+            "data": base64_image,
+        },
+    }, False
+
+
+def prepare_images(images: Sequence[ImageData], long_edge: Optional[int] = None) -> tuple[List[ImageData], List[str]]:
+    """缩放 / 重新压缩后再编码（见 services/image_preprocess.py）
+
+    缓存 key 仍按原图摘要计算；返回的是处理后图片及其摘要（Files API 按处理后的内容复用）。
+    未启用预处理时原样返回，上传图片复用接收时的摘要和 base64 结果。
+    预处理和摘要计算在进程池中执行（见 services/image_workers.py），多张图片并行处理。
+
+    Args:
+        long_edge: 分辨率档位，None 表示使用 IMAGE_MAX_LONG_EDGE
+
+    Returns:
+        (处理后的图片列表, 对应摘要列表)
+    """
+    if not is_preprocess_enabled():
+        return list(images), [image_digest(image_data) for image_data in images]
+    settings = get_preprocess_settings()
+    if long_edge:
+        settings["max_long_edge"] = long_edge
+    results = preprocess_many([raw_image_bytes(image_data) for image_data in images], settings)
+    return [processed for processed, _, _ in results], [digest for _, _, digest in results]
+
+
+def build_image_blocks(client: Anthropic, images: Sequence[ImageData], digests: Sequence[str]) -> tuple[list, bool]:
+    """按顺序为每张图片构建内容块
+
+    Returns:
+        (image_blocks, uses_files_api)，任意一张图片使用了 file_id 时 uses_files_api 为 True
+    """
+    blocks = []
+    uses_files_api = False
+    for image_data, digest in zip(images, digests):
+        block, uses_file = build_image_block(client, image_data, digest)
+        blocks.append(block)
+        uses_files_api = uses_files_api or uses_file
+    return blocks, uses_files_api
+
+
+def plan_pipeline_request(image_data: Union[ImageData, Sequence[ImageData]], slim: bool = False) -> dict:
+    """确定一次多模态请求的模型、prompt 变体和缓存 key（不调用 API）
+
+    多张图片时每张图片单独计算摘要（Files API 按单张复用），
+    缓存 key 和 prompt 变体使用按顺序组合后的摘要。
+
+    Returns:
+        {"model", "max_tokens", "digest", "digests", "prompt_version", "prompts", "cache_key"}
+    """
+    _, model = get_claude_credentials()
+    max_tokens = 4096
+    if slim:
+        model, max_tokens = get_slim_settings()
+        logger.info(f"⚠️  token 预算紧张，使用精简配置（model: {model}, max_tokens: {max_tokens}）")
+
+    images = [image_data] if isinstance(image_data, (bytes, IngestedImage)) else list(image_data)
+    digests = [image_digest(data) for data in images]
+    digest = combine_digests(digests)
+    prompt_version, prompts = select_prompt("multimodal", digest)
+
+    return {
+        "model": model,
+        "max_tokens": max_tokens,
+        "digest": digest,
+        "digests": digests,
+        "prompt_version": prompt_version,
+        "prompts": prompts,
+        "cache_key": make_cache_key(digest, prompt_version, model),
+    }
+
+
+def build_messages(image_blocks: Union[dict, Sequence[dict]], prompts: dict) -> list:
+    """构建多模态请求的 messages（图片块 + 用户提示词）
+
+    多张图片时在每张图片前标注序号，并提示模型把它们当作同一道题合并识别。
+    """
+    if isinstance(image_blocks, dict):
+        image_blocks = [image_blocks]
+
+    content = []
+    if len(image_blocks) == 1:
+        content.append(image_blocks[0])
+    else:
+        for index, block in enumerate(image_blocks, start=1):
+            content.append({"type": "text", "text": f"图片 {index}："})
+            content.append(block)
+        content.append({
+            "type": "text",
+            "text": f"以上 {len(image_blocks)} 张图片按顺序组成同一道题（如题干、示意图或跨页内容），"
+                    "请合并识别为一道完整的题目后再作答。",
+        })
+    content.append({
+        "type": "text",
+        "text": prompts["user"]
+    })
+
+    return [
+        {
+            "role": "user",
+            "content": content,
+        }
+    ]
+
+
+def build_batch_request(image_data: bytes, custom_id: str, slim: bool = False) -> tuple[dict, dict]:
+    """构建 Message Batches 的单条请求（与 call_claude_pipeline 的首次调用参数一致）
+
+    Returns:
+        (batch_request, plan)
+    """
+    plan = plan_pipeline_request(image_data, slim=slim)
+    base64_image, mime_type = encode_image_to_base64(prepare_for_model(image_data))
+    image_block = {
+        "type": "image",
+        "source": {"type": "base64", "media_type": mime_type, "data": base64_image},
+    }
+    request = {
+        "custom_id": custom_id,
+        "params": {
+            "model": plan["model"],
+            "max_tokens": plan["max_tokens"],
+            "system": plan["prompts"]["system"],
+            "messages": build_messages(image_block, plan["prompts"]),
+            "temperature": 0,
+        },
+    }
+    return request, plan
+
+
+def call_claude_pipeline(image_source: ImageInput, slim: bool = False) -> dict:
     """调用 Claude 多模态 API 完成 OCR + 解析 + 动画指令生成
 
+    prompt 变体按图片摘要从 prompt_registry 中确定性选择，
+    结果按「图片摘要 + prompt 版本 + 模型」缓存。
+    图片从 IMAGE_TIER_LADDER 的最低分辨率档开始发送，结果缺题目文字 / 关键参数或参数不合理时
+    升到下一档重试（最高档不再做该检查）；JSON 无效时先以更强的提示重试一次，
+    配置了 CLAUDE_ESCALATION_MODEL 时再升级模型。同一档位的图片内容块只构建一次。
+    一道题由多张图片组成时，所有图片作为多个图片块在同一次请求中发送。
+
     Args:
-        image_source: 图片路径或图片字节
+        image_source: 图片路径或图片字节，或按顺序排列的多张图片
+        slim: 是否使用精简配置（token 预算紧张时由 process_image 开启）
 
     Returns:
         {
@@ -365,70 +783,302 @@ def call_claude_pipeline(image_source: Union[str, bytes, Path]) -> dict:
         RuntimeError: API 调用失败
         ValueError: 响应格式错误
     """
-    # 1. 获取 API 配置
-    api_key, model = get_claude_credentials()
-
-    # 2. 编码图片
-    logger.info("开始 Claude 多模态 Pipeline...")
-    base64_image, mime_type = encode_image_to_base64(image_source)
-
-    # 3. 构建消息
-    client = Anthropic(api_key=api_key)
-
-    messages = [
-        {
-            "role": "user",
-            "content": [
-                {
-                    "type": "image",
-                    "source": {
-                        "type": "base64",
-                        "media_type": mime_type,
-                        "data": base64_image,
-                    },
-                },
-                {
-                    "type": "text",
-                    "text": CLAUDE_USER_PROMPT
-                }
-            ],
-        }
+    # 1. 获取 API 配置、选择 prompt 变体并检查缓存
+    api_key, _ = get_claude_credentials()
+    images = read_image_list(image_source)
+    plan = plan_pipeline_request(images, slim=slim)
+    model, max_tokens = plan["model"], plan["max_tokens"]
+    digest, prompt_version, prompts = plan["digest"], plan["prompt_version"], plan["prompts"]
+
+    cache_key = plan["cache_key"]
+    cached = result_store.get(cache_key)
+    if cached is not None:
+        return cached
+
+    logger.info(f"开始 Claude 多模态 Pipeline（prompt: {prompt_version}，{len(images)} 张图片）...")
+    client = create_claude_client(api_key)
+
+    # 2. 分辨率档位：每档的图片内容块只预处理 / 编码 / 上传一次，所有尝试复用
+    #    按图片实际尺寸去掉不会产生不同图片的档位
+    tiers = plan_tier_ladder([image_dimensions(data) for data in images]) if is_preprocess_enabled() else [None]
+    tier_blocks: Dict[Optional[int], tuple] = {}
+
+    def blocks_for(tier: Optional[int]) -> tuple:
+        if tier not in tier_blocks:
+            try:
+                prepared, prepared_digests = prepare_images(images, tier)
+                tier_blocks[tier] = build_image_blocks(client, prepared, prepared_digests)
+            except DeadlineExceeded:
+                raise
+            except Exception as e:
+                logger.error(f"❌ 图片处理失败: {e}")
+                raise RuntimeError(f"Claude Pipeline 失败: {e}")
+        return tier_blocks[tier]
+
+    # 3. 提示 / 模型尝试顺序：首次调用 -> 强化提示重试 -> （可选）升级模型
+    strict_suffix = "\n\n**再次强调：只返回纯 JSON 对象，不要有任何其他内容！**"
+    prompt_attempts = [
+        (model, max_tokens, prompts["system"]),
+        (model, max_tokens, prompts["system"] + strict_suffix),
     ]
+    escalation_model = get_escalation_model()
+    if escalation_model and escalation_model != model:
+        prompt_attempts.append((escalation_model, 4096, prompts["system"] + strict_suffix))
+
+    # 4. 调用 Claude API：疑似分辨率不足 -> 升档；其他校验失败 -> 下一个提示 / 模型
+    max_attempts = len(prompt_attempts) + len(tiers) - 1
+    prompt_index, tier_index = 0, 0
+    last_error = None
+    for attempt in range(1, max_attempts + 1):
+        tier = tiers[tier_index]
+        final_tier = tier_index == len(tiers) - 1
+        attempt_model, attempt_max_tokens, system_prompt = prompt_attempts[prompt_index]
+        image_blocks, uses_files_api = blocks_for(tier)
+        messages = build_messages(image_blocks, prompts)
 
-    # 4. 调用 Claude API
-    try:
-        logger.info(f"正在调用 Claude API（model: {model}）...")
-        response = client.messages.create(
-            model=model,
-            max_tokens=4096,
-            system=CLAUDE_SYSTEM_PROMPT,
-            messages=messages,
-            temperature=0  # 使用确定性输出
-        )
+        try:
+            logger.info(
+                f"正在调用 Claude API（model: {attempt_model}，分辨率档位: {tier or '原图'}，"
+                f"第 {attempt}/{max_attempts} 次）..."
+            )
+            started = time.perf_counter()
+            if uses_files_api:
+                response = client.beta.messages.create(
+                    model=attempt_model,
+                    max_tokens=attempt_max_tokens,
+                    system=system_prompt,
+                    messages=messages,
+                    temperature=0,
+                    betas=[FILES_API_BETA],
+                    **timeout_kwargs(stage=f"Claude 第 {attempt} 次调用"),
+                )
+            else:
+                response = client.messages.create(
+                    model=attempt_model,
+                    max_tokens=attempt_max_tokens,
+                    system=system_prompt,
+                    messages=messages,
+                    temperature=0,  # 使用确定性输出
+                    **timeout_kwargs(stage=f"Claude 第 {attempt} 次调用"),
+                )
+            latency_ms = (time.perf_counter() - started) * 1000
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            # SDK 超时可能是截止时间耗尽导致的，优先报告超时
+            check_deadline("Claude API")
+            logger.error(f"❌ Claude API 调用失败: {e}")
+            raise RuntimeError(f"Claude Pipeline 失败: {e}")
 
-        # 5. 提取并解析响应
+        # 5. 提取、解析并规范化响应（非最高档时检查参数是否完整合理）
         raw_text = response.content[0].text
         logger.debug(f"Claude 原始返回: {raw_text[:300]}...")
 
-        # 清理并解析 JSON
-        cleaned_text = clean_json_response(raw_text)
+        try:
+            normalized = parse_claude_response(raw_text, strict=not final_tier)
+        except ValueError as e:
+            input_tokens, output_tokens = record_usage("claude", attempt_model, response, "invalid")
+            record_prompt_result("multimodal", prompt_version, input_tokens, output_tokens, latency_ms, False)
+            last_error = e
+            if isinstance(e, LowResolutionSuspected) and not final_tier:
+                tier_stats.record(tier, "escalated", input_tokens)
+                tier_index += 1
+                logger.warning(f"⚠️  第 {attempt} 次结果疑似分辨率不足（{e}），升到档位 {tiers[tier_index]}")
+                continue
+
+            tier_stats.record(tier, "invalid", input_tokens)
+            logger.warning(f"⚠️  第 {attempt} 次返回结果校验失败: {e}")
+            prompt_index += 1
+            if prompt_index >= len(prompt_attempts):
+                break
+            continue
+
+        input_tokens, output_tokens = record_usage("claude", attempt_model, response, normalized["problem_type"])
+        record_prompt_result("multimodal", prompt_version, input_tokens, output_tokens, latency_ms, True)
+        tier_stats.record(tier, "accepted", input_tokens)
+        result_store.put(
+            cache_key, normalized,
+            source="claude", digest=digest, prompt_version=prompt_version, model=attempt_model,
+        )
+        shadow_evaluator.submit("claude", normalized)
+
+        logger.info(f"✅ Claude Pipeline 成功完成（problem_type: {normalized['problem_type']}，档位: {tier or '原图'}）")
+        return normalized
+
+    logger.error(f"❌ Claude 返回结果多次校验失败: {last_error}")
+    raise RuntimeError(f"Claude Pipeline 失败: {last_error}")
+
+
+# ==================== 两阶段 / 规则引擎路径 ====================
+
+def _ocr_image(image_source: ImageInput) -> str:
+    """Mathpix OCR 提取题目文本（图片字节无需落盘；多张图片按顺序拼接）"""
+    from services.ocr_service import extract_text
+
+    sources = image_source if isinstance(image_source, (list, tuple)) else [image_source]
+    texts = []
+    for source in sources:
+        check_deadline("OCR")
+        if isinstance(source, IngestedImage):
+            source = source.data
+        text = extract_text(source if isinstance(source, bytes) else str(source))
+        if text and text.strip():
+            texts.append(text.strip())
+
+    ocr_text = "\n".join(texts)
+    if not ocr_text:
+        raise RuntimeError("OCR 未识别到题目文本，请改用 manual_text 输入")
+    return ocr_text
 
+
+def two_stage_pipeline(image_source: ImageInput) -> dict:
+    """两阶段 Pipeline：Mathpix OCR -> 纯文本 Claude 解析（llm_service）
+
+    纯文本调用比多模态调用的 input tokens 少得多；
+    Claude 未配置或预算耗尽时 llm_service 会自动降级到规则引擎。
+
+    Returns:
+        同 call_claude_pipeline 的返回格式
+    """
+    return _two_stage_pipeline(image_source)[0]
+
+
+def _two_stage_pipeline(image_source: ImageInput) -> tuple[dict, str]:
+    """two_stage_pipeline 的实现，同时返回文本解析的来源（见 llm_service.analyze_physics_text_with_outcome）"""
+    from services.llm_service import analyze_physics_text_with_outcome
+
+    ocr_text = _ocr_image(image_source)
+    analysis, outcome = analyze_physics_text_with_outcome(ocr_text)
+
+    parameters = dict(analysis.get("parameters", {}))
+    motion_type = parameters.pop("motion_type", None) or "projectile"
+    parameters.pop("preview_text", None)
+
+    logger.info(f"✅ [Two-Stage] 完成（problem_type: {motion_type}，来源: {outcome}）")
+    return {
+        "problem_text": ocr_text.strip(),
+        "problem_type": motion_type,
+        "parameters": parameters,
+        "solution_steps": analysis.get("solution_steps", []),
+        "animation_instructions": analysis.get("animation_instructions", {}),
+    }, outcome
+
+
+def ocr_rule_engine_pipeline(image_source: ImageInput) -> dict:
+    """规则引擎路径：Mathpix OCR + 规则引擎（不消耗 Claude tokens）"""
+    ocr_text = _ocr_image(image_source)
+    return manual_pipeline(ocr_text)
+
+
+def _is_mathpix_configured() -> bool:
+    from services.ocr_service import get_ocr_status
+
+    return bool(get_ocr_status().get("mathpix_configured"))
+
+
+def _is_claude_configured() -> bool:
+    return bool(os.environ.get("CLAUDE_API_KEY", "").strip())
+
+
+def get_available_paths(tier: Optional[str] = None) -> list:
+    """根据凭证配置和 token 预算档位列出可用的图片处理路径"""
+    tier = tier or get_budget_tier()
+    claude_ok = _is_claude_configured() and tier != "rule_engine"
+    mathpix_ok = _is_mathpix_configured()
+
+    paths = []
+    if claude_ok:
+        paths.append("multimodal")
+    if claude_ok and mathpix_ok:
+        paths.append("two_stage")
+    if mathpix_ok:
+        paths.append("rule_engine")
+    return paths
+
+
+def run_image_path(path: str, image_source: ImageInput, slim: bool = False) -> dict:
+    """执行指定的图片处理路径，并把延迟 / tokens / 成败反馈给路由器
+
+    multimodal 路径在 CLAUDE_SPLIT_MODE 开启时使用小问拆分 Pipeline。
+    two_stage 的文本 Claude 调用失败、降级到规则引擎时，结果照常返回，但对路由器记为失败
+    （否则 Claude 故障期间降级结果几乎不耗 tokens，路由器反而会偏向 two_stage）。
+    """
+    from services.split_pipeline import is_split_mode_enabled, split_claude_pipeline
+
+    started = time.perf_counter()
+    success = False
+    degraded = False
+    cancelled = False
+    with track_request_usage() as usage:
         try:
-            data = json.loads(cleaned_text)
-        except json.JSONDecodeError as e:
-            logger.error(f"JSON 解析失败: {e}")
-            logger.error(f"原始文本: {cleaned_text[:500]}")
-            raise ValueError(f"Claude 返回的不是有效 JSON: {e}")
+            if path == "multimodal" and is_split_mode_enabled():
+                result = split_claude_pipeline(image_source, slim=slim)
+            elif path == "multimodal":
+                result = call_claude_pipeline(image_source, slim=slim)
+            elif path == "two_stage":
+                result, outcome = _two_stage_pipeline(image_source)
+                degraded = outcome == "fallback"
+            elif path == "rule_engine":
+                result = ocr_rule_engine_pipeline(image_source)
+            else:
+                raise ValueError(f"未知的 Pipeline 路径: {path}")
+            success = not degraded
+            return result
+        except RequestCancelled:
+            # 客户端主动断开不是路径本身的问题，不计入路由统计
+            cancelled = True
+            raise
+        finally:
+            if not cancelled:
+                pipeline_router.record(
+                    path,
+                    time.perf_counter() - started,
+                    usage["input_tokens"] + usage["output_tokens"],
+                    success,
+                )
+
+
+def budget_fallback_pipeline(image_source: ImageInput) -> dict:
+    """token 预算耗尽时处理图片：Mathpix OCR + 规则引擎（不消耗 Claude tokens）
+
+    如果 Mathpix 未配置，则退回精简配置的 Claude 调用，保证请求不会直接失败。
+    """
+    if not _is_mathpix_configured():
+        logger.warning("⚠️  token 预算已耗尽且 Mathpix 未配置，退回精简 Claude 调用")
+        return run_image_path("multimodal", image_source, slim=True)
 
-        # 6. 校验并规范化
-        normalized = validate_and_normalize_response(data)
+    logger.info("⚠️  token 预算已耗尽，使用 Mathpix OCR + 规则引擎")
+    return run_image_path("rule_engine", image_source)
 
-        logger.info(f"✅ Claude Pipeline 成功完成（problem_type: {normalized['problem_type']}）")
-        return normalized
 
-    except Exception as e:
-        logger.error(f"❌ Claude API 调用失败: {e}")
-        raise RuntimeError(f"Claude Pipeline 失败: {e}")
+def route_image_pipeline(image_source: ImageInput) -> dict:
+    """按 PIPELINE_MODE 和 token 预算选择图片处理路径
+
+    - claude: 多模态（预算耗尽时降级）
+    - two_stage: Mathpix OCR + 文本 Claude
+    - auto: 路由器按观测到的延迟 / 成本 / 成功率选择
+    """
+    mode = get_pipeline_mode()
+    tier = get_budget_tier()
+    check_deadline("路由")
+
+    if mode == "auto":
+        candidates = get_available_paths(tier)
+        if not candidates:
+            # 没有可用路径时退回原有的预算降级逻辑
+            return budget_fallback_pipeline(image_source)
+        path = pipeline_router.choose(candidates)
+        return run_image_path(path, image_source, slim=(tier == "slim"))
+
+    if mode == "two_stage":
+        logger.info("✅ 使用 Two-Stage Pipeline（Mathpix OCR + 文本 Claude）")
+        return run_image_path("two_stage", image_source)
+
+    if tier == "rule_engine":
+        return budget_fallback_pipeline(image_source)
+
+    logger.info("✅ 检测到 image_source，使用 Claude Pipeline")
+    return run_image_path("multimodal", image_source, slim=(tier == "slim"))
 
 
 # ==================== Manual 模式（降级方案） ====================
@@ -467,101 +1117,15 @@ def manual_pipeline(manual_text: str) -> dict:
 
 
 def detect_motion_type(text: str) -> str:
-    """规则引擎：检测运动类型"""
-    # 检查匀速直线运动
-    if "匀速" in text or "匀速直线" in text:
-        return "uniform"
-
-    # 检查自由落体
-    if any(kw in text for kw in ["自由落体", "自由下落"]):
-        return "free_fall"
-
-    # 检查平抛运动
-    if any(kw in text for kw in ["平抛", "水平抛", "水平抛射"]):
-        return "horizontal_projectile"
-
-    # 检查竖直上抛
-    if "竖直上抛" in text or "竖直抛" in text:
-        return "vertical_throw"
-
-    # 检查斜面
-    if any(kw in text for kw in ["斜面", "斜坡", "inclined plane"]):
-        return "inclined_plane"
-
-    # 检查角度：如果有角度且不是 0 或 90，则为一般抛体
-    angle_match = re.search(r"([0-9]+(?:\.[0-9]+)?)\s*[°度]", text)
-    if angle_match:
-        angle = float(angle_match.group(1))
-        if 0 < angle < 90:
-            return "projectile"
-        elif angle == 90:
-            return "vertical_throw"
-        elif angle == 0:
-            return "horizontal_projectile"
-
-    # 检查斜抛
-    if any(kw in text for kw in ["斜抛", "斜向", "角度"]):
-        return "projectile"
-
-    # 最后检查一般的"抛"
-    if "抛" in text or "弹道" in text or "抛体" in text:
-        return "projectile"
-
-    # 默认
-    return "projectile"
+    """规则引擎：检测运动类型（关键词规则见 services/rule_engine.py）"""
+    return pipeline_motion_rules.classify(text)
 
 
 def extract_parameters(text: str) -> dict:
-    """规则引擎：提取参数"""
-    def match_number(patterns):
-        for pattern in patterns:
-            m = re.search(pattern, text, re.IGNORECASE)
-            if m:
-                try:
-                    return float(m.group(1))
-                except ValueError:
-                    continue
-        return None
-
-    speed = match_number([
-        r"初速度\s*[:：=]?\s*([0-9]+(?:\.[0-9]+)?)",
-        r"v0?\s*[:：=]?\s*([0-9]+(?:\.[0-9]+)?)",
-        r"速度\s*[:：=]?\s*([0-9]+(?:\.[0-9]+)?)\s*(?:m/s|米/秒)?",
-        r"以\s*([0-9]+(?:\.[0-9]+)?)\s*m/s",
-        r"([0-9]+(?:\.[0-9]+)?)\s*m/s\s*的.*速度",
-    ])
-
-    angle = match_number([
-        r"角度\s*[:：=]?\s*([0-9]+(?:\.[0-9]+)?)",
-        r"([0-9]+(?:\.[0-9]+)?)\s*[°度]\s*角",
-        r"以\s*([0-9]+(?:\.[0-9]+)?)\s*[°度]",
-    ])
-
-    height = match_number([
-        r"高度\s*(?:为|是|[:：])\s*([0-9]+(?:\.[0-9]+)?)",
-        r"从\s*([0-9]+(?:\.[0-9]+)?)\s*[米m]",
-        r"高\s*([0-9]+(?:\.[0-9]+)?)\s*[米m]",
-        r"([0-9]+(?:\.[0-9]+)?)\s*米高",
-        r"([0-9]+(?:\.[0-9]+)?)\s*m高",
-    ])
-
-    gravity = match_number([
-        r"g\s*[:：=]?\s*([0-9]+(?:\.[0-9]+)?)",
-        r"重力加速度\s*(?:为|是|[:：])\s*([0-9]+(?:\.[0-9]+)?)",
-    ]) or 9.8
-
-    friction = match_number([
-        r"摩擦系数\s*[:：=]?\s*([0-9]+(?:\.[0-9]+)?)",
-        r"μ\s*[:：=]?\s*([0-9]+(?:\.[0-9]+)?)",
-    ])
-
-    return {
-        "initial_speed": speed,
-        "angle": angle,
-        "initial_height": height,
-        "gravity": gravity,
-        "friction": friction,
-    }
+    """规则引擎：提取参数（正则表见 services/rule_engine.py）"""
+    params = pipeline_parameter_rules.extract(text)
+    params["gravity"] = params["gravity"] or 9.8
+    return params
 
 
 def generate_solution_steps(motion_type: str, params: dict, text_preview: str) -> list:
@@ -677,25 +1241,32 @@ def generate_animation_instructions(motion_type: str, params: dict) -> dict:
     if motion_type == "inclined_plane" and friction is not None:
         instructions["friction"] = friction
 
+    # 抛体 / 自由落体附带预计算的轨迹采样点，前端直接插值
+    trajectory = build_trajectory(instructions)
+    if trajectory is not None:
+        instructions["trajectory"] = trajectory
+
     return instructions
 
 
 # ==================== 主入口 ====================
 
 def process_image(
-    image_source: Optional[Union[str, bytes, Path]] = None,
-    manual_text: Optional[str] = None
+    image_source: Optional[ImageInput] = None,
+    manual_text: Optional[str] = None,
+    deadline: Optional[Deadline] = None,
 ) -> dict:
     """主入口：处理图片或文本，返回统一的结构化结果
 
     智能模式选择：
     - 如果提供了 manual_text，优先使用 manual pipeline（无论环境变量如何配置）
-    - 如果只提供了 image_source，使用 claude pipeline
+    - 如果只提供了 image_source，按 PIPELINE_MODE 选择 claude / two_stage / auto 路径
     - 这样可以灵活切换，无需修改环境变量
 
     Args:
-        image_source: 图片路径/字节（claude 模式必需）
+        image_source: 图片路径/字节，或按顺序排列的多张图片（claude 模式必需）
         manual_text: 手动输入的题目文本（manual 模式必需）
+        deadline: 请求截止时间（可选），传递给 OCR / Claude 的每一次外部调用
 
     Returns:
         {
@@ -709,7 +1280,14 @@ def process_image(
     Raises:
         ValueError: 参数错误
         RuntimeError: 处理失败
+        DeadlineExceeded: 超过截止时间或客户端已断开（RuntimeError 的子类）
     """
+    with deadline_scope(deadline):
+        return _process_image(image_source, manual_text)
+
+
+def _process_image(image_source: Optional[ImageInput], manual_text: Optional[str]) -> dict:
+    """process_image 的实现（在 deadline scope 内执行）"""
     # 智能模式选择：优先使用 manual_text（如果提供）
     if manual_text and manual_text.strip():
         # 有 manual_text，使用 manual pipeline
@@ -717,9 +1295,8 @@ def process_image(
         return manual_pipeline(manual_text)
 
     elif image_source:
-        # 有图片，使用 claude pipeline
-        logger.info("✅ 检测到 image_source，使用 Claude Pipeline")
-        return call_claude_pipeline(image_source)
+        # 有图片，根据 PIPELINE_MODE 和 token 预算档位选择路径
+        return route_image_pipeline(image_source)
 
     else:
         # 什么都没有，检查环境变量配置的模式并给出友好提示
@@ -746,15 +1323,23 @@ def get_pipeline_status() -> dict:
             "error": Optional[str]
         }
     """
+    from services.split_pipeline import is_split_mode_enabled
+
     mode = get_pipeline_mode()
 
     status = {
         "mode": mode,
         "claude_configured": False,
+        "budget_tier": get_budget_tier(),
+        "split_mode": is_split_mode_enabled(),
+        "files_api": {"enabled": is_files_api_enabled(), **file_id_cache.stats()},
         "error": None
     }
 
-    if mode == "claude":
+    if mode in ("two_stage", "auto"):
+        status["available_paths"] = get_available_paths()
+
+    if mode in ("claude", "two_stage", "auto"):
         try:
             get_claude_credentials()
             status["claude_configured"] = True
@@ -0,0 +1,189 @@
+"""请求级截止时间（deadline）传递与客户端断开检测
+
+upload 视图为每个请求创建一个 Deadline，经 process_image / extract_text 传递到每一次外部调用：
+每个阶段只拿到剩余的时间（Mathpix 的 requests timeout、Anthropic SDK 的 per-request timeout），
+重试 / 升级 / 下一阶段开始前检查是否已超时或已取消。
+
+Deadline 与 usage_tracker.track_request_usage 一样按线程保存（deadline_scope），
+线程池中的任务需要显式传入并重新进入 scope。
+
+客户端断开检测是尽力而为的：后台线程定期对连接 socket 做 MSG_PEEK，
+读到 EOF 即取消 Deadline。已经发出的 HTTP 调用无法中途打断，
+但它的 timeout 已被限制在剩余时间内，之后的调用不会再发起。
+"""
+
+import logging
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+# 剩余时间低于该值时视为已超时（不足以完成一次网络往返）
+MIN_CALL_TIMEOUT = 0.5
+
+# 断开检测轮询间隔（秒）
+DISCONNECT_POLL_INTERVAL = 0.5
+
+_deadline_local = threading.local()
+
+
+class DeadlineExceeded(RuntimeError):
+    """请求超过截止时间"""
+
+
+class RequestCancelled(DeadlineExceeded):
+    """请求被取消（客户端已断开）"""
+
+
+class Deadline:
+    """线程安全的请求截止时间，可被取消"""
+
+    def __init__(self, timeout_s: Optional[float] = None):
+        self.started_at = time.monotonic()
+        self.expires_at = self.started_at + timeout_s if timeout_s and timeout_s > 0 else None
+        self._cancelled = threading.Event()
+        self.cancel_reason: Optional[str] = None
+
+    def remaining(self) -> Optional[float]:
+        """剩余秒数（没有截止时间时返回 None）"""
+        if self.expires_at is None:
+            return None
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    @property
+    def expired(self) -> bool:
+        remaining = self.remaining()
+        return remaining is not None and remaining < MIN_CALL_TIMEOUT
+
+    def cancel(self, reason: str = "cancelled") -> None:
+        if not self.cancelled:
+            self.cancel_reason = reason
+            self._cancelled.set()
+            logger.warning(f"⚠️  请求已取消: {reason}（已运行 {self.elapsed():.1f}s）")
+
+    def check(self, stage: str = "") -> None:
+        """已取消或已超时时抛出异常
+
+        Raises:
+            RequestCancelled: 请求已取消
+            DeadlineExceeded: 请求已超时
+        """
+        where = f"（{stage}）" if stage else ""
+        if self.cancelled:
+            raise RequestCancelled(f"请求已取消{where}: {self.cancel_reason}")
+        if self.expired:
+            raise DeadlineExceeded(f"请求超时{where}: 已运行 {self.elapsed():.1f}s")
+
+    def timeout(self, cap: Optional[float] = None, stage: str = "") -> Optional[float]:
+        """下一次外部调用可用的超时时间：min(剩余时间, cap)
+
+        Raises:
+            RequestCancelled / DeadlineExceeded: 已没有剩余时间
+        """
+        self.check(stage)
+        remaining = self.remaining()
+        if remaining is None:
+            return cap
+        return remaining if cap is None else min(remaining, cap)
+
+
+@contextmanager
+def deadline_scope(deadline: Optional[Deadline]) -> Iterator[Optional[Deadline]]:
+    """在 with 块内把 deadline 设为当前线程的截止时间（None 表示沿用外层）"""
+    previous = getattr(_deadline_local, "deadline", None)
+    _deadline_local.deadline = deadline if deadline is not None else previous
+    try:
+        yield _deadline_local.deadline
+    finally:
+        _deadline_local.deadline = previous
+
+
+def current_deadline() -> Optional[Deadline]:
+    return getattr(_deadline_local, "deadline", None)
+
+
+def check_deadline(stage: str = "") -> None:
+    """检查当前线程的截止时间（没有 deadline 时不做任何事）"""
+    deadline = current_deadline()
+    if deadline is not None:
+        deadline.check(stage)
+
+
+def request_timeout(cap: Optional[float] = None, stage: str = "") -> Optional[float]:
+    """当前线程下一次外部调用的超时时间（没有 deadline 时返回 cap）"""
+    deadline = current_deadline()
+    if deadline is None:
+        return cap
+    return deadline.timeout(cap, stage)
+
+
+def timeout_kwargs(cap: Optional[float] = None, stage: str = "") -> Dict[str, Any]:
+    """Anthropic SDK 调用的 timeout 参数
+
+    SDK 中 timeout=None 表示不限时，所以没有超时时间时不传该参数（使用客户端默认值）。
+    """
+    timeout = request_timeout(cap, stage)
+    return {} if timeout is None else {"timeout": timeout}
+
+
+# ==================== 客户端断开检测 ====================
+
+def _connection_socket(environ: dict) -> Optional[socket.socket]:
+    """从 WSGI environ 中取出客户端连接（werkzeug 开发服务器 / gunicorn）"""
+    for key in ("werkzeug.socket", "gunicorn.socket"):
+        sock = environ.get(key)
+        if isinstance(sock, socket.socket):
+            return sock
+    return None
+
+
+def _peer_closed(sock: socket.socket) -> bool:
+    """非阻塞 peek：读到 EOF 表示客户端已关闭连接"""
+    try:
+        return sock.recv(1, socket.MSG_PEEK | socket.MSG_DONTWAIT) == b""
+    except (BlockingIOError, InterruptedError):
+        return False
+    except OSError:
+        return True
+
+
+@contextmanager
+def watch_disconnect(environ: dict, deadline: Deadline) -> Iterator[bool]:
+    """在 with 块内后台检测客户端是否断开，断开时取消 deadline
+
+    需要请求体已经读完（否则 peek 会读到未消费的请求数据）。
+    拿不到连接 socket（其他 WSGI 服务器）或平台不支持 MSG_DONTWAIT 时不做检测。
+
+    Yields:
+        是否启用了检测
+    """
+    sock = _connection_socket(environ)
+    if sock is None or not hasattr(socket, "MSG_DONTWAIT"):
+        yield False
+        return
+
+    stop = threading.Event()
+
+    def _watch():
+        while not stop.wait(DISCONNECT_POLL_INTERVAL):
+            if _peer_closed(sock):
+                deadline.cancel("客户端已断开连接")
+                return
+
+    watcher = threading.Thread(target=_watch, name="disconnect-watcher", daemon=True)
+    watcher.start()
+    try:
+        yield True
+    finally:
+        stop.set()
+        watcher.join(timeout=DISCONNECT_POLL_INTERVAL * 2)
@@ -0,0 +1,165 @@
+"""Files API 图片复用
+
+开启后，同一请求的重试 / 模型升级不再重复发送整张 base64 图片：
+图片只通过 Files API 上传一次，之后所有尝试都用 file_id 引用。
+file_id 按图片摘要缓存，到期后从缓存移除；远端文件由后台线程在宽限期过后调用 Files API 删除，
+过期前刚拿到 file_id 的请求（重试 / 升级模型）在宽限期内仍可使用，删除也不占用请求线程和请求时限。
+
+环境变量：
+- CLAUDE_USE_FILES_API: 是否启用（可选，默认 false）
+- CLAUDE_FILE_TTL: file_id 缓存有效期（秒，可选，默认 3600）
+- CLAUDE_FILE_DELETE_GRACE: 过期后再等待多久删除远端文件（秒，可选，默认 600）
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from services.deadline import timeout_kwargs
+
+logger = logging.getLogger(__name__)
+
+FILES_API_BETA = "files-api-2025-04-14"
+
+# 后台清理的间隔，以及单次删除请求的超时（秒）
+CLEANUP_INTERVAL = 60
+DELETE_TIMEOUT = 10
+
+
+def is_files_api_enabled() -> bool:
+    return os.environ.get("CLAUDE_USE_FILES_API", "false").lower() in ("true", "1", "yes")
+
+
+def get_file_ttl() -> int:
+    try:
+        return int(os.environ.get("CLAUDE_FILE_TTL", "3600"))
+    except ValueError:
+        return 3600
+
+
+def get_delete_grace() -> int:
+    try:
+        return max(int(os.environ.get("CLAUDE_FILE_DELETE_GRACE", "600")), 0)
+    except ValueError:
+        return 600
+
+
+class FileIdCache:
+    """图片摘要 -> Files API file_id 的缓存（带过期和后台远端清理）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: Dict[str, tuple[str, float]] = {}  # digest -> (file_id, expires_at)
+        self._retired: List[tuple[str, float]] = []  # 已移出缓存、等待删除的 (file_id, delete_after)
+        self._upload_locks: Dict[str, threading.Lock] = {}
+        self._client: Any = None
+        self._worker: Optional[threading.Thread] = None
+        self.uploads = 0
+        self.hits = 0
+        self.deleted = 0
+
+    def _digest_lock(self, digest: str) -> threading.Lock:
+        with self._lock:
+            return self._upload_locks.setdefault(digest, threading.Lock())
+
+    def get(self, digest: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry and entry[1] > time.time():
+                self.hits += 1
+                return entry[0]
+        return None
+
+    def get_or_upload(self, client: Any, digest: str, data: bytes, mime_type: str) -> str:
+        """返回图片对应的 file_id，缓存未命中时上传
+
+        同一摘要的并发请求只会上传一次。
+        """
+        file_id = self.get(digest)
+        if file_id:
+            return file_id
+
+        with self._digest_lock(digest):
+            # 等锁期间可能已被其他线程上传
+            file_id = self.get(digest)
+            if file_id:
+                return file_id
+
+            extension = mime_type.split("/")[-1]
+            try:
+                metadata = client.beta.files.upload(
+                    file=(f"{digest[:16]}.{extension}", data, mime_type),
+                    betas=[FILES_API_BETA],
+                    **timeout_kwargs(stage="Files API 上传"),
+                )
+            except Exception:
+                # 上传失败的摘要不会进入缓存，也就不会随过期清理，这里直接释放它的锁
+                with self._lock:
+                    self._upload_locks.pop(digest, None)
+                raise
+            file_id = metadata.id
+            with self._lock:
+                self._entries[digest] = (file_id, time.time() + get_file_ttl())
+                self.uploads += 1
+
+        logger.info(f"✅ 图片已上传到 Files API（file_id: {file_id}）")
+        self._ensure_worker(client)
+        return file_id
+
+    def invalidate(self, digest: str) -> None:
+        with self._lock:
+            self._entries.pop(digest, None)
+
+    def cleanup(self, client: Any, force: bool = False) -> int:
+        """过期的 file_id 移出缓存，删除宽限期已过（force=True 时为全部）的远端文件，返回删除数量"""
+        now = time.time()
+        grace = get_delete_grace()
+        with self._lock:
+            for digest, (file_id, expires_at) in list(self._entries.items()):
+                if force or expires_at <= now:
+                    del self._entries[digest]
+                    self._upload_locks.pop(digest, None)
+                    self._retired.append((file_id, expires_at + grace))
+            due = [file_id for file_id, delete_after in self._retired if force or delete_after <= now]
+            self._retired = [item for item in self._retired if not (force or item[1] <= now)]
+
+        deleted = 0
+        for file_id in due:
+            try:
+                client.beta.files.delete(file_id, betas=[FILES_API_BETA], timeout=DELETE_TIMEOUT)
+                deleted += 1
+                logger.info(f"🗑️  已删除过期文件: {file_id}")
+            except Exception as e:
+                logger.warning(f"⚠️  删除文件 {file_id} 失败: {e}")
+
+        with self._lock:
+            self.deleted += deleted
+        return deleted
+
+    # ---------- 后台线程 ----------
+
+    def _ensure_worker(self, client: Any) -> None:
+        with self._lock:
+            self._client = client
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="file-id-cleanup", daemon=True)
+                self._worker.start()
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(CLEANUP_INTERVAL)
+            try:
+                self.cleanup(self._client)
+            except Exception as e:
+                logger.error(f"❌ Files API 清理失败: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"cached": len(self._entries), "pending_delete": len(self._retired),
+                    "uploads": self.uploads, "hits": self.hits, "deleted": self.deleted}
+
+
+# 进程级单例
+file_id_cache = FileIdCache()
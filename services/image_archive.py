@@ -0,0 +1,406 @@
+"""上传图片的内容寻址归档
+
+每张上传的图片按 SHA-256 摘要（与结果缓存 key 中的摘要相同）归档到 UPLOAD_FOLDER/archive：
+
+- objects/<摘要前 2 位>/<3-4 位>/<摘要>.<扩展名>，同一张图片重复上传只保存一份
+- 后台线程写入：先原样保存，再按 EXIF 旋正、限制长边并重新压缩为 WebP（不更小时保留原图）
+- SQLite 索引（index.sqlite3）记录尺寸、字节数、上传次数和最近访问时间，按摘要直接查找
+- 总占用超过 IMAGE_ARCHIVE_MAX_MB 时按最近访问时间淘汰最旧的图片（降到上限的 90%）
+
+prompt / 模型更新后可以直接用归档图片重新解析（POST /archive/reprocess），不需要用户重新上传。
+归档图片以原图摘要作为 IngestedImage.digest 交给 pipeline，新结果缓存在原图的 key 下，
+之后同一张照片再次上传时直接命中。
+
+环境变量：
+- IMAGE_ARCHIVE: 是否归档上传图片（可选，默认 false：归档会长期保留用户照片，需要时显式开启）
+- IMAGE_ARCHIVE_DIR: 归档目录（可选，默认 uploads/archive）
+- IMAGE_ARCHIVE_MAX_MB: 归档总容量（MB，可选，默认 1024）
+- IMAGE_ARCHIVE_LONG_EDGE: 归档图片的长边上限（像素，可选，默认 3072，0 表示保持原尺寸）
+- IMAGE_ARCHIVE_QUALITY: WebP 质量（可选，默认 90）
+"""
+
+import io
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from PIL import Image, ImageOps
+
+from config import Config
+from services.image_probe import ImageRejected, probe_image
+from services.ingest import IngestedImage
+from services.result_store import compute_digest
+
+logger = logging.getLogger(__name__)
+
+# 后台队列长度；队列满时放弃归档（不阻塞请求）
+ARCHIVE_QUEUE_SIZE = 64
+
+# 超过容量时淘汰到上限的该比例，避免每次写入都触发淘汰
+EVICT_TARGET_RATIO = 0.9
+
+_EXTENSIONS = {"jpeg": "jpg", "png": "png", "gif": "gif", "webp": "webp"}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    digest TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    format TEXT NOT NULL,
+    width INTEGER,
+    height INTEGER,
+    original_bytes INTEGER NOT NULL,
+    stored_bytes INTEGER NOT NULL,
+    filename TEXT,
+    recompressed INTEGER NOT NULL DEFAULT 0,
+    uploads INTEGER NOT NULL DEFAULT 1,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS images_last_access ON images (last_access);
+"""
+
+
+def is_archive_enabled() -> bool:
+    return os.environ.get("IMAGE_ARCHIVE", "false").lower() in ("true", "1", "yes")
+
+
+def get_archive_dir() -> Path:
+    return Path(os.environ.get("IMAGE_ARCHIVE_DIR", "").strip() or os.path.join(Config.UPLOAD_FOLDER, "archive"))
+
+
+def get_archive_limit() -> int:
+    """归档总容量（字节，0 表示不限制）"""
+    try:
+        return max(int(float(os.environ.get("IMAGE_ARCHIVE_MAX_MB", "1024")) * 1024 * 1024), 0)
+    except ValueError:
+        return 1024 * 1024 * 1024
+
+
+def get_archive_settings() -> Dict[str, int]:
+    def _int_env(name: str, default: int) -> int:
+        try:
+            return int(os.environ.get(name, str(default)))
+        except ValueError:
+            return default
+
+    return {
+        "long_edge": max(_int_env("IMAGE_ARCHIVE_LONG_EDGE", 3072), 0),
+        "quality": min(max(_int_env("IMAGE_ARCHIVE_QUALITY", 90), 1), 100),
+    }
+
+
+def recompress_for_archive(data: bytes, settings: Optional[Dict[str, int]] = None) -> Optional[Tuple[bytes, Tuple[int, int]]]:
+    """按 EXIF 旋正、限制长边并编码为 WebP
+
+    Returns:
+        (WebP 字节, (宽, 高))；结果不比原图小或无法解码时返回 None
+    """
+    settings = settings or get_archive_settings()
+    try:
+        img = Image.open(io.BytesIO(data))
+        long_edge = settings["long_edge"]
+        if img.format == "JPEG" and long_edge and max(img.size) > long_edge * 2:
+            # 解码时按 1/2、1/4 降采样（仍不小于目标尺寸）
+            scale = long_edge / max(img.size)
+            img.draft("RGB", (int(img.width * scale), int(img.height * scale)))
+        img = ImageOps.exif_transpose(img)
+        if img.mode not in ("RGB", "RGBA", "L", "LA"):
+            img = img.convert("RGBA" if "transparency" in img.info or img.mode.endswith("A") else "RGB")
+        if long_edge and max(img.size) > long_edge:
+            scale = long_edge / max(img.size)
+            img = img.resize((max(int(img.width * scale), 1), max(int(img.height * scale), 1)), Image.LANCZOS)
+        out = io.BytesIO()
+        img.save(out, "WEBP", quality=settings["quality"], method=4)
+    except Exception as e:
+        logger.warning(f"⚠️  归档图片重新压缩失败，保留原图: {e}")
+        return None
+    encoded = out.getvalue()
+    if len(encoded) >= len(data):
+        return None
+    return encoded, img.size
+
+
+class ImageArchive:
+    """内容寻址的图片归档（单个后台线程负责写入、重新压缩和淘汰）"""
+
+    def __init__(self, directory: Optional[Path] = None):
+        self._directory = directory
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._opened_dir: Optional[Path] = None
+        self._total_bytes = 0
+        self._queue: "queue.Queue[tuple]" = queue.Queue(maxsize=ARCHIVE_QUEUE_SIZE)
+        self._worker: Optional[threading.Thread] = None
+        self._stats = {
+            "stored": 0,
+            "deduplicated": 0,
+            "recompressed": 0,
+            "evicted": 0,
+            "dropped": 0,
+            "failed": 0,
+        }
+        self._recompress_runs = 0
+        self._recompress_ms = 0.0
+
+    @property
+    def directory(self) -> Path:
+        return self._directory if self._directory is not None else get_archive_dir()
+
+    # ---------- 索引 ----------
+
+    def _connect(self) -> sqlite3.Connection:
+        """打开（或在目录变化时重新打开）索引（调用方持有锁）"""
+        directory = self.directory
+        if self._db is not None and self._opened_dir == directory:
+            return self._db
+        if self._db is not None:
+            self._db.close()
+        directory.mkdir(parents=True, exist_ok=True)
+        db = sqlite3.connect(str(directory / "index.sqlite3"), check_same_thread=False)
+        db.row_factory = sqlite3.Row
+        db.execute("PRAGMA journal_mode=WAL")
+        db.executescript(_SCHEMA)
+        self._db, self._opened_dir = db, directory
+        self._total_bytes = db.execute("SELECT COALESCE(SUM(stored_bytes), 0) FROM images").fetchone()[0]
+
+        # 上次退出前没来得及重新压缩的图片
+        pending = [row[0] for row in db.execute("SELECT digest FROM images WHERE recompressed = 0")]
+        for digest in pending:
+            self._enqueue(("recompress", digest))
+        return db
+
+    @staticmethod
+    def _object_path(digest: str, image_format: str) -> str:
+        return f"objects/{digest[:2]}/{digest[2:4]}/{digest}.{_EXTENSIONS.get(image_format, 'bin')}"
+
+    def _write_object(self, relative_path: str, data: bytes) -> None:
+        path = self.directory / relative_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _remove_object(self, relative_path: str) -> None:
+        try:
+            (self.directory / relative_path).unlink()
+        except FileNotFoundError:
+            pass
+
+    # ---------- 后台线程 ----------
+
+    def _enqueue(self, job: tuple) -> bool:
+        try:
+            self._queue.put_nowait(job)
+            return True
+        except queue.Full:
+            self._stats["dropped"] += 1
+            return False
+
+    def _ensure_worker(self) -> None:
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="image-archive", daemon=True)
+                self._worker.start()
+
+    def _run(self) -> None:
+        while True:
+            job = self._queue.get()
+            try:
+                if job[0] == "store":
+                    self._store(*job[1:])
+                else:
+                    self._recompress(job[1])
+            except Exception as e:
+                self._stats["failed"] += 1
+                logger.error(f"❌ 图片归档失败: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _store(self, image: Any) -> None:
+        """原样写入一张图片（已存在时只更新上传次数和访问时间），随后重新压缩"""
+        if isinstance(image, IngestedImage):
+            digest, filename, info = image.digest, image.filename, image.info
+            data = image.data
+        else:
+            digest, filename, info, data = compute_digest(image), None, None, image
+
+        now = time.time()
+        with self._lock:
+            db = self._connect()
+            updated = db.execute(
+                "UPDATE images SET uploads = uploads + 1, last_access = ? WHERE digest = ?", (now, digest)
+            ).rowcount
+            db.commit()
+        if updated:
+            self._stats["deduplicated"] += 1
+            return
+
+        if info is None:
+            try:
+                info = probe_image(data)
+            except ImageRejected:
+                info = {"format": "bin", "width": None, "height": None}
+        relative_path = self._object_path(digest, info["format"])
+        self._write_object(relative_path, data)
+        with self._lock:
+            db = self._connect()
+            db.execute(
+                "INSERT OR IGNORE INTO images (digest, path, format, width, height, original_bytes, stored_bytes,"
+                " filename, created_at, last_access) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (digest, relative_path, info["format"], info["width"], info["height"],
+                 len(data), len(data), filename, now, now),
+            )
+            db.commit()
+            self._total_bytes += len(data)
+        self._stats["stored"] += 1
+        self._recompress(digest, data)
+
+    def _recompress(self, digest: str, data: Optional[bytes] = None) -> None:
+        with self._lock:
+            row = self._connect().execute("SELECT * FROM images WHERE digest = ?", (digest,)).fetchone()
+        if row is None or row["recompressed"]:
+            return
+        if data is None:
+            data = (self.directory / row["path"]).read_bytes()
+
+        started = time.perf_counter()
+        result = recompress_for_archive(data)
+        self._recompress_runs += 1
+        self._recompress_ms += (time.perf_counter() - started) * 1000
+        if result is None:
+            new_path, stored, fmt, (width, height) = row["path"], len(data), row["format"], (row["width"], row["height"])
+        else:
+            encoded, (width, height) = result
+            new_path, stored, fmt = self._object_path(digest, "webp"), len(encoded), "webp"
+            self._write_object(new_path, encoded)
+            self._stats["recompressed"] += 1
+
+        with self._lock:
+            db = self._connect()
+            db.execute(
+                "UPDATE images SET path = ?, format = ?, width = ?, height = ?, stored_bytes = ?, recompressed = 1"
+                " WHERE digest = ?",
+                (new_path, fmt, width, height, stored, digest),
+            )
+            db.commit()
+            self._total_bytes += stored - row["stored_bytes"]
+        if new_path != row["path"]:
+            self._remove_object(row["path"])
+        self._evict()
+
+    def _evict(self) -> None:
+        """超过容量时按最近访问时间淘汰"""
+        limit = get_archive_limit()
+        if not limit or self._total_bytes <= limit:
+            return
+        target = int(limit * EVICT_TARGET_RATIO)
+        removed = []
+        with self._lock:
+            db = self._connect()
+            for row in db.execute("SELECT digest, path, stored_bytes FROM images ORDER BY last_access"):
+                if self._total_bytes <= target:
+                    break
+                removed.append((row["digest"], row["path"]))
+                self._total_bytes -= row["stored_bytes"]
+            db.executemany("DELETE FROM images WHERE digest = ?", [(digest,) for digest, _ in removed])
+            db.commit()
+        for _, relative_path in removed:
+            self._remove_object(relative_path)
+        self._stats["evicted"] += len(removed)
+        if removed:
+            logger.info(f"图片归档超过容量，淘汰 {len(removed)} 张最久未访问的图片")
+
+    # ---------- 对外接口 ----------
+
+    def submit(self, images: Iterable[Any]) -> int:
+        """把图片（IngestedImage 或字节）交给后台线程归档，不阻塞调用方
+
+        Returns:
+            进入队列的图片数（队列满时放弃的不计入）
+        """
+        if not is_archive_enabled():
+            return 0
+        self._ensure_worker()
+        return sum(self._enqueue(("store", image)) for image in images)
+
+    def flush(self) -> None:
+        """等待队列中的归档任务全部完成（脚本 / 测试使用）"""
+        self._ensure_worker()
+        self._queue.join()
+
+    def describe(self, digest: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._connect().execute("SELECT * FROM images WHERE digest = ?", (digest,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def load(self, digest: str) -> Optional[IngestedImage]:
+        """读取归档图片（更新访问时间）；摘要沿用原图摘要，结果缓存 key 与原图一致"""
+        row = self.describe(digest)
+        if row is None:
+            return None
+        try:
+            data = (self.directory / row["path"]).read_bytes()
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            db = self._connect()
+            db.execute("UPDATE images SET last_access = ? WHERE digest = ?", (time.time(), digest))
+            db.commit()
+        info = None
+        if row["format"] in _EXTENSIONS:
+            info = {
+                "format": row["format"],
+                "mime_type": f"image/{row['format']}",
+                "width": row["width"],
+                "height": row["height"],
+            }
+        return IngestedImage(row["filename"], len(data), digest, data[:32], raw=data, info=info)
+
+    def load_many(self, digests: Iterable[str]) -> Tuple[List[IngestedImage], List[str]]:
+        """按顺序读取多张归档图片
+
+        Returns:
+            (图片列表, 不存在的摘要列表)
+        """
+        images, missing = [], []
+        for digest in digests:
+            image = self.load(digest)
+            if image is None:
+                missing.append(digest)
+            else:
+                images.append(image)
+        return images, missing
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            db = self._connect()
+            count, original = db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(original_bytes), 0) FROM images"
+            ).fetchone()
+            total = self._total_bytes
+        return {
+            "enabled": is_archive_enabled(),
+            "directory": str(self.directory),
+            "images": count,
+            "stored_bytes": total,
+            "original_bytes": original,
+            "compression_ratio": round(total / original, 3) if original else None,
+            "capacity_bytes": get_archive_limit(),
+            "queued": self._queue.qsize(),
+            **self._stats,
+            "avg_recompress_ms": round(self._recompress_ms / self._recompress_runs, 1) if self._recompress_runs else None,
+        }
+
+
+# 全局单例
+image_archive = ImageArchive()
+
+
+def get_archive_stats() -> Dict[str, Any]:
+    return image_archive.stats()
@@ -0,0 +1,525 @@
+"""图片预处理：按 token 预算缩放并重新压缩后再编码
+
+手机拍的题目照片通常 12MP、几 MB，直接 base64 发送既慢又贵：
+Claude 按像素计费（约 宽 × 高 / 750 个 image tokens），长边超过 1568 时服务端还会再缩放一次。
+在 encode_image_to_base64 之前统一做：
+
+1. 按 EXIF 方向旋正（手机竖拍的照片）
+2. 裁掉桌面、页边距等不含文字的区域（缩略图上用 NumPy 做投影分析，找不到可靠区域时保留整图）
+3. 按长边上限和 image token 预算缩放（JPEG 用 draft 模式在解码时直接降采样，比例按裁剪后的区域计算）
+4. 近似灰度的照片转为灰度（彩色示意图保留颜色）
+5. 以配置的 JPEG / WebP 质量重新编码；结果不比原图小时保留原图
+
+环境变量：
+- IMAGE_PREPROCESS: 是否启用（可选，默认 true）
+- IMAGE_MAX_LONG_EDGE: 长边上限（像素，可选，默认 1568）
+- IMAGE_TOKEN_BUDGET: 单张图片的 image token 上限（可选，默认 1600，0 表示只按长边限制）
+- IMAGE_FORMAT: jpeg / webp（可选，默认 jpeg）
+- IMAGE_QUALITY: 重新编码质量（可选，默认 85）
+- IMAGE_GRAYSCALE: auto / true / false（可选，默认 auto：色度很低时才转灰度）
+- IMAGE_CROP: 是否裁剪到文字区域（可选，默认 true）
+- IMAGE_CROP_PADDING: 裁剪边距，占裁剪区域宽高的比例（可选，默认 0.04）
+- IMAGE_TIER_LADDER: 渐进分辨率的长边档位，逗号分隔（可选，默认 1092,1568）。
+  call_claude_pipeline 从最低档开始，结果缺参数 / 参数不合理时才升到下一档
+- IMAGE_CLIENT_RESIZE: 是否让浏览器上传前先缩放 / 重新压缩（可选，默认 true，见 get_client_upload_target）
+- IMAGE_CLIENT_QUALITY: 浏览器重新压缩的质量（0-1，可选，默认 0.9）
+"""
+
+import io
+import logging
+import math
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from PIL import Image, ImageOps, ImageStat
+
+logger = logging.getLogger(__name__)
+
+# Claude 视觉输入的 token 估算：宽 × 高 / 750
+PIXELS_PER_IMAGE_TOKEN = 750
+
+# auto 模式下判定为「近似灰度」的色度阈值（Cb / Cr 偏离 128 的均方根）
+GRAYSCALE_CHROMA_THRESHOLD = 6.0
+
+# 文字区域检测用的缩略图长边（像素）
+CROP_THUMB_LONG_EDGE = 320
+
+# 裁剪区域占整图比例超过该值时不裁剪（收益太小），低于最小值时视为检测失败
+CROP_MAX_AREA_RATIO = 0.85
+CROP_MIN_AREA_RATIO = 0.04
+
+# 浏览器端缩放的余量：服务端裁剪通常保留整图 45% 以上的面积，
+# 长边多留 1.5 倍时裁剪后的区域仍不低于最高档位
+CLIENT_CROP_HEADROOM = 1.5
+
+_FORMATS = {
+    "jpeg": ("JPEG", "image/jpeg"),
+    "webp": ("WEBP", "image/webp"),
+}
+
+
+def _get_int_env(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, str(default)))
+    except ValueError:
+        return default
+
+
+def is_preprocess_enabled() -> bool:
+    return os.environ.get("IMAGE_PREPROCESS", "true").lower() in ("true", "1", "yes")
+
+
+def _get_float_env(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, str(default)))
+    except ValueError:
+        return default
+
+
+def get_preprocess_settings() -> Dict[str, Any]:
+    image_format = os.environ.get("IMAGE_FORMAT", "jpeg").lower()
+    if image_format not in _FORMATS:
+        logger.warning(f"⚠️  不支持的 IMAGE_FORMAT={image_format!r}，使用 jpeg")
+        image_format = "jpeg"
+    grayscale = os.environ.get("IMAGE_GRAYSCALE", "auto").lower()
+    if grayscale not in ("auto", "true", "false"):
+        grayscale = "auto"
+    return {
+        "max_long_edge": _get_int_env("IMAGE_MAX_LONG_EDGE", 1568),
+        "token_budget": _get_int_env("IMAGE_TOKEN_BUDGET", 1600),
+        "format": image_format,
+        "quality": min(max(_get_int_env("IMAGE_QUALITY", 85), 1), 100),
+        "grayscale": grayscale,
+        "crop": os.environ.get("IMAGE_CROP", "true").lower() in ("true", "1", "yes"),
+        "crop_padding": min(max(_get_float_env("IMAGE_CROP_PADDING", 0.04), 0.0), 0.5),
+    }
+
+
+def get_tier_ladder() -> List[int]:
+    """渐进分辨率档位（长边，升序去重）；未配置有效值时只有 IMAGE_MAX_LONG_EDGE 一档"""
+    raw = os.environ.get("IMAGE_TIER_LADDER", "1092,1568")
+    tiers = set()
+    for item in raw.split(","):
+        try:
+            value = int(item.strip())
+        except ValueError:
+            continue
+        if value > 0:
+            tiers.add(value)
+    return sorted(tiers) or [get_preprocess_settings()["max_long_edge"]]
+
+
+def plan_tier_ladder(sizes: Sequence[Optional[Tuple[int, int]]]) -> List[int]:
+    """按图片实际尺寸精简档位：缩放结果与上一档完全相同的档位去掉
+
+    图片长边不超过某一档时，更高的档位发送的是同一张图片，升档只会重复请求。
+    尺寸未知（None）时返回完整档位。
+    """
+    ladder = get_tier_ladder()
+    if not sizes or any(size is None for size in sizes):
+        return ladder
+    token_budget = get_preprocess_settings()["token_budget"]
+    kept, previous = [], None
+    for tier in ladder:
+        targets = [target_size(width, height, tier, token_budget) for width, height in sizes]
+        if targets != previous:
+            kept.append(tier)
+            previous = targets
+    return kept
+
+
+def get_client_upload_target() -> Dict[str, Any]:
+    """浏览器上传前缩放 / 重新压缩的目标（GET /upload/config 下发给 static/main.js）
+
+    长边和像素上限取最高分辨率档位（升档时也不需要重新上传）；服务端会裁剪时再留
+    CLIENT_CROP_HEADROOM 的余量。编码格式与服务端 IMAGE_FORMAT 一致，
+    质量略高于服务端，避免两次有损压缩叠加。
+    """
+    settings = get_preprocess_settings()
+    long_edge = max(get_tier_ladder() + [settings["max_long_edge"]])
+    max_pixels = settings["token_budget"] * PIXELS_PER_IMAGE_TOKEN
+    if is_preprocess_enabled() and settings["crop"]:
+        long_edge = int(long_edge * CLIENT_CROP_HEADROOM)
+        max_pixels = int(max_pixels * CLIENT_CROP_HEADROOM ** 2)
+    return {
+        "enabled": os.environ.get("IMAGE_CLIENT_RESIZE", "true").lower() in ("true", "1", "yes"),
+        "max_long_edge": long_edge,
+        "max_pixels": max_pixels,
+        "format": settings["format"],
+        "mime_type": _FORMATS[settings["format"]][1],
+        "quality": min(max(_get_float_env("IMAGE_CLIENT_QUALITY", 0.9), 0.1), 1.0),
+    }
+
+
+def estimate_image_tokens(width: int, height: int) -> int:
+    """估算一张图片的 image tokens"""
+    return math.ceil(width * height / PIXELS_PER_IMAGE_TOKEN)
+
+
+def target_size(
+    width: int,
+    height: int,
+    max_long_edge: int,
+    token_budget: int = 0,
+) -> Tuple[int, int]:
+    """同时满足长边上限和 token 预算的目标尺寸（只缩小不放大）"""
+    scale = 1.0
+    if max_long_edge > 0:
+        scale = min(scale, max_long_edge / max(width, height))
+    if token_budget > 0:
+        scale = min(scale, math.sqrt(token_budget * PIXELS_PER_IMAGE_TOKEN / (width * height)))
+    if scale >= 1.0:
+        return width, height
+    return max(int(width * scale), 1), max(int(height * scale), 1)
+
+
+def is_near_grayscale(img: Image.Image) -> bool:
+    """在缩略图上估算色度：文字 / 黑白题目照片的 Cb、Cr 基本集中在 128 附近"""
+    if img.mode in ("L", "LA", "1"):
+        return True
+    thumb = img.convert("RGB")
+    thumb.thumbnail((128, 128))
+    _, cb, cr = thumb.convert("YCbCr").split()
+    chroma = []
+    for channel in (cb, cr):
+        stat = ImageStat.Stat(channel)
+        # 相对 128 的均方根 = sqrt(方差 + (均值 - 128)²)
+        chroma.append(math.sqrt(stat.var[0] + (stat.mean[0] - 128) ** 2))
+    return max(chroma) < GRAYSCALE_CHROMA_THRESHOLD
+
+
+# ==================== 文字区域裁剪 ====================
+
+def _analysis_thumbnail(img: Image.Image) -> np.ndarray:
+    """生成用于区域检测的灰度缩略图
+
+    大图先最近邻采样到缩略图的 4 倍，再 4×4 均值降采样：
+    12MP 照片约 2ms，而直接 reduce / BOX 缩放需要 20ms 以上。
+    """
+    width, height = img.size
+    scale = CROP_THUMB_LONG_EDGE / max(width, height)
+    if scale >= 1:
+        small = img
+    else:
+        thumb_size = (max(int(width * scale), 1), max(int(height * scale), 1))
+        if max(width, height) > CROP_THUMB_LONG_EDGE * 4:
+            sampled = img.resize((thumb_size[0] * 4, thumb_size[1] * 4), Image.NEAREST)
+            small = sampled.reduce(4)
+        else:
+            small = img.resize(thumb_size, Image.BOX)
+    return np.asarray(small.convert("L"), dtype=np.int16)
+
+
+def _sliding_extreme(gray: np.ndarray, radius: int, reducer) -> np.ndarray:
+    """可分离的 (2r+1)×(2r+1) 最大 / 最小值滤波（reducer 为 np.maximum / np.minimum）"""
+    size = 2 * radius + 1
+    height, width = gray.shape
+    padded = np.pad(gray, radius, mode="edge")
+    rows = padded[:, 0:width].copy()
+    for offset in range(1, size):
+        reducer(rows, padded[:, offset:offset + width], out=rows)
+    out = rows[0:height].copy()
+    for offset in range(1, size):
+        reducer(out, rows[offset:offset + height], out=out)
+    return out
+
+
+def _box_mean(mask: np.ndarray, radius: int) -> np.ndarray:
+    """(2r+1)×(2r+1) 窗口内的均值（积分图实现）"""
+    padded = np.pad(mask.astype(np.float32), radius + 1, mode="constant")
+    integral = padded.cumsum(axis=0).cumsum(axis=1)
+    size = 2 * radius + 1
+    total = (
+        integral[size:, size:] - integral[:-size, size:]
+        - integral[size:, :-size] + integral[:-size, :-size]
+    )
+    return total[: mask.shape[0], : mask.shape[1]] / (size * size)
+
+
+def _significant_span(profile: np.ndarray, max_gap: int, min_mass_ratio: float = 0.05) -> Optional[Tuple[int, int]]:
+    """在一维投影上找出所有有效区段（允许 max_gap 以内的空隙），合并质量占比足够的区段
+
+    Returns:
+        (start, end)（end 不含），没有有效区段时返回 None
+    """
+    active = np.flatnonzero(profile > 0)
+    if active.size == 0:
+        return None
+
+    # 相邻有效位置间隔超过 max_gap 视为新区段
+    breaks = np.flatnonzero(np.diff(active) > max_gap + 1)
+    starts = np.concatenate(([active[0]], active[breaks + 1]))
+    ends = np.concatenate((active[breaks], [active[-1]])) + 1
+
+    cumulative = np.concatenate(([0.0], np.cumsum(profile)))
+    masses = cumulative[ends] - cumulative[starts]
+    keep = masses >= masses.sum() * min_mass_ratio
+    if not keep.any():
+        return None
+    return int(starts[keep].min()), int(ends[keep].max())
+
+
+def find_content_box(img: Image.Image) -> Optional[Tuple[int, int, int, int]]:
+    """用投影分析找出文字所在区域
+
+    1. 缩略图上做黑帽变换，比周围背景明显更暗的细笔画即「墨迹」
+    2. 去掉孤立噪点
+    3. 行、列投影分别找出有效区段并合并，得到包围盒
+
+    Returns:
+        原图坐标下的 (left, top, right, bottom)，没有可靠文字区域时返回 None
+    """
+    gray = _analysis_thumbnail(img)
+    thumb_h, thumb_w = gray.shape
+    if thumb_h < 16 or thumb_w < 16:
+        return None
+
+    # 黑帽变换（闭运算 - 原图）：细的深色笔画（文字、示意图线条）响应强，
+    # 纸张与桌面之间的明暗交界、大面积阴影响应弱
+    closed = _sliding_extreme(_sliding_extreme(gray, 3, np.maximum), 3, np.minimum)
+    blackhat = closed - gray
+
+    threshold = max(24, int(np.percentile(blackhat, 99.5) * 0.3))
+    ink = blackhat > threshold
+    # 去掉孤立的噪点（桌面纹理、JPEG 噪声）
+    dense = ink & (_box_mean(ink, radius=2) > 0.12)
+    if dense.mean() < 0.001:
+        return None
+
+    row_span = _significant_span(dense.sum(axis=1), max_gap=max(thumb_h // 12, 2))
+    if row_span is None:
+        return None
+    col_span = _significant_span(dense[row_span[0]:row_span[1]].sum(axis=0), max_gap=max(thumb_w // 12, 2))
+    if col_span is None:
+        return None
+
+    scale_x = img.size[0] / thumb_w
+    scale_y = img.size[1] / thumb_h
+    return (
+        int(col_span[0] * scale_x), int(row_span[0] * scale_y),
+        int(np.ceil(col_span[1] * scale_x)), int(np.ceil(row_span[1] * scale_y)),
+    )
+
+
+def pad_content_box(box: Tuple[int, int, int, int], size: Tuple[int, int],
+                    padding: float = 0.04) -> Optional[Tuple[int, int, int, int]]:
+    """给文字区域加边距；裁剪收益太小或区域太小（视为检测失败）时返回 None"""
+    width, height = size
+    left, top, right, bottom = box
+    pad_x = int((right - left) * padding) + 8
+    pad_y = int((bottom - top) * padding) + 8
+    box = (max(left - pad_x, 0), max(top - pad_y, 0), min(right + pad_x, width), min(bottom + pad_y, height))
+
+    area_ratio = (box[2] - box[0]) * (box[3] - box[1]) / (width * height)
+    if not (CROP_MIN_AREA_RATIO <= area_ratio <= CROP_MAX_AREA_RATIO):
+        return None
+    return box
+
+
+def crop_to_content(img: Image.Image, padding: float = 0.04) -> Tuple[Image.Image, Optional[Tuple[int, int, int, int]]]:
+    """裁剪到文字区域（加边距）；检测失败或收益太小时返回原图
+
+    Returns:
+        (图片, 裁剪框或 None)
+    """
+    box = find_content_box(img)
+    if box is not None:
+        box = pad_content_box(box, img.size, padding)
+    if box is None:
+        return img, None
+    return img.crop(box), box
+
+
+def _flatten(img: Image.Image) -> Image.Image:
+    """转为 RGB / L；透明背景铺白底（直接丢弃 alpha 会让透明区域变黑、盖住文字）"""
+    if img.mode in ("RGB", "L"):
+        return img
+    if img.mode in ("RGBA", "LA", "PA") or (img.mode == "P" and "transparency" in img.info):
+        rgba = img.convert("RGBA")
+        background = Image.new("RGB", rgba.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.getchannel("A"))
+        return background
+    return img.convert("RGB")
+
+
+def preprocess_image(
+    image_data: bytes,
+    settings: Optional[Dict[str, Any]] = None,
+) -> Tuple[bytes, Dict[str, Any]]:
+    """缩放并重新压缩一张图片
+
+    Args:
+        image_data: 原始图片字节
+        settings: 覆盖 get_preprocess_settings() 的配置（基准测试用）
+
+    Returns:
+        (处理后的图片字节, 处理信息)；无法解码或处理后不更小时返回原图
+    """
+    settings = settings or get_preprocess_settings()
+    started = time.perf_counter()
+    info: Dict[str, Any] = {"original_bytes": len(image_data), "applied": False}
+
+    try:
+        img = Image.open(io.BytesIO(image_data))
+        original_size = img.size
+        info["original_size"] = original_size
+
+        # EXIF 方向可能交换宽高，按旋正后的尺寸计算
+        orientation = img.getexif().get(0x0112, 1)
+        transposed = orientation in (5, 6, 7, 8)
+        width, height = img.size
+        if transposed:
+            width, height = height, width
+        is_jpeg = img.format == "JPEG"
+        oriented = False
+
+        # 先找裁剪框（旋正后的原图坐标），再按裁剪区域计算目标尺寸
+        crop_box = None
+        crop_w, crop_h = width, height
+        if settings.get("crop"):
+            crop_started = time.perf_counter()
+            if is_jpeg:
+                # 文字区域检测只用缩略图：另外按最小的 draft 比例解码一份，不影响正式解码的比例
+                analysis = Image.open(io.BytesIO(image_data))
+                analysis.draft("RGB", (CROP_THUMB_LONG_EDGE, CROP_THUMB_LONG_EDGE))
+                analysis = _flatten(ImageOps.exif_transpose(analysis))
+            else:
+                img = analysis = _flatten(ImageOps.exif_transpose(img))
+                oriented = True
+            box = find_content_box(analysis)
+            if box is not None:
+                scale_x, scale_y = width / analysis.size[0], height / analysis.size[1]
+                box = (
+                    int(box[0] * scale_x), int(box[1] * scale_y),
+                    min(math.ceil(box[2] * scale_x), width), min(math.ceil(box[3] * scale_y), height),
+                )
+                crop_box = pad_content_box(box, (width, height), settings.get("crop_padding", 0.04))
+            if crop_box is not None:
+                crop_w, crop_h = crop_box[2] - crop_box[0], crop_box[3] - crop_box[1]
+            info["crop_ms"] = round((time.perf_counter() - crop_started) * 1000, 2)
+        info["crop_box"] = crop_box
+        new_w, new_h = target_size(crop_w, crop_h, settings["max_long_edge"], settings["token_budget"])
+
+        # JPEG 解码时直接按 1/2、1/4、1/8 降采样，大图解码快很多；
+        # 比例按裁剪区域计算，保证裁剪后仍不小于目标尺寸
+        if is_jpeg and (new_w, new_h) != (crop_w, crop_h):
+            draft_w = math.ceil(width * new_w / crop_w)
+            draft_h = math.ceil(height * new_h / crop_h)
+            img.draft("RGB", (draft_h, draft_w) if transposed else (draft_w, draft_h))
+
+        if not oriented:
+            img = _flatten(ImageOps.exif_transpose(img))
+        if crop_box is not None:
+            scale_x, scale_y = img.size[0] / width, img.size[1] / height
+            img = img.crop((
+                int(crop_box[0] * scale_x), int(crop_box[1] * scale_y),
+                min(math.ceil(crop_box[2] * scale_x), img.size[0]), min(math.ceil(crop_box[3] * scale_y), img.size[1]),
+            ))
+
+        grayscale = settings["grayscale"] == "true" or (
+            settings["grayscale"] == "auto" and is_near_grayscale(img)
+        )
+        if grayscale and img.mode != "L":
+            img = img.convert("L")
+
+        if img.size != (new_w, new_h):
+            img = img.resize((new_w, new_h), Image.LANCZOS, reducing_gap=2.0)
+
+        pil_format, mime_type = _FORMATS[settings["format"]]
+        out = io.BytesIO()
+        save_kwargs = {"quality": settings["quality"]}
+        if pil_format == "JPEG":
+            save_kwargs.update(optimize=True, progressive=True)
+        else:
+            save_kwargs.update(method=4)
+        img.save(out, pil_format, **save_kwargs)
+        processed = out.getvalue()
+    except Exception as e:
+        logger.warning(f"⚠️  图片预处理失败，使用原图: {e}")
+        info["error"] = str(e)
+        return image_data, info
+
+    info.update({
+        "size": (new_w, new_h),
+        "grayscale": grayscale,
+        "mime_type": mime_type,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 2),
+    })
+
+    # 没有裁剪、缩放和旋转时，重新编码不一定更小
+    if (len(processed) >= len(image_data) and crop_box is None
+            and (new_w, new_h) == original_size and orientation == 1):
+        info.update({"bytes": len(image_data), "mime_type": None})
+        return image_data, info
+
+    info.update({"applied": True, "bytes": len(processed)})
+    logger.info(
+        f"🖼️  图片预处理: {original_size[0]}x{original_size[1]} -> {new_w}x{new_h}"
+        f"{'（已裁剪）' if crop_box else ''}"
+        f"{'（灰度）' if grayscale else ''}, {len(image_data)} -> {len(processed)} 字节, "
+        f"约 {estimate_image_tokens(new_w, new_h)} image tokens, {info['elapsed_ms']}ms"
+    )
+    return processed, info
+
+
+def prepare_for_model(image_data: bytes, long_edge: Optional[int] = None) -> bytes:
+    """发送给模型前的预处理入口（未启用时原样返回）
+
+    Args:
+        long_edge: 分辨率档位（覆盖 IMAGE_MAX_LONG_EDGE），None 表示使用配置值
+    """
+    if not is_preprocess_enabled():
+        return image_data
+    settings = get_preprocess_settings()
+    if long_edge:
+        settings["max_long_edge"] = long_edge
+    processed, _ = preprocess_image(image_data, settings)
+    return processed
+
+
+# ==================== 分辨率档位统计 ====================
+
+TIER_OUTCOMES = ("accepted", "escalated", "invalid")
+
+
+class TierStats:
+    """按分辨率档位统计结果：accepted（通过校验）/ escalated（疑似分辨率不足，升档）/ invalid（其他校验失败）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def record(self, tier: Optional[int], outcome: str, input_tokens: int = 0) -> None:
+        key = str(tier) if tier else "original"
+        with self._lock:
+            stats = self._stats.setdefault(key, {"requests": 0, "input_tokens": 0, **{o: 0 for o in TIER_OUTCOMES}})
+            stats["requests"] += 1
+            stats["input_tokens"] += input_tokens
+            stats[outcome] += 1
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            snapshot = {tier: dict(stats) for tier, stats in self._stats.items()}
+        return {
+            tier: {
+                **{k: v for k, v in stats.items() if k != "input_tokens"},
+                "success_rate": round(stats["accepted"] / stats["requests"], 4) if stats["requests"] else None,
+                "avg_input_tokens": round(stats["input_tokens"] / stats["requests"], 1) if stats["requests"] else None,
+            }
+            for tier, stats in sorted(snapshot.items(), key=lambda item: (item[0] == "original", item[0].zfill(6)))
+        }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
+
+
+# 进程级单例
+tier_stats = TierStats()
+
+
+def get_tier_stats() -> Dict[str, Any]:
+    return {"ladder": get_tier_ladder(), "enabled": is_preprocess_enabled(), "tiers": tier_stats.summary()}
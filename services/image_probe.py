@@ -0,0 +1,209 @@
+"""只读文件头的图片探测与解压炸弹限制
+
+上传时 IngestStream 在收到前几 KB 数据时就调用 probe_header，拿到真实格式和像素尺寸：
+- 扩展名正确但内容不是允许的格式（HEIC、PDF、GIF 改名等）
+- 边长超过 MAX_IMAGE_DIMENSION
+- 像素数超过 MAX_IMAGE_PIXELS（几 MB 的文件解码后可能是几亿像素）
+都在图片写入内存、发送给 Claude 之前拒绝。尺寸同时用于规划分辨率档位（见 image_preprocess.plan_tier_ladder）。
+
+只解析文件头，不解码像素：JPEG 沿段标记找到 SOF，PNG 读 IHDR，GIF 读逻辑屏幕描述符，WebP 读 VP8 / VP8L / VP8X。
+"""
+
+import logging
+import struct
+from typing import Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+# 探测最多读取的文件头长度（JPEG 的 EXIF / ICC 段可能较长）
+PROBE_MAX_BYTES = 256 * 1024
+
+DEFAULT_MAX_PIXELS = 60_000_000
+DEFAULT_MAX_DIMENSION = 12_000
+
+MIME_TYPES = {
+    "jpeg": "image/jpeg",
+    "png": "image/png",
+    "gif": "image/gif",
+    "webp": "image/webp",
+}
+
+# 扩展名 -> 格式
+EXTENSION_FORMATS = {
+    "jpg": "jpeg",
+    "jpeg": "jpeg",
+    "png": "png",
+    "gif": "gif",
+    "webp": "webp",
+}
+
+# JPEG 中带尺寸的帧头（SOF0-SOF15，除去 DHT / JPG / DAC）
+_JPEG_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+# 没有长度字段的独立标记
+_JPEG_STANDALONE_MARKERS = set(range(0xD0, 0xDA)) | {0x01}
+
+
+class ImageRejected(ValueError):
+    """上传的图片不可接受（格式不对 / 尺寸过大 / 疑似解压炸弹 / 无法识别）"""
+
+    def __init__(self, code: str, message: str, status: int = 400):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+        self.status = status
+
+
+def allowed_formats_for_extensions(extensions: Iterable[str]) -> set:
+    """ALLOWED_EXTENSIONS -> 允许的真实格式"""
+    return {EXTENSION_FORMATS[ext.lower()] for ext in extensions if ext.lower() in EXTENSION_FORMATS}
+
+
+def _describe_unknown(header: bytes) -> str:
+    """常见的非图片 / 不支持格式，用于错误提示"""
+    if header.startswith(b"%PDF"):
+        return "PDF"
+    if header[4:8] == b"ftyp":
+        brand = header[8:12].decode("ascii", "replace")
+        return "HEIC/HEIF" if brand in ("heic", "heix", "hevc", "mif1", "msf1") else f"ISO 媒体（{brand}）"
+    if header.startswith(b"BM"):
+        return "BMP"
+    if header[:4] in (b"II*\x00", b"MM\x00*"):
+        return "TIFF"
+    return "未知格式"
+
+
+def _probe_jpeg(header: bytes, complete: bool) -> Optional[tuple]:
+    offset = 2
+    size = len(header)
+    while True:
+        # 跳过填充的 0xFF
+        while offset < size and header[offset] == 0xFF and offset + 1 < size and header[offset + 1] == 0xFF:
+            offset += 1
+        if offset + 2 > size:
+            break
+        if header[offset] != 0xFF:
+            raise ImageRejected("unreadable_image", "JPEG 文件头损坏")
+        marker = header[offset + 1]
+        if marker in _JPEG_STANDALONE_MARKERS:
+            offset += 2
+            continue
+        if marker == 0xDA:  # SOS：图像数据开始前还没有 SOF
+            raise ImageRejected("unreadable_image", "JPEG 缺少帧头（SOF）")
+        if offset + 4 > size:
+            break
+        (length,) = struct.unpack(">H", header[offset + 2:offset + 4])
+        if marker in _JPEG_SOF_MARKERS:
+            if offset + 9 > size:
+                break
+            height, width = struct.unpack(">HH", header[offset + 5:offset + 9])
+            return width, height
+        offset += 2 + length
+
+    if complete:
+        raise ImageRejected("unreadable_image", "没有在文件头中找到 JPEG 帧头（SOF）")
+    return None
+
+
+def _probe_webp(header: bytes) -> Optional[tuple]:
+    if len(header) < 30:
+        return None
+    chunk = header[12:16]
+    if chunk == b"VP8 ":
+        width, height = struct.unpack("<HH", header[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b"VP8L":
+        bits = int.from_bytes(header[21:25], "little")
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b"VP8X":
+        width = int.from_bytes(header[24:27], "little") + 1
+        height = int.from_bytes(header[27:30], "little") + 1
+        return width, height
+    raise ImageRejected("unreadable_image", "无法识别的 WebP 数据块")
+
+
+def probe_header(header: bytes, complete: bool = False) -> Optional[dict]:
+    """从文件头解析格式和像素尺寸
+
+    Args:
+        header: 文件开头的字节
+        complete: header 是否已是完整文件 / 已达到读取上限（为 True 时不再返回 None）
+
+    Returns:
+        {"format", "mime_type", "width", "height"}；需要更多字节时返回 None
+
+    Raises:
+        ImageRejected: 不是可识别的图片，或文件头损坏
+    """
+    if len(header) < 12 and not complete:
+        return None
+
+    size = None
+    if header[:8] == b"\x89PNG\r\n\x1a\n":
+        image_format = "png"
+        if len(header) >= 24:
+            if header[12:16] != b"IHDR":
+                raise ImageRejected("unreadable_image", "PNG 缺少 IHDR")
+            size = struct.unpack(">II", header[16:24])
+    elif header[:2] == b"\xff\xd8":
+        image_format = "jpeg"
+        size = _probe_jpeg(header, complete)
+    elif header[:6] in (b"GIF87a", b"GIF89a"):
+        image_format = "gif"
+        if len(header) >= 10:
+            size = struct.unpack("<HH", header[6:10])
+    elif header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        image_format = "webp"
+        size = _probe_webp(header)
+    else:
+        raise ImageRejected("unsupported_format", f"不是支持的图片格式（{_describe_unknown(header)}）")
+
+    if size is None:
+        if complete:
+            raise ImageRejected("unreadable_image", "图片文件头不完整")
+        return None
+
+    width, height = size
+    return {"format": image_format, "mime_type": MIME_TYPES[image_format], "width": width, "height": height}
+
+
+def validate_probe(
+    info: dict,
+    allowed_formats: Optional[Iterable[str]] = None,
+    max_pixels: int = DEFAULT_MAX_PIXELS,
+    max_dimension: int = DEFAULT_MAX_DIMENSION,
+) -> dict:
+    """按格式白名单和尺寸限制检查探测结果
+
+    Raises:
+        ImageRejected: 格式不允许（400）、尺寸为 0（400）、边长或像素数超限（413）
+    """
+    if allowed_formats is not None and info["format"] not in set(allowed_formats):
+        raise ImageRejected(
+            "unsupported_format",
+            f"图片实际格式为 {info['format']}，仅支持: {', '.join(sorted(allowed_formats))}",
+        )
+
+    width, height = info["width"], info["height"]
+    if width <= 0 or height <= 0:
+        raise ImageRejected("unreadable_image", f"图片尺寸无效: {width}x{height}")
+    if max_dimension and max(width, height) > max_dimension:
+        raise ImageRejected(
+            "image_too_large", f"图片尺寸 {width}x{height} 超过边长上限 {max_dimension}px", status=413
+        )
+    if max_pixels and width * height > max_pixels:
+        raise ImageRejected(
+            "decompression_bomb",
+            f"图片解码后有 {width * height / 1e6:.0f}MP，超过上限 {max_pixels / 1e6:.0f}MP",
+            status=413,
+        )
+    return info
+
+
+def probe_image(image_data: bytes) -> dict:
+    """探测完整图片字节（非上传来源，例如 bulk 任务、脚本传入的字节）
+
+    Raises:
+        ImageRejected: 不是可识别的图片
+    """
+    header = bytes(image_data[:PROBE_MAX_BYTES])
+    return probe_header(header, complete=True)
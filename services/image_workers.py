@@ -0,0 +1,223 @@
+"""图片预处理进程池
+
+12MP 照片的解码、旋正、裁剪、缩放、重新编码和摘要计算是 CPU 密集的，在请求线程里执行时
+会长时间持有 GIL，同一 worker 中其他请求（包括纯文本请求）的延迟随之抖动。
+这里把 preprocess_image 放到有界的 ProcessPoolExecutor 中执行，请求线程只等待 future：
+
+- 输入输出通过共享内存传递，不经过 pickle：请求线程为每张图片创建一块与原图等大的共享内存并写入原图，
+  worker 处理后把结果（总是不大于原图；更大时改为返回字节）写回同一块内存，由请求线程读取并释放
+- worker 常驻并在启动时预先加载 Pillow 编解码器 / NumPy（`python app.py` 启动服务时由 warm_preprocess_pool 提前拉起，
+  其他情况在第一张图片到达时创建）
+- 等待时间受请求 deadline 限制；进程池异常时退回在当前线程处理
+
+环境变量：
+- IMAGE_PREPROCESS_WORKERS: 进程数（可选，默认 auto = min(CPU 核数, 4)；0 表示在请求线程中处理）
+"""
+
+import concurrent.futures
+import io
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from services.deadline import check_deadline, request_timeout
+from services.image_preprocess import preprocess_image
+from services.result_store import compute_digest
+
+logger = logging.getLogger(__name__)
+
+MAX_AUTO_WORKERS = 4
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+# 进程池创建 / 异常重建次数，以及交给进程池 / 退回当前线程处理的图片数
+_stats = {"pools_created": 0, "pool_resets": 0, "pool_images": 0, "inline_fallbacks": 0}
+
+
+def get_preprocess_workers() -> int:
+    raw = os.environ.get("IMAGE_PREPROCESS_WORKERS", "auto").lower()
+    if raw == "auto":
+        return min(os.cpu_count() or 1, MAX_AUTO_WORKERS)
+    try:
+        return max(int(raw), 0)
+    except ValueError:
+        return 0
+
+
+def _mp_context():
+    # 父进程有多个请求线程，fork 不安全；Linux 上用 forkserver（预加载本模块），其他平台用 spawn
+    if sys.platform.startswith("linux"):
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload([__name__])
+        return context
+    return multiprocessing.get_context("spawn")
+
+
+def _warm_worker() -> None:
+    """worker 初始化：加载编解码器并跑一次小图，避免第一张图片承担导入 / 初始化开销"""
+    from PIL import Image
+
+    out = io.BytesIO()
+    Image.new("RGB", (64, 64), (255, 255, 255)).save(out, "JPEG")
+    preprocess_image(out.getvalue())
+
+
+def _ping() -> int:
+    return os.getpid()
+
+
+def _in_child_process() -> bool:
+    """当前进程是否为 multiprocessing 子进程
+
+    worker 启动时会以 __mp_main__ 重新导入主模块（如 app.py），此时 parent_process() 尚未设置，
+    但 current_process()._inheriting 为 True；在这期间创建进程池会报 bootstrapping 错误。
+    """
+    return multiprocessing.parent_process() is not None or getattr(multiprocessing.current_process(), "_inheriting", False)
+
+
+def get_preprocess_pool() -> Optional[ProcessPoolExecutor]:
+    """进程池单例（IMAGE_PREPROCESS_WORKERS=0 或当前进程本身是 worker 时返回 None）"""
+    global _pool
+    workers = get_preprocess_workers()
+    if workers <= 0 or _in_child_process():
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=workers, mp_context=_mp_context(), initializer=_warm_worker
+            )
+            _stats["pools_created"] += 1
+            logger.info(f"✅ 图片预处理进程池已创建（{workers} 个进程）")
+        return _pool
+
+
+def warm_preprocess_pool() -> None:
+    """提前拉起全部 worker（不等待完成）"""
+    pool = get_preprocess_pool()
+    if pool is None:
+        return
+    for _ in range(get_preprocess_workers()):
+        pool.submit(_ping)
+
+
+def _reset_pool(pool: ProcessPoolExecutor) -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+            _stats["pool_resets"] += 1
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def shutdown_preprocess_pool() -> None:
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def get_preprocess_pool_stats() -> Dict[str, Any]:
+    with _pool_lock:
+        return {"workers": get_preprocess_workers(), "running": _pool is not None, **_stats}
+
+
+# ==================== worker 端 ====================
+
+def _preprocess_task(shm_name: str, size: int, settings: Dict[str, Any]) -> Tuple[str, Any, Dict[str, Any], str]:
+    """在 worker 中处理共享内存里的一张图片
+
+    Returns:
+        ("unchanged", None, info, digest)：保留原图
+        ("shm", 结果长度, info, digest)：结果已写回共享内存
+        ("bytes", 结果字节, info, digest)：结果比原图大，放不进共享内存
+    """
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        data = bytes(shm.buf[:size])
+        processed, info = preprocess_image(data, settings)
+        digest = compute_digest(processed)
+        if processed is data:
+            return "unchanged", None, info, digest
+        if len(processed) > size:
+            return "bytes", processed, info, digest
+        shm.buf[:len(processed)] = processed
+        return "shm", len(processed), info, digest
+    finally:
+        shm.close()
+
+
+# ==================== 请求线程端 ====================
+
+def _preprocess_inline(images: Sequence[bytes], settings: Dict[str, Any]) -> List[Tuple[bytes, Dict[str, Any], str]]:
+    results = []
+    for image_data in images:
+        processed, info = preprocess_image(image_data, settings)
+        results.append((processed, info, compute_digest(processed)))
+    return results
+
+
+def preprocess_many(images: Sequence[bytes], settings: Dict[str, Any]) -> List[Tuple[bytes, Dict[str, Any], str]]:
+    """预处理一道题的全部图片（进程池中并行），保持顺序
+
+    Returns:
+        [(处理后的图片字节, 处理信息, 处理后图片的摘要), ...]
+
+    Raises:
+        DeadlineExceeded / RequestCancelled: 等待期间请求超时或被取消
+    """
+    pool = get_preprocess_pool()
+    if pool is None or not images:
+        return _preprocess_inline(images, settings)
+
+    segments: List[shared_memory.SharedMemory] = []
+    futures = []
+    try:
+        for image_data in images:
+            shm = shared_memory.SharedMemory(create=True, size=max(len(image_data), 1))
+            segments.append(shm)
+            shm.buf[:len(image_data)] = image_data
+            futures.append(pool.submit(_preprocess_task, shm.name, len(image_data), settings))
+
+        results = []
+        for image_data, shm, future in zip(images, segments, futures):
+            try:
+                kind, payload, info, digest = future.result(timeout=request_timeout(stage="图片预处理"))
+            except concurrent.futures.TimeoutError:
+                check_deadline("图片预处理")
+                raise
+            if kind == "unchanged":
+                processed = image_data
+            elif kind == "shm":
+                processed = bytes(shm.buf[:payload])
+            else:
+                processed = payload
+            if info.get("applied"):
+                logger.info(
+                    f"🖼️  图片预处理（进程池）: {info['original_size'][0]}x{info['original_size'][1]}"
+                    f" -> {info['size'][0]}x{info['size'][1]}, {len(image_data)} -> {len(processed)} 字节,"
+                    f" {info['elapsed_ms']}ms"
+                )
+            results.append((processed, info, digest))
+        _stats["pool_images"] += len(results)
+        return results
+
+    except BrokenProcessPool as e:
+        logger.error(f"❌ 图片预处理进程池异常，改为在当前线程处理: {e}")
+        _reset_pool(pool)
+        _stats["inline_fallbacks"] += len(images)
+        return _preprocess_inline(images, settings)
+
+    finally:
+        for future in futures:
+            future.cancel()
+        for shm in segments:
+            shm.close()
+            shm.unlink()
@@ -0,0 +1,347 @@
+"""上传图片的单次遍历接收（ingest）
+
+werkzeug 解析 multipart 请求体时按块写入文件流。IngestRequest 把默认的临时文件替换为 IngestStream，
+在数据到达的同一次遍历中完成：
+- SHA-256 摘要（作为缓存 key，后续不必再把图片读一遍）
+- 按需 base64 编码，写入按请求长度预先分配的缓冲区
+
+两种模式（见 get_ingest_mode）：
+- raw: 原图字节写入 SpooledTemporaryFile（与 werkzeug 默认行为相同），
+  供图片预处理 / Files API / Mathpix 使用
+- base64: 只保留 base64 结果，不保留原图字节。发送给 Claude 的就是原图 base64 时使用，
+  相比「读出字节 -> base64 bytes -> str」每张图片少持有一份原图和一份临时 base64
+
+收到文件头后立即探测真实格式和像素尺寸（见 services/image_probe.py），
+不符合要求的图片丢弃后续数据，finish() 时抛出 ImageRejected。
+"""
+
+import binascii
+import hashlib
+import io
+import logging
+import os
+from tempfile import SpooledTemporaryFile
+from typing import BinaryIO, Optional, Union
+
+from flask import Request, current_app, has_app_context
+
+from services.file_cache import is_files_api_enabled
+from services.image_preprocess import is_preprocess_enabled
+from services.image_probe import (
+    DEFAULT_MAX_DIMENSION,
+    DEFAULT_MAX_PIXELS,
+    EXTENSION_FORMATS,
+    PROBE_MAX_BYTES,
+    ImageRejected,
+    allowed_formats_for_extensions,
+    probe_header,
+    validate_probe,
+)
+
+logger = logging.getLogger(__name__)
+
+# 超过该大小的原图写入临时文件（与 werkzeug 默认一致）
+SPOOL_MAX_MEMORY = 500 * 1024
+
+# 非 IngestStream 的文件流按块读取的大小（3 的倍数，base64 编码不需要跨块拼接）
+READ_CHUNK_SIZE = 64 * 1024 * 3
+
+# 识别图片格式所需的文件头长度
+HEAD_SIZE = 32
+
+INGEST_MODES = ("raw", "base64")
+
+
+def get_ingest_mode() -> str:
+    """上传图片的接收模式
+
+    UPLOAD_INGEST_MODE 为 auto（默认）时：图片预处理、Files API 都关闭，
+    且 PIPELINE_MODE=claude（不会走 Mathpix）时使用 base64，否则使用 raw。
+    """
+    mode = os.environ.get("UPLOAD_INGEST_MODE", "auto").lower()
+    if mode in INGEST_MODES:
+        return mode
+    pipeline_mode = os.environ.get("PIPELINE_MODE", "claude").lower()
+    if not is_preprocess_enabled() and not is_files_api_enabled() and pipeline_mode == "claude":
+        return "base64"
+    return "raw"
+
+
+def get_upload_limits() -> dict:
+    """上传图片的格式白名单和尺寸上限（来自 app 配置，不在 app 上下文中时使用默认值）"""
+    config = current_app.config if has_app_context() else {}
+    return {
+        "allowed_formats": allowed_formats_for_extensions(config.get("ALLOWED_EXTENSIONS", EXTENSION_FORMATS)),
+        "max_pixels": config.get("MAX_IMAGE_PIXELS", DEFAULT_MAX_PIXELS),
+        "max_dimension": config.get("MAX_IMAGE_DIMENSION", DEFAULT_MAX_DIMENSION),
+    }
+
+
+def base64_length(size: int) -> int:
+    """size 字节编码后的 base64 长度（含 padding）"""
+    return (size + 2) // 3 * 4
+
+
+class IngestedImage:
+    """已接收的上传图片：摘要、文件头、探测结果，以及原图字节或 base64 结果（至少其一）"""
+
+    __slots__ = ("filename", "size", "digest", "head", "info", "_raw", "_base64")
+
+    def __init__(
+        self,
+        filename: Optional[str],
+        size: int,
+        digest: str,
+        head: bytes,
+        raw: Optional[bytes] = None,
+        encoded: Optional[Union[bytearray, str]] = None,
+        info: Optional[dict] = None,
+    ):
+        self.filename = filename
+        self.size = size
+        self.digest = digest
+        self.head = head
+        # image_probe 的结果：{"format", "mime_type", "width", "height"}（未探测时为 None）
+        self.info = info
+        self._raw = raw
+        self._base64 = encoded
+
+    @property
+    def data(self) -> bytes:
+        """原图字节（base64 模式下每次按需解码，不缓存）"""
+        if self._raw is not None:
+            return self._raw
+        return binascii.a2b_base64(self._base64)
+
+    @property
+    def has_raw(self) -> bool:
+        return self._raw is not None
+
+    def base64_text(self) -> str:
+        """base64 字符串（第一次调用时由缓冲区转换并缓存，缓冲区随即释放）"""
+        if isinstance(self._base64, str):
+            return self._base64
+        if self._base64 is None:
+            text = binascii.b2a_base64(self._raw, newline=False).decode("ascii")
+        else:
+            text = self._base64.decode("ascii")
+        self._base64 = text
+        return text
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __repr__(self) -> str:
+        mode = "raw" if self.has_raw else "base64"
+        return f"IngestedImage({self.filename!r}, {self.size} 字节, {mode}, sha256={self.digest[:12]})"
+
+
+class IngestStream(io.RawIOBase):
+    """可写入的上传文件流：写入时同步计算摘要，并写入临时文件或 base64 缓冲区
+
+    werkzeug 写完后会 seek(0)，FileStorage.read() 等读取接口仍然可用（base64 模式下读取时才解码），
+    但接收图片应使用 finish() 直接取得 IngestedImage。
+    """
+
+    def __init__(
+        self,
+        mode: str = "raw",
+        size_hint: Optional[int] = None,
+        limits: Optional[dict] = None,
+        spool: Optional[BinaryIO] = None,
+    ):
+        """
+        Args:
+            mode: raw / base64
+            size_hint: 文件本身的长度（已知时按它预分配 base64 缓冲区；未知时缓冲区随写入增长）
+            limits: validate_probe 的参数；为 None 时不探测
+            spool: raw 模式下写入原图的文件（默认为 SpooledTemporaryFile；
+                分块上传会话传入 UPLOAD_FOLDER 下的文件，见 services/upload_sessions.py）
+        """
+        super().__init__()
+        if mode not in INGEST_MODES:
+            raise ValueError(f"未知的接收模式: {mode}")
+        self.mode = mode
+        self._hash = hashlib.sha256()
+        self._size = 0
+        self._head = b""
+        if mode == "raw" and spool is None:
+            spool = SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY, mode="w+b")
+        self._spool = spool if mode == "raw" else None
+        # 按文件长度预分配（multipart 分段通常没有 Content-Length，此时不预分配），结束时截断
+        self._encoded = bytearray(base64_length(size_hint)) if mode == "base64" and size_hint else bytearray()
+        self._encoded_len = 0
+        self._carry = b""
+        self._reader: Optional[io.BytesIO] = None
+        self._result: Optional[IngestedImage] = None
+        self._limits = limits
+        self._probe_buffer: Optional[bytearray] = bytearray() if limits is not None else None
+        self._probe_info: Optional[dict] = None
+        self.error: Optional[ImageRejected] = None
+
+    # ---------- 写入 ----------
+
+    @property
+    def received(self) -> int:
+        """已接收的字节数（被拒绝后不再增加）"""
+        return self._size
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, chunk) -> int:
+        if self._result is not None:
+            raise ValueError("上传流已结束，不能继续写入")
+        view = memoryview(chunk)
+        size = view.nbytes
+        if self._probe_buffer is not None:
+            self._feed_probe(view)
+        if self.error is not None:
+            # 已拒绝：丢弃后续数据（werkzeug 仍会读完请求体）
+            return size
+        if len(self._head) < HEAD_SIZE:
+            self._head += bytes(view[:HEAD_SIZE - len(self._head)])
+        self._hash.update(view)
+        self._size += size
+        if self._spool is not None:
+            self._spool.write(view)
+        else:
+            self._encode(view)
+        return size
+
+    def _feed_probe(self, view: memoryview, complete: bool = False) -> None:
+        """累积文件头直到能确定格式和尺寸，然后按 limits 检查"""
+        buffer = self._probe_buffer
+        if len(buffer) < PROBE_MAX_BYTES:
+            buffer += view[:PROBE_MAX_BYTES - len(buffer)]
+        try:
+            info = probe_header(bytes(buffer), complete=complete or len(buffer) >= PROBE_MAX_BYTES)
+            if info is None:
+                return
+            self._probe_info = validate_probe(info, **self._limits)
+        except ImageRejected as e:
+            self._reject(e)
+        self._probe_buffer = None
+
+    def _reject(self, error: ImageRejected) -> None:
+        logger.warning(f"⚠️  拒绝上传图片（{error.code}）: {error.message}")
+        self.error = error
+        if self._spool is not None:
+            self._spool.close()
+            self._spool = None
+        self._encoded = bytearray()
+        self._carry = b""
+
+    def _encode(self, view: memoryview) -> None:
+        if self._carry:
+            view = memoryview(self._carry + bytes(view))
+        usable = len(view) // 3 * 3
+        if usable:
+            self._append(binascii.b2a_base64(view[:usable], newline=False))
+        self._carry = bytes(view[usable:])
+
+    def _append(self, encoded: bytes) -> None:
+        end = self._encoded_len + len(encoded)
+        # 超出预分配长度时切片赋值会自动扩展
+        self._encoded[self._encoded_len:end] = encoded
+        self._encoded_len = end
+
+    def finish(self, filename: Optional[str] = None) -> IngestedImage:
+        """结束写入，返回 IngestedImage（可重复调用）
+
+        Raises:
+            ImageRejected: 图片在探测阶段被拒绝
+        """
+        if self._result is not None:
+            return self._result
+        if self._probe_buffer is not None:
+            self._feed_probe(memoryview(b""), complete=True)
+        if self.error is not None:
+            raise self.error
+
+        if self._spool is not None:
+            self._spool.seek(0)
+            raw = self._spool.read()
+            self._spool.close()
+            self._spool = None
+            self._result = IngestedImage(
+                filename, self._size, self._hash.hexdigest(), self._head, raw=raw, info=self._probe_info
+            )
+        else:
+            if self._carry:
+                self._append(binascii.b2a_base64(self._carry, newline=False))
+                self._carry = b""
+            del self._encoded[self._encoded_len:]
+            self._result = IngestedImage(
+                filename, self._size, self._hash.hexdigest(), self._head,
+                encoded=self._encoded, info=self._probe_info,
+            )
+            self._encoded = bytearray()
+        return self._result
+
+    # ---------- 读取（兼容 FileStorage）----------
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def _reader_stream(self) -> io.BytesIO:
+        if self._reader is None:
+            self._reader = io.BytesIO(self.finish().data)
+        return self._reader
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        # 写完后的 seek(0) 不应触发解码
+        if self._reader is None and offset == 0 and whence == io.SEEK_SET:
+            return 0
+        return self._reader_stream().seek(offset, whence)
+
+    def tell(self) -> int:
+        return self._reader.tell() if self._reader is not None else 0
+
+    def readinto(self, buffer) -> int:
+        return self._reader_stream().readinto(buffer)
+
+    def close(self) -> None:
+        if self._spool is not None:
+            self._spool.close()
+            self._spool = None
+        self._reader = None
+        super().close()
+
+
+class IngestRequest(Request):
+    """上传文件直接写入 IngestStream 的 Flask Request"""
+
+    def _get_file_stream(
+        self,
+        total_content_length: Optional[int],
+        content_type: Optional[str],
+        filename: Optional[str] = None,
+        content_length: Optional[int] = None,
+    ):
+        # 只用分段自己的 Content-Length：请求体总长度包含所有文件，按它给每个文件预分配会成倍浪费内存
+        return IngestStream(get_ingest_mode(), content_length, get_upload_limits())
+
+
+def ingest_upload(file_storage) -> IngestedImage:
+    """取得上传文件的 IngestedImage
+
+    文件流已经是 IngestStream（app 使用 IngestRequest）时直接结束写入；
+    否则按块读取一遍文件流，同样一次遍历完成探测、摘要和编码。
+
+    Raises:
+        ImageRejected: 格式不对、尺寸过大或疑似解压炸弹
+    """
+    stream = file_storage.stream
+    if isinstance(stream, IngestStream):
+        return stream.finish(file_storage.filename)
+
+    ingest = IngestStream(get_ingest_mode(), file_storage.content_length or None, get_upload_limits())
+    for chunk in iter(lambda: stream.read(READ_CHUNK_SIZE), b""):
+        ingest.write(chunk)
+        if ingest.error is not None:
+            break
+    return ingest.finish(file_storage.filename)
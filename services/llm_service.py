@@ -14,12 +14,22 @@ from __future__ import annotations
 import json
 import logging
 import math
-import re
+import os
+import threading
+import time
 from typing import Any, Dict, Optional
 
-from anthropic import Anthropic
 from flask import current_app
 
+from services.claude_pipeline import create_claude_client, get_slim_settings
+from services.deadline import DeadlineExceeded, check_deadline, timeout_kwargs
+from services.motion_classifier import get_classifier_path, load_motion_classifier, predict_motion_type
+from services.prompt_registry import prompt_registry, record_prompt_result, select_prompt
+from services.rule_engine import CONFIDENCE_PENALTIES, fallback_motion_rules, fallback_parameter_rules
+from services.shadow_eval import shadow_evaluator
+from services.trajectory import CANVAS_HEIGHT, CANVAS_WIDTH, MAX_SCALE, MIN_SCALE, build_trajectory
+from services.usage_tracker import get_budget_tier, record_usage
+
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -77,6 +87,25 @@ CLAUDE_USER_PROMPT_TEMPLATE = """请解析以下物理题目文本，提取运
 
 现在请开始解析，只返回 JSON："""
 
+# 精简版 prompt（A/B 测试用）
+CLAUDE_SYSTEM_PROMPT_COMPACT = """物理运动学题解析。只输出纯 JSON，不要 Markdown 代码块和解释。"""
+
+CLAUDE_USER_PROMPT_TEMPLATE_COMPACT = """题目：
+{ocr_text}
+
+输出 JSON：{{"motion_type":类型,"parameters":{{"initial_speed":m/s,"angle":度,"initial_height":m,"gravity":默认9.8}},"solution_steps":[步骤...]}}
+未给出的参数为 null。
+motion_type: horizontal_projectile(平抛,angle=0) / free_fall(自由落体,v0=0,angle=90) / vertical_throw(竖直上抛,angle=90) / projectile(斜抛) / uniform(匀速直线)"""
+
+prompt_registry.register(
+    "text", "v1",
+    system=CLAUDE_SYSTEM_PROMPT, user_template=CLAUDE_USER_PROMPT_TEMPLATE,
+)
+prompt_registry.register(
+    "text", "v2-compact",
+    system=CLAUDE_SYSTEM_PROMPT_COMPACT, user_template=CLAUDE_USER_PROMPT_TEMPLATE_COMPACT,
+)
+
 
 def _clean_json_response(text: str) -> str:
     """清理 Claude 返回的文本，移除 Markdown 代码块标记"""
@@ -128,22 +157,39 @@ def _call_claude_api(ocr_text: str) -> Optional[Dict[str, Any]]:
         logger.info("未配置 CLAUDE_API_KEY，跳过 LLM 调用")
         return None
 
+    # 根据 token 预算档位决定是否调用 / 使用精简模型
+    tier = get_budget_tier()
+    if tier == "rule_engine":
+        logger.warning("⚠️  token 预算已耗尽，跳过 LLM 调用，使用规则引擎")
+        return None
+
+    model = cfg.get("CLAUDE_MODEL", "claude-3-5-sonnet-20241022")
+    max_tokens = cfg.get("CLAUDE_MAX_TOKENS", 2048)
+    if tier == "slim":
+        model, max_tokens = get_slim_settings()
+        logger.info(f"⚠️  token 预算紧张，使用精简配置（model: {model}）")
+
     try:
-        client = Anthropic(api_key=api_key)
+        client = create_claude_client(api_key)
 
-        # 构建用户提示词
-        user_prompt = CLAUDE_USER_PROMPT_TEMPLATE.format(ocr_text=ocr_text)
+        # 按题目文本确定性选择 prompt 变体，构建用户提示词
+        prompt_version, prompts = select_prompt("text", ocr_text)
+        system_prompt = prompts["system"]
+        user_prompt = prompts["user_template"].format(ocr_text=ocr_text)
 
         # 调用 Claude API
-        logger.info(f"调用 Claude API: model={cfg.get('CLAUDE_MODEL')}")
+        logger.info(f"调用 Claude API: model={model}, prompt={prompt_version}")
+        started = time.perf_counter()
         response = client.messages.create(
-            model=cfg.get("CLAUDE_MODEL", "claude-3-5-sonnet-20241022"),
-            max_tokens=cfg.get("CLAUDE_MAX_TOKENS", 2048),
-            system=CLAUDE_SYSTEM_PROMPT,
+            model=model,
+            max_tokens=max_tokens,
+            system=system_prompt,
             messages=[
                 {"role": "user", "content": user_prompt}
-            ]
+            ],
+            **timeout_kwargs(stage="文本 Claude 调用"),
         )
+        latency_ms = (time.perf_counter() - started) * 1000
 
         # 提取文本内容
         raw_text = response.content[0].text
@@ -152,6 +198,10 @@ def _call_claude_api(ocr_text: str) -> Optional[Dict[str, Any]]:
         # 清理并解析 JSON
         cleaned_text = _clean_json_response(raw_text)
         parsed = _validate_and_fix_json(cleaned_text)
+        input_tokens, output_tokens = record_usage(
+            "text", model, response, parsed.get("motion_type") if parsed else "invalid"
+        )
+        record_prompt_result("text", prompt_version, input_tokens, output_tokens, latency_ms, parsed is not None)
 
         if parsed:
             logger.info(f"Claude 成功解析，运动类型: {parsed.get('motion_type')}")
@@ -160,17 +210,19 @@ def _call_claude_api(ocr_text: str) -> Optional[Dict[str, Any]]:
         # 第一次失败，尝试重试（添加更强的提示）
         logger.warning("首次解析失败，尝试重试...")
         retry_response = client.messages.create(
-            model=cfg.get("CLAUDE_MODEL", "claude-3-5-sonnet-20241022"),
-            max_tokens=cfg.get("CLAUDE_MAX_TOKENS", 2048),
-            system=CLAUDE_SYSTEM_PROMPT + "\n\n**再次强调：只返回纯 JSON 对象，不要有任何其他内容！**",
+            model=model,
+            max_tokens=max_tokens,
+            system=system_prompt + "\n\n**再次强调：只返回纯 JSON 对象，不要有任何其他内容！**",
             messages=[
                 {"role": "user", "content": user_prompt + "\n\n只返回 JSON，不要解释："}
-            ]
+            ],
+            **timeout_kwargs(stage="文本 Claude 重试"),
         )
 
         retry_text = retry_response.content[0].text
         retry_cleaned = _clean_json_response(retry_text)
         retry_parsed = _validate_and_fix_json(retry_cleaned)
+        record_usage("text_retry", model, retry_response, retry_parsed.get("motion_type") if retry_parsed else "invalid")
 
         if retry_parsed:
             logger.info("重试成功")
@@ -179,114 +231,115 @@ def _call_claude_api(ocr_text: str) -> Optional[Dict[str, Any]]:
         logger.error("重试仍然失败，返回 None")
         return None
 
+    except DeadlineExceeded:
+        # 超时 / 客户端断开时不再降级到规则引擎，直接结束请求
+        raise
     except Exception as e:
+        check_deadline("文本 Claude 调用")
         logger.error(f"Claude API 调用失败: {e}")
         return None
 
 
 # ==================== 规则引擎降级方案 ====================
 
-def _match_number(patterns, text: str) -> Optional[float]:
-    """使用正则表达式匹配数字"""
-    for pattern in patterns:
-        m = re.search(pattern, text, re.IGNORECASE)
-        if m:
-            try:
-                return float(m.group(1))
-            except ValueError:
-                continue
-    return None
-
-
 def _extract_parameters_fallback(ocr_text: str) -> Dict[str, Any]:
-    """规则引擎：使用正则抓取参数"""
-    speed = _match_number([
-        r"初速度\s*[:：=]?\s*([0-9]+(?:\.[0-9]+)?)",
-        r"v0\s*[:：=]?\s*([0-9]+(?:\.[0-9]+)?)",
-        r"速度\s*[:：=]?\s*([0-9]+(?:\.[0-9]+)?)\s*(?:m/s|米/秒|米每秒)?",
-        r"以\s*([0-9]+(?:\.[0-9]+)?)\s*m/s",
-        r"([0-9]+(?:\.[0-9]+)?)\s*m/s\s*的.*速度",
-    ], ocr_text)
-
-    angle = _match_number([
-        r"角度\s*[:：=]?\s*([0-9]+(?:\.[0-9]+)?)",
-        r"([0-9]+(?:\.[0-9]+)?)\s*[°度]\s*角",
-        r"以\s*([0-9]+(?:\.[0-9]+)?)\s*[°度]",
-    ], ocr_text)
-
-    height = _match_number([
-        r"高度\s*(?:为|是|[:：])\s*([0-9]+(?:\.[0-9]+)?)",
-        r"从\s*([0-9]+(?:\.[0-9]+)?)\s*[米m]",
-        r"高\s*([0-9]+(?:\.[0-9]+)?)\s*[米m]",
-        r"([0-9]+(?:\.[0-9]+)?)\s*米高",
-        r"([0-9]+(?:\.[0-9]+)?)\s*m高",
-    ], ocr_text)
-
-    gravity = _match_number([
-        r"g\s*[:：=]?\s*([0-9]+(?:\.[0-9]+)?)",
-        r"重力加速度\s*(?:为|是|[:：])\s*([0-9]+(?:\.[0-9]+)?)",
-    ], ocr_text) or 9.8
-
-    return {
-        "initial_speed": speed,
-        "angle": angle,
-        "initial_height": height,
-        "gravity": gravity,
-    }
+    """规则引擎：使用正则抓取参数（正则表见 services/rule_engine.py）"""
+    params = fallback_parameter_rules.extract(ocr_text)
+    params["gravity"] = params["gravity"] or 9.8
+    return params
 
 
 def _detect_motion_type_fallback(ocr_text: str) -> str:
-    """规则引擎：运动类型判别
+    """规则引擎：运动类型判别（关键词规则见 services/rule_engine.py）
 
     优先级：具体类型 > 一般类型
     """
-    # 检查匀速直线运动（优先，避免误判）
-    if "匀速" in ocr_text or "匀速直线" in ocr_text:
-        return "uniform"
-
-    # 检查自由落体（优先，很明确）
-    if any(keyword in ocr_text for keyword in ["自由落体", "自由下落"]):
-        return "free_fall"
-
-    # 检查平抛运动（优先，很明确）
-    if any(keyword in ocr_text for keyword in ["平抛", "水平抛", "水平抛射"]):
-        return "horizontal_projectile"
-
-    # 检查竖直上抛（需要更具体的关键词，避免误判斜抛）
-    # 只有明确说"竖直"才判定为竖直上抛
-    if "竖直上抛" in ocr_text or "竖直抛" in ocr_text:
-        return "vertical_throw"
-
-    # 检查角度信息：如果有角度且不是0或90，则为一般抛体
-    angle_match = re.search(r"([0-9]+(?:\.[0-9]+)?)\s*[°度]", ocr_text)
-    if angle_match:
-        angle = float(angle_match.group(1))
-        if 0 < angle < 90 and angle != 0:
-            return "projectile"
-        elif angle == 90:
-            return "vertical_throw"
-        elif angle == 0:
-            return "horizontal_projectile"
-
-    # 检查是否有"斜"、"角"等关键词，表明是斜抛
-    if any(keyword in ocr_text for keyword in ["斜抛", "斜向", "角度"]):
-        return "projectile"
-
-    # 最后才检查一般的"抛"
-    if "抛" in ocr_text or "弹道" in ocr_text or "抛体" in ocr_text:
-        return "projectile"
-
-    # 英文关键词
-    lowered = ocr_text.lower()
-    if "parabola" in lowered or "projectile" in lowered:
-        return "projectile"
-
-    # 如果检查到"下落"但不是自由落体，可能是有初速度的抛体
-    if "下落" in ocr_text or "坠落" in ocr_text:
-        return "projectile"
-
-    # 默认返回一般抛体运动
-    return "projectile"
+    return fallback_motion_rules.classify(ocr_text)
+
+
+def get_fast_path_threshold(motion_type: Optional[str] = None) -> Optional[float]:
+    """规则引擎置信度达到该值时不调用 Claude（RULE_ENGINE_FAST_PATH_THRESHOLD，默认 0 即关闭，校准后再开启）
+
+    给出 motion_type 且影子评估（services/shadow_eval.py）中该类型样本足够时，改用由一致率推导的阈值
+    （不低于配置值；None 表示该类型不走快速路径）。
+    """
+    try:
+        threshold = float(os.environ.get("RULE_ENGINE_FAST_PATH_THRESHOLD", "0"))
+    except ValueError:
+        threshold = 0.0
+    if threshold <= 0:
+        return None
+    if motion_type is None:
+        return threshold
+    return shadow_evaluator.fast_path_threshold(motion_type, threshold)
+
+
+# 本地分类器以不低于该概率判为其他类型时，降低规则引擎的置信度
+CLASSIFIER_MIN_PROBABILITY = 0.5
+
+
+def _rule_engine_confidence(ocr_text: str, motion_type: str, params: Dict[str, Any]) -> tuple:
+    """规则引擎结果的置信度和扣分原因（加载了本地分类器时参考分类器的判断）"""
+    confidence, reasons = fallback_motion_rules.confidence(ocr_text, motion_type, params)
+    prediction = predict_motion_type(ocr_text)
+    if prediction is not None:
+        label, probability = prediction
+        if label != motion_type and probability >= CLASSIFIER_MIN_PROBABILITY:
+            confidence = round(confidence * CONFIDENCE_PENALTIES["classifier_disagrees"], 4)
+            reasons.append(f"classifier_disagrees:{label}")
+    return confidence, reasons
+
+
+# 文本解析的去向
+TEXT_OUTCOMES = ("fast_path", "claude", "fallback", "rule_engine")
+
+
+class TextOutcomeStats:
+    """统计文本解析的去向：fast_path（规则引擎置信度达到阈值，跳过 Claude）/ claude /
+    fallback（Claude 调用失败，降级到规则引擎）/ rule_engine（未启用 LLM）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, float]] = {}
+
+    def record(self, motion_type: str, outcome: str, confidence: float) -> None:
+        with self._lock:
+            stats = self._stats.setdefault(motion_type, {"requests": 0, "confidence": 0.0, **{o: 0 for o in TEXT_OUTCOMES}})
+            stats["requests"] += 1
+            stats["confidence"] += confidence
+            stats[outcome] += 1
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            snapshot = {motion_type: dict(stats) for motion_type, stats in self._stats.items()}
+        return {
+            motion_type: {
+                **{k: v for k, v in stats.items() if k != "confidence"},
+                "avg_confidence": round(stats["confidence"] / stats["requests"], 4),
+                "fast_path_rate": round(stats["fast_path"] / stats["requests"], 4),
+            }
+            for motion_type, stats in sorted(snapshot.items())
+        }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
+
+
+# 进程级单例
+text_outcome_stats = TextOutcomeStats()
+
+
+def get_fast_path_stats() -> Dict[str, Any]:
+    classifier = load_motion_classifier()
+    summary = text_outcome_stats.summary()
+    for motion_type, stats in summary.items():
+        stats["threshold"] = get_fast_path_threshold(motion_type)
+    return {
+        "threshold": get_fast_path_threshold(),
+        "classifier": {"path": get_classifier_path(), "labels": classifier.labels} if classifier else None,
+        "motion_types": summary,
+    }
 
 
 def _compute_duration(motion_type: str, v0: float, angle_deg: float, g: float, h0: float) -> float:
@@ -376,12 +429,12 @@ def _build_animation_instructions(motion_type: str, params: Dict[str, Any]) -> D
     max_height = h0 + (v0 * math.sin(math.radians(angle))) ** 2 / (2 * g) if v0 > 0 else h0
 
     # scale 使得最大范围在画面内
-    scale_x = 700 / max(max_range, 1)
-    scale_y = 500 / max(max_height, 1)
-    scale = min(scale_x, scale_y, 30)  # 不超过30，确保可见
-    scale = max(scale, 10)  # 不小于10，确保不太小
+    scale_x = CANVAS_WIDTH / max(max_range, 1)
+    scale_y = CANVAS_HEIGHT / max(max_height, 1)
+    scale = min(scale_x, scale_y, MAX_SCALE)  # 不超过上限，确保可见
+    scale = max(scale, MIN_SCALE)  # 不小于下限，确保不太小
 
-    return {
+    instructions = {
         "type": "uniform" if motion_type == "uniform" else "projectile",
         "initial_speed": v0,
         "angle": angle,
@@ -394,6 +447,13 @@ def _build_animation_instructions(motion_type: str, params: Dict[str, Any]) -> D
         "motion_type_original": motion_type,
     }
 
+    # 抛体附带预计算的轨迹采样点（与 claude_pipeline.generate_animation_instructions 相同）
+    trajectory = build_trajectory(instructions)
+    if trajectory is not None:
+        instructions["trajectory"] = trajectory
+
+    return instructions
+
 
 def _build_solution_steps(motion_type: str, params: Dict[str, Any], ocr_preview: str) -> list:
     """生成解题步骤"""
@@ -430,7 +490,14 @@ def _build_solution_steps(motion_type: str, params: Dict[str, Any], ocr_preview:
 
 def analyze_physics_text(ocr_text: str) -> dict:
     """
-    主入口：解析物理题文本，返回结构化结果
+    主入口：解析物理题文本，返回结构化结果（格式见 analyze_physics_text_with_outcome）
+    """
+    return analyze_physics_text_with_outcome(ocr_text)[0]
+
+
+def analyze_physics_text_with_outcome(ocr_text: str) -> tuple[dict, str]:
+    """
+    解析物理题文本，同时返回结果的来源
 
     返回格式：
     {
@@ -439,6 +506,9 @@ def analyze_physics_text(ocr_text: str) -> dict:
         "solution_steps": list,
         "animation_instructions": dict
     }
+
+    来源（同 TEXT_OUTCOMES）：fast_path / claude / fallback（Claude 调用失败，降级到规则引擎）/
+    rule_engine（未启用 LLM）
     """
     if not ocr_text or not ocr_text.strip():
         logger.warning("OCR文本为空，使用默认示例")
@@ -446,10 +516,29 @@ def analyze_physics_text(ocr_text: str) -> dict:
 
     preview = ocr_text[:100] + ("..." if len(ocr_text) > 100 else "")
 
-    # 1. 优先尝试 Claude API
+    # 1. 规则引擎（和本地分类器）先解析（微秒级）；置信度达到阈值时直接使用，不调用 Claude
+    motion_type = _detect_motion_type_fallback(ocr_text)
+    params = _extract_parameters_fallback(ocr_text)
+    confidence, reasons = _rule_engine_confidence(ocr_text, motion_type, params)
+
     claude_result = None
-    if current_app.config.get("ENABLE_LLM"):
-        claude_result = _call_claude_api(ocr_text)
+    if not current_app.config.get("ENABLE_LLM"):
+        outcome = "rule_engine"
+    else:
+        threshold = get_fast_path_threshold(motion_type)
+        if threshold is not None and confidence >= threshold and not shadow_evaluator.should_explore():
+            outcome = "fast_path"
+            logger.info(f"✅ 规则引擎置信度 {confidence} ≥ {threshold}，跳过 Claude（motion_type={motion_type}）")
+        else:
+            if threshold is not None and confidence >= threshold:
+                logger.info(f"规则引擎置信度 {confidence} ≥ {threshold}，抽样交给 Claude 复核（影子评估）")
+            elif threshold is not None:
+                logger.info(f"规则引擎置信度 {confidence} < {threshold}（{', '.join(reasons)}），调用 Claude")
+            claude_result = _call_claude_api(ocr_text)
+            outcome = "claude" if claude_result else "fallback"
+            if claude_result:
+                shadow_evaluator.submit("text", claude_result, problem_text=ocr_text)
+    text_outcome_stats.record(motion_type, outcome, confidence)
 
     if claude_result:
         # 使用 Claude 解析结果
@@ -475,11 +564,9 @@ def analyze_physics_text(ocr_text: str) -> dict:
         logger.info(f"使用 Claude 解析结果: motion_type={motion_type}")
 
     else:
-        # 2. 降级使用规则引擎
-        logger.info("使用规则引擎降级方案")
-        motion_type = _detect_motion_type_fallback(ocr_text)
-        params = _extract_parameters_fallback(ocr_text)
-
+        # 2. 使用规则引擎结果（高置信度 / 降级）
+        if outcome != "fast_path":
+            logger.info("使用规则引擎降级方案")
         animation_instructions = _build_animation_instructions(motion_type, params)
         solution_steps = _build_solution_steps(motion_type, params, preview)
 
@@ -493,4 +580,4 @@ def analyze_physics_text(ocr_text: str) -> dict:
         },
         "solution_steps": solution_steps,
         "animation_instructions": animation_instructions,
-    }
\ No newline at end of file
+    }, outcome
\ No newline at end of file
@@ -0,0 +1,177 @@
+"""从已存储的 Claude 结果学习的运动类型分类器（字符 n-gram 哈希 + 多分类逻辑回归）
+
+每条 Claude 结果都是一条 "题目文本 -> problem_type" 的标注样本。scripts/train_motion_classifier.py
+离线读取结果存储训练，保存为 .npz；服务启动时按 MOTION_CLASSIFIER_PATH 加载，
+在调用 LLM 之前给出运动类型和概率（与规则引擎结果矛盾时不走快速路径）。
+
+特征：文本转小写后的 1~3 字符 n-gram，用码点的多项式哈希映射到 2^bits 个桶，
+每次出现计 1 / sqrt(n-gram 总数)。哈希在 NumPy 中向量化计算（不依赖 Python 的随机化 hash），
+推理只是一次按桶取权重求和 + softmax，与文本长度基本无关。
+
+配置：
+- MOTION_CLASSIFIER_PATH: 模型文件路径（可选，默认不启用）
+"""
+
+import logging
+import os
+import threading
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BITS = 14
+DEFAULT_NGRAM_RANGE = (1, 3)
+
+_PRIME = np.uint64(1000003)
+_MIX = np.uint64(0x9E3779B97F4A7C15)
+
+
+def get_classifier_path() -> Optional[str]:
+    path = os.environ.get("MOTION_CLASSIFIER_PATH", "").strip()
+    return path or None
+
+
+def hash_ngrams(text: str, bits: int = DEFAULT_BITS, ngram_range: Tuple[int, int] = DEFAULT_NGRAM_RANGE) -> np.ndarray:
+    """文本中每个字符 n-gram 所在的桶（按出现次数重复）"""
+    codes = np.frombuffer(text.lower().encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    low, high = ngram_range
+    grams, rolling = [], codes
+    for n in range(1, high + 1):
+        if n > 1:
+            # rolling[i] 为 codes[i:i+n] 的多项式哈希
+            rolling = rolling[:-1] * _PRIME + codes[n - 1:]
+        if n >= low:
+            grams.append(rolling)
+    # 乘法哈希取高 bits 位
+    return ((np.concatenate(grams) * _MIX) >> np.uint64(64 - bits)).view(np.intp)
+
+
+class MotionClassifier:
+    """哈希 n-gram 特征上的多分类逻辑回归"""
+
+    def __init__(self, weights: np.ndarray, bias: np.ndarray, labels: Sequence[str],
+                 bits: int = DEFAULT_BITS, ngram_range: Tuple[int, int] = DEFAULT_NGRAM_RANGE):
+        if weights.shape != (1 << bits, len(labels)) or bias.shape != (len(labels),):
+            raise ValueError(f"模型形状不匹配: weights {weights.shape}, bias {bias.shape}, {len(labels)} 个类型")
+        self.weights = np.ascontiguousarray(weights, dtype=np.float32)
+        self.bias = np.asarray(bias, dtype=np.float32)
+        self.labels = [str(label) for label in labels]
+        self.bits = bits
+        self.ngram_range = tuple(ngram_range)
+
+    def predict_proba(self, text: str) -> np.ndarray:
+        buckets = hash_ngrams(text, self.bits, self.ngram_range)
+        logits = self.bias
+        if len(buckets):
+            logits = logits + np.take(self.weights, buckets, axis=0).sum(axis=0) / np.sqrt(len(buckets))
+        logits = np.exp(logits - logits.max())
+        return logits / logits.sum()
+
+    def predict(self, text: str) -> Tuple[str, float]:
+        """(最可能的运动类型, 概率)"""
+        proba = self.predict_proba(text)
+        best = int(proba.argmax())
+        return self.labels[best], float(proba[best])
+
+    @classmethod
+    def train(cls, texts: Sequence[str], labels: Sequence[str], bits: int = DEFAULT_BITS,
+              ngram_range: Tuple[int, int] = DEFAULT_NGRAM_RANGE, epochs: int = 200,
+              learning_rate: float = 0.1, l2: float = 1e-4) -> "MotionClassifier":
+        """全批量 Adam 训练（稀疏特征按行拼接，不构造稠密矩阵）"""
+        classes = sorted(set(labels))
+        index = {label: i for i, label in enumerate(classes)}
+        y = np.array([index[label] for label in labels])
+        rows = [hash_ngrams(text, bits, ngram_range) for text in texts]
+        lengths = np.array([len(r) for r in rows])
+        cols = np.concatenate(rows)
+        values = np.repeat(1 / np.sqrt(np.maximum(lengths, 1)), lengths)
+        row_of = np.repeat(np.arange(len(rows)), lengths)
+        nonempty = lengths > 0
+        starts = (np.cumsum(lengths) - lengths)[nonempty]
+
+        size, k = 1 << bits, len(classes)
+        weights = np.zeros((size, k))
+        bias = np.zeros(k)
+        target = np.eye(k)[y]
+        moments = [np.zeros_like(weights), np.zeros_like(weights), np.zeros_like(bias), np.zeros_like(bias)]
+        beta1, beta2, eps = 0.9, 0.999, 1e-8
+
+        for step in range(1, epochs + 1):
+            logits = np.tile(bias, (len(rows), 1))
+            if len(cols):
+                logits[nonempty] += np.add.reduceat(weights[cols] * values[:, None], starts, axis=0)
+            logits -= logits.max(axis=1, keepdims=True)
+            proba = np.exp(logits)
+            proba /= proba.sum(axis=1, keepdims=True)
+            delta = (proba - target) / len(rows)
+
+            grad_w = np.stack([
+                np.bincount(cols, weights=values * delta[row_of, j], minlength=size) for j in range(k)
+            ], axis=1) + l2 * weights
+            grad_b = delta.sum(axis=0)
+            for param, grad, m, v in ((weights, grad_w, moments[0], moments[1]), (bias, grad_b, moments[2], moments[3])):
+                m *= beta1
+                m += (1 - beta1) * grad
+                v *= beta2
+                v += (1 - beta2) * grad * grad
+                param -= learning_rate * (m / (1 - beta1 ** step)) / (np.sqrt(v / (1 - beta2 ** step)) + eps)
+
+        return cls(weights, bias, classes, bits, ngram_range)
+
+    def save(self, path: str) -> None:
+        """权重以 float16 压缩保存"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "wb") as f:
+            np.savez_compressed(
+                f,
+                weights=self.weights.astype(np.float16),
+                bias=self.bias,
+                labels=np.array(self.labels),
+                config=np.array([self.bits, *self.ngram_range]),
+            )
+
+    @classmethod
+    def load(cls, path: str) -> "MotionClassifier":
+        with np.load(path, allow_pickle=False) as data:
+            bits, low, high = (int(v) for v in data["config"])
+            return cls(data["weights"], data["bias"], list(data["labels"]), bits, (low, high))
+
+
+_lock = threading.Lock()
+_classifier: Optional[MotionClassifier] = None
+_loaded_path: Optional[str] = None
+
+
+def load_motion_classifier() -> Optional[MotionClassifier]:
+    """按 MOTION_CLASSIFIER_PATH 加载模型（启动时调用；路径未变时不重复加载）"""
+    global _classifier, _loaded_path
+    path = get_classifier_path()
+    with _lock:
+        if path == _loaded_path:
+            return _classifier
+        _loaded_path = path
+        _classifier = None
+        if not path:
+            return None
+        if not os.path.exists(path):
+            logger.warning(f"⚠️  运动类型分类器不存在: {path}")
+            return None
+        try:
+            _classifier = MotionClassifier.load(path)
+        except Exception as e:
+            logger.error(f"❌ 运动类型分类器加载失败: {e}")
+            return None
+        logger.info(f"✅ 已加载运动类型分类器: {path}（{len(_classifier.labels)} 个类型）")
+        return _classifier
+
+
+def predict_motion_type(text: str) -> Optional[Tuple[str, float]]:
+    """(运动类型, 概率)；未配置模型时返回 None"""
+    classifier = load_motion_classifier()
+    if classifier is None:
+        return None
+    return classifier.predict(text)
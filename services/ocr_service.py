@@ -1,7 +1,7 @@
 """
 OCR 服务模块 - Mathpix API 版本
 
-提供统一接口：extract_text(image_path: str, manual_text: Optional[str] = None) -> str
+提供统一接口：extract_text(image_path: Union[str, bytes], manual_text: Optional[str] = None) -> str
 
 支持的 provider（通过环境变量 OCR_MODE 控制）：
 - mathpix: 使用 Mathpix API（默认）
@@ -16,15 +16,20 @@ import os
 import base64
 import hashlib
 import logging
-from typing import Optional
+from typing import Optional, Union
 
 import requests
 
+from services.deadline import Deadline, DeadlineExceeded, check_deadline, deadline_scope, request_timeout
+
 logger = logging.getLogger(__name__)
 
 # Mathpix API 配置
 MATHPIX_API_URL = "https://api.mathpix.com/v3/text"
 
+# 单次 Mathpix 请求的超时上限（秒），请求有截止时间时取剩余时间和上限中较小者
+MATHPIX_TIMEOUT = 30
+
 
 def get_ocr_mode() -> str:
     """
@@ -64,27 +69,32 @@ def _get_mathpix_credentials() -> tuple[str, str]:
     return app_id, app_key
 
 
-def _encode_image_to_base64(image_path: str) -> str:
+def _encode_image_to_base64(image_source: Union[str, bytes]) -> str:
     """
     将图片编码为 base64（data URI 格式）
 
     Args:
-        image_path: 图片文件路径
+        image_source: 图片文件路径或图片字节
 
     Returns:
         data URI 格式的 base64 字符串
     """
     try:
-        with open(image_path, "rb") as f:
-            image_data = f.read()
-
-        # 检测图片格式
-        if image_path.lower().endswith(".png"):
-            mime_type = "image/png"
-        elif image_path.lower().endswith((".jpg", ".jpeg")):
-            mime_type = "image/jpeg"
+        if isinstance(image_source, bytes):
+            image_data = image_source
+            # 根据文件头判断格式
+            mime_type = "image/png" if image_data[:8] == b"\x89PNG\r\n\x1a\n" else "image/jpeg"
         else:
-            mime_type = "image/jpeg"  # 默认
+            with open(image_source, "rb") as f:
+                image_data = f.read()
+
+            # 检测图片格式
+            if image_source.lower().endswith(".png"):
+                mime_type = "image/png"
+            elif image_source.lower().endswith((".jpg", ".jpeg")):
+                mime_type = "image/jpeg"
+            else:
+                mime_type = "image/jpeg"  # 默认
 
         base64_data = base64.b64encode(image_data).decode("utf-8")
         data_uri = f"data:{mime_type};base64,{base64_data}"
@@ -97,12 +107,12 @@ def _encode_image_to_base64(image_path: str) -> str:
         raise
 
 
-def _mathpix_ocr_extract(image_path: str) -> str:
+def _mathpix_ocr_extract(image_path: Union[str, bytes]) -> str:
     """
     使用 Mathpix API 提取文本
 
     Args:
-        image_path: 图片文件路径
+        image_path: 图片文件路径或图片字节
 
     Returns:
         提取的文本（优先返回 Markdown，其次 LaTeX，最后纯文本）
@@ -113,7 +123,8 @@ def _mathpix_ocr_extract(image_path: str) -> str:
     app_id, app_key = _get_mathpix_credentials()
 
     # 1. 编码图片为 base64
-    logger.info(f"开始 Mathpix OCR 识别: {image_path}")
+    source_desc = f"{len(image_path)} 字节" if isinstance(image_path, bytes) else image_path
+    logger.info(f"开始 Mathpix OCR 识别: {source_desc}")
     image_data_uri = _encode_image_to_base64(image_path)
 
     # 2. 构建请求
@@ -129,14 +140,15 @@ def _mathpix_ocr_extract(image_path: str) -> str:
         "ocr": ["math", "text"]  # 同时识别数学公式和文本
     }
 
-    # 3. 调用 Mathpix API
+    # 3. 调用 Mathpix API（超时不超过请求剩余时间）
+    timeout = request_timeout(MATHPIX_TIMEOUT, stage="Mathpix OCR")
     try:
-        logger.info("正在调用 Mathpix API...")
+        logger.info(f"正在调用 Mathpix API（超时 {timeout:.1f}s）...")
         response = requests.post(
             MATHPIX_API_URL,
             json=payload,
             headers=headers,
-            timeout=30  # 30 秒超时
+            timeout=timeout
         )
 
         # 检查 HTTP 状态码
@@ -155,11 +167,15 @@ def _mathpix_ocr_extract(image_path: str) -> str:
         logger.info(f"✅ Mathpix API 调用成功")
 
     except requests.exceptions.Timeout:
-        logger.error("❌ Mathpix API 请求超时（30秒）")
+        # 截止时间耗尽导致的超时直接报告给调用方
+        check_deadline("Mathpix OCR")
+        logger.error(f"❌ Mathpix API 请求超时（{timeout:.1f}秒）")
         raise RuntimeError("Mathpix API 请求超时，请稍后重试")
     except requests.exceptions.RequestException as e:
         logger.error(f"❌ Mathpix API 请求失败: {e}")
         raise RuntimeError(f"Mathpix API 请求失败: {e}")
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         logger.error(f"❌ 未知错误: {e}")
         raise RuntimeError(f"Mathpix OCR 失败: {e}")
@@ -193,7 +209,7 @@ def _mathpix_ocr_extract(image_path: str) -> str:
     return extracted_text
 
 
-def _generate_deterministic_text(image_path: str, manual_text: Optional[str] = None) -> str:
+def _generate_deterministic_text(image_path: Union[str, bytes], manual_text: Optional[str] = None) -> str:
     """
     生成确定性的测试文本（manual 模式）
 
@@ -203,7 +219,7 @@ def _generate_deterministic_text(image_path: str, manual_text: Optional[str] = N
     3. 输出包含物理题特征（便于下游解析）
 
     Args:
-        image_path: 图片路径
+        image_path: 图片路径或图片字节
         manual_text: 手动输入文本（优先使用）
 
     Returns:
@@ -214,9 +230,12 @@ def _generate_deterministic_text(image_path: str, manual_text: Optional[str] = N
         logger.info(f"✅ [Manual Mode] 使用手动输入的文本（{len(manual_text)} 字符）")
         return manual_text.strip()
 
-    # 2. 根据图片路径生成 hash 值（确保不同图片产生不同文本）
-    hash_input = f"{image_path}_{os.path.getmtime(image_path)}"
-    hash_value = hashlib.md5(hash_input.encode()).hexdigest()
+    # 2. 根据图片路径（或图片内容）生成 hash 值（确保不同图片产生不同文本）
+    if isinstance(image_path, bytes):
+        hash_value = hashlib.md5(image_path).hexdigest()
+    else:
+        hash_input = f"{image_path}_{os.path.getmtime(image_path)}"
+        hash_value = hashlib.md5(hash_input.encode()).hexdigest()
 
     # 3. 使用 hash 生成确定性参数
     # 取 hash 的不同位置作为参数种子
@@ -272,13 +291,18 @@ def _generate_deterministic_text(image_path: str, manual_text: Optional[str] = N
     return text
 
 
-def extract_text(image_path: str, manual_text: Optional[str] = None) -> str:
+def extract_text(
+    image_path: Union[str, bytes],
+    manual_text: Optional[str] = None,
+    deadline: Optional[Deadline] = None,
+) -> str:
     """
     统一 OCR 接口：从图片中提取文本
 
     Args:
-        image_path: 图片文件路径
+        image_path: 图片文件路径或图片字节（上传后未落盘的图片）
         manual_text: 手动输入的文本（manual 模式专用）
+        deadline: 请求截止时间（可选，默认沿用当前线程的 deadline）
 
     Returns:
         提取的文本字符串
@@ -291,14 +315,21 @@ def extract_text(image_path: str, manual_text: Optional[str] = None) -> str:
     Raises:
         RuntimeError: OCR 初始化或识别失败
         FileNotFoundError: 图片文件不存在（mathpix 模式）
+        DeadlineExceeded: 超过截止时间或客户端已断开
     """
+    with deadline_scope(deadline):
+        return _extract_text(image_path, manual_text)
+
+
+def _extract_text(image_path: Union[str, bytes], manual_text: Optional[str]) -> str:
+    """extract_text 的实现（在 deadline scope 内执行）"""
     mode = get_ocr_mode()
 
     logger.info(f"OCR 模式: {mode}")
 
     if mode == "mathpix":
         # Mathpix 模式：调用 Mathpix API
-        if not os.path.exists(image_path):
+        if not isinstance(image_path, bytes) and not os.path.exists(image_path):
             raise FileNotFoundError(f"图片文件不存在: {image_path}")
 
         return _mathpix_ocr_extract(image_path)
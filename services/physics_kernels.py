@@ -0,0 +1,104 @@
+"""动画持续时间 / 缩放比例的 NumPy 批量计算
+
+claude_pipeline.estimate_duration / estimate_scale、llm_service._compute_duration 和
+_build_animation_instructions 中的 scale 计算都是逐题调用的标量函数。这里给出对应的向量化版本：
+输入等长数组 (运动类型, v0, angle, g, h0)，一次返回整批结果，各运动类型的分支用掩码选择，
+结果与标量函数一致（scripts/bench_physics_kernels.py 逐行校验并测速）。
+批量分析、参数扫描、批量导入等一次处理成千上万道题的场景使用
+（batch_service 收集 Message Batch 结果时按批次一次补齐缺失的 duration / scale）。
+
+缺失值（None）按 NaN 传入，与标量函数一样使用默认值（v0=10、angle=45、h0=0）。
+"""
+
+from typing import Sequence, Tuple, Union
+
+import numpy as np
+
+from services.trajectory import CANVAS_HEIGHT, CANVAS_WIDTH, MAX_SCALE, MIN_SCALE
+
+ArrayLike = Union[Sequence, np.ndarray]
+
+DEFAULT_GRAVITY = 9.8
+
+
+def _as_float(values: ArrayLike) -> np.ndarray:
+    """转为 float64 数组（None 变为 NaN）"""
+    return np.asarray(values, dtype=np.float64)
+
+
+def _fill(values: np.ndarray, default: float) -> np.ndarray:
+    return np.where(np.isnan(values), default, values)
+
+
+def _fix_gravity(g: np.ndarray) -> np.ndarray:
+    """g <= 0（或缺失）时使用 9.8"""
+    return np.where(g > 0, g, DEFAULT_GRAVITY)
+
+
+def _projectile_duration(vy0: np.ndarray, g: np.ndarray, h0: np.ndarray) -> np.ndarray:
+    """求解 y(t) = h0 + vy0*t - 0.5*g*t^2 = 0 的正根；判别式为负时 2 秒，至少 0.5 秒"""
+    discriminant = vy0 * vy0 + 2 * g * h0
+    with np.errstate(invalid="ignore"):
+        t = (vy0 + np.sqrt(discriminant)) / g
+    return np.where(discriminant < 0, 2.0, np.maximum(t, 0.5))
+
+
+def _scale(v0: np.ndarray, angle_rad: np.ndarray, sin_angle: np.ndarray, g: np.ndarray, h0: np.ndarray) -> np.ndarray:
+    """最大射程和最高点都落在画面内的 scale（限制在 10~30）"""
+    moving = v0 > 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        max_range = np.where(moving, v0 * v0 * np.abs(np.sin(2 * angle_rad)) / g, 10)
+        max_height = np.where(moving, h0 + (v0 * sin_angle) ** 2 / (2 * g), h0)
+    scale = np.minimum(np.minimum(CANVAS_WIDTH / np.maximum(max_range, 1), CANVAS_HEIGHT / np.maximum(max_height, 1)),
+                       MAX_SCALE)
+    return np.maximum(scale, MIN_SCALE)
+
+
+def estimate_animation_extent(motion_types: ArrayLike, v0: ArrayLike, angle: ArrayLike, g: ArrayLike,
+                              h0: ArrayLike) -> Tuple[np.ndarray, np.ndarray]:
+    """批量版 claude_pipeline.estimate_duration + estimate_scale，返回 (持续时间, 缩放比例)"""
+    types = np.asarray(motion_types)
+    g = _fix_gravity(_as_float(g))
+    v0 = _fill(_as_float(v0), 10.0)
+    h0 = _fill(_as_float(h0), 0.0)
+    angle_rad = np.radians(_fill(_as_float(angle), 45.0))
+    sin_angle = np.sin(angle_rad)
+    uniform = types == "uniform"
+
+    # 自由落体：t = sqrt(2h/g)，没有高度时 2 秒
+    with np.errstate(invalid="ignore"):
+        free_fall = np.where(h0 > 0, np.sqrt(2 * h0 / g), 2.0)
+    durations = np.where(uniform, 5.0, np.where(types == "free_fall", free_fall,
+                                                  _projectile_duration(v0 * sin_angle, g, h0)))
+    scales = np.where(uniform, 20.0, _scale(v0, angle_rad, sin_angle, g, h0))
+    return durations, scales
+
+
+def estimate_durations(motion_types: ArrayLike, v0: ArrayLike, angle: ArrayLike, g: ArrayLike,
+                       h0: ArrayLike) -> np.ndarray:
+    """批量版 claude_pipeline.estimate_duration"""
+    return estimate_animation_extent(motion_types, v0, angle, g, h0)[0]
+
+
+def estimate_scales(motion_types: ArrayLike, v0: ArrayLike, angle: ArrayLike, g: ArrayLike,
+                    h0: ArrayLike) -> np.ndarray:
+    """批量版 claude_pipeline.estimate_scale"""
+    return estimate_animation_extent(motion_types, v0, angle, g, h0)[1]
+
+
+def fallback_animation_extent(motion_types: ArrayLike, v0: ArrayLike, angle: ArrayLike, g: ArrayLike,
+                              h0: ArrayLike) -> Tuple[np.ndarray, np.ndarray]:
+    """批量版 llm_service._compute_duration + _build_animation_instructions 中的 scale 计算
+
+    与 claude_pipeline 的版本不同：自由落体也按抛体公式计算，scale 不区分匀速运动，
+    也不修正 g（调用方已用 `or 9.8` 处理缺失值）。
+    """
+    types = np.asarray(motion_types)
+    g = _as_float(g)
+    v0 = _as_float(v0)
+    h0 = _as_float(h0)
+    angle_rad = np.radians(_as_float(angle))
+    sin_angle = np.sin(angle_rad)
+
+    durations = np.where(types == "uniform", 5.0, _projectile_duration(v0 * sin_angle, _fix_gravity(g), h0))
+    return durations, _scale(v0, angle_rad, sin_angle, g, h0)
@@ -0,0 +1,152 @@
+"""Pipeline 路由器：按观测到的延迟 / 成本 / 成功率为每个请求选择处理路径
+
+可选路径：
+- multimodal: Claude 多模态一体化（call_claude_pipeline）
+- two_stage: Mathpix OCR -> 纯文本 Claude（llm_service.analyze_physics_text）
+- rule_engine: Mathpix OCR -> 规则引擎（不消耗 Claude tokens）
+
+每条路径维护指数滑动平均（EWMA）的延迟、token 数和成功率，
+得分 = 延迟权重 × 秒 + token 权重 × 千 tokens + 固定成本 + 失败惩罚 × 失败率，
+选得分最低的可用路径；样本不足的路径优先探索，避免冷启动时一直不被选中。
+
+环境变量：
+- ROUTER_LATENCY_WEIGHT: 每秒延迟的得分（可选，默认 1.0）
+- ROUTER_TOKEN_WEIGHT: 每千 tokens 的得分（可选，默认 0.5）
+- ROUTER_OCR_COST: 每次 Mathpix 调用的固定得分（可选，默认 0.5）
+- ROUTER_FAILURE_PENALTY: 失败率的得分（可选，默认 20）
+- ROUTER_RULE_ENGINE_PENALTY: 规则引擎准确率较低的固定惩罚（可选，默认 5）
+- ROUTER_MIN_SAMPLES: 每条路径至少探索的请求数（可选，默认 3）
+"""
+
+import logging
+import os
+import threading
+from typing import Any, Dict, Iterable, List
+
+logger = logging.getLogger(__name__)
+
+ROUTER_PATHS = ("multimodal", "two_stage", "rule_engine")
+
+# EWMA 平滑系数
+_EWMA_ALPHA = 0.2
+
+
+def _get_float_env(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, str(default)))
+    except ValueError:
+        return default
+
+
+def get_router_weights() -> Dict[str, float]:
+    return {
+        "latency": _get_float_env("ROUTER_LATENCY_WEIGHT", 1.0),
+        "tokens": _get_float_env("ROUTER_TOKEN_WEIGHT", 0.5),
+        "ocr_cost": _get_float_env("ROUTER_OCR_COST", 0.5),
+        "failure": _get_float_env("ROUTER_FAILURE_PENALTY", 20.0),
+        "rule_engine": _get_float_env("ROUTER_RULE_ENGINE_PENALTY", 5.0),
+    }
+
+
+def get_min_samples() -> int:
+    try:
+        return int(os.environ.get("ROUTER_MIN_SAMPLES", "3"))
+    except ValueError:
+        return 3
+
+
+class PipelineRouter:
+    """线程安全的路径统计与选择"""
+
+    def __init__(self, paths: Iterable[str] = ROUTER_PATHS):
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, float]] = {
+            path: {
+                "requests": 0,
+                "failures": 0,
+                "latency_s": 0.0,
+                "tokens": 0.0,
+                "success_rate": 1.0,
+            }
+            for path in paths
+        }
+
+    def record(self, path: str, latency_s: float, tokens: int, success: bool) -> None:
+        """记录一次路径执行结果"""
+        with self._lock:
+            stats = self._stats[path]
+            if stats["requests"] == 0:
+                stats["latency_s"] = latency_s
+                stats["tokens"] = float(tokens)
+                stats["success_rate"] = 1.0 if success else 0.0
+            else:
+                stats["latency_s"] += _EWMA_ALPHA * (latency_s - stats["latency_s"])
+                stats["tokens"] += _EWMA_ALPHA * (tokens - stats["tokens"])
+                stats["success_rate"] += _EWMA_ALPHA * ((1.0 if success else 0.0) - stats["success_rate"])
+            stats["requests"] += 1
+            if not success:
+                stats["failures"] += 1
+
+    def _score(self, path: str, stats: Dict[str, float], weights: Dict[str, float]) -> float:
+        score = (
+            weights["latency"] * stats["latency_s"]
+            + weights["tokens"] * stats["tokens"] / 1000
+            + weights["failure"] * (1.0 - stats["success_rate"])
+        )
+        if path in ("two_stage", "rule_engine"):
+            score += weights["ocr_cost"]
+        if path == "rule_engine":
+            score += weights["rule_engine"]
+        return score
+
+    def choose(self, candidates: List[str]) -> str:
+        """在可用路径中选择得分最低的一条（样本不足的路径优先探索）
+
+        Raises:
+            RuntimeError: 没有可用路径
+        """
+        if not candidates:
+            raise RuntimeError("没有可用的 Pipeline 路径（请配置 CLAUDE_API_KEY 或 Mathpix 凭证）")
+
+        weights = get_router_weights()
+        min_samples = get_min_samples()
+
+        with self._lock:
+            snapshot = {path: dict(self._stats[path]) for path in candidates}
+
+        # 冷启动：样本最少且不足 min_samples 的路径优先
+        unexplored = [p for p in candidates if snapshot[p]["requests"] < min_samples]
+        if unexplored:
+            chosen = min(unexplored, key=lambda p: snapshot[p]["requests"])
+            logger.info(f"🧭 路由探索: {chosen}（样本 {int(snapshot[chosen]['requests'])}）")
+            return chosen
+
+        scores = {p: self._score(p, snapshot[p], weights) for p in candidates}
+        chosen = min(candidates, key=lambda p: scores[p])
+        logger.info(f"🧭 路由选择: {chosen}（得分 {', '.join(f'{p}={s:.2f}' for p, s in scores.items())}）")
+        return chosen
+
+    def summary(self) -> Dict[str, Any]:
+        weights = get_router_weights()
+        with self._lock:
+            snapshot = {path: dict(stats) for path, stats in self._stats.items()}
+        return {
+            path: {
+                "requests": int(stats["requests"]),
+                "failures": int(stats["failures"]),
+                "avg_latency_s": round(stats["latency_s"], 3),
+                "avg_tokens": round(stats["tokens"], 1),
+                "success_rate": round(stats["success_rate"], 4),
+                "score": round(self._score(path, stats, weights), 3) if stats["requests"] else None,
+            }
+            for path, stats in snapshot.items()
+        }
+
+
+# 进程级单例
+pipeline_router = PipelineRouter()
+
+
+def get_router_stats() -> Dict[str, Any]:
+    return pipeline_router.summary()
+
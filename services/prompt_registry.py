@@ -0,0 +1,180 @@
+"""Prompt 版本注册表与 A/B 分流统计
+
+每个 prompt 家族（multimodal / text 等）可以注册多个带版本号的变体，
+请求按 request key（图片摘要或题目文本）的 hash 做确定性分流：
+同一张图片 / 同一段文本始终命中同一个变体，便于缓存和复现。
+
+每个变体记录：请求数、input/output tokens、延迟、校验失败率，
+用数据决定能否上线更短的 prompt。
+
+环境变量：
+- PROMPT_SPLIT_<FAMILY>: 分流权重，例如 PROMPT_SPLIT_MULTIMODAL="v1:80,v2-compact:20"
+  （可选，默认全部流量走 v1）
+"""
+
+import hashlib
+import logging
+import os
+import threading
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_VERSION = "v1"
+
+# 分流精度（万分之一）
+_SPLIT_BUCKETS = 10000
+
+
+class PromptRegistry:
+    """线程安全的 prompt 注册表"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._variants: Dict[str, Dict[str, Dict[str, str]]] = {}
+        self._stats: Dict[tuple, Dict[str, float]] = {}
+
+    def register(self, family: str, version: str, **prompts: str) -> None:
+        """注册一个 prompt 变体
+
+        Args:
+            family: prompt 家族名（如 multimodal / text）
+            version: 版本号（如 v1 / v2-compact）
+            **prompts: 变体包含的各段 prompt（如 system=..., user=...）
+        """
+        with self._lock:
+            self._variants.setdefault(family, {})[version] = dict(prompts)
+
+    def get(self, family: str, version: str = DEFAULT_VERSION) -> Dict[str, str]:
+        """获取指定变体；不存在时抛出 KeyError"""
+        with self._lock:
+            return dict(self._variants[family][version])
+
+    def versions(self, family: str) -> list:
+        with self._lock:
+            return list(self._variants.get(family, {}))
+
+    def get_split(self, family: str) -> Dict[str, float]:
+        """读取分流权重（忽略未注册的版本），未配置时全部走 DEFAULT_VERSION"""
+        raw = os.environ.get(f"PROMPT_SPLIT_{family.upper()}", "").strip()
+        known = self.versions(family)
+        weights: Dict[str, float] = {}
+
+        for part in raw.split(","):
+            if ":" not in part:
+                continue
+            version, weight = part.split(":", 1)
+            version = version.strip()
+            if version not in known:
+                logger.warning(f"PROMPT_SPLIT_{family.upper()} 中的版本 {version!r} 未注册，已忽略")
+                continue
+            try:
+                weights[version] = max(float(weight), 0.0)
+            except ValueError:
+                logger.warning(f"PROMPT_SPLIT_{family.upper()} 权重非法: {part!r}")
+
+        if not weights or sum(weights.values()) <= 0:
+            return {DEFAULT_VERSION: 1.0}
+        return weights
+
+    def select(self, family: str, request_key: str) -> tuple[str, Dict[str, str]]:
+        """按 request key 的 hash 确定性选择变体
+
+        Returns:
+            (version, prompts)
+        """
+        weights = self.get_split(family)
+        total = sum(weights.values())
+
+        digest = hashlib.sha256(request_key.encode("utf-8")).digest()
+        bucket = int.from_bytes(digest[:8], "big") % _SPLIT_BUCKETS
+        point = bucket / _SPLIT_BUCKETS * total
+
+        chosen = None
+        cumulative = 0.0
+        for version, weight in sorted(weights.items()):
+            cumulative += weight
+            if point < cumulative:
+                chosen = version
+                break
+        if chosen is None:
+            chosen = sorted(weights)[-1]
+
+        return chosen, self.get(family, chosen)
+
+    def record(
+        self,
+        family: str,
+        version: str,
+        input_tokens: int,
+        output_tokens: int,
+        latency_ms: float,
+        valid: bool,
+    ) -> None:
+        """记录一次调用的结果"""
+        with self._lock:
+            stats = self._stats.setdefault((family, version), {
+                "requests": 0,
+                "input_tokens": 0,
+                "output_tokens": 0,
+                "latency_ms": 0.0,
+                "validation_failures": 0,
+            })
+            stats["requests"] += 1
+            stats["input_tokens"] += input_tokens
+            stats["output_tokens"] += output_tokens
+            stats["latency_ms"] += latency_ms
+            if not valid:
+                stats["validation_failures"] += 1
+
+    def summary(self) -> Dict[str, Any]:
+        """各变体的平均 tokens / 延迟 / 校验失败率"""
+        with self._lock:
+            families = {family: list(variants) for family, variants in self._variants.items()}
+            stats = {key: dict(value) for key, value in self._stats.items()}
+
+        result: Dict[str, Any] = {}
+        for family, versions in families.items():
+            split = self.get_split(family)
+            entries = {}
+            for version in versions:
+                s = stats.get((family, version))
+                n = s["requests"] if s else 0
+                entries[version] = {
+                    "weight": split.get(version, 0.0),
+                    "requests": n,
+                    "avg_input_tokens": round(s["input_tokens"] / n, 1) if n else None,
+                    "avg_output_tokens": round(s["output_tokens"] / n, 1) if n else None,
+                    "avg_latency_ms": round(s["latency_ms"] / n, 1) if n else None,
+                    "validation_failure_rate": round(s["validation_failures"] / n, 4) if n else None,
+                }
+            result[family] = entries
+        return result
+
+
+# 进程级单例
+prompt_registry = PromptRegistry()
+
+
+def select_prompt(family: str, request_key: str) -> tuple[str, Dict[str, str]]:
+    """便捷函数：选择 prompt 变体"""
+    return prompt_registry.select(family, request_key)
+
+
+def record_prompt_result(
+    family: str,
+    version: str,
+    input_tokens: int,
+    output_tokens: int,
+    latency_ms: float,
+    valid: bool,
+) -> None:
+    """便捷函数：记录变体表现"""
+    prompt_registry.record(family, version, input_tokens, output_tokens, latency_ms, valid)
+
+
+def get_prompt_stats(family: Optional[str] = None) -> Dict[str, Any]:
+    summary = prompt_registry.summary()
+    if family is not None:
+        return {family: summary.get(family, {})}
+    return summary
@@ -0,0 +1,163 @@
+"""Pipeline 结果缓存 / 结果存储
+
+以「图片摘要 + prompt 版本 + 模型」为 key 缓存规范化后的结果，
+同一张图片重复上传时直接返回，不再消耗 Claude tokens。
+prompt 版本进入 key，切换 / A/B 测试新 prompt 时不会命中旧结果。
+
+配置 RESULT_STORE_PATH 后，每条结果还会追加写入 JSONL 文件：
+进程重启后可以恢复缓存，批量任务的结果也落在这里，供离线分析使用。
+
+环境变量：
+- RESULT_CACHE_SIZE: 内存中最多缓存的结果条数（可选，默认 256，0 表示关闭缓存）
+- RESULT_STORE_PATH: 结果持久化 JSONL 文件路径（可选，默认不持久化）
+"""
+
+import copy
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def get_cache_size() -> int:
+    try:
+        return int(os.environ.get("RESULT_CACHE_SIZE", "256"))
+    except ValueError:
+        return 256
+
+
+def get_store_path() -> Optional[str]:
+    path = os.environ.get("RESULT_STORE_PATH", "").strip()
+    return path or None
+
+
+def compute_digest(data: bytes) -> str:
+    """计算内容的 SHA-256 摘要（十六进制）"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def make_cache_key(digest: str, prompt_version: str, model: str) -> str:
+    """构造结果缓存 key：图片摘要 + prompt 版本 + 模型"""
+    return f"{digest}:{prompt_version}:{model}"
+
+
+class ResultStore:
+    """线程安全的 LRU 结果缓存（可选 JSONL 持久化）"""
+
+    def __init__(self, capacity: Optional[int] = None, path: Optional[str] = None):
+        self._lock = threading.Lock()
+        self._items: "OrderedDict[str, dict]" = OrderedDict()
+        self._capacity = capacity
+        self._path = path
+        self._loaded_path: Optional[str] = None
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def capacity(self) -> int:
+        return self._capacity if self._capacity is not None else get_cache_size()
+
+    @property
+    def path(self) -> Optional[str]:
+        return self._path if self._path is not None else get_store_path()
+
+    def _ensure_loaded(self) -> None:
+        """首次访问时从 JSONL 文件恢复最近的结果（调用方持有锁）"""
+        path = self.path
+        if not path or self._loaded_path == path:
+            return
+        self._loaded_path = path
+        if not os.path.exists(path):
+            return
+
+        capacity = self.capacity
+        for record in self._read_records(path):
+            self._items[record["key"]] = record["result"]
+            self._items.move_to_end(record["key"])
+            while len(self._items) > capacity:
+                self._items.popitem(last=False)
+        logger.info(f"✅ 已从 {path} 恢复 {len(self._items)} 条结果")
+
+    @staticmethod
+    def _read_records(path: str) -> Iterator[dict]:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning("⚠️  跳过损坏的结果记录")
+                    continue
+                if "key" in record and "result" in record:
+                    yield record
+
+    def iter_records(self) -> Iterator[dict]:
+        """遍历持久化的全部结果记录（{"key", "ts", "result", ...}）"""
+        path = self.path
+        if not path or not os.path.exists(path):
+            return iter(())
+        return self._read_records(path)
+
+    def get(self, key: str) -> Optional[dict]:
+        """命中时返回结果副本，未命中返回 None"""
+        with self._lock:
+            self._ensure_loaded()
+            result = self._items.get(key)
+            if result is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+        logger.info(f"✅ 结果缓存命中: {key[:16]}...")
+        return copy.deepcopy(result)
+
+    def put(self, key: str, result: dict, **meta) -> None:
+        """写入结果；meta（如 source / digest）只写入持久化记录"""
+        capacity = self.capacity
+        path = self.path
+        if capacity <= 0 and not path:
+            return
+        with self._lock:
+            self._ensure_loaded()
+            if capacity > 0:
+                self._items[key] = copy.deepcopy(result)
+                self._items.move_to_end(key)
+                while len(self._items) > capacity:
+                    self._items.popitem(last=False)
+
+            if path:
+                record = {"key": key, "ts": round(time.time(), 3), **meta, "result": result}
+                try:
+                    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+                    with open(path, "a", encoding="utf-8") as f:
+                        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                except OSError as e:
+                    logger.warning(f"⚠️  结果持久化失败: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._items),
+                "capacity": self.capacity,
+                "path": self.path,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+# 进程级单例
+result_store = ResultStore()
@@ -0,0 +1,336 @@
+"""规则引擎（manual 模式 / Claude 调用失败时的降级方案）共用的参数提取和运动类型判别
+
+claude_pipeline 和 llm_service 原先各自维护一份正则 / 关键词列表，每次调用对每条正则执行 re.search
+（每次都要查 re 模块的编译缓存，嵌套的 match_number 闭包也每次重建）。这里把两份规则表集中到一处，
+在导入时整理一次：
+
+- 参数：每个参数按优先级依次尝试，取第一条能匹配的正则的最左匹配（与原实现的结果完全一致）；
+  每条正则预先算出它必须包含的一段没有大小写之分的字面文字（如 "米高"、"速度"），
+  文本中没有这段文字时直接跳过，不必扫描（对以数字开头、没有字面前缀可用的正则尤其有效）
+- 运动类型：关键词规则按优先级逐条查找，命中即返回；hits 给出所有规则的全部命中位置
+- 置信度：按关键词是否明确、必需参数是否齐全、角度是否矛盾给规则引擎的结果打分，
+  分数足够高的文本题不必再调用 Claude（scripts/calibrate_rule_engine.py 对照已存储的 Claude 结果校准）
+
+scripts/bench_rule_engine.py 对比新旧实现的结果并测速。
+"""
+
+import re
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+# 所有参数正则共用的数字分组（每条正则恰好一个，即 group(1)）
+NUMBER = r"([0-9]+(?:\.[0-9]+)?)"
+
+# claude_pipeline.extract_parameters（manual 模式）
+PIPELINE_PARAMETER_PATTERNS: Dict[str, List[str]] = {
+    "initial_speed": [
+        r"初速度\s*[:：=]?\s*([0-9]+(?:\.[0-9]+)?)",
+        r"v0?\s*[:：=]?\s*([0-9]+(?:\.[0-9]+)?)",
+        r"速度\s*[:：=]?\s*([0-9]+(?:\.[0-9]+)?)\s*(?:m/s|米/秒)?",
+        r"以\s*([0-9]+(?:\.[0-9]+)?)\s*m/s",
+        r"([0-9]+(?:\.[0-9]+)?)\s*m/s\s*的.*速度",
+    ],
+    "angle": [
+        r"角度\s*[:：=]?\s*([0-9]+(?:\.[0-9]+)?)",
+        r"([0-9]+(?:\.[0-9]+)?)\s*[°度]\s*角",
+        r"以\s*([0-9]+(?:\.[0-9]+)?)\s*[°度]",
+    ],
+    "initial_height": [
+        r"高度\s*(?:为|是|[:：])\s*([0-9]+(?:\.[0-9]+)?)",
+        r"从\s*([0-9]+(?:\.[0-9]+)?)\s*[米m]",
+        r"高\s*([0-9]+(?:\.[0-9]+)?)\s*[米m]",
+        r"([0-9]+(?:\.[0-9]+)?)\s*米高",
+        r"([0-9]+(?:\.[0-9]+)?)\s*m高",
+    ],
+    "gravity": [
+        r"g\s*[:：=]?\s*([0-9]+(?:\.[0-9]+)?)",
+        r"重力加速度\s*(?:为|是|[:：])\s*([0-9]+(?:\.[0-9]+)?)",
+    ],
+    "friction": [
+        r"摩擦系数\s*[:：=]?\s*([0-9]+(?:\.[0-9]+)?)",
+        r"μ\s*[:：=]?\s*([0-9]+(?:\.[0-9]+)?)",
+    ],
+}
+
+# llm_service._extract_parameters_fallback（Claude 失败时的降级）：速度只认 v0，不提取摩擦系数
+FALLBACK_PARAMETER_PATTERNS: Dict[str, List[str]] = {
+    "initial_speed": [
+        r"初速度\s*[:：=]?\s*([0-9]+(?:\.[0-9]+)?)",
+        r"v0\s*[:：=]?\s*([0-9]+(?:\.[0-9]+)?)",
+        r"速度\s*[:：=]?\s*([0-9]+(?:\.[0-9]+)?)\s*(?:m/s|米/秒|米每秒)?",
+        r"以\s*([0-9]+(?:\.[0-9]+)?)\s*m/s",
+        r"([0-9]+(?:\.[0-9]+)?)\s*m/s\s*的.*速度",
+    ],
+    "angle": PIPELINE_PARAMETER_PATTERNS["angle"],
+    "initial_height": PIPELINE_PARAMETER_PATTERNS["initial_height"],
+    "gravity": PIPELINE_PARAMETER_PATTERNS["gravity"],
+}
+
+_METACHARS = set("\\()[]{}.^$|?*+")
+_QUANTIFIERS = set("?*+{")
+
+
+def required_literal(pattern: str) -> Optional[str]:
+    """正则匹配时一定会出现的最长一段字面文字
+
+    只看最外层：分组、字符类里的内容和后面跟量词的字符都不算必需；
+    忽略大小写匹配时，有大小写之分的字符（m、v 等）可能以另一种写法出现，不能用 `in` 判断，也不算。
+    """
+    runs, current = [], []
+    depth, i = 0, 0
+    while i < len(pattern):
+        ch = pattern[i]
+        if ch == "\\":
+            runs, current = _end_run(runs, current)
+            i += 2
+        elif ch == "[":
+            # 跳到配对的 ]（字符类开头的 ] 是字面字符）
+            runs, current = _end_run(runs, current)
+            i = pattern.index("]", i + 2 if pattern[i + 1] == "]" else i + 1) + 1
+        elif ch in "()":
+            runs, current = _end_run(runs, current)
+            depth += 1 if ch == "(" else -1
+            i += 1
+        else:
+            optional = i + 1 < len(pattern) and pattern[i + 1] in _QUANTIFIERS
+            if depth or optional or ch in _METACHARS or ch.lower() != ch or ch.upper() != ch:
+                runs, current = _end_run(runs, current)
+            else:
+                current.append(ch)
+            i += 1
+    runs, _ = _end_run(runs, current)
+    return max(runs, key=len) if runs else None
+
+
+def _end_run(runs: List[str], current: List[str]) -> Tuple[List[str], List[str]]:
+    if current:
+        runs.append("".join(current))
+    return runs, []
+
+
+class ParameterRules:
+    """按优先级排列的参数正则表（导入时编译一次，多个模块共用）"""
+
+    def __init__(self, fields: Dict[str, Sequence[str]], flags: int = re.IGNORECASE):
+        # [(参数名, [(编译后的 search, 必需的字面文字)])]
+        self._rules: List[Tuple[str, List[Tuple]]] = []
+        for name, patterns in fields.items():
+            compiled = []
+            for pattern in patterns:
+                regex = re.compile(pattern, flags)
+                if regex.groups != 1 or NUMBER not in pattern:
+                    raise ValueError(f"参数正则必须恰好包含一个分组（数字）: {pattern}")
+                compiled.append((regex.search, required_literal(pattern)))
+            self._rules.append((name, compiled))
+
+    def extract(self, text: str) -> Dict[str, Optional[float]]:
+        """每个参数取第一条能匹配的正则的数值，没有匹配时为 None"""
+        values: Dict[str, Optional[float]] = {}
+        for name, rules in self._rules:
+            value = None
+            for search, literal in rules:
+                if literal is not None and literal not in text:
+                    continue
+                m = search(text)
+                if m:
+                    value = float(m.group(1))
+                    break
+            values[name] = value
+        return values
+
+
+# 全局单例
+pipeline_parameter_rules = ParameterRules(PIPELINE_PARAMETER_PATTERNS)
+fallback_parameter_rules = ParameterRules(FALLBACK_PARAMETER_PATTERNS)
+
+
+# ==================== 运动类型判别 ====================
+
+# 题干中第一个角度数值（如 "30°"、"45 度"）
+ANGLE_PATTERN = re.compile(r"([0-9]+(?:\.[0-9]+)?)\s*[°度]")
+
+# 规则表中的占位：在这个优先级检查第一个角度数值（0 < 角度 < 90 为斜抛，90 为竖直上抛，0 为平抛）
+ANGLE_RULE = "angle"
+
+# claude_pipeline.detect_motion_type：(运动类型, 关键词) 按优先级排列，命中第一条即返回
+PIPELINE_MOTION_RULES: List[Tuple[str, List[str]]] = [
+    ("uniform", ["匀速", "匀速直线"]),
+    ("free_fall", ["自由落体", "自由下落"]),
+    ("horizontal_projectile", ["平抛", "水平抛", "水平抛射"]),
+    ("vertical_throw", ["竖直上抛", "竖直抛"]),
+    ("inclined_plane", ["斜面", "斜坡", "inclined plane"]),
+    (ANGLE_RULE, []),
+    ("projectile", ["斜抛", "斜向", "角度"]),
+    ("projectile", ["抛", "弹道", "抛体"]),
+]
+
+# llm_service._detect_motion_type_fallback：没有斜面；英文关键词不区分大小写（以 * 开头），
+# 最后 "下落" / "坠落" 也按一般抛体处理
+FALLBACK_MOTION_RULES: List[Tuple[str, List[str]]] = [
+    ("uniform", ["匀速", "匀速直线"]),
+    ("free_fall", ["自由落体", "自由下落"]),
+    ("horizontal_projectile", ["平抛", "水平抛", "水平抛射"]),
+    ("vertical_throw", ["竖直上抛", "竖直抛"]),
+    (ANGLE_RULE, []),
+    ("projectile", ["斜抛", "斜向", "角度"]),
+    ("projectile", ["抛", "弹道", "抛体"]),
+    ("projectile", ["*parabola", "*projectile"]),
+    ("projectile", ["下落", "坠落"]),
+]
+
+
+# 各运动类型必需的参数（缺失时动画只能使用默认值）
+REQUIRED_PARAMETERS: Dict[str, Tuple[str, ...]] = {
+    "uniform": ("initial_speed",),
+    "free_fall": ("initial_height",),
+    "horizontal_projectile": ("initial_speed", "initial_height"),
+    "vertical_throw": ("initial_speed",),
+    "inclined_plane": ("angle",),
+    "projectile": ("initial_speed", "angle"),
+}
+
+# 置信度按原因连乘扣分（1.0 表示关键词明确、参数齐全、角度一致）
+CONFIDENCE_PENALTIES: Dict[str, float] = {
+    "no_keyword": 0.4,            # 没有支持该类型的关键词 / 角度，只是默认类型
+    "conflicting_keyword": 0.5,   # 同时命中了其他类型的关键词
+    "missing_parameter": 0.6,     # 每缺一个必需参数乘一次
+    "conflicting_angle": 0.5,     # 题干中有多个不同角度，或角度与运动类型矛盾
+    "classifier_disagrees": 0.5,  # 本地分类器（services/motion_classifier.py）判为其他类型
+}
+
+# 角度能直接判别的类型（斜面的倾角不代表抛射方向）
+_ANGLE_TYPES = ("projectile", "horizontal_projectile", "vertical_throw")
+
+
+def classify_angle(angle: float) -> Optional[str]:
+    """角度规则：0 < 角度 < 90 为斜抛，90 为竖直上抛，0 为平抛，其他角度不下结论"""
+    if 0 < angle < 90:
+        return "projectile"
+    if angle == 90:
+        return "vertical_throw"
+    if angle == 0:
+        return "horizontal_projectile"
+    return None
+
+
+class MotionTypeRules:
+    """按优先级排列的运动类型关键词规则（导入时整理一次，多个模块共用）
+
+    classify 按优先级逐条做子串查找，命中即返回。CPython 的 `in` 在 C 里扫描，
+    绝大多数题目在前几条规则就能确定类型，比先把所有关键词的位置一次扫出来再套优先级更快
+    （scripts/bench_rule_engine.py 对比了单次扫描的合并正则）。需要全部命中位置时用 hits。
+    """
+
+    def __init__(self, rules: Sequence[Tuple[str, Sequence[str]]], default: str = "projectile"):
+        self.default = default
+        # [(运动类型, 区分大小写的关键词, 不区分大小写的关键词)]
+        self._rules: List[Tuple[str, Tuple[str, ...], Tuple[str, ...]]] = []
+        for label, keywords in rules:
+            exact = [kw for kw in keywords if not kw.startswith("*")]
+            folded = [kw[1:].lower() for kw in keywords if kw.startswith("*")]
+            self._rules.append((label, tuple(exact), tuple(folded)))
+
+        # 默认类型的第一条规则之后的同类规则是兜底关键词（"抛"、"下落" 等），不算与其他类型冲突
+        default_rules = [i for i, (label, _, _) in enumerate(self._rules) if label == default]
+        self._catch_all = set(default_rules[1:])
+
+        # 判别时跳过多余的关键词：同一条规则中包含另一个关键词的（"匀速直线" 含 "匀速"）一定同时命中
+        self._checks = [
+            (label, tuple(kw for kw in exact if not any(other != kw and other in kw for other in exact)), folded)
+            for label, exact, folded in self._rules
+        ]
+
+    def classify(self, text: str) -> str:
+        lowered = None
+        for label, exact, folded in self._checks:
+            if label == ANGLE_RULE:
+                angle_match = ANGLE_PATTERN.search(text)
+                if angle_match:
+                    result = classify_angle(float(angle_match.group(1)))
+                    if result is not None:
+                        return result
+                continue
+            for keyword in exact:
+                if keyword in text:
+                    return label
+            if folded:
+                if lowered is None:
+                    lowered = text.lower()
+                for keyword in folded:
+                    if keyword in lowered:
+                        return label
+        return self.default
+
+    def hits(self, text: str) -> List[Tuple[int, str, str, int]]:
+        """所有规则的全部命中，按位置排序：[(位置, 运动类型, 命中的文字, 规则优先级)]
+
+        角度规则的命中记为 (位置, classify_angle 的结果或 "angle", "30°", 优先级)。
+        """
+        found = []
+        lowered = None
+        for priority, (label, exact, folded) in enumerate(self._rules):
+            if label == ANGLE_RULE:
+                for m in ANGLE_PATTERN.finditer(text):
+                    found.append((m.start(), classify_angle(float(m.group(1))) or ANGLE_RULE, m.group(0), priority))
+                continue
+            if folded and lowered is None:
+                lowered = text.lower()
+            for haystack, keywords in ((text, exact), (lowered, folded)):
+                for keyword in keywords:
+                    start = haystack.find(keyword)
+                    while start != -1:
+                        found.append((start, label, keyword, priority))
+                        start = haystack.find(keyword, start + 1)
+        found.sort()
+        return found
+
+    def confidence(self, text: str, motion_type: str, params: Dict[str, Any]) -> Tuple[float, List[str]]:
+        """规则引擎结果（classify 的运动类型和 extract 的参数）的置信度，返回 (0~1 的分数, 扣分原因)
+
+        - 关键词：至少有一个支持该类型的关键词或角度，且没有其他类型的关键词
+          （被更长关键词包含的命中，如 "平抛" 中的 "抛"，不单独计算；兜底关键词不算冲突）
+        - 参数：REQUIRED_PARAMETERS 中的参数都已提取
+        - 角度：题干中的角度数值一致，且能判别类型时与运动类型相符
+        """
+        keyword_hits, angles = [], set()
+        for pos, label, matched, priority in self.hits(text):
+            if self._rules[priority][0] == ANGLE_RULE:
+                angles.add(float(ANGLE_PATTERN.match(matched).group(1)))
+                if label == motion_type:
+                    keyword_hits.append((pos, pos, label, priority))
+            else:
+                keyword_hits.append((pos, pos + len(matched), label, priority))
+
+        # 去掉被更长关键词包含的命中
+        keyword_hits = [
+            hit for hit in keyword_hits
+            if not any(o[0] <= hit[0] and hit[1] <= o[1] and o[1] - o[0] > hit[1] - hit[0] for o in keyword_hits)
+        ]
+
+        reasons = []
+        if not any(label == motion_type for _, _, label, _ in keyword_hits):
+            reasons.append("no_keyword")
+        conflicts = sorted({
+            label for _, _, label, priority in keyword_hits
+            if label != motion_type and label != ANGLE_RULE and priority not in self._catch_all
+        })
+        reasons.extend(f"conflicting_keyword:{label}" for label in conflicts)
+
+        for name in REQUIRED_PARAMETERS.get(motion_type, ()):
+            if params.get(name) is None:
+                reasons.append(f"missing_parameter:{name}")
+
+        angle = params.get("angle")
+        if len(angles) > 1:
+            reasons.append("conflicting_angle:" + "/".join(f"{a:g}" for a in sorted(angles)))
+        elif angle is not None and motion_type in _ANGLE_TYPES and classify_angle(angle) not in (None, motion_type):
+            reasons.append(f"conflicting_angle:{angle:g}")
+
+        score = 1.0
+        for reason in reasons:
+            score *= CONFIDENCE_PENALTIES[reason.split(":", 1)[0]]
+        return round(score, 4), reasons
+
+
+# 全局单例
+pipeline_motion_rules = MotionTypeRules(PIPELINE_MOTION_RULES)
+fallback_motion_rules = MotionTypeRules(FALLBACK_MOTION_RULES)
@@ -0,0 +1,381 @@
+"""规则引擎影子评估：在请求路径之外用 Claude 的结果检验规则引擎
+
+每个经 Claude 解析的题目（多模态 / 批量 / 小问拆分 / 两阶段的纯文本调用）都交给后台线程，
+用规则引擎（claude_pipeline.detect_motion_type、extract_parameters、generate_animation_instructions）
+重新解析同一段 problem_text，逐字段比较：
+
+- 核心字段：运动类型、初速度、角度、初始高度、重力加速度（两边都没有给出也算一致；
+  一方没有给出时按运动类型隐含的值比较，如自由落体的初速度为 0）
+- 动画字段：动画类型、初速度、角度、初始高度、持续时间（持续时间允许 5% 误差）
+
+同时用两阶段文本解析快速路径实际使用的规则（llm_service 的 fallback 规则和 _rule_engine_confidence，
+含本地分类器的扣分）解析一次，只比较核心字段。
+
+每条比较结果追加一行到 SHADOW_EVAL_LOG（{"ts", "source", "claude", "rule", "conf", "diff",
+"fast_rule", "fast_conf", "fast_diff"}，只记录不一致的字段名），启动时读回最近 SHADOW_EVAL_WINDOW 条，
+文件行数超过窗口的两倍时压缩重写；未配置日志时只在内存中保留最近一个窗口（重启后重新积累）。
+
+按 Claude 的运动类型发布各字段一致率（GET /pipeline/shadow）；按快速路径规则判出的运动类型
+推导快速路径阈值：该类型快速路径置信度 ≥ 阈值的样本中核心字段一致率达到 SHADOW_EVAL_TARGET 的最低阈值
+（样本不足 SHADOW_EVAL_MIN_SAMPLES 时沿用 RULE_ENGINE_FAST_PATH_THRESHOLD，任何阈值都达不到时关闭该类型的快速路径）。
+推导出的阈值不低于 RULE_ENGINE_FAST_PATH_THRESHOLD：快速路径打开后，高置信度的题目不再经过 Claude，
+样本只剩 SHADOW_EVAL_EXPLORE 比例的抽样复核，不能据此把阈值放得比运维配置的更低。
+
+环境变量：
+- SHADOW_EVAL: 是否启用影子评估（可选，默认 true）
+- SHADOW_EVAL_LOG: 比较结果日志（JSONL，可选，默认不写文件；建议放在仓库目录之外）
+- SHADOW_EVAL_WINDOW: 统计最近多少条比较结果（可选，默认 2000）
+- SHADOW_EVAL_TARGET: 快速路径要求的核心字段一致率（可选，默认 0.95）
+- SHADOW_EVAL_MIN_SAMPLES: 推导阈值至少需要的样本数（可选，默认 30）
+- SHADOW_EVAL_EXPLORE: 本可走快速路径的文本仍交给 Claude 复核的比例（可选，默认 0.05，0 表示不抽样）
+"""
+
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# 后台队列长度；队列满时放弃评估（不阻塞请求）
+SHADOW_QUEUE_SIZE = 256
+
+CORE_FIELDS = ("motion_type", "initial_speed", "angle", "initial_height", "gravity")
+ANIMATION_FIELDS = ("animation.type", "animation.initial_speed", "animation.angle", "animation.initial_y",
+                    "animation.duration")
+
+# 数值字段的相对误差容限（持续时间由双方各自估算，放宽到 5%）
+VALUE_TOLERANCE = 1e-3
+DURATION_TOLERANCE = 0.05
+
+
+def is_shadow_enabled() -> bool:
+    return os.environ.get("SHADOW_EVAL", "true").lower() in ("true", "1", "yes")
+
+
+def get_shadow_log_path() -> str:
+    """比较结果日志路径（空字符串表示不写文件）"""
+    return os.environ.get("SHADOW_EVAL_LOG", "").strip()
+
+
+def get_shadow_settings() -> Dict[str, float]:
+    def _env(name: str, default: float, cast) -> float:
+        try:
+            return cast(os.environ.get(name, str(default)))
+        except ValueError:
+            return default
+
+    return {
+        "window": max(_env("SHADOW_EVAL_WINDOW", 2000, int), 1),
+        "target": _env("SHADOW_EVAL_TARGET", 0.95, float),
+        "min_samples": max(_env("SHADOW_EVAL_MIN_SAMPLES", 30, int), 1),
+        "explore": min(max(_env("SHADOW_EVAL_EXPLORE", 0.05, float), 0.0), 1.0),
+    }
+
+
+# 运动类型隐含的参数值：一方没有给出时按该值比较（如 Claude 给出自由落体 v0=0、角度 90，规则引擎为 null）
+IMPLIED_PARAMETERS: Dict[str, Dict[str, float]] = {
+    "free_fall": {"initial_speed": 0, "angle": 90},
+    "horizontal_projectile": {"angle": 0},
+    "vertical_throw": {"angle": 90},
+    "uniform": {"angle": 0},
+}
+
+
+def _number(value: Any) -> Optional[float]:
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _same(a: Any, b: Any, tolerance: float = VALUE_TOLERANCE) -> bool:
+    a, b = _number(a), _number(b)
+    if a is None or b is None:
+        return a is None and b is None
+    return abs(a - b) <= tolerance * max(1.0, abs(b))
+
+
+def _core_diff(motion_type: str, params: Dict[str, Any], claude_type: str,
+               claude_params: Dict[str, Any]) -> list:
+    """核心字段中与 Claude 不一致的字段名"""
+    implied = {"initial_height": 0, **IMPLIED_PARAMETERS.get(claude_type, {})}
+    diff = []
+    if motion_type != claude_type:
+        diff.append("motion_type")
+    for name in CORE_FIELDS[1:]:
+        ours, theirs = params.get(name), claude_params.get(name)
+        if not _same(implied.get(name) if ours is None else ours, implied.get(name) if theirs is None else theirs):
+            diff.append(name)
+    return diff
+
+
+def compare_with_rule_engine(problem_text: str, claude_type: str, claude_params: Dict[str, Any],
+                             claude_animation: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """用规则引擎重新解析题目，与 Claude 的结果逐字段比较
+
+    Returns:
+        {"rule": 规则引擎的运动类型, "conf": 规则引擎置信度, "diff": [不一致的字段],
+         "fast_rule" / "fast_conf" / "fast_diff": 快速路径规则的运动类型、置信度和不一致的核心字段}
+    """
+    from services.claude_pipeline import detect_motion_type, extract_parameters, generate_animation_instructions
+    from services.llm_service import (
+        _detect_motion_type_fallback, _extract_parameters_fallback, _rule_engine_confidence,
+    )
+    from services.rule_engine import pipeline_motion_rules
+
+    motion_type = detect_motion_type(problem_text)
+    params = extract_parameters(problem_text)
+    animation = generate_animation_instructions(motion_type, params)
+    confidence, _ = pipeline_motion_rules.confidence(problem_text, motion_type, params)
+
+    # 两阶段文本解析的快速路径（与 llm_service.parse_problem_text 相同的规则和置信度）
+    fast_type = _detect_motion_type_fallback(problem_text)
+    fast_params = _extract_parameters_fallback(problem_text)
+    fast_confidence, _ = _rule_engine_confidence(problem_text, fast_type, fast_params)
+
+    claude_params = dict(claude_params or {})
+    claude_params["gravity"] = claude_params.get("gravity") or 9.8
+    if not claude_animation:
+        claude_animation = generate_animation_instructions(claude_type, claude_params)
+
+    diff = _core_diff(motion_type, params, claude_type, claude_params)
+    if animation.get("type") != claude_animation.get("type"):
+        diff.append("animation.type")
+    for field in ANIMATION_FIELDS[1:]:
+        name = field.split(".", 1)[1]
+        tolerance = DURATION_TOLERANCE if name == "duration" else VALUE_TOLERANCE
+        if not _same(animation.get(name), claude_animation.get(name), tolerance):
+            diff.append(field)
+    return {
+        "rule": motion_type, "conf": confidence, "diff": diff,
+        "fast_rule": fast_type, "fast_conf": fast_confidence,
+        "fast_diff": _core_diff(fast_type, fast_params, claude_type, claude_params),
+    }
+
+
+class ShadowEvaluator:
+    """后台线程逐条比较规则引擎与 Claude 的结果，维护最近一个窗口的一致率"""
+
+    def __init__(self, path: Optional[str] = None):
+        self._path = path
+        self._lock = threading.Lock()
+        self._entries: deque = deque(maxlen=get_shadow_settings()["window"])
+        self._loaded_path: Optional[str] = None
+        self._log_lines = 0
+        self._thresholds: Optional[Dict[str, Dict[str, Any]]] = None
+        self._queue: "queue.Queue[tuple]" = queue.Queue(maxsize=SHADOW_QUEUE_SIZE)
+        self._worker: Optional[threading.Thread] = None
+        self._stats = {"evaluated": 0, "dropped": 0, "failed": 0}
+
+    @property
+    def path(self) -> str:
+        return self._path if self._path is not None else get_shadow_log_path()
+
+    # ---------- 日志 ----------
+
+    def _ensure_loaded(self) -> None:
+        """首次访问时从日志读回最近一个窗口的比较结果（调用方持有锁）"""
+        path = self.path
+        window = get_shadow_settings()["window"]
+        if self._loaded_path == path and self._entries.maxlen == window:
+            return
+        self._loaded_path = path
+        self._entries = deque(maxlen=window)
+        self._log_lines = 0
+        self._thresholds = None
+        if not path or not os.path.exists(path):
+            return
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if "claude" in entry and "rule" in entry and "diff" in entry:
+                    self._entries.append(entry)
+                    self._log_lines += 1
+        logger.info(f"✅ 已从 {path} 读回 {len(self._entries)} 条影子评估结果")
+
+    def _append(self, entry: Dict[str, Any]) -> None:
+        """记录一条比较结果（调用方持有锁）；日志超过窗口两倍时只保留窗口内的记录"""
+        self._ensure_loaded()
+        self._entries.append(entry)
+        self._thresholds = None
+        path = self.path
+        if not path:
+            return
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if self._log_lines + 1 > 2 * self._entries.maxlen:
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.writelines(json.dumps(e, ensure_ascii=False) + "\n" for e in self._entries)
+            os.replace(tmp_path, path)
+            self._log_lines = len(self._entries)
+        else:
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self._log_lines += 1
+
+    # ---------- 后台线程 ----------
+
+    def _ensure_worker(self) -> None:
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="shadow-eval", daemon=True)
+                self._worker.start()
+
+    def _run(self) -> None:
+        while True:
+            job = self._queue.get()
+            try:
+                self.evaluate(*job)
+            except Exception as e:
+                self._stats["failed"] += 1
+                logger.error(f"❌ 影子评估失败: {e}")
+            finally:
+                self._queue.task_done()
+
+    def evaluate(self, source: str, problem_text: str, claude_type: str, claude_params: Dict[str, Any],
+                 claude_animation: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """同步比较一条结果并记录"""
+        result = compare_with_rule_engine(problem_text, claude_type, claude_params, claude_animation)
+        entry = {"ts": round(time.time(), 3), "source": source, "claude": claude_type, **result}
+        with self._lock:
+            self._append(entry)
+        self._stats["evaluated"] += 1
+        return entry
+
+    # ---------- 对外接口 ----------
+
+    def submit(self, source: str, result: Dict[str, Any], problem_text: Optional[str] = None) -> bool:
+        """把一条 Claude 结果交给后台线程评估，不阻塞调用方
+
+        Args:
+            source: 结果来源（claude / batch / split / text）
+            result: Claude 的结果（problem_type 或 motion_type、parameters，可选 animation_instructions）
+            problem_text: 题目文本（默认取 result["problem_text"]）
+
+        Returns:
+            是否进入队列（未启用、没有题目文本或队列满时为 False）
+        """
+        text = problem_text or result.get("problem_text")
+        if not is_shadow_enabled() or not text:
+            return False
+        claude_type = str(result.get("problem_type") or result.get("motion_type") or "projectile")
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait((
+                source, text, claude_type.removeprefix("physics_"),
+                dict(result.get("parameters") or {}), dict(result.get("animation_instructions") or {}),
+            ))
+            return True
+        except queue.Full:
+            self._stats["dropped"] += 1
+            return False
+
+    def flush(self) -> None:
+        """等待队列中的评估任务全部完成（脚本 / 测试使用）"""
+        self._ensure_worker()
+        self._queue.join()
+
+    def _compute_thresholds(self) -> Dict[str, Dict[str, Any]]:
+        """按快速路径规则判出的运动类型和置信度推导快速路径阈值（调用方持有锁）
+
+        没有快速路径字段的旧记录不参与推导。
+        """
+        settings = get_shadow_settings()
+        by_type: Dict[str, list] = {}
+        for entry in self._entries:
+            if "fast_rule" not in entry:
+                continue
+            by_type.setdefault(entry["fast_rule"], []).append((entry.get("fast_conf", 0.0), not entry["fast_diff"]))
+
+        thresholds = {}
+        for motion_type, samples in sorted(by_type.items()):
+            samples.sort(reverse=True)
+            threshold, covered, agreed = None, 0, 0
+            for i, (confidence, agrees) in enumerate(samples):
+                covered += 1
+                agreed += agrees
+                # 同一置信度的样本要么都走快速路径、要么都不走，只在置信度变化处取阈值
+                boundary = i + 1 == len(samples) or samples[i + 1][0] != confidence
+                if boundary and covered >= settings["min_samples"] and agreed / covered >= settings["target"]:
+                    threshold = confidence
+            thresholds[motion_type] = {
+                "samples": len(samples),
+                "agreement": round(sum(a for _, a in samples) / len(samples), 4),
+                "threshold": threshold,
+                "enough_samples": len(samples) >= settings["min_samples"],
+            }
+        return thresholds
+
+    def thresholds(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            self._ensure_loaded()
+            if self._thresholds is None:
+                self._thresholds = self._compute_thresholds()
+            return self._thresholds
+
+    def fast_path_threshold(self, motion_type: str, default: float) -> Optional[float]:
+        """快速路径规则判为 motion_type 时的阈值（样本不足时为 default，None 表示不走快速路径）
+
+        推导值只能提高阈值：快速路径打开后高置信度样本只来自抽样复核，不能把阈值降到 default 以下。
+        """
+        entry = self.thresholds().get(motion_type)
+        if entry is None or not entry["enough_samples"]:
+            return default
+        if entry["threshold"] is None:
+            return None
+        return max(default, entry["threshold"])
+
+    def should_explore(self) -> bool:
+        """本可走快速路径的文本是否抽样交给 Claude（让高置信度区间持续有影子评估样本）"""
+        return is_shadow_enabled() and random.random() < get_shadow_settings()["explore"]
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            self._ensure_loaded()
+            entries = list(self._entries)
+        problem_types: Dict[str, Dict[str, Any]] = {}
+        for entry in entries:
+            stats = problem_types.setdefault(entry["claude"], {"samples": 0, "agreed": 0, "diff": {}})
+            stats["samples"] += 1
+            stats["agreed"] += not any(field in CORE_FIELDS for field in entry["diff"])
+            for field in entry["diff"]:
+                stats["diff"][field] = stats["diff"].get(field, 0) + 1
+        return {
+            "enabled": is_shadow_enabled(),
+            "log": self.path or None,
+            **get_shadow_settings(),
+            "samples": len(entries),
+            "queued": self._queue.qsize(),
+            **self._stats,
+            "problem_types": {
+                problem_type: {
+                    "samples": stats["samples"],
+                    "agreement": round(stats["agreed"] / stats["samples"], 4),
+                    "fields": {
+                        field: round(1 - stats["diff"].get(field, 0) / stats["samples"], 4)
+                        for field in CORE_FIELDS + ANIMATION_FIELDS
+                    },
+                }
+                for problem_type, stats in sorted(problem_types.items())
+            },
+            "fast_path_thresholds": self.thresholds(),
+        }
+
+
+# 全局单例
+shadow_evaluator = ShadowEvaluator()
+
+
+def get_shadow_stats() -> Dict[str, Any]:
+    return shadow_evaluator.summary()
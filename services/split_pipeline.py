@@ -0,0 +1,394 @@
+"""小问拆分 Pipeline：先提取题目和小问边界，再并行解答每个小问
+
+作业照片里的题目经常带 (1)(2)(3) 多个小问，单次 4096 tokens 的调用要串行写完所有解答，
+容易被截断。拆分模式分两步：
+
+1. 提取：多模态调用只返回 problem_text / parameters / animation_instructions 和 sub_questions
+   （不写解题步骤，输出短）
+2. 解答：每个小问一次纯文本调用（不再发送图片），在进程内共享的有界线程池中并行执行，
+   按小问顺序合并为一个 solution_steps 列表；请求的 deadline 显式传入工作线程，
+   任意小问失败 / 超时时取消尚未开始的小问
+
+每次调用的 usage 都会记录（预算档位按实际消耗的 tokens 计算）：已完成的小问在请求线程中记录，
+放弃请求时仍在进行的调用在结束后由工作线程记录。
+
+环境变量：
+- CLAUDE_SPLIT_MODE: 是否启用小问拆分（可选，默认 false）
+- CLAUDE_SPLIT_WORKERS: 并行解答的线程数上限（所有请求共享，可选，默认 4）
+- CLAUDE_SPLIT_PART_MAX_TOKENS: 单个小问解答的 max_tokens（可选，默认 1536）
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from typing import Any, Dict, List, Optional
+
+from services.claude_pipeline import (
+    ImageInput,
+    build_image_blocks,
+    build_messages,
+    clean_json_response,
+    create_claude_client,
+    get_claude_credentials,
+    plan_pipeline_request,
+    prepare_images,
+    read_image_list,
+    validate_and_normalize_response,
+)
+from services.deadline import (
+    Deadline,
+    DeadlineExceeded,
+    check_deadline,
+    current_deadline,
+    deadline_scope,
+    timeout_kwargs,
+)
+from services.file_cache import FILES_API_BETA
+from services.prompt_registry import prompt_registry, record_prompt_result, select_prompt
+from services.result_store import make_cache_key, result_store
+from services.shadow_eval import shadow_evaluator
+from services.usage_tracker import record_usage
+
+logger = logging.getLogger(__name__)
+
+STRICT_SUFFIX = "\n\n**再次强调：只返回纯 JSON 对象，不要有任何其他内容！**"
+
+# 所有请求共享的小问解答线程池（并发请求不会叠加 CLAUDE_SPLIT_WORKERS 个线程）
+_solve_pool: Optional[ThreadPoolExecutor] = None
+_solve_pool_lock = threading.Lock()
+
+
+def is_split_mode_enabled() -> bool:
+    return os.environ.get("CLAUDE_SPLIT_MODE", "false").lower() in ("true", "1", "yes")
+
+
+def get_split_workers() -> int:
+    try:
+        return max(int(os.environ.get("CLAUDE_SPLIT_WORKERS", "4")), 1)
+    except ValueError:
+        return 4
+
+
+def get_part_max_tokens() -> int:
+    try:
+        return int(os.environ.get("CLAUDE_SPLIT_PART_MAX_TOKENS", "1536"))
+    except ValueError:
+        return 1536
+
+
+def get_solve_pool() -> ThreadPoolExecutor:
+    """首次使用时按 CLAUDE_SPLIT_WORKERS 创建共享线程池"""
+    global _solve_pool
+    with _solve_pool_lock:
+        if _solve_pool is None:
+            _solve_pool = ThreadPoolExecutor(max_workers=get_split_workers(), thread_name_prefix="split-solve")
+        return _solve_pool
+
+
+# ==================== Prompt ====================
+
+SPLIT_EXTRACT_SYSTEM_PROMPT = """你是一个物理题 OCR + 解析专家。你只负责识别题目、提取参数和拆分小问，不需要解题。
+
+**CRITICAL：你必须只返回纯 JSON，不要包含任何 Markdown 代码块标记（如 ```json），不要有任何解释性文字。**
+"""
+
+SPLIT_EXTRACT_USER_PROMPT = """请从图片中识别物理题目，并按以下 JSON 格式返回（不要包含 ```json 等标记）：
+{"problem_text":题目原文,"problem_type":类型,"parameters":{"initial_speed":m/s,"angle":度,"initial_height":m,"gravity":默认9.8,"friction":系数},"animation_instructions":{"type":动画类型,"initial_speed","angle","gravity","initial_x":0,"initial_y":初始高度,"duration":秒,"scale":10-30},"sub_questions":[{"label":"(1)","question":第一问原文},{"label":"(2)","question":第二问原文}]}
+未给出的参数为 null。
+problem_type: projectile(斜抛) / horizontal_projectile(平抛,angle=0) / free_fall(自由落体,v0=0) / vertical_throw(竖直上抛,angle=90) / uniform(匀速直线) / inclined_plane(斜面)
+type: free_fall→free_fall, uniform→uniform, inclined_plane→inclined_plane, 其余→projectile
+sub_questions 按题目中的顺序列出所有小问；题目没有小问时只返回一项，label 为空字符串，question 为完整设问。
+不要写解题步骤，只返回 JSON："""
+
+SPLIT_SOLVE_SYSTEM_PROMPT = """你是一个物理解题专家。根据给定的题目和已提取的参数，只解答指定的小问。
+
+**CRITICAL：你必须只返回纯 JSON，不要包含任何 Markdown 代码块标记（如 ```json），不要有任何解释性文字。**
+"""
+
+SPLIT_SOLVE_USER_TEMPLATE = """题目：
+{problem_text}
+
+已提取参数：{parameters}
+
+只解答这一问 {label}：{question}
+
+返回 JSON：{{"steps": ["步骤1：...", "步骤2：...", "步骤3：..."]}}（至少 2 步，包含公式和数值结果）"""
+
+prompt_registry.register(
+    "split_extract", "v1",
+    system=SPLIT_EXTRACT_SYSTEM_PROMPT, user=SPLIT_EXTRACT_USER_PROMPT,
+)
+prompt_registry.register(
+    "split_solve", "v1",
+    system=SPLIT_SOLVE_SYSTEM_PROMPT, user_template=SPLIT_SOLVE_USER_TEMPLATE,
+)
+
+
+# ==================== 解析 ====================
+
+def _load_json_object(raw_text: str) -> dict:
+    cleaned_text = clean_json_response(raw_text)
+    try:
+        data = json.loads(cleaned_text)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Claude 返回的不是有效 JSON: {e}")
+    if not isinstance(data, dict):
+        raise ValueError("Claude 返回的不是 JSON 对象")
+    return data
+
+
+def parse_extraction_response(raw_text: str) -> tuple[dict, List[dict]]:
+    """解析提取阶段的返回
+
+    Returns:
+        (规范化后的题目 dict（solution_steps 为空）, 小问列表 [{"label", "question"}])
+
+    Raises:
+        ValueError: 不是有效 JSON 或缺少必需字段
+    """
+    data = _load_json_object(raw_text)
+    raw_parts = data.pop("sub_questions", None)
+    data["solution_steps"] = []
+    normalized = validate_and_normalize_response(data)
+
+    parts = []
+    if isinstance(raw_parts, list):
+        for index, part in enumerate(raw_parts, start=1):
+            if isinstance(part, dict) and str(part.get("question") or "").strip():
+                label = str(part.get("label") or "").strip()
+                parts.append({"label": label or f"({index})", "question": str(part["question"]).strip()})
+            elif isinstance(part, str) and part.strip():
+                parts.append({"label": f"({index})", "question": part.strip()})
+
+    if not parts:
+        # 没有小问：整道题作为一问
+        parts = [{"label": "", "question": normalized["problem_text"]}]
+    return normalized, parts
+
+
+def parse_solve_response(raw_text: str) -> List[str]:
+    """解析单个小问的解答，返回步骤列表
+
+    Raises:
+        ValueError: 不是有效 JSON 或 steps 为空
+    """
+    data = _load_json_object(raw_text)
+    steps = data.get("steps")
+    if not isinstance(steps, list):
+        raise ValueError("缺少 steps 字段")
+    steps = [str(step).strip() for step in steps if str(step).strip()]
+    if not steps:
+        raise ValueError("steps 为空")
+    return steps
+
+
+def merge_solution_steps(parts: List[dict], part_steps: List[List[str]]) -> List[str]:
+    """按小问顺序合并解答步骤（多个小问时每问前加标题行）"""
+    if len(parts) == 1:
+        return list(part_steps[0])
+
+    merged = []
+    for part, steps in zip(parts, part_steps):
+        merged.append(f"{part['label']} {part['question']}")
+        merged.extend(steps)
+    return merged
+
+
+# ==================== 调用 ====================
+
+def _create_message(client: Any, uses_files_api: bool, stage: str, **kwargs) -> Any:
+    kwargs.update(timeout_kwargs(stage=stage))
+    if uses_files_api:
+        return client.beta.messages.create(betas=[FILES_API_BETA], temperature=0, **kwargs)
+    return client.messages.create(temperature=0, **kwargs)
+
+
+def _solve_part(
+    client: Any,
+    model: str,
+    prompts: Dict[str, str],
+    problem: dict,
+    part: dict,
+    deadline: Optional[Deadline] = None,
+) -> dict:
+    """解答单个小问（在线程池中执行，校验失败时强化提示重试一次）
+
+    usage 和 deadline 都是线程局部的：deadline 由调用方显式传入，
+    usage 由调用方统一记录（见 _record_part_usage）。API 调用抛出的异常也放在返回值中，
+    这样之前已完成的尝试仍会被记录。
+
+    Returns:
+        {"steps", "attempts": [(response, latency_ms, valid)]}，失败时另有 "error"（和 "exception"）
+    """
+    user_prompt = prompts["user_template"].format(
+        problem_text=problem["problem_text"],
+        parameters=json.dumps(problem["parameters"], ensure_ascii=False),
+        label=part["label"],
+        question=part["question"],
+    )
+    attempts = []
+    last_error = None
+    for system_prompt in (prompts["system"], prompts["system"] + STRICT_SUFFIX):
+        started = time.perf_counter()
+        try:
+            with deadline_scope(deadline):
+                response = _create_message(
+                    client, False, f"小问 {part['label']}",
+                    model=model,
+                    max_tokens=get_part_max_tokens(),
+                    system=system_prompt,
+                    messages=[{"role": "user", "content": user_prompt}],
+                )
+        except Exception as e:
+            return {"steps": None, "attempts": attempts, "error": e, "exception": e}
+        latency_ms = (time.perf_counter() - started) * 1000
+        try:
+            steps = parse_solve_response(response.content[0].text)
+        except ValueError as e:
+            attempts.append((response, latency_ms, False))
+            last_error = e
+            continue
+        attempts.append((response, latency_ms, True))
+        return {"steps": steps, "attempts": attempts}
+
+    return {"steps": None, "attempts": attempts, "error": last_error}
+
+
+def _record_part_usage(outcome: dict, model: str, solve_version: str, problem_type: str) -> None:
+    """记录一个小问所有尝试的 usage 和 prompt 变体表现"""
+    for response, latency_ms, valid in outcome["attempts"]:
+        input_tokens, output_tokens = record_usage("split_solve", model, response, problem_type if valid else "invalid")
+        record_prompt_result("split_solve", solve_version, input_tokens, output_tokens, latency_ms, valid)
+
+
+def split_claude_pipeline(image_source: ImageInput, slim: bool = False) -> dict:
+    """小问拆分模式：提取题目和小问边界 -> 并行解答每个小问 -> 按顺序合并
+
+    Args:
+        image_source: 图片路径或图片字节，或按顺序排列的多张图片
+        slim: 是否使用精简配置
+
+    Returns:
+        同 call_claude_pipeline 的返回格式
+
+    Raises:
+        RuntimeError: API 调用失败或返回结果多次校验失败
+    """
+    # 1. 选择 prompt 变体并检查缓存
+    api_key, _ = get_claude_credentials()
+    images = read_image_list(image_source)
+    plan = plan_pipeline_request(images, slim=slim)
+    model, max_tokens, digest = plan["model"], plan["max_tokens"], plan["digest"]
+    extract_version, extract_prompts = select_prompt("split_extract", digest)
+    solve_version, solve_prompts = select_prompt("split_solve", digest)
+
+    cache_key = make_cache_key(digest, f"split-{extract_version}+{solve_version}", model)
+    cached = result_store.get(cache_key)
+    if cached is not None:
+        return cached
+
+    logger.info(f"开始小问拆分 Pipeline（{len(images)} 张图片）...")
+    client = create_claude_client(api_key)
+
+    # 2. 提取题目和小问（失败时强化提示重试一次）
+    try:
+        prepared, prepared_digests = prepare_images(images)
+        image_blocks, uses_files_api = build_image_blocks(client, prepared, prepared_digests)
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        logger.error(f"❌ 图片处理失败: {e}")
+        raise RuntimeError(f"小问拆分 Pipeline 失败: {e}")
+
+    messages = build_messages(image_blocks, extract_prompts)
+    problem, parts = None, None
+    last_error = None
+    for system_prompt in (extract_prompts["system"], extract_prompts["system"] + STRICT_SUFFIX):
+        try:
+            started = time.perf_counter()
+            response = _create_message(
+                client, uses_files_api, "小问提取",
+                model=model, max_tokens=max_tokens, system=system_prompt, messages=messages,
+            )
+            latency_ms = (time.perf_counter() - started) * 1000
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            check_deadline("小问提取")
+            logger.error(f"❌ Claude API 调用失败: {e}")
+            raise RuntimeError(f"小问拆分 Pipeline 失败: {e}")
+
+        try:
+            problem, parts = parse_extraction_response(response.content[0].text)
+        except ValueError as e:
+            input_tokens, output_tokens = record_usage("split_extract", model, response, "invalid")
+            record_prompt_result("split_extract", extract_version, input_tokens, output_tokens, latency_ms, False)
+            logger.warning(f"⚠️  小问提取结果校验失败: {e}")
+            last_error = e
+            continue
+
+        input_tokens, output_tokens = record_usage("split_extract", model, response, problem["problem_type"])
+        record_prompt_result("split_extract", extract_version, input_tokens, output_tokens, latency_ms, True)
+        break
+
+    if problem is None:
+        logger.error(f"❌ 小问提取多次校验失败: {last_error}")
+        raise RuntimeError(f"小问拆分 Pipeline 失败: {last_error}")
+
+    # 3. 并行解答各小问（纯文本调用，不再发送图片）
+    logger.info(f"识别到 {len(parts)} 个小问，并行解答（共享线程池 {get_split_workers()} 个线程）")
+    deadline = current_deadline()
+    pool = get_solve_pool()
+    futures: Dict[Future, int] = {
+        pool.submit(_solve_part, client, model, solve_prompts, problem, part, deadline): index
+        for index, part in enumerate(parts)
+    }
+    problem_type = problem["problem_type"]
+
+    def record_late(done: Future) -> None:
+        if not done.cancelled() and done.exception() is None:
+            _record_part_usage(done.result(), model, solve_version, problem_type)
+
+    outcomes: Dict[int, dict] = {}
+    failed = None
+    try:
+        for future in as_completed(futures):
+            index = futures[future]
+            outcomes[index] = future.result()
+            if outcomes[index]["steps"] is None:
+                failed = index
+                break
+    finally:
+        # 4. 在请求线程中记录已完成小问的 usage；失败时取消尚未开始的小问，
+        #    正在进行的调用（受 deadline 超时约束）结束后由工作线程记录
+        for future, index in futures.items():
+            if index not in outcomes and not future.cancel():
+                future.add_done_callback(record_late)
+        for outcome in outcomes.values():
+            _record_part_usage(outcome, model, solve_version, problem_type)
+
+    if failed is not None:
+        part, outcome = parts[failed], outcomes[failed]
+        error = outcome.get("exception")
+        if isinstance(error, DeadlineExceeded):
+            raise error
+        if error is not None:
+            check_deadline("小问解答")
+            logger.error(f"❌ Claude API 调用失败: {error}")
+            raise RuntimeError(f"小问拆分 Pipeline 失败: {error}")
+        logger.error(f"❌ 小问 {part['label']} 解答多次校验失败: {outcome['error']}")
+        raise RuntimeError(f"小问拆分 Pipeline 失败: 小问 {part['label']} {outcome['error']}")
+    part_steps = [outcomes[index]["steps"] for index in range(len(parts))]
+
+    problem["solution_steps"] = merge_solution_steps(parts, part_steps)
+    result_store.put(
+        cache_key, problem,
+        source="split", digest=digest, prompt_version=f"{extract_version}+{solve_version}", model=model,
+    )
+    shadow_evaluator.submit("split", problem)
+
+    logger.info(f"✅ 小问拆分 Pipeline 成功完成（{len(parts)} 个小问，problem_type: {problem['problem_type']}）")
+    return problem
@@ -0,0 +1,153 @@
+"""预计算的轨迹采样点（附加到 animation_instructions.trajectory）
+
+前端原先在 animations/projectile_motion.js / free_fall.js 中逐帧计算（自由落体用 Euler 积分）并把每一帧追加到轨迹线。
+这里在后端用闭式运动学一次算出整条轨迹：
+
+    x(t) = x0 + vx·t
+    y(t) = h0 + vy0·t - g·t²/2
+
+采样是自适应的：先取关键时刻（起点、最高点、落地），再把弦与曲线最大偏离超过容差的区间按时间二分。
+匀加速轨迹在 [t0, t1] 上与弦的最大偏离为 g·Δt²/8·|Δx|/弦长（出现在中点），
+所以最高点附近（弦接近水平）点多，陡峭、接近直线的段点少；竖直运动整条轨迹在一条直线上，只保留关键点。
+容差按画面像素给出（TRAJECTORY_TOLERANCE_PX / scale 米），画出的轨迹线与真实曲线的偏差不超过该像素数。
+
+前端在相邻两点之间按匀加速插值（加速度为 (0, -g)），位置和速度都是精确的，不必逐帧积分。
+
+环境变量：
+- TRAJECTORY_SAMPLES: 是否附加轨迹采样点（可选，默认 true）
+- TRAJECTORY_TOLERANCE_PX: 轨迹线允许的最大偏差（像素，可选，默认 0.5）
+- TRAJECTORY_MAX_POINTS: 每条轨迹最多的采样点数（可选，默认 200）
+"""
+
+import math
+import os
+from typing import Any, Dict, List, Optional
+
+# 采样点的小数位数：时间 0.1ms，坐标 1mm
+TIME_DIGITS = 4
+POSITION_DIGITS = 3
+
+# 预计算轨迹的动画类型（均为竖直方向匀加速的抛体）
+TRAJECTORY_TYPES = ("projectile", "free_fall")
+
+# Canvas 默认大小约 800x600，留边距后的可用范围（像素），以及 scale（像素/米）的上下限
+CANVAS_WIDTH = 700
+CANVAS_HEIGHT = 500
+MIN_SCALE = 10
+MAX_SCALE = 30
+
+
+def is_trajectory_enabled() -> bool:
+    return os.environ.get("TRAJECTORY_SAMPLES", "true").lower() in ("true", "1", "yes")
+
+
+def get_trajectory_settings() -> Dict[str, float]:
+    try:
+        tolerance_px = float(os.environ.get("TRAJECTORY_TOLERANCE_PX", "0.5"))
+    except ValueError:
+        tolerance_px = 0.5
+    try:
+        max_points = int(os.environ.get("TRAJECTORY_MAX_POINTS", "200"))
+    except ValueError:
+        max_points = 200
+    return {"tolerance_px": max(tolerance_px, 0.01), "max_points": max(max_points, 2)}
+
+
+def _chord_deviation(t0: float, t1: float, vx: float, vy0: float, g: float) -> float:
+    """[t0, t1] 段的弦与轨迹的最大距离（米）"""
+    dt = t1 - t0
+    dx = vx * dt
+    dy = vy0 * dt - g * (t1 * t1 - t0 * t0) / 2
+    length = math.hypot(dx, dy)
+    if length == 0:
+        return 0.0
+    return g * dt * dt / 8 * abs(dx) / length
+
+
+def sample_trajectory(v0: float, angle: float, g: float, h0: float, duration: float, x0: float = 0,
+                      tolerance: float = 0.02, max_points: int = 200) -> Dict[str, Any]:
+    """闭式运动学 + 自适应采样
+
+    Args:
+        v0, angle, g, h0, x0: 初速度（m/s）、抛射角（度）、重力加速度、初始高度和水平位置（m）
+        duration: 没有落地点（如从地面水平抛出）时的采样时长（秒）
+        tolerance: 轨迹线允许的最大偏差（米）
+        max_points: 最多的采样点数
+
+    Returns:
+        {"tolerance", "t": [...], "x": [...], "y": [...], "events": [{"type": "apex"/"impact", "t", "x", "y", ...}]}
+    """
+    angle_rad = math.radians(angle)
+    vx = v0 * math.cos(angle_rad)
+    vy0 = v0 * math.sin(angle_rad)
+    # 竖直抛出时 cos(90°) 不严格为 0，避免出现极小的水平漂移
+    if abs(vx) < 1e-9 * max(v0, 1):
+        vx = 0.0
+
+    def position(t: float) -> tuple:
+        return x0 + vx * t, h0 + vy0 * t - g * t * t / 2
+
+    events = []
+    discriminant = vy0 * vy0 + 2 * g * h0
+    t_impact = (vy0 + math.sqrt(discriminant)) / g if g > 0 and discriminant >= 0 else None
+    if t_impact is not None and t_impact > 0:
+        t_end = t_impact
+    else:
+        t_impact, t_end = None, max(duration, 0.1)
+
+    t_apex = vy0 / g if g > 0 else None
+    if t_apex is not None and 0 < t_apex < t_end:
+        x, y = position(t_apex)
+        events.append({"type": "apex", "t": t_apex, "x": x, "y": y, "speed": abs(vx)})
+    if t_impact is not None:
+        x, y = position(t_impact)
+        events.append({"type": "impact", "t": t_impact, "x": x, "y": 0.0,
+                       "speed": math.hypot(vx, vy0 - g * t_impact)})
+
+    # 关键时刻之间按弦偏离二分（按时间顺序处理，点数达到上限时剩余区间不再细分）
+    times = [0.0] + [event["t"] for event in events if event["t"] < t_end] + [t_end]
+    samples: List[float] = [times[0]]
+    pending = [(t0, t1) for t0, t1 in zip(times[:-1], times[1:])][::-1]
+    while pending:
+        t0, t1 = pending.pop()
+        if len(samples) + len(pending) + 1 < max_points and _chord_deviation(t0, t1, vx, vy0, g) > tolerance:
+            middle = (t0 + t1) / 2
+            pending.extend([(middle, t1), (t0, middle)])
+        else:
+            samples.append(t1)
+
+    xs, ys = zip(*(position(t) for t in samples))
+    if t_impact is not None:
+        ys = ys[:-1] + (0.0,)
+    return {
+        "tolerance": round(tolerance, 4),
+        "t": [round(t, TIME_DIGITS) for t in samples],
+        "x": [round(x, POSITION_DIGITS) for x in xs],
+        "y": [round(y, POSITION_DIGITS) for y in ys],
+        "events": [
+            {key: round(value, TIME_DIGITS if key == "t" else POSITION_DIGITS) if key != "type" else value
+             for key, value in event.items()}
+            for event in events
+        ],
+    }
+
+
+def build_trajectory(instructions: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """按动画指令（type / initial_speed / angle / gravity / initial_x / initial_y / duration / scale）生成采样点
+
+    未启用或动画类型不是抛体 / 自由落体时返回 None。
+    """
+    if not is_trajectory_enabled() or instructions.get("type") not in TRAJECTORY_TYPES:
+        return None
+    settings = get_trajectory_settings()
+    scale = instructions.get("scale") or 20
+    return sample_trajectory(
+        v0=float(instructions.get("initial_speed") or 0),
+        angle=float(instructions.get("angle") or 0),
+        g=float(instructions.get("gravity") or 9.8),
+        h0=float(instructions.get("initial_y") or 0),
+        duration=float(instructions.get("duration") or 2.0),
+        x0=float(instructions.get("initial_x") or 0),
+        tolerance=settings["tolerance_px"] / scale,
+        max_points=int(settings["max_points"]),
+    )
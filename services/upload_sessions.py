@@ -0,0 +1,427 @@
+"""可续传的分块上传会话
+
+移动网络下上传几 MB 的照片时，multipart 上传中途断线就只能从头再传。分块上传协议：
+
+1. POST /upload/sessions 声明要上传的文件（文件名 + 字节数），创建会话
+2. PUT /upload/sessions/<id>/files/<index>，请求头 Upload-Offset 指明这一块的起始位置；
+   断线后 GET /upload/sessions/<id> 查询已收到的字节数，从那里继续
+3. POST /upload/sessions/<id>/finalize 结束上传并调用 process_image
+
+每个文件的数据按到达顺序写入 IngestStream（见 services/ingest.py）：摘要、文件头探测
+（格式不对 / 解压炸弹在第一块就拒绝）都在接收时增量完成，原图写入 UPLOAD_FOLDER 下的会话目录。
+分块文件只在 PUT 写入和 finalize 读取期间打开，空闲的会话不占用文件描述符。
+finalize 时由 IngestStream 直接取得 IngestedImage 交给 pipeline，不再解析请求体或重新计算摘要。
+
+会话的总占用有上限（按声明的文件大小预占）：分块文件在 finalize 时删除，原图随后留在内存中交给 pipeline，
+预占的容量一直保留到 finalize 完成、图片释放为止。空闲超过 TTL 的会话会被清理。
+finalize 的结果在会话中保留到过期（只保留响应，不再持有图片），响应丢失时重复 finalize 直接返回同一结果。
+
+环境变量：
+- UPLOAD_SESSION_DIR: 会话目录（可选，默认 uploads/sessions）
+- UPLOAD_SESSION_SPOOL_MB: 会话目录的总容量（MB，可选，默认 512）
+- UPLOAD_SESSION_TTL: 会话空闲多久后过期（秒，可选，默认 900）
+"""
+
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from config import Config
+from services.image_probe import ImageRejected
+from services.ingest import IngestedImage, IngestStream
+
+logger = logging.getLogger(__name__)
+
+# 从请求体读取分块数据的大小
+READ_CHUNK_SIZE = 64 * 1024
+
+# 等待同一会话上一个请求结束的最长时间（秒）；断线后服务端可能还在读旧连接
+SESSION_LOCK_TIMEOUT = 5.0
+
+SESSION_STATES = ("open", "finalizing", "done")
+
+
+def get_session_dir() -> Path:
+    return Path(os.environ.get("UPLOAD_SESSION_DIR", "").strip() or os.path.join(Config.UPLOAD_FOLDER, "sessions"))
+
+
+def get_session_spool_limit() -> int:
+    try:
+        return max(int(float(os.environ.get("UPLOAD_SESSION_SPOOL_MB", "512")) * 1024 * 1024), 0)
+    except ValueError:
+        return 512 * 1024 * 1024
+
+
+def get_session_ttl() -> float:
+    try:
+        return max(float(os.environ.get("UPLOAD_SESSION_TTL", "900")), 1.0)
+    except ValueError:
+        return 900.0
+
+
+class SessionError(Exception):
+    """分块上传会话的请求不合法（偏移不一致、会话不存在 / 已满等）"""
+
+    def __init__(self, code: str, message: str, status: int = 400, details: Optional[dict] = None):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+        self.status = status
+        self.details = details or {}
+
+
+class PartFile:
+    """会话的分块文件，作为 IngestStream 的 spool
+
+    只在 write_chunk 期间以追加方式打开（见 opened），finalize 时一次读出；
+    其余时间不持有文件描述符，大量空闲会话不会耗尽进程的文件描述符。
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._file = None
+        path.touch()
+
+    @contextmanager
+    def opened(self) -> Iterator["PartFile"]:
+        self._file = open(self.path, "ab")
+        try:
+            yield self
+        finally:
+            self.close()
+
+    def write(self, data) -> int:
+        if self._file is None:
+            raise ValueError(f"分块文件未打开: {self.path}")
+        return self._file.write(data)
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        # IngestStream.finish 先 seek(0) 再 read()；read 总是从头读取整个文件
+        return 0
+
+    def read(self) -> bytes:
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class SessionFile:
+    """会话中的一个文件：声明的大小、分块文件和接收它的 IngestStream（finalize 完成后释放）"""
+
+    def __init__(self, index: int, filename: str, size: int, part: PartFile, stream: IngestStream):
+        self.index = index
+        self.filename = filename
+        self.size = size
+        self.part = part
+        self.stream: Optional[IngestStream] = stream
+        self._received = 0
+
+    @property
+    def received(self) -> int:
+        return self.stream.received if self.stream is not None else self._received
+
+    def release(self) -> None:
+        """关闭 IngestStream 并丢弃它缓存的 IngestedImage（原图字节）"""
+        if self.stream is not None:
+            self._received = self.stream.received
+            self.stream.close()
+            self.stream = None
+
+    @property
+    def complete(self) -> bool:
+        return self.received == self.size
+
+    def summary(self) -> Dict[str, Any]:
+        return {"index": self.index, "filename": self.filename, "size": self.size, "received": self.received}
+
+
+class UploadSession:
+    def __init__(self, session_id: str, directory: Path, files: List[SessionFile]):
+        self.id = session_id
+        self.directory = directory
+        self.files = files
+        self.state = "open"
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        self.lock = threading.Lock()
+        self.spool_released = False
+        # finalize 的结果：(响应 JSON, 状态码)
+        self.result: Optional[Tuple[dict, int]] = None
+
+    @property
+    def total_size(self) -> int:
+        return sum(f.size for f in self.files)
+
+    def touch(self) -> None:
+        self.updated_at = time.time()
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "session_id": self.id,
+            "state": self.state,
+            "files": [f.summary() for f in self.files],
+            "expires_in": max(round(self.updated_at + get_session_ttl() - time.time()), 0),
+        }
+
+
+class UploadSessionStore:
+    """进程内的会话表（进程重启后会话失效，客户端收到 404 后重新创建）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sessions: Dict[str, UploadSession] = {}
+        # 按声明大小预占的会话目录容量
+        self._reserved = 0
+        self._stats = {
+            "created": 0,
+            "finalized": 0,
+            "expired": 0,
+            "aborted": 0,
+            "rejected": 0,
+            "chunks": 0,
+            "resumed_chunks": 0,
+            "duplicate_bytes": 0,
+            "interrupted_chunks": 0,
+        }
+
+    # ---------- 会话生命周期 ----------
+
+    def create(self, files: Sequence[Tuple[str, int]], limits: dict) -> UploadSession:
+        """创建会话并为声明的文件预占容量
+
+        会话总是以 raw 模式接收（原图写入会话目录）：慢速上传可能持续几分钟，
+        不在内存中长时间持有 base64 缓冲区。
+
+        Raises:
+            SessionError: 会话目录容量不足（503）
+        """
+        total = sum(size for _, size in files)
+        capacity = get_session_spool_limit()
+        self.purge_expired()
+        with self._lock:
+            if capacity and self._reserved + total > capacity:
+                raise SessionError(
+                    "session_spool_full", "上传会话过多，请稍后重试", status=503,
+                    details={"available_bytes": max(capacity - self._reserved, 0)},
+                )
+            self._reserved += total
+
+        session_id = uuid.uuid4().hex
+        directory = get_session_dir() / session_id
+        try:
+            directory.mkdir(parents=True, exist_ok=False)
+            session_files = []
+            for index, (filename, size) in enumerate(files):
+                part = PartFile(directory / f"{index}.part")
+                stream = IngestStream("raw", size, limits, spool=part)
+                session_files.append(SessionFile(index, filename, size, part, stream))
+        except Exception:
+            shutil.rmtree(directory, ignore_errors=True)
+            with self._lock:
+                self._reserved -= total
+            raise
+
+        session = UploadSession(session_id, directory, session_files)
+        with self._lock:
+            self._sessions[session_id] = session
+            self._stats["created"] += 1
+        logger.info(f"创建上传会话 {session_id}: {len(files)} 个文件，共 {total} 字节")
+        return session
+
+    def get(self, session_id: str) -> UploadSession:
+        """
+        Raises:
+            SessionError: 会话不存在或已过期（404）
+        """
+        self.purge_expired()
+        with self._lock:
+            session = self._sessions.get(session_id)
+        if session is None:
+            raise SessionError("session_not_found", "上传会话不存在或已过期", status=404)
+        return session
+
+    def _release_spool(self, session: UploadSession) -> None:
+        """删除会话的分块文件、释放图片，归还预占容量（可重复调用）"""
+        with self._lock:
+            if session.spool_released:
+                return
+            session.spool_released = True
+            self._reserved -= session.total_size
+        for f in session.files:
+            f.release()
+        shutil.rmtree(session.directory, ignore_errors=True)
+
+    def remove(self, session: UploadSession, reason: str = "aborted") -> None:
+        with self._lock:
+            if self._sessions.pop(session.id, None) is None:
+                return
+            if reason in self._stats:
+                self._stats[reason] += 1
+        self._release_spool(session)
+
+    def purge_expired(self) -> int:
+        """清理空闲超过 TTL 的会话（正在 finalize 的除外）"""
+        deadline = time.time() - get_session_ttl()
+        with self._lock:
+            expired = [s for s in self._sessions.values() if s.updated_at < deadline and s.state != "finalizing"]
+        for session in expired:
+            logger.info(f"上传会话 {session.id} 已过期（state={session.state}）")
+            self.remove(session, reason="expired")
+        return len(expired)
+
+    # ---------- 分块 ----------
+
+    def write_chunk(self, session: UploadSession, index: int, offset: int, read: Callable[[int], bytes]) -> int:
+        """把一个分块写入会话中的第 index 个文件
+
+        边读边写：连接中途断开时已读到的数据保留，客户端查询偏移后从断点继续。
+        重发的分块与已收到的数据重叠时跳过重叠部分。
+
+        Args:
+            offset: 分块在文件中的起始位置（Upload-Offset）
+            read: 读取请求体的函数（如 request.stream.read）
+
+        Returns:
+            写入后已收到的字节数
+
+        Raises:
+            SessionError: 文件序号 / 偏移不合法、会话已结束或有其他请求正在写入
+            ImageRejected: 文件头探测不通过（格式不对 / 尺寸过大 / 疑似解压炸弹）
+        """
+        if not 0 <= index < len(session.files):
+            raise SessionError("invalid_file_index", f"文件序号超出范围: {index}", status=404)
+        if not session.lock.acquire(timeout=SESSION_LOCK_TIMEOUT):
+            raise SessionError("upload_in_progress", "该会话有其他请求正在写入", status=409)
+        try:
+            if session.state != "open":
+                raise SessionError("session_closed", "上传会话已结束", status=409)
+            target = session.files[index]
+            received = target.received
+            if offset > received:
+                raise SessionError(
+                    "offset_mismatch", f"偏移 {offset} 超过已收到的 {received} 字节", status=409,
+                    details={"received": received},
+                )
+            skip = received - offset
+            with self._lock:
+                self._stats["chunks"] += 1
+                self._stats["resumed_chunks"] += skip > 0
+            try:
+                with target.part.opened():
+                    self._copy_chunk(target, skip, read)
+            except (SessionError, ImageRejected):
+                raise
+            except Exception:
+                # 连接中断：保留已写入的数据
+                with self._lock:
+                    self._stats["interrupted_chunks"] += 1
+                raise
+            finally:
+                session.touch()
+            return target.received
+        finally:
+            session.lock.release()
+
+    def _copy_chunk(self, target: SessionFile, skip: int, read: Callable[[int], bytes]) -> None:
+        """从请求体读取分块追加到文件（跳过与已收到数据重叠的前 skip 字节）"""
+        while True:
+            chunk = read(READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            if skip:
+                dropped = min(skip, len(chunk))
+                skip -= dropped
+                with self._lock:
+                    self._stats["duplicate_bytes"] += dropped
+                chunk = chunk[dropped:]
+                if not chunk:
+                    continue
+            if target.received + len(chunk) > target.size:
+                raise SessionError(
+                    "size_exceeded", f"文件超过声明的 {target.size} 字节", status=400,
+                    details={"received": target.received},
+                )
+            target.stream.write(chunk)
+            if target.stream.error is not None:
+                raise target.stream.error
+
+    # ---------- finalize ----------
+
+    def begin_finalize(self, session: UploadSession) -> Optional[List[IngestedImage]]:
+        """结束写入，取得交给 pipeline 的图片
+
+        Returns:
+            IngestedImage 列表；会话已经 finalize 过时返回 None（使用 session.result）
+
+        Raises:
+            SessionError: 文件未传完（409）或正在 finalize（409）
+            ImageRejected: 文件头探测不通过
+        """
+        if not session.lock.acquire(timeout=SESSION_LOCK_TIMEOUT):
+            raise SessionError("upload_in_progress", "该会话有其他请求正在写入", status=409)
+        try:
+            if session.state == "done":
+                return None
+            if session.state == "finalizing":
+                raise SessionError("session_finalizing", "上传会话正在处理", status=409)
+            incomplete = [f.summary() for f in session.files if not f.complete]
+            if incomplete:
+                raise SessionError(
+                    "upload_incomplete", "还有文件没有传完", status=409, details={"files": incomplete},
+                )
+            images = [f.stream.finish(f.filename) for f in session.files]
+            session.state = "finalizing"
+        finally:
+            session.lock.release()
+        # 原图已在 IngestedImage 中，分块文件可以立即删除；预占的容量保留到图片释放（complete_finalize）
+        shutil.rmtree(session.directory, ignore_errors=True)
+        return images
+
+    def abandon_finalize(self, session: UploadSession) -> None:
+        """finalize 未完成（客户端断开）：回到 open，下次 finalize 重新处理同一批图片
+
+        IngestStream.finish 的结果会被缓存，分块文件删除后仍可再次取得 IngestedImage；
+        图片仍在内存中，预占的容量继续保留到会话完成或过期。
+        """
+        session.state = "open"
+        session.touch()
+
+    def complete_finalize(self, session: UploadSession, result: Tuple[dict, int]) -> None:
+        """保存结果并释放图片：之后重复 finalize 只返回结果，会话不再占用内存和预占容量"""
+        session.result = result
+        session.state = "done"
+        session.touch()
+        with self._lock:
+            self._stats["finalized"] += 1
+        self._release_spool(session)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            states = {state: 0 for state in SESSION_STATES}
+            for session in self._sessions.values():
+                states[session.state] += 1
+            return {
+                "sessions": len(self._sessions),
+                "states": states,
+                "spool_reserved_bytes": self._reserved,
+                "spool_capacity_bytes": get_session_spool_limit(),
+                **self._stats,
+            }
+
+
+# 全局单例
+upload_sessions = UploadSessionStore()
+
+
+def get_upload_session_stats() -> Dict[str, Any]:
+    return upload_sessions.stats()
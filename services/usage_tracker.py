@@ -0,0 +1,239 @@
+"""Token 用量统计与预算控制
+
+记录每次 Claude 调用的 input/output tokens（按 pipeline、model、problem_type 细分），
+提供滚动窗口（小时 / 天）聚合，并根据配置的 token 预算给出降级档位：
+
+- full: 预算充足，正常调用
+- slim: 预算所剩不多，改用精简模型 / 更小的 max_tokens
+- rule_engine: 预算耗尽，尽量走规则引擎（不消耗 Claude tokens）
+
+环境变量：
+- TOKEN_BUDGET_HOURLY: 每小时 token 预算（可选，0 或不设表示不限制）
+- TOKEN_BUDGET_DAILY: 每天 token 预算（可选，0 或不设表示不限制）
+- TOKEN_BUDGET_SLIM_RATIO: 剩余预算低于该比例时切换到 slim（可选，默认 0.2）
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+# 滚动窗口（秒）
+USAGE_WINDOWS = {
+    "hour": 3600,
+    "day": 86400,
+}
+
+BUDGET_TIERS = ("full", "slim", "rule_engine")
+
+# 当前线程正在统计的单请求用量（见 track_request_usage）
+_request_local = threading.local()
+
+
+def _get_int_env(name: str, default: int = 0) -> int:
+    """读取整数环境变量，非法值按默认值处理"""
+    raw = os.environ.get(name, "").strip()
+    if not raw:
+        return default
+    try:
+        return int(raw)
+    except ValueError:
+        logger.warning(f"环境变量 {name}={raw!r} 不是整数，使用默认值 {default}")
+        return default
+
+
+def get_token_budgets() -> Dict[str, int]:
+    """获取各窗口的 token 预算（0 表示不限制）"""
+    return {
+        "hour": _get_int_env("TOKEN_BUDGET_HOURLY"),
+        "day": _get_int_env("TOKEN_BUDGET_DAILY"),
+    }
+
+
+def get_slim_ratio() -> float:
+    """剩余预算比例低于该值时切换到 slim 档位"""
+    try:
+        return float(os.environ.get("TOKEN_BUDGET_SLIM_RATIO", "0.2"))
+    except ValueError:
+        return 0.2
+
+
+def usage_from_response(response: Any) -> tuple[int, int]:
+    """从 Anthropic 响应中提取 (input_tokens, output_tokens)，缺失时返回 (0, 0)"""
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return 0, 0
+    return (
+        int(getattr(usage, "input_tokens", 0) or 0),
+        int(getattr(usage, "output_tokens", 0) or 0),
+    )
+
+
+class UsageTracker:
+    """线程安全的 token 用量记录器
+
+    每次调用保存一条事件（时间戳 + 维度 + tokens），只保留最长窗口内的事件；
+    另外维护进程启动以来的累计值。
+    """
+
+    def __init__(self, retention_seconds: int = max(USAGE_WINDOWS.values())):
+        self._lock = threading.Lock()
+        self._events: deque = deque()
+        self._retention = retention_seconds
+        self._lifetime: Dict[str, int] = {"requests": 0, "input_tokens": 0, "output_tokens": 0}
+
+    def record(
+        self,
+        pipeline: str,
+        model: str,
+        input_tokens: int,
+        output_tokens: int,
+        problem_type: Optional[str] = None,
+    ) -> None:
+        """记录一次调用的 token 用量"""
+        now = time.time()
+        event = (now, pipeline, model, problem_type or "unknown", input_tokens, output_tokens)
+
+        request_usage = getattr(_request_local, "usage", None)
+        if request_usage is not None:
+            request_usage["input_tokens"] += input_tokens
+            request_usage["output_tokens"] += output_tokens
+
+        with self._lock:
+            self._events.append(event)
+            self._lifetime["requests"] += 1
+            self._lifetime["input_tokens"] += input_tokens
+            self._lifetime["output_tokens"] += output_tokens
+            self._prune(now)
+
+        logger.info(
+            f"📊 Token 用量: pipeline={pipeline}, model={model}, "
+            f"input={input_tokens}, output={output_tokens}"
+        )
+
+    def _prune(self, now: float) -> None:
+        cutoff = now - self._retention
+        while self._events and self._events[0][0] < cutoff:
+            self._events.popleft()
+
+    def window_total(self, seconds: int) -> int:
+        """统计最近 seconds 秒内消耗的总 tokens（input + output）"""
+        cutoff = time.time() - seconds
+        with self._lock:
+            return sum(e[4] + e[5] for e in self._events if e[0] >= cutoff)
+
+    def summary(self) -> Dict[str, Any]:
+        """按窗口聚合，并按 pipeline / model / problem_type 细分"""
+        now = time.time()
+        with self._lock:
+            self._prune(now)
+            events = list(self._events)
+            lifetime = dict(self._lifetime)
+
+        windows = {}
+        for name, seconds in USAGE_WINDOWS.items():
+            cutoff = now - seconds
+            totals = {"requests": 0, "input_tokens": 0, "output_tokens": 0}
+            breakdown: Dict[str, Dict[str, Dict[str, int]]] = {
+                "pipeline": {}, "model": {}, "problem_type": {},
+            }
+            for ts, pipeline, model, problem_type, inp, out in events:
+                if ts < cutoff:
+                    continue
+                totals["requests"] += 1
+                totals["input_tokens"] += inp
+                totals["output_tokens"] += out
+                for dim, key in (("pipeline", pipeline), ("model", model), ("problem_type", problem_type)):
+                    bucket = breakdown[dim].setdefault(
+                        key, {"requests": 0, "input_tokens": 0, "output_tokens": 0}
+                    )
+                    bucket["requests"] += 1
+                    bucket["input_tokens"] += inp
+                    bucket["output_tokens"] += out
+            windows[name] = {"totals": totals, **breakdown}
+
+        return {"windows": windows, "lifetime": lifetime}
+
+    def reset(self) -> None:
+        """清空所有记录（调试用）"""
+        with self._lock:
+            self._events.clear()
+            self._lifetime = {"requests": 0, "input_tokens": 0, "output_tokens": 0}
+
+
+# 进程级单例
+usage_tracker = UsageTracker()
+
+
+@contextmanager
+def track_request_usage() -> Iterator[Dict[str, int]]:
+    """统计当前线程在 with 块内消耗的 tokens（用于按请求 / 按路径核算成本）
+
+    用法：
+        with track_request_usage() as usage:
+            call_claude_pipeline(...)
+        usage["input_tokens"], usage["output_tokens"]
+    """
+    previous = getattr(_request_local, "usage", None)
+    usage = {"input_tokens": 0, "output_tokens": 0}
+    _request_local.usage = usage
+    try:
+        yield usage
+    finally:
+        _request_local.usage = previous
+        if previous is not None:
+            previous["input_tokens"] += usage["input_tokens"]
+            previous["output_tokens"] += usage["output_tokens"]
+
+
+def record_usage(
+    pipeline: str,
+    model: str,
+    response: Any,
+    problem_type: Optional[str] = None,
+) -> tuple[int, int]:
+    """从 Anthropic 响应中提取 usage 并记录，返回 (input_tokens, output_tokens)"""
+    input_tokens, output_tokens = usage_from_response(response)
+    usage_tracker.record(pipeline, model, input_tokens, output_tokens, problem_type)
+    return input_tokens, output_tokens
+
+
+def get_budget_status() -> Dict[str, Any]:
+    """计算各窗口的预算使用情况和当前降级档位"""
+    budgets = get_token_budgets()
+    slim_ratio = get_slim_ratio()
+
+    windows = {}
+    tier = "full"
+    for name, seconds in USAGE_WINDOWS.items():
+        budget = budgets.get(name, 0)
+        used = usage_tracker.window_total(seconds)
+        if budget <= 0:
+            windows[name] = {"budget": None, "used": used, "remaining_ratio": None}
+            continue
+
+        remaining_ratio = max(budget - used, 0) / budget
+        windows[name] = {"budget": budget, "used": used, "remaining_ratio": round(remaining_ratio, 4)}
+
+        if remaining_ratio <= 0:
+            window_tier = "rule_engine"
+        elif remaining_ratio < slim_ratio:
+            window_tier = "slim"
+        else:
+            window_tier = "full"
+
+        # 取所有窗口中最严格的档位
+        if BUDGET_TIERS.index(window_tier) > BUDGET_TIERS.index(tier):
+            tier = window_tier
+
+    return {"tier": tier, "slim_ratio": slim_ratio, "windows": windows}
+
+
+def get_budget_tier() -> str:
+    """当前降级档位：full / slim / rule_engine"""
+    return get_budget_status()["tier"]
@@ -106,7 +106,8 @@ class AnimationEngine {
         g: g,
         mass: mass,
         bounce: raw.bounce || false,
-        bounceLoss: raw.bounceLoss || 0.8
+        bounceLoss: raw.bounceLoss || 0.8,
+        trajectory: raw.trajectory  // 后端预计算的轨迹采样点（可选）
       };
     } else if (motionType === 'uniform') {
       subType = 'uniform';
@@ -150,7 +151,8 @@ class AnimationEngine {
         angle: angle,
         g: g,
         h0: h0,
-        mass: mass
+        mass: mass,
+        trajectory: raw.trajectory  // 后端预计算的轨迹采样点（可选）
       };
     }
 
@@ -0,0 +1,157 @@
+/**
+ * 上传前的图片缩放 / 重新压缩
+ *
+ * 手机拍的题目照片 4-8MB，校园 Wi-Fi 下上传本身常比解题还慢，而服务端最终只用约 1-2MP。
+ * 这里按 GET /upload/config 下发的目标（与 services/image_preprocess.py 的分辨率档位一致）
+ * 在浏览器中按 EXIF 旋正、缩放并重新编码为 JPEG / WebP。
+ *
+ * 同一个文件有两种加载方式：
+ * - Web Worker 脚本：支持 OffscreenCanvas 的浏览器在 worker 中解码、缩放、编码，不阻塞页面
+ * - 页面中的普通脚本：提供 window.ImageCompress，不支持 OffscreenCanvas 时在主线程完成
+ */
+
+(function (scope) {
+  'use strict';
+
+  // 只处理浏览器能可靠解码的格式（GIF 等原样上传，由服务端判断）
+  const COMPRESSIBLE_TYPES = ['image/jpeg', 'image/png', 'image/webp'];
+
+  /**
+   * 同时满足长边上限和像素上限的目标尺寸（只缩小不放大），与服务端 target_size 相同
+   */
+  function targetSize(width, height, target) {
+    let scale = 1;
+    if (target.max_long_edge > 0) {
+      scale = Math.min(scale, target.max_long_edge / Math.max(width, height));
+    }
+    if (target.max_pixels > 0) {
+      scale = Math.min(scale, Math.sqrt(target.max_pixels / (width * height)));
+    }
+    if (scale >= 1) {
+      return [width, height];
+    }
+    return [Math.max(Math.floor(width * scale), 1), Math.max(Math.floor(height * scale), 1)];
+  }
+
+  function createCanvas(width, height) {
+    if (typeof OffscreenCanvas !== 'undefined') {
+      return new OffscreenCanvas(width, height);
+    }
+    const canvas = document.createElement('canvas');
+    canvas.width = width;
+    canvas.height = height;
+    return canvas;
+  }
+
+  function canvasToBlob(canvas, type, quality) {
+    if (typeof canvas.convertToBlob === 'function') {
+      return canvas.convertToBlob({ type, quality });
+    }
+    return new Promise((resolve, reject) => {
+      canvas.toBlob((blob) => (blob ? resolve(blob) : reject(new Error('图片编码失败'))), type, quality);
+    });
+  }
+
+  /**
+   * 解码图片并按 EXIF 旋正（重新编码会丢掉 EXIF，必须在这里应用方向）
+   *
+   * @returns {Promise<{source, width, height, release: Function}>}
+   */
+  async function decode(blob) {
+    if (typeof createImageBitmap === 'function') {
+      const bitmap = await createImageBitmap(blob, { imageOrientation: 'from-image' });
+      return { source: bitmap, width: bitmap.width, height: bitmap.height, release: () => bitmap.close() };
+    }
+    // 主线程回退：<img> 解码（浏览器默认按 EXIF 旋正）
+    const url = URL.createObjectURL(blob);
+    const img = new Image();
+    img.src = url;
+    try {
+      await img.decode();
+    } catch (err) {
+      URL.revokeObjectURL(url);
+      throw err;
+    }
+    return { source: img, width: img.naturalWidth, height: img.naturalHeight, release: () => URL.revokeObjectURL(url) };
+  }
+
+  /**
+   * 缩放到目标尺寸：先逐次减半到目标的 2 倍以内，再一次缩放到位
+   * （一步缩小太多倍时浏览器的插值会产生明显锯齿，细小的文字笔画会断开）
+   */
+  function drawScaled(image, outWidth, outHeight) {
+    let current = image.source;
+    let width = image.width;
+    let height = image.height;
+    while (width > outWidth * 2 && height > outHeight * 2) {
+      width = Math.ceil(width / 2);
+      height = Math.ceil(height / 2);
+      const half = createCanvas(width, height);
+      const halfCtx = half.getContext('2d');
+      halfCtx.imageSmoothingQuality = 'high';
+      halfCtx.drawImage(current, 0, 0, width, height);
+      current = half;
+    }
+
+    const canvas = createCanvas(outWidth, outHeight);
+    const ctx = canvas.getContext('2d');
+    // 透明背景铺白底（直接编码为 JPEG 时透明区域会变黑、盖住文字）
+    ctx.fillStyle = '#fff';
+    ctx.fillRect(0, 0, outWidth, outHeight);
+    ctx.imageSmoothingQuality = 'high';
+    ctx.drawImage(current, 0, 0, outWidth, outHeight);
+    return canvas;
+  }
+
+  /**
+   * 压缩一张图片
+   *
+   * @param {Blob} file - 用户选择的图片
+   * @param {Object} target - /upload/config 的 resize 字段
+   * @returns {Promise<Object>} { compressed, blob, width, height, originalWidth, originalHeight, elapsedMs }；
+   *   compressed 为 false 时应上传原图（不需要缩放、格式不支持或结果不更小）
+   */
+  async function compressImage(file, target) {
+    const started = Date.now();
+    if (!COMPRESSIBLE_TYPES.includes(file.type)) {
+      return { compressed: false, reason: 'unsupported_type' };
+    }
+
+    const image = await decode(file);
+    try {
+      const [width, height] = targetSize(image.width, image.height, target);
+      const result = { originalWidth: image.width, originalHeight: image.height, width, height };
+      // 尺寸不变且已是目标格式：重新编码只会多一次有损压缩
+      if (width === image.width && height === image.height && file.type === target.mime_type) {
+        return { ...result, compressed: false, reason: 'within_target' };
+      }
+
+      const canvas = drawScaled(image, width, height);
+      let blob = await canvasToBlob(canvas, target.mime_type, target.quality);
+      // 不支持编码 WebP 的浏览器会退回 PNG，改用 JPEG
+      if (blob.type !== target.mime_type) {
+        blob = await canvasToBlob(canvas, 'image/jpeg', target.quality);
+      }
+      if (blob.size >= file.size) {
+        return { ...result, compressed: false, reason: 'not_smaller' };
+      }
+      return { ...result, compressed: true, blob, elapsedMs: Date.now() - started };
+    } finally {
+      image.release();
+    }
+  }
+
+  const isWorker = typeof WorkerGlobalScope !== 'undefined' && scope instanceof WorkerGlobalScope;
+
+  if (isWorker) {
+    // worker 协议：{ id, file, target } -> { id, ok, result } / { id, ok: false, error }
+    scope.onmessage = (event) => {
+      const { id, file, target } = event.data;
+      compressImage(file, target)
+        .then((result) => scope.postMessage({ id, ok: true, result }))
+        .catch((err) => scope.postMessage({ id, ok: false, error: err && err.message ? err.message : String(err) }));
+    };
+  } else {
+    scope.ImageCompress = { targetSize, compressImage };
+  }
+})(typeof self !== 'undefined' ? self : this);
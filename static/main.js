@@ -16,6 +16,108 @@ const submitButton = uploadForm.querySelector('button[type="submit"]');
 
 controls.style.display = 'none';
 
+// 上传前压缩：目标分辨率由 GET /upload/config 下发，压缩逻辑见 image_compress.js
+let uploadConfigPromise = null;
+let compressWorker = null;
+let compressSeq = 0;
+const compressPending = new Map();
+
+function loadUploadConfig() {
+  if (!uploadConfigPromise) {
+    uploadConfigPromise = fetch('/upload/config')
+      .then((response) => (response.ok ? response.json() : null))
+      .catch(() => null);
+  }
+  return uploadConfigPromise;
+}
+
+// 页面加载时预取配置，提交时不必再等一次请求
+loadUploadConfig();
+
+function getCompressWorker(workerUrl) {
+  // null: 尚未创建；false: 不可用（不支持 OffscreenCanvas 或 worker 出错），改在主线程压缩
+  if (compressWorker === null) {
+    compressWorker = false;
+    if (workerUrl && typeof Worker !== 'undefined' && typeof OffscreenCanvas !== 'undefined') {
+      try {
+        const worker = new Worker(workerUrl);
+        worker.onmessage = (event) => {
+          const { id, ok, result, error } = event.data;
+          const pending = compressPending.get(id);
+          if (!pending) return;
+          compressPending.delete(id);
+          if (ok) {
+            pending.resolve(result);
+          } else {
+            pending.reject(new Error(error));
+          }
+        };
+        worker.onerror = (event) => {
+          console.warn('[Main] 图片压缩 worker 出错，改在主线程压缩:', event.message);
+          compressWorker = false;
+          compressPending.forEach((pending) => pending.reject(new Error('worker 出错')));
+          compressPending.clear();
+        };
+        compressWorker = worker;
+      } catch (err) {
+        console.warn('[Main] 无法创建图片压缩 worker:', err);
+      }
+    }
+  }
+  return compressWorker || null;
+}
+
+function compressInWorker(worker, file, target) {
+  return new Promise((resolve, reject) => {
+    compressSeq += 1;
+    compressPending.set(compressSeq, { resolve, reject });
+    worker.postMessage({ id: compressSeq, file, target });
+  });
+}
+
+async function compressForUpload(file, target) {
+  let result;
+  const worker = getCompressWorker(target.worker_url);
+  try {
+    result = worker
+      ? await compressInWorker(worker, file, target)
+      : await window.ImageCompress.compressImage(file, target);
+  } catch (err) {
+    if (!worker) {
+      console.warn('[Main] 图片压缩失败，上传原图:', err);
+      return file;
+    }
+    // worker 中解码失败时在主线程再试一次（主线程可以用 <img> 解码）
+    try {
+      result = await window.ImageCompress.compressImage(file, target);
+    } catch (fallbackErr) {
+      console.warn('[Main] 图片压缩失败，上传原图:', fallbackErr);
+      return file;
+    }
+  }
+
+  if (!result.compressed) {
+    return file;
+  }
+  console.log(
+    `[Main] 图片已压缩: ${result.originalWidth}x${result.originalHeight} -> ${result.width}x${result.height}, `
+    + `${(file.size / 1024).toFixed(0)}KB -> ${(result.blob.size / 1024).toFixed(0)}KB（${result.elapsedMs}ms）`,
+  );
+  const extension = result.blob.type === 'image/webp' ? 'webp' : 'jpg';
+  const name = `${file.name.replace(/\.[^.]*$/, '')}.${extension}`;
+  return new File([result.blob], name, { type: result.blob.type });
+}
+
+function prepareUploadFiles(files) {
+  return loadUploadConfig().then((config) => {
+    const target = config && config.resize;
+    if (!target || !target.enabled || !window.ImageCompress) {
+      return files;
+    }
+    return Promise.all(files.map((file) => compressForUpload(file, target)));
+  });
+}
+
 function setLoading(isLoading) {
   loadingEl.style.display = isLoading ? 'flex' : 'none';
   submitButton.disabled = isLoading;
@@ -140,15 +242,12 @@ function resetCanvas() {
 
 uploadForm.addEventListener('submit', (event) => {
   event.preventDefault();
-  const file = fileInput.files[0];
-  if (!file) {
+  const files = Array.from(fileInput.files);
+  if (files.length === 0) {
     showError('请选择一张图片再上传');
     return;
   }
 
-  const formData = new FormData();
-  formData.append('file', file);
-
   showError('');
   setLoading(true);
   resetCanvas();
@@ -156,10 +255,16 @@ uploadForm.addEventListener('submit', (event) => {
   instructionsContainer.textContent = '';
   metaContainer.textContent = '';
 
-  fetch('/upload', {
-    method: 'POST',
-    body: formData,
-  })
+  prepareUploadFiles(files)
+    .then((uploadFiles) => {
+      // 多张图片按选择顺序属于同一道题（题干 + 示意图、跨页题目），一次请求提交
+      const formData = new FormData();
+      uploadFiles.forEach((file) => formData.append('file', file));
+      return fetch('/upload', {
+        method: 'POST',
+        body: formData,
+      });
+    })
     .then((response) => {
       if (!response.ok) {
         throw new Error(`上传失败，状态码：${response.status}`);